@@ -0,0 +1,540 @@
+"""
+Base común de los sistemas de cache Redis de SGM (contabilidad y nómina)
+=======================================================================
+
+SGMCacheBase reúne lo que ambos sistemas hacen igual sobre sus claves
+{KEY_PREFIX}:{cliente_id}:{periodo}:{tipo_dato}:
+
+- Serialización (SGM_CACHE_SERIALIZER): json | json-zlib | msgpack | msgpack-zlib.
+  Los formatos compactos guardan un byte de cabecera para detectar el formato al
+  leer; las entradas JSON sin cabecera se siguen leyendo igual.
+- Tier local (SGM_CACHE_LOCAL_TIER): LRU en memoria de cada proceso delante de
+  Redis, coherente entre procesos por el canal pub/sub LOCAL_INVALIDATION_CHANNEL.
+- Registro de claves: sets {REGISTRY_PREFIX}:clientes, {REGISTRY_PREFIX}:{cliente_id}
+  y {REGISTRY_PREFIX}:{cliente_id}:{periodo} para no recorrer el keyspace con KEYS.
+
+Cada sistema define sus prefijos y canal como atributos de clase, abre sus
+conexiones (redis_client y redis_bin) y llama a _configurar_cache() en __init__.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from django.conf import settings
+from typing import Dict, Any, Optional, List, Tuple, Union
+
+try:
+    import msgpack
+except ImportError:  # Opcional: sin msgpack se usa JSON comprimido
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# El marcador y los sets del registro caducan juntos (cada escritura renueva los
+# sets): al vencer se reconstruye con SCAN, así un set perdido no se arrastra más
+# de REGISTRY_TTL. Cada proceso vuelve a mirar el marcador cada REGISTRY_CHECK_SECONDS.
+REGISTRY_TTL = 24 * 3600
+REGISTRY_CHECK_SECONDS = 60
+SCAN_COUNT = 1000
+
+# Formatos de serialización: byte de cabecera de los payloads compactos.
+# JSON nunca empieza con estos bytes, así que las entradas antiguas se detectan solas.
+FORMATO_MSGPACK = b'\x01'
+FORMATO_MSGPACK_ZLIB = b'\x02'
+FORMATO_JSON_ZLIB = b'\x03'
+SERIALIZADORES = ('json', 'json-zlib', 'msgpack', 'msgpack-zlib')
+SERIALIZER_STATS_FLUSH = 100
+
+
+class _LocalLRUCache:
+    """
+    Cache LRU en memoria del proceso (tier local delante de Redis)
+    
+    Acotado por número de entradas y por bytes (tamaño del payload guardado en
+    Redis, como aproximación), con TTL por entrada. Los valores se devuelven
+    sin copiar: quien los lea debe tratarlos como sólo lectura.
+    """
+    
+    def __init__(self, max_entries: int, max_bytes: int, ttl: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (valor, bytes, expira_en)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entrada = self._entries.get(key)
+            if entrada is None or entrada[2] < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entrada[0]
+    
+    def set(self, key: str, valor: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (valor, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, tamaño, _) = self._entries.popitem(last=False)
+                self._bytes -= tamaño
+                self.evictions += 1
+    
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+    
+    def invalidate_prefix(self, prefijo: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefijo)]:
+                self._remove(key)
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+    
+    def _remove(self, key: str) -> None:
+        entrada = self._entries.pop(key, None)
+        if entrada is not None:
+            self._bytes -= entrada[1]
+    
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate_percent': round(self.hits / total * 100, 2) if total else 0,
+        }
+
+
+class SGMCacheBase:
+    """
+    Serialización, tier local y registro de claves comunes a los sistemas de cache
+    
+    Atributos de clase que define cada sistema:
+        KEY_PREFIX: prefijo de sus claves (p. ej. 'sgm:contabilidad')
+        REGISTRY_PREFIX / REGISTRY_READY_KEY: sets del registro y su marcador
+        LOCAL_INVALIDATION_CHANNEL: canal pub/sub de invalidaciones del tier local
+        SERIALIZER_STATS_PREFIX: hashes con las estadísticas del serializador
+    """
+    
+    KEY_PREFIX = None
+    REGISTRY_PREFIX = None
+    REGISTRY_READY_KEY = None
+    LOCAL_INVALIDATION_CHANNEL = None
+    SERIALIZER_STATS_PREFIX = None
+    
+    def _configurar_cache(self) -> None:
+        """Serializador, registro de claves y tier local según los settings SGM_CACHE_*"""
+        # Serializador de payloads. Ojo: msgpack conserva claves int en los
+        # dicts, mientras que JSON las convierte a str
+        self.serializer = getattr(settings, 'SGM_CACHE_SERIALIZER', 'json')
+        if self.serializer not in SERIALIZADORES:
+            logger.warning(f"SGM_CACHE_SERIALIZER desconocido '{self.serializer}', usando json")
+            self.serializer = 'json'
+        if self.serializer.startswith('msgpack') and msgpack is None:
+            logger.warning("msgpack no está instalado, usando json-zlib")
+            self.serializer = 'json-zlib'
+        self.compress_min_bytes = getattr(settings, 'SGM_CACHE_COMPRESS_MIN_BYTES', 2048)
+        self._serializer_stats = {}
+        
+        # Registro de claves: con False se usa SCAN por patrón (más lento)
+        self.usar_registro = getattr(settings, 'SGM_CACHE_KEY_REGISTRY', True)
+        self._registro_verificado = None  # time.monotonic() de la última vez que se vio el marcador
+        
+        # Tier local opcional (LRU por proceso) para lecturas calientes
+        self.local_tier = getattr(settings, 'SGM_CACHE_LOCAL_TIER', False)
+        self._local_cache = None
+        self._local_pid = None
+        self._local_lock = threading.Lock()
+    
+    def _get_key(self, cliente_id: int, periodo: str, tipo_dato: str) -> str:
+        """
+        Generar clave Redis siguiendo el patrón del sistema SGM
+        Formato: {KEY_PREFIX}:{cliente_id}:{periodo}:{tipo_dato}
+        """
+        return f"{self.KEY_PREFIX}:{cliente_id}:{periodo}:{tipo_dato}"
+    
+    def _serialize_data(self, data: Any) -> bytes:
+        """
+        Serializar datos para almacenar en Redis según self.serializer
+        
+        Con *-zlib sólo se comprime sobre compress_min_bytes; bajo ese tamaño
+        json-zlib guarda JSON plano.
+        """
+        try:
+            inicio = time.perf_counter()
+            if self.serializer.startswith('msgpack'):
+                raw = msgpack.packb(data, default=str, use_bin_type=True)
+                cabecera, cabecera_zlib = FORMATO_MSGPACK, FORMATO_MSGPACK_ZLIB
+            else:
+                raw = json.dumps(data, ensure_ascii=False, default=str).encode('utf-8')
+                cabecera, cabecera_zlib = b'', FORMATO_JSON_ZLIB
+            
+            if self.serializer.endswith('zlib') and len(raw) >= self.compress_min_bytes:
+                payload = cabecera_zlib + zlib.compress(raw)
+            else:
+                payload = cabecera + raw
+            
+            self._registrar_serializacion('encode', len(raw), len(payload), time.perf_counter() - inicio)
+            return payload
+        except Exception as e:
+            logger.error(f"Error serializando datos: {e}")
+            raise
+    
+    def _deserialize_data(self, data: Union[str, bytes]) -> Any:
+        """Deserializar datos desde Redis detectando el formato por la cabecera"""
+        try:
+            inicio = time.perf_counter()
+            if isinstance(data, str):
+                return json.loads(data)
+            
+            cabecera = data[:1]
+            if cabecera in (FORMATO_MSGPACK, FORMATO_MSGPACK_ZLIB):
+                if msgpack is None:
+                    raise ValueError("Payload en msgpack pero msgpack no está instalado")
+                raw = zlib.decompress(data[1:]) if cabecera == FORMATO_MSGPACK_ZLIB else data[1:]
+                resultado = msgpack.unpackb(raw, raw=False, strict_map_key=False)
+            elif cabecera == FORMATO_JSON_ZLIB:
+                raw = zlib.decompress(data[1:])
+                resultado = json.loads(raw)
+            else:
+                raw = data
+                resultado = json.loads(data)
+            
+            self._registrar_serializacion('decode', len(raw), len(data), time.perf_counter() - inicio)
+            return resultado
+        except Exception as e:
+            logger.error(f"Error deserializando datos: {e}")
+            raise
+    
+    def _registrar_serializacion(self, operacion: str, bytes_raw: int, bytes_stored: int,
+                                 segundos: float) -> None:
+        """
+        Acumular estadísticas del serializador en memoria y volcarlas a Redis
+        cada SERIALIZER_STATS_FLUSH operaciones
+        """
+        stats = self._serializer_stats
+        stats[f'{operacion}_count'] = stats.get(f'{operacion}_count', 0) + 1
+        stats[f'{operacion}_ms'] = stats.get(f'{operacion}_ms', 0.0) + segundos * 1000
+        stats[f'{operacion}_bytes_raw'] = stats.get(f'{operacion}_bytes_raw', 0) + bytes_raw
+        stats[f'{operacion}_bytes_stored'] = stats.get(f'{operacion}_bytes_stored', 0) + bytes_stored
+        if stats.get('encode_count', 0) + stats.get('decode_count', 0) >= SERIALIZER_STATS_FLUSH:
+            self._flush_serializer_stats()
+    
+    def _flush_serializer_stats(self) -> None:
+        """Volcar estadísticas acumuladas del serializador al hash de Redis"""
+        stats, self._serializer_stats = self._serializer_stats, {}
+        if not stats:
+            return
+        try:
+            key = f"{self.SERIALIZER_STATS_PREFIX}:{self.serializer}"
+            pipe = self.redis_client.pipeline(transaction=False)
+            for campo, valor in stats.items():
+                if isinstance(valor, float):
+                    pipe.hincrbyfloat(key, campo, valor)
+                else:
+                    pipe.hincrby(key, campo, valor)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"Error guardando estadísticas del serializador: {e}")
+    
+    def get_serializer_stats(self) -> Dict[str, Any]:
+        """
+        Estadísticas del serializador por formato: bytes antes/después de
+        comprimir, bytes ahorrados y tiempo medio de encode/decode
+        
+        Returns:
+            Dict {formato: estadísticas}
+        """
+        self._flush_serializer_stats()
+        resultado = {'activo': self.serializer}
+        for formato in SERIALIZADORES:
+            datos = self.redis_client.hgetall(f"{self.SERIALIZER_STATS_PREFIX}:{formato}")
+            if not datos:
+                continue
+            encode_count = int(datos.get('encode_count', 0))
+            decode_count = int(datos.get('decode_count', 0))
+            bytes_raw = int(datos.get('encode_bytes_raw', 0))
+            bytes_stored = int(datos.get('encode_bytes_stored', 0))
+            resultado[formato] = {
+                'encode_count': encode_count,
+                'decode_count': decode_count,
+                'bytes_raw': bytes_raw,
+                'bytes_stored': bytes_stored,
+                'bytes_saved': bytes_raw - bytes_stored,
+                'compression_ratio': round(bytes_raw / bytes_stored, 2) if bytes_stored else None,
+                'avg_encode_ms': round(float(datos.get('encode_ms', 0)) / encode_count, 3) if encode_count else None,
+                'avg_decode_ms': round(float(datos.get('decode_ms', 0)) / decode_count, 3) if decode_count else None,
+            }
+        return resultado
+    
+    # ========== Tier Local (LRU en proceso) ==========
+    def _get_local_cache(self) -> Optional[_LocalLRUCache]:
+        """
+        Tier local del proceso, o None si está desactivado. Se crea (o se
+        recrea tras un fork) junto con su listener de invalidaciones pub/sub.
+        """
+        if not self.local_tier:
+            return None
+        if self._local_pid != os.getpid():
+            with self._local_lock:
+                if self._local_pid != os.getpid():
+                    self._local_cache = _LocalLRUCache(
+                        max_entries=getattr(settings, 'SGM_CACHE_LOCAL_MAX_ENTRIES', 256),
+                        max_bytes=getattr(settings, 'SGM_CACHE_LOCAL_MAX_BYTES', 64 * 1024 * 1024),
+                        ttl=getattr(settings, 'SGM_CACHE_LOCAL_TTL', 30),
+                    )
+                    self._iniciar_listener_invalidaciones()
+                    self._local_pid = os.getpid()
+        return self._local_cache
+    
+    def _iniciar_listener_invalidaciones(self) -> None:
+        """Suscribirse al canal de invalidaciones en un hilo daemon"""
+        try:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.LOCAL_INVALIDATION_CHANNEL: self._on_invalidacion})
+            pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=self._on_listener_error)
+        except Exception as e:
+            logger.warning(f"Sin listener de invalidaciones, el tier local depende sólo del TTL: {e}")
+    
+    def _on_invalidacion(self, message: Dict[str, Any]) -> None:
+        """Aplicar en el tier local una invalidación publicada por cualquier proceso"""
+        local = self._local_cache
+        if local is None:
+            return
+        try:
+            datos = json.loads(message['data'])
+        except (TypeError, ValueError):
+            return
+        for key in datos.get('keys', []):
+            local.invalidate(key)
+        for prefijo in datos.get('prefijos', []):
+            local.invalidate_prefix(prefijo)
+    
+    def _on_listener_error(self, error: Exception, pubsub, thread) -> None:
+        """Tras un corte pudimos perder mensajes: vaciar el tier local y reintentar"""
+        logger.debug(f"Error en listener de invalidaciones: {error}")
+        if self._local_cache is not None:
+            self._local_cache.clear()
+        time.sleep(1)
+    
+    def _publicar_invalidacion(self, keys: List[str] = None, prefijos: List[str] = None,
+                               pipe=None) -> None:
+        """
+        Publicar una invalidación para los tiers locales de todos los procesos
+        (el propio incluido). Con pipe se encola junto a la escritura.
+        """
+        if not self.local_tier:
+            return
+        mensaje = json.dumps({'keys': keys or [], 'prefijos': prefijos or []})
+        try:
+            (pipe or self.redis_client).publish(self.LOCAL_INVALIDATION_CHANNEL, mensaje)
+        except Exception as e:
+            logger.debug(f"Error publicando invalidación: {e}")
+    
+    def _invalidar_local(self, keys: List[str] = None, prefijos: List[str] = None) -> None:
+        """Invalidar de inmediato en el tier local de este proceso"""
+        local = self._local_cache if self._local_pid == os.getpid() else None
+        if local is None:
+            return
+        for key in keys or []:
+            local.invalidate(key)
+        for prefijo in prefijos or []:
+            local.invalidate_prefix(prefijo)
+    
+    def _get_con_tier_local(self, key: str) -> Tuple[Any, bool]:
+        """
+        GET de un payload con el tier local delante de Redis
+        
+        Returns:
+            (valor deserializado o None, True si se sirvió desde el tier local)
+        """
+        local = self._get_local_cache()
+        if local is not None:
+            valor = local.get(key)
+            if valor is not None:
+                return valor, True
+        data = self.redis_bin.get(key)
+        if not data:
+            return None, False
+        valor = self._deserialize_data(data)
+        if local is not None:
+            local.set(key, valor, len(data))
+        return valor, False
+    
+    # ========== Registro de Claves ==========
+    def _registry_cliente_key(self, cliente_id: int) -> str:
+        """Set con los períodos en cache de un cliente"""
+        return f"{self.REGISTRY_PREFIX}:{cliente_id}"
+    
+    def _registry_periodo_key(self, cliente_id: int, periodo: str) -> str:
+        """Set con las claves en cache de un cliente/periodo"""
+        return f"{self.REGISTRY_PREFIX}:{cliente_id}:{periodo}"
+    
+    def _set_registrado(self, key: str, ttl: Optional[int], serialized_data: str,
+                        cliente_id: int, periodo: str) -> None:
+        """
+        Guardar un valor (sin expiración si ttl es None) y registrar su clave
+        en los sets del cliente/periodo, en una sola ida a Redis
+        """
+        pipe = self.redis_client.pipeline()
+        if ttl:
+            pipe.setex(key, ttl, serialized_data)
+        else:
+            pipe.set(key, serialized_data)
+        self._registrar_en_sets(pipe, key, cliente_id, periodo)
+        self._publicar_invalidacion(keys=[key], pipe=pipe)
+        pipe.execute()
+        self._invalidar_local(keys=[key])
+    
+    def _registro_disponible(self) -> bool:
+        """
+        Indica si se puede usar el registro. Si falta el marcador (primera vez
+        o vencido tras REGISTRY_TTL) reconstruye el registro con SCAN.
+        """
+        if not self.usar_registro:
+            return False
+        ahora = time.monotonic()
+        if self._registro_verificado is not None and ahora - self._registro_verificado < REGISTRY_CHECK_SECONDS:
+            return True
+        try:
+            if not self.redis_client.exists(self.REGISTRY_READY_KEY):
+                self.rebuild_key_registry()
+            self._registro_verificado = ahora
+            return True
+        except Exception as e:
+            logger.warning(f"Registro de claves no disponible, usando SCAN: {e}")
+            self._registro_verificado = None
+            return False
+    
+    def _registrar_en_sets(self, pipe, key: str, cliente_id, periodo: str) -> None:
+        """Agregar una clave a los sets del registro renovando su TTL (REGISTRY_TTL)"""
+        for reg_key, miembro in ((self._registry_periodo_key(cliente_id, periodo), key),
+                                 (self._registry_cliente_key(cliente_id), periodo),
+                                 (f"{self.REGISTRY_PREFIX}:clientes", cliente_id)):
+            pipe.sadd(reg_key, miembro)
+            pipe.expire(reg_key, REGISTRY_TTL)
+    
+    def rebuild_key_registry(self) -> int:
+        """
+        Reconstruir el registro de claves recorriendo {KEY_PREFIX}:* con SCAN
+        
+        Returns:
+            int: Número de claves registradas
+        """
+        registradas = 0
+        pipe = self.redis_client.pipeline()
+        for key in self.redis_client.scan_iter(match=f"{self.KEY_PREFIX}:*", count=SCAN_COUNT):
+            parts = key.split(':')
+            if len(parts) < 5 or parts[2] == 'stats':
+                continue  # {KEY_PREFIX}:{cliente_id}:{periodo}:{tipo_dato}
+            cliente_id, periodo = parts[2], parts[3]
+            self._registrar_en_sets(pipe, key, cliente_id, periodo)
+            registradas += 1
+        # Sets y marcador en una sola transacción y con el mismo TTL
+        pipe.set(self.REGISTRY_READY_KEY, datetime.now().isoformat(), ex=REGISTRY_TTL)
+        pipe.execute()
+        logger.info(f"Registro de claves de {self.KEY_PREFIX} reconstruido: {registradas} claves")
+        return registradas
+    
+    def _claves_vivas(self, registro: Dict[str, List[str]]) -> List[str]:
+        """
+        Filtrar claves registradas que ya expiraron (TTL) y depurarlas del registro
+        
+        Args:
+            registro: {set_de_registro: [claves]}
+        """
+        pares = [(reg_key, key) for reg_key, keys in registro.items() for key in keys]
+        if not pares:
+            return []
+        pipe = self.redis_client.pipeline(transaction=False)
+        for _, key in pares:
+            pipe.exists(key)
+        existe = pipe.execute()
+        
+        vivas = []
+        for (reg_key, key), ok in zip(pares, existe):
+            if ok:
+                vivas.append(key)
+            else:
+                pipe.srem(reg_key, key)
+        pipe.execute()
+        return vivas
+    
+    def get_client_keys(self, cliente_id: int, periodo: str = None) -> List[str]:
+        """
+        Obtener las claves en cache de un cliente (o de un cliente/periodo)
+        
+        Usa el registro de claves; si está desactivado o falla, recorre con
+        SCAN el patrón del cliente.
+        
+        Args:
+            cliente_id: ID del cliente
+            periodo: Período específico (opcional)
+            
+        Returns:
+            Lista de claves Redis existentes
+        """
+        if self._registro_disponible():
+            try:
+                periodos = [periodo] if periodo else list(self.redis_client.smembers(self._registry_cliente_key(cliente_id)))
+                pipe = self.redis_client.pipeline(transaction=False)
+                registro_keys = [self._registry_periodo_key(cliente_id, p) for p in periodos]
+                for reg_key in registro_keys:
+                    pipe.smembers(reg_key)
+                registro = dict(zip(registro_keys, pipe.execute()))
+                return self._claves_vivas(registro)
+            except Exception as e:
+                logger.warning(f"Error leyendo registro de claves, usando SCAN: {e}")
+        
+        pattern = self._get_key(cliente_id, periodo or '*', '*')
+        return list(self.redis_client.scan_iter(match=pattern, count=SCAN_COUNT))
+    
+    def _delete_registradas(self, cliente_id: int, keys: List[str]) -> int:
+        """
+        Eliminar claves del cache y del registro del cliente
+        
+        Returns:
+            int: Número de claves eliminadas
+        """
+        if not keys:
+            return 0
+        pipe = self.redis_client.pipeline()
+        pipe.delete(*keys)
+        for key in keys:
+            parts = key.split(':')
+            if len(parts) >= 5:
+                pipe.srem(self._registry_periodo_key(cliente_id, parts[3]), key)
+        self._publicar_invalidacion(keys=keys, pipe=pipe)
+        deleted = pipe.execute()[0]
+        self._invalidar_local(keys=keys)
+        return deleted
+    
+    def _forget_periodo(self, cliente_id: int, periodo: str) -> None:
+        """Quitar un período completo del registro del cliente"""
+        pipe = self.redis_client.pipeline()
+        pipe.delete(self._registry_periodo_key(cliente_id, periodo))
+        pipe.srem(self._registry_cliente_key(cliente_id), periodo)
+        pipe.execute()
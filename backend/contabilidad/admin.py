@@ -344,10 +344,15 @@ class MovimientoContableAdmin(admin.ModelAdmin):
         batch_size = 5000
         borrados = 0
         pks = list(queryset.values_list('pk', flat=True))
+        cierres = set(queryset.values_list('cierre__cliente_id', 'cierre__periodo').distinct())
         for i in range(0, len(pks), batch_size):
             sub = pks[i:i+batch_size]
             MovimientoContable.objects.filter(pk__in=sub).delete()
             borrados += len(sub)
+        # Borrado fuera de una carga: el snapshot de cuentas no cambia de versión
+        from .tasks_reportes import invalidar_snapshot_cuentas
+        for cliente_id, periodo in cierres:
+            invalidar_snapshot_cuentas(cliente_id, periodo)
         self.message_user(request, f"Eliminados {borrados} movimientos contables", level=messages.SUCCESS)
     eliminar_movimientos_seleccionados.short_description = "Eliminar movimientos seleccionados (batch)"
 
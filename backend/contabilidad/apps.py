@@ -10,6 +10,8 @@ class ContabilidadConfig(AppConfig):
         Importar tasks cuando la app esté lista para asegurar 
         que Celery las registre correctamente.
         """
+        from . import signals  # Invalidación del molde de clasificación
+        
         try:
             from . import tasks
             from . import tasks_de_tipo_doc
@@ -15,10 +15,29 @@ sgm:contabilidad:{cliente_id}:{periodo}/
 ├── cuentas
 └── pruebas (Datos de prueba y testing)
 
+Registro de claves (sets, evita KEYS sobre todo el keyspace):
+sgm:registry:contabilidad:clientes -> Clientes con datos en cache
+sgm:registry:contabilidad:{cliente_id} -> Períodos del cliente
+sgm:registry:contabilidad:{cliente_id}:{periodo} -> Claves del cliente/periodo
+
+Serialización (SGM_CACHE_SERIALIZER):
+json | json-zlib | msgpack | msgpack-zlib. Los formatos compactos guardan un
+byte de cabecera para detectar el formato al leer; las entradas JSON sin
+cabecera se siguen leyendo igual.
+
+Serialización, tier local y registro de claves vienen de SGMCacheBase
+(api/cache_redis_base.py), compartida con el otro sistema de cache.
+
+Tier local (SGM_CACHE_LOCAL_TIER):
+LRU en memoria de cada proceso delante de Redis para las lecturas calientes,
+acotado por entradas, bytes y TTL. set_*/invalidate_* publican en
+sgm:cache:invalidaciones:contabilidad para invalidarlo en todos los procesos.
+
 Logs de actividad:
-sgm:logs:{timestamp}:{id} -> Logs individuales con claves separadas
-- Ejemplo: sgm:logs:2025-07-17T20:29:59.974025+00:00:123
-- Ordenación natural por timestamp para eficiencia
+sgm:logs:{id} -> Logs individuales con claves separadas
+sgm:logs_index -> Sorted set {clave_log: timestamp} para orden y retención
+sgm:logs_index:{cliente|periodo|tarjeta}:{valor} -> Índices secundarios para filtros
+- Inserción, retención y paginación en O(log N) con MGET en lote
 - Políticas de retención automática
 
 Autor: Sistema SGM
@@ -32,12 +51,55 @@ from datetime import datetime, timedelta
 from django.conf import settings
 from typing import Dict, Any, Optional, List, Union
 
+# Serialización, tier local y registro de claves comunes con el otro sistema de
+# cache; los formatos y _LocalLRUCache se re-exportan para quien los importe de aquí
+from api.cache_redis_base import (  # noqa: F401
+    FORMATO_JSON_ZLIB,
+    FORMATO_MSGPACK,
+    FORMATO_MSGPACK_ZLIB,
+    REGISTRY_CHECK_SECONDS,
+    SCAN_COUNT,
+    SERIALIZADORES,
+    SGMCacheBase,
+    _LocalLRUCache,
+)
+
 # Configurar logging
 logger = logging.getLogger(__name__)
 
-class SGMCacheSystem:
+# Índices de logs de actividad (sorted sets con score = timestamp epoch)
+LOGS_INDEX_KEY = "sgm:logs_index"
+LOGS_INDEX_FILTROS = {
+    'cliente': 'cliente_id',
+    'periodo': 'periodo_cierre',
+    'tarjeta': 'tarjeta',
+}
+LOGS_MGET_BATCH = 500
+# Marca de "índice revisado": con el índice vacío evita repetir el SCAN de
+# sgm:logs:* en cada lectura; al vencer se vuelve a revisar (logs sin indexar)
+LOGS_INDEX_BUILT_KEY = f"{LOGS_INDEX_KEY}:_construido"
+LOGS_INDEX_BUILT_TTL = 3600
+
+# Registro de claves por cliente/periodo (ver _set_registrado)
+REGISTRY_PREFIX = "sgm:registry:contabilidad"
+REGISTRY_READY_KEY = f"{REGISTRY_PREFIX}:_ready"
+# Pseudo-período de las claves por cliente que no dependen del período (p. ej. el
+# molde de clasificación): así siguen el formato de clave y entran al registro
+PERIODO_CLIENTE = "_cliente"
+
+# Canal pub/sub para mantener coherentes los tiers locales (LRU) de cada proceso
+LOCAL_INVALIDATION_CHANNEL = "sgm:cache:invalidaciones:contabilidad"
+
+
+class SGMCacheSystem(SGMCacheBase):
     """Sistema de cache Redis para SGM - Contabilidad"""
     
+    KEY_PREFIX = "sgm:contabilidad"
+    REGISTRY_PREFIX = REGISTRY_PREFIX
+    REGISTRY_READY_KEY = REGISTRY_READY_KEY
+    LOCAL_INVALIDATION_CHANNEL = LOCAL_INVALIDATION_CHANNEL
+    SERIALIZER_STATS_PREFIX = "sgm:stats:serializer"
+    
     def __init__(self):
         """Inicializar conexión a Redis DB 1 (contabilidad)"""
         try:
@@ -52,6 +114,18 @@ class SGMCacheSystem:
                 retry_on_timeout=True
             )
             
+            # Cliente binario para leer payloads (pueden venir comprimidos o en msgpack)
+            self.redis_bin = redis.Redis(
+                host='redis',
+                port=6379,
+                db=1,
+                password=getattr(settings, 'REDIS_PASSWORD', ''),
+                decode_responses=False,
+                socket_connect_timeout=5,
+                socket_timeout=5,
+                retry_on_timeout=True
+            )
+            
             # Verificar conexión
             if not self.redis_client.ping():
                 raise redis.ConnectionError("No se pudo conectar a Redis")
@@ -67,29 +141,8 @@ class SGMCacheSystem:
         self.long_ttl = 14400    # 4 horas para datos estables
         self.short_ttl = 300     # 5 minutos para datos temporales
         
-    def _get_key(self, cliente_id: int, periodo: str, tipo_dato: str) -> str:
-        """
-        Generar clave Redis siguiendo el patrón del sistema SGM
-        Formato: sgm:contabilidad:{cliente_id}:{periodo}:{tipo_dato}
-        """
-        return f"sgm:contabilidad:{cliente_id}:{periodo}:{tipo_dato}"
-    
-    def _serialize_data(self, data: Any) -> str:
-        """Serializar datos para almacenar en Redis"""
-        try:
-            return json.dumps(data, ensure_ascii=False, default=str)
-        except Exception as e:
-            logger.error(f"Error serializando datos: {e}")
-            raise
-    
-    def _deserialize_data(self, data: str) -> Any:
-        """Deserializar datos desde Redis"""
-        try:
-            return json.loads(data)
-        except Exception as e:
-            logger.error(f"Error deserializando datos: {e}")
-            raise
-    
+        self._configurar_cache()
+        
     # ========== KPIs ==========
     def set_kpis(self, cliente_id: int, periodo: str, kpis: Dict[str, Any], ttl: int = None) -> bool:
         """
@@ -121,7 +174,7 @@ class SGMCacheSystem:
             }
             
             serialized_data = self._serialize_data(kpis_with_meta)
-            self.redis_client.setex(key, ttl, serialized_data)
+            self._set_registrado(key, ttl, serialized_data, cliente_id, periodo)
             
             self._increment_stat("cache_writes")
             self._increment_stat("kpis_cached")
@@ -147,11 +200,11 @@ class SGMCacheSystem:
         key = self._get_key(cliente_id, periodo, "kpis")
         
         try:
-            data = self.redis_client.get(key)
-            if data:
-                kpis = self._deserialize_data(data)
-                self._increment_stat("cache_hits")
-                self._increment_stat("kpis_retrieved")
+            kpis, desde_local = self._get_con_tier_local(key)
+            if kpis is not None:
+                if not desde_local:
+                    self._increment_stat("cache_hits")
+                    self._increment_stat("kpis_retrieved")
                 
                 logger.debug(f"KPIs obtenidos del cache: cliente={cliente_id}, periodo={periodo}")
                 return kpis
@@ -204,7 +257,7 @@ class SGMCacheSystem:
             }
             
             serialized_data = self._serialize_data(datos_with_meta)
-            self.redis_client.setex(key, ttl, serialized_data)
+            self._set_registrado(key, ttl, serialized_data, cliente_id, periodo)
             
             self._increment_stat("cache_writes")
             self._increment_stat(f"{tipo_estado}_cached")
@@ -231,11 +284,11 @@ class SGMCacheSystem:
         key = self._get_key(cliente_id, periodo, tipo_estado)
         
         try:
-            data = self.redis_client.get(key)
-            if data:
-                estado = self._deserialize_data(data)
-                self._increment_stat("cache_hits")
-                self._increment_stat(f"{tipo_estado}_retrieved")
+            estado, desde_local = self._get_con_tier_local(key)
+            if estado is not None:
+                if not desde_local:
+                    self._increment_stat("cache_hits")
+                    self._increment_stat(f"{tipo_estado}_retrieved")
                 
                 logger.debug(f"Estado {tipo_estado.upper()} obtenido del cache: cliente={cliente_id}, periodo={periodo}")
                 return estado
@@ -249,6 +302,54 @@ class SGMCacheSystem:
             self._increment_stat("cache_errors")
             return None
     
+    def set_movimientos_cierre(self, cliente_id: int, periodo: str, indice: Dict[str, Any],
+                               ttl: int = None) -> bool:
+        """
+        Guardar el índice de movimientos del cierre para Streamlit. Va en su propia
+        clave ('movimientos_cierre'): 'movimientos' es la lista de set_movimientos.
+        Solo lleva, por código de cuenta, la cantidad de movimientos y la URL de su
+        detalle paginado; las filas no se guardan en Redis.
+        
+        Args:
+            cliente_id: ID del cliente
+            periodo: Período contable
+            indice: {'cierre_id', 'cuentas': {codigo: {...}}}
+            ttl: Tiempo de vida en segundos (el mismo de los estados financieros)
+            
+        Returns:
+            bool: True si se guardó exitosamente
+        """
+        key = self._get_key(cliente_id, periodo, "movimientos_cierre")
+        ttl = ttl or self.long_ttl
+        
+        try:
+            serialized_data = self._serialize_data(indice)
+            self._set_registrado(key, ttl, serialized_data, cliente_id, periodo)
+            self._increment_stat("cache_writes")
+            logger.info(f"Índice de movimientos guardado: cliente={cliente_id}, periodo={periodo}")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error guardando índice de movimientos: {e}")
+            return False
+    
+    def get_movimientos_cierre(self, cliente_id: int, periodo: str) -> Optional[Dict[str, Any]]:
+        """Obtener el índice de movimientos del cierre guardado por set_movimientos_cierre"""
+        key = self._get_key(cliente_id, periodo, "movimientos_cierre")
+        
+        try:
+            data = self.redis_bin.get(key)
+            if data:
+                self._increment_stat("cache_hits")
+                return self._deserialize_data(data)
+            self._increment_stat("cache_misses")
+            return None
+            
+        except Exception as e:
+            logger.error(f"Error obteniendo índice de movimientos: {e}")
+            self._increment_stat("cache_errors")
+            return None
+    
     # ========== Procesamiento ==========
     def set_procesamiento_status(self, cliente_id: int, periodo: str, status: Dict[str, Any]) -> bool:
         """
@@ -278,7 +379,7 @@ class SGMCacheSystem:
             
             serialized_data = self._serialize_data(status_with_meta)
             # Procesamiento con TTL corto (5 minutos)
-            self.redis_client.setex(key, self.short_ttl, serialized_data)
+            self._set_registrado(key, self.short_ttl, serialized_data, cliente_id, periodo)
             
             self._increment_stat("procesamiento_updates")
             
@@ -303,7 +404,7 @@ class SGMCacheSystem:
         key = self._get_key(cliente_id, periodo, "procesamiento")
         
         try:
-            data = self.redis_client.get(key)
+            data = self.redis_bin.get(key)
             if data:
                 status = self._deserialize_data(data)
                 logger.debug(f"Estado de procesamiento obtenido: cliente={cliente_id}, periodo={periodo}")
@@ -343,7 +444,7 @@ class SGMCacheSystem:
             }
             
             serialized_data = self._serialize_data(alertas_with_meta)
-            self.redis_client.setex(key, self.default_ttl, serialized_data)
+            self._set_registrado(key, self.default_ttl, serialized_data, cliente_id, periodo)
             
             self._increment_stat("cache_writes")
             self._increment_stat("alertas_cached")
@@ -369,7 +470,7 @@ class SGMCacheSystem:
         key = self._get_key(cliente_id, periodo, "alertas")
         
         try:
-            data = self.redis_client.get(key)
+            data = self.redis_bin.get(key)
             if data:
                 alertas_data = self._deserialize_data(data)
                 self._increment_stat("cache_hits")
@@ -417,7 +518,7 @@ class SGMCacheSystem:
             }
             
             serialized_data = self._serialize_data(movimientos_with_meta)
-            self.redis_client.setex(key, ttl, serialized_data)
+            self._set_registrado(key, ttl, serialized_data, cliente_id, periodo)
             
             self._increment_stat("cache_writes")
             self._increment_stat("movimientos_cached")
@@ -443,7 +544,7 @@ class SGMCacheSystem:
         key = self._get_key(cliente_id, periodo, "movimientos")
         
         try:
-            data = self.redis_client.get(key)
+            data = self.redis_bin.get(key)
             if data:
                 movimientos_data = self._deserialize_data(data)
                 self._increment_stat("cache_hits")
@@ -490,7 +591,7 @@ class SGMCacheSystem:
             }
             
             serialized_data = self._serialize_data(cuentas_with_meta)
-            self.redis_client.setex(key, ttl, serialized_data)
+            self._set_registrado(key, ttl, serialized_data, cliente_id, periodo)
             
             self._increment_stat("cache_writes")
             self._increment_stat("cuentas_cached")
@@ -516,7 +617,7 @@ class SGMCacheSystem:
         key = self._get_key(cliente_id, periodo, "cuentas")
         
         try:
-            data = self.redis_client.get(key)
+            data = self.redis_bin.get(key)
             if data:
                 cuentas = self._deserialize_data(data)
                 self._increment_stat("cache_hits")
@@ -531,11 +632,181 @@ class SGMCacheSystem:
         except Exception as e:
             logger.error(f"Error obteniendo cuentas: {e}")
             return None
-    
+
+    # ========== Snapshot de cuentas del cierre ==========
+    def set_snapshot_cierre(self, cliente_id: int, periodo: str, parte: str, snapshot: Dict[str, Any],
+                            ttl: int = None) -> bool:
+        """
+        Guardar una parte del snapshot de cuentas de un cierre ('cuentas' con los
+        agregados por cuenta, 'movimientos' con el detalle)
+
+        Args:
+            cliente_id: ID del cliente
+            periodo: Período contable
+            parte: Parte del snapshot
+            snapshot: Datos compactos (incluyen cierre_id y version)
+            ttl: Tiempo de vida en segundos
+
+        Returns:
+            bool: True si se guardó exitosamente
+        """
+        key = self._get_key(cliente_id, periodo, f"snapshot_{parte}")
+        ttl = ttl or self.long_ttl
+
+        try:
+            serialized_data = self._serialize_data(snapshot)
+            self._set_registrado(key, ttl, serialized_data, cliente_id, periodo)
+            self._increment_stat("cache_writes")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error guardando snapshot {parte}: {e}")
+            return False
+
+    def get_snapshot_cierre(self, cliente_id: int, periodo: str, parte: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtener una parte del snapshot de cuentas de un cierre
+
+        Returns:
+            Dict con el snapshot o None
+        """
+        key = self._get_key(cliente_id, periodo, f"snapshot_{parte}")
+
+        try:
+            data = self.redis_bin.get(key)
+            if data:
+                self._increment_stat("cache_hits")
+                return self._deserialize_data(data)
+            else:
+                self._increment_stat("cache_misses")
+                return None
+
+        except Exception as e:
+            logger.error(f"Error obteniendo snapshot {parte}: {e}")
+            return None
+
+    def invalidate_snapshot_cierre(self, cliente_id: int, periodo: str = None) -> int:
+        """
+        Invalidar el snapshot de cuentas de un cliente/período (o de todos los períodos
+        del cliente, p. ej. al renombrar una cuenta)
+
+        Returns:
+            int: Número de claves eliminadas
+        """
+        try:
+            keys = [key for key in self.get_client_keys(cliente_id, periodo) if ':snapshot_' in key]
+            return self._delete_registradas(cliente_id, keys)
+
+        except Exception as e:
+            logger.error(f"Error invalidando snapshot de cuentas: {e}")
+            return 0
+
+    # ========== Molde de clasificación por cliente ==========
+    def _molde_key(self, cliente_id: int) -> str:
+        """El molde no depende del período: sgm:contabilidad:{cliente_id}:_cliente:molde_clasificacion"""
+        return self._get_key(cliente_id, PERIODO_CLIENTE, 'molde_clasificacion')
+
+    def set_molde_clasificacion(self, cliente_id: int, molde: Dict[str, Any], ttl: int = None) -> bool:
+        """
+        Guardar el molde de clasificación compilado de un cliente (sets de ESF/ERI/ECP
+        resueltos y opción → categoría/grupo). Se invalida al editar sets u opciones
+
+        Args:
+            cliente_id: ID del cliente
+            molde: Molde compilado
+            ttl: Tiempo de vida en segundos (por defecto 24 horas)
+
+        Returns:
+            bool: True si se guardó exitosamente
+        """
+        try:
+            self._set_registrado(
+                self._molde_key(cliente_id), ttl or 86400, self._serialize_data(molde), cliente_id, PERIODO_CLIENTE
+            )
+            self._increment_stat("cache_writes")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error guardando molde de clasificación: {e}")
+            return False
+
+    def get_molde_clasificacion(self, cliente_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Obtener el molde de clasificación compilado de un cliente
+
+        Returns:
+            Dict con el molde o None
+        """
+        try:
+            data = self.redis_bin.get(self._molde_key(cliente_id))
+            if data:
+                self._increment_stat("cache_hits")
+                return self._deserialize_data(data)
+            else:
+                self._increment_stat("cache_misses")
+                return None
+
+        except Exception as e:
+            logger.error(f"Error obteniendo molde de clasificación: {e}")
+            return None
+
+    def invalidate_molde_clasificacion(self, cliente_id: int) -> bool:
+        """
+        Invalidar el molde de clasificación de un cliente
+
+        Returns:
+            bool: True si existía y se eliminó
+        """
+        try:
+            return bool(self._delete_registradas(cliente_id, [self._molde_key(cliente_id)]))
+
+        except Exception as e:
+            logger.error(f"Error invalidando molde de clasificación: {e}")
+            return False
+
     # ========== Logs de Actividad Globales ==========
+    def _log_score(self, log_data: Dict[str, Any]) -> float:
+        """Score del log en los índices: timestamp como epoch (segundos)"""
+        timestamp = log_data.get('timestamp')
+        try:
+            return datetime.fromisoformat(str(timestamp).replace('Z', '+00:00')).timestamp()
+        except (TypeError, ValueError):
+            return datetime.now().timestamp()
+
+    def _log_index_keys(self, log_data: Dict[str, Any]) -> List[str]:
+        """Índices secundarios a los que pertenece un log"""
+        keys = []
+        for nombre, campo in LOGS_INDEX_FILTROS.items():
+            valor = log_data.get(campo)
+            if valor not in (None, ''):
+                keys.append(f"{LOGS_INDEX_KEY}:{nombre}:{valor}")
+        return keys
+
+    def _mget_logs(self, log_keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Obtener logs en lotes con MGET (una ida a Redis por lote)
+
+        Returns:
+            Lista alineada con log_keys; None para logs inexistentes o corruptos
+        """
+        logs = []
+        for i in range(0, len(log_keys), LOGS_MGET_BATCH):
+            batch = log_keys[i:i + LOGS_MGET_BATCH]
+            for key, data in zip(batch, self.redis_bin.mget(batch)):
+                if not data:
+                    logs.append(None)
+                    continue
+                try:
+                    logs.append(self._deserialize_data(data))
+                except Exception as e:
+                    logger.warning(f"Error deserializando log {key}: {e}")
+                    logs.append(None)
+        return logs
+
     def add_log(self, log_data: Dict[str, Any], max_logs: int = 10000) -> bool:
         """
-        Agregar un log usando claves individuales sgm:logs:{id}
+        Agregar un log usando claves individuales sgm:logs:{id} e indexarlo
+        por timestamp en sgm:logs_index (más índices por cliente/periodo/tarjeta)
         
         Args:
             log_data: Datos del log a agregar
@@ -550,10 +821,16 @@ class SGMCacheSystem:
             
             # Formato simplificado: sgm:logs:{id}
             log_key = f"sgm:logs:{log_id}"
+            score = self._log_score(log_data)
             
-            # Serializar y guardar el log individual
+            # Serializar, guardar e indexar el log en una sola ida a Redis
             serialized_data = self._serialize_data(log_data)
-            self.redis_client.set(log_key, serialized_data)
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.set(log_key, serialized_data)
+            pipe.zadd(LOGS_INDEX_KEY, {log_key: score})
+            for index_key in self._log_index_keys(log_data):
+                pipe.zadd(index_key, {log_key: score})
+            pipe.execute()
             
             # Aplicar política de retención si es necesario
             self._apply_logs_retention_policy(max_logs)
@@ -570,49 +847,127 @@ class SGMCacheSystem:
     
     def _apply_logs_retention_policy(self, max_logs: int) -> None:
         """
-        Aplicar política de retención eliminando logs antiguos si se excede el límite
+        Aplicar política de retención eliminando logs antiguos si se excede el límite.
+        Usa el índice ordenado, por lo que sólo toca los logs que sobran.
         
         Args:
             max_logs: Máximo número de logs a mantener
         """
         try:
-            # Obtener todas las claves de logs
-            log_keys = self.redis_client.keys("sgm:logs:*")
+            total = self.redis_client.zcard(LOGS_INDEX_KEY)
             
             # Si no excedemos el límite, no hacer nada
-            if len(log_keys) <= max_logs:
+            if total <= max_logs:
                 return
             
-            # Para determinar cuáles son los más antiguos, necesitamos revisar el timestamp dentro del log
-            # Obtener una muestra de logs para ordenar por timestamp
-            logs_with_timestamps = []
-            
-            for key in log_keys:
-                try:
-                    data = self.redis_client.get(key)
-                    if data:
-                        log_data = self._deserialize_data(data)
-                        timestamp = log_data.get('timestamp', '1970-01-01T00:00:00.000Z')
-                        logs_with_timestamps.append((timestamp, key))
-                except Exception:
-                    # Si hay error deserializando, considerar este log como candidato para eliminar
-                    logs_with_timestamps.append(('1970-01-01T00:00:00.000Z', key))
-            
-            # Ordenar por timestamp (más antiguos primero)
-            logs_with_timestamps.sort(key=lambda x: x[0])
-            
-            # Calcular cuántos logs eliminar
-            logs_to_delete = len(logs_with_timestamps) - max_logs
-            old_logs = [key for _, key in logs_with_timestamps[:logs_to_delete]]
-            
-            # Eliminar logs antiguos
+            # Los más antiguos son los de menor score
+            old_logs = self.redis_client.zrange(LOGS_INDEX_KEY, 0, total - max_logs - 1)
             if old_logs:
-                deleted_count = self.redis_client.delete(*old_logs)
+                deleted_count = self._delete_logs_by_key(old_logs)
                 logger.debug(f"Política de retención aplicada: {deleted_count} logs eliminados")
                 self._increment_stat("logs_retention_applied")
             
         except Exception as e:
             logger.error(f"Error aplicando política de retención: {e}")
+
+    def _delete_logs_by_key(self, log_keys: List[str]) -> int:
+        """
+        Eliminar logs y sus entradas en todos los índices
+        
+        Returns:
+            int: Número de logs eliminados
+        """
+        if not log_keys:
+            return 0
+        logs = self._mget_logs(log_keys)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.delete(*log_keys)
+        pipe.zrem(LOGS_INDEX_KEY, *log_keys)
+        for key, log_data in zip(log_keys, logs):
+            for index_key in self._log_index_keys(log_data or {}):
+                pipe.zrem(index_key, key)
+        return pipe.execute()[0]
+
+    def delete_logs(self, log_ids: List[Any]) -> int:
+        """
+        Eliminar logs por id manteniendo los índices consistentes
+        
+        Args:
+            log_ids: IDs de los logs a eliminar
+            
+        Returns:
+            int: Número de logs eliminados
+        """
+        try:
+            return self._delete_logs_by_key([f"sgm:logs:{log_id}" for log_id in log_ids])
+        except Exception as e:
+            logger.error(f"Error eliminando logs: {e}")
+            return 0
+
+    def rebuild_logs_index(self) -> int:
+        """
+        Reconstruir los índices de logs desde las claves sgm:logs:* (SCAN).
+        Necesario sólo para logs guardados antes de existir el índice.
+        
+        Returns:
+            int: Número de logs indexados
+        """
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.delete(LOGS_INDEX_KEY)
+            for index_key in self.redis_client.scan_iter(match=f"{LOGS_INDEX_KEY}:*", count=1000):
+                pipe.delete(index_key)
+            pipe.execute()
+
+            indexados = 0
+            batch = []
+            for key in self.redis_client.scan_iter(match="sgm:logs:*", count=1000):
+                batch.append(key)
+                if len(batch) >= LOGS_MGET_BATCH:
+                    indexados += self._index_existing_logs(batch)
+                    batch = []
+            indexados += self._index_existing_logs(batch)
+            self.redis_client.set(LOGS_INDEX_BUILT_KEY, datetime.now().isoformat(), ex=LOGS_INDEX_BUILT_TTL)
+
+            logger.info(f"Índice de logs reconstruido: {indexados} logs")
+            return indexados
+        except Exception as e:
+            logger.error(f"Error reconstruyendo índice de logs: {e}")
+            return 0
+
+    def _index_existing_logs(self, log_keys: List[str]) -> int:
+        """Indexar un lote de logs ya guardados"""
+        if not log_keys:
+            return 0
+        pipe = self.redis_client.pipeline(transaction=False)
+        indexados = 0
+        for key, log_data in zip(log_keys, self._mget_logs(log_keys)):
+            if log_data is None:
+                continue
+            score = self._log_score(log_data)
+            pipe.zadd(LOGS_INDEX_KEY, {key: score})
+            for index_key in self._log_index_keys(log_data):
+                pipe.zadd(index_key, {key: score})
+            indexados += 1
+        pipe.execute()
+        return indexados
+
+    def _ensure_logs_index(self) -> int:
+        """
+        Devolver el tamaño del índice, reconstruyéndolo si está vacío pero
+        existen logs sin indexar. El SCAN se hace a lo más una vez por
+        LOGS_INDEX_BUILT_TTL (LOGS_INDEX_BUILT_KEY), aunque no haya logs.
+        """
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.zcard(LOGS_INDEX_KEY)
+        pipe.exists(LOGS_INDEX_BUILT_KEY)
+        total, revisado = pipe.execute()
+        if total or revisado:
+            return total
+        if next(self.redis_client.scan_iter(match="sgm:logs:*", count=1000), None):
+            return self.rebuild_logs_index()
+        self.redis_client.set(LOGS_INDEX_BUILT_KEY, datetime.now().isoformat(), ex=LOGS_INDEX_BUILT_TTL)
+        return 0
     
     def get_all_logs(self, limit: int = None) -> Optional[List[Dict[str, Any]]]:
         """
@@ -625,41 +980,20 @@ class SGMCacheSystem:
             Lista de logs ordenados o None
         """
         try:
-            # Obtener todas las claves de logs
-            log_keys = self.redis_client.keys("sgm:logs:*")
+            total = self._ensure_logs_index()
             
-            if not log_keys:
+            if not total:
                 self._increment_stat("cache_misses")
                 return None
             
-            # Obtener logs con timestamp para ordenar
-            logs_with_timestamps = []
-            
-            for key in log_keys:
-                try:
-                    data = self.redis_client.get(key)
-                    if data:
-                        log_data = self._deserialize_data(data)
-                        timestamp = log_data.get('timestamp', '1970-01-01T00:00:00.000Z')
-                        logs_with_timestamps.append((timestamp, log_data))
-                except Exception as e:
-                    logger.warning(f"Error deserializando log {key}: {e}")
-                    continue
-            
-            # Ordenar por timestamp descendente (más recientes primero)
-            logs_with_timestamps.sort(key=lambda x: x[0], reverse=True)
-            
-            # Extraer solo los datos del log
-            logs = [log_data for _, log_data in logs_with_timestamps]
-            
-            # Aplicar límite si se especifica
-            if limit:
-                logs = logs[:limit]
+            end = (limit - 1) if limit else -1
+            log_keys = self.redis_client.zrevrange(LOGS_INDEX_KEY, 0, end)
+            logs = [log for log in self._mget_logs(log_keys) if log is not None]
             
             self._increment_stat("cache_hits")
             self._increment_stat("logs_retrieved")
             
-            logger.debug(f"Logs obtenidos: {len(logs)} de {len(log_keys)} claves")
+            logger.debug(f"Logs obtenidos: {len(logs)} de {total} indexados")
             return logs
                 
         except Exception as e:
@@ -669,59 +1003,59 @@ class SGMCacheSystem:
     def get_logs_filtered(self, cliente_id: int = None, periodo: str = None, 
                          tarjeta: str = None, limit: int = 100) -> List[Dict[str, Any]]:
         """
-        Obtener logs filtrados
+        Obtener logs filtrados, paginando el índice más selectivo en orden
+        descendente de timestamp
         
         Args:
             cliente_id: Filtrar por cliente (opcional)
             periodo: Filtrar por período (opcional)
             tarjeta: Filtrar por tipo de tarjeta (opcional)
-            limit: Límite de resultados
+            limit: Límite de resultados (None = sin límite)
             
         Returns:
             Lista de logs filtrados
         """
         try:
-            # Obtener todas las claves de logs
-            log_keys = self.redis_client.keys("sgm:logs:*")
-            
-            if not log_keys:
+            if not self._ensure_logs_index():
                 return []
-            
-            # Obtener logs con timestamp para ordenar
-            logs_with_timestamps = []
-            
-            for key in log_keys:
-                try:
-                    data = self.redis_client.get(key)
-                    if not data:
+
+            filtros = {'cliente': cliente_id, 'periodo': periodo, 'tarjeta': tarjeta}
+            candidatos = [
+                f"{LOGS_INDEX_KEY}:{nombre}:{valor}"
+                for nombre, valor in filtros.items() if valor
+            ] or [LOGS_INDEX_KEY]
+            if len(candidatos) > 1:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for index_key in candidatos:
+                    pipe.zcard(index_key)
+                tamaños = pipe.execute()
+                index_key = candidatos[tamaños.index(min(tamaños))]
+            else:
+                index_key = candidatos[0]
+
+            page_size = max(min(limit or LOGS_MGET_BATCH, LOGS_MGET_BATCH), 50)
+            filtered_logs = []
+            start = 0
+            while limit is None or len(filtered_logs) < limit:
+                log_keys = self.redis_client.zrevrange(index_key, start, start + page_size - 1)
+                if not log_keys:
+                    break
+                start += page_size
+                for log_data in self._mget_logs(log_keys):
+                    if log_data is None:
                         continue
-                    
-                    log_data = self._deserialize_data(data)
-                    timestamp = log_data.get('timestamp', '1970-01-01T00:00:00.000Z')
-                    
-                    # Aplicar filtros
+                    # Los índices se indexan por str; se confirma el valor exacto
                     if cliente_id and log_data.get('cliente_id') != cliente_id:
                         continue
-                    
                     if periodo and log_data.get('periodo_cierre') != periodo:
                         continue
-                    
                     if tarjeta and log_data.get('tarjeta') != tarjeta:
                         continue
-                    
-                    logs_with_timestamps.append((timestamp, log_data))
-                    
-                except Exception as e:
-                    logger.warning(f"Error procesando log {key}: {e}")
-                    continue
+                    filtered_logs.append(log_data)
+                    if limit is not None and len(filtered_logs) >= limit:
+                        break
             
-            # Ordenar por timestamp descendente (más recientes primero)
-            logs_with_timestamps.sort(key=lambda x: x[0], reverse=True)
-            
-            # Extraer solo los datos del log y aplicar límite
-            filtered_logs = [log_data for _, log_data in logs_with_timestamps[:limit]]
-            
-            logger.debug(f"Logs filtrados: {len(filtered_logs)} de {len(log_keys)} claves, filtros: cliente={cliente_id}, periodo={periodo}, tarjeta={tarjeta}")
+            logger.debug(f"Logs filtrados: {len(filtered_logs)} desde {index_key}, filtros: cliente={cliente_id}, periodo={periodo}, tarjeta={tarjeta}")
             return filtered_logs
             
         except Exception as e:
@@ -730,24 +1064,29 @@ class SGMCacheSystem:
     
     def clear_logs(self) -> bool:
         """
-        Limpiar todos los logs
+        Limpiar todos los logs y sus índices
         
         Returns:
             bool: True si se limpiaron exitosamente
         """
         try:
-            # Obtener todas las claves de logs
-            log_keys = self.redis_client.keys("sgm:logs:*")
-            
-            if log_keys:
-                deleted_count = self.redis_client.delete(*log_keys)
+            deleted_count = 0
+            for pattern in ("sgm:logs:*", f"{LOGS_INDEX_KEY}*"):
+                batch = []
+                for key in self.redis_client.scan_iter(match=pattern, count=1000):
+                    batch.append(key)
+                    if len(batch) >= LOGS_MGET_BATCH:
+                        deleted_count += self.redis_client.delete(*batch)
+                        batch = []
+                if batch:
+                    deleted_count += self.redis_client.delete(*batch)
+            
+            if deleted_count:
                 self._increment_stat("logs_cleared")
-                
                 logger.info(f"Logs limpiados: {deleted_count} claves eliminadas")
-                return True
             else:
                 logger.info("No hay logs para limpiar")
-                return True
+            return True
             
         except Exception as e:
             logger.error(f"Error limpiando logs: {e}")
@@ -755,90 +1094,65 @@ class SGMCacheSystem:
     
     def get_logs_stats(self) -> Dict[str, Any]:
         """
-        Obtener estadísticas de los logs usando operaciones eficientes de Redis
+        Obtener estadísticas de los logs usando el índice ordenado
         
         Returns:
             Dict con estadísticas de logs
         """
         try:
-            # Obtener todas las claves de logs
-            log_keys = self.redis_client.keys("sgm:logs:*")
+            total = self._ensure_logs_index()
             
             # Estadísticas básicas
             stats = {
-                'total_logs': len(log_keys),
+                'total_logs': total,
                 'oldest_log': None,
                 'newest_log': None,
                 'logs_by_cliente': {},
                 'logs_by_tarjeta': {},
                 'logs_by_accion': {},
                 'logs_by_resultado': {},
-                'sample_keys': log_keys[:5] if log_keys else []  # Muestra de claves
+                'sample_keys': self.redis_client.zrevrange(LOGS_INDEX_KEY, 0, 4) if total else []  # Muestra de claves
             }
             
-            if not log_keys:
+            if not total:
                 return stats
             
-            # Ordenar claves para obtener el más antiguo y más nuevo
-            log_keys.sort()
-            
-            # Extraer timestamp del más antiguo y más nuevo
-            if log_keys:
-                # Para obtener timestamps, necesitamos revisar el contenido de las claves
-                # Obtener una muestra pequeña para no afectar performance
-                sample_size = min(10, len(log_keys))
-                sample_keys = log_keys[:sample_size] + log_keys[-sample_size:] if len(log_keys) > sample_size else log_keys
+            # Extremos del índice (los scores son timestamps)
+            oldest = self.redis_client.zrange(LOGS_INDEX_KEY, 0, 0)
+            newest = self.redis_client.zrevrange(LOGS_INDEX_KEY, 0, 0)
+            extremos = self._mget_logs(oldest + newest)
+            if extremos[0]:
+                stats['oldest_log'] = extremos[0].get('timestamp')
+            if extremos[-1]:
+                stats['newest_log'] = extremos[-1].get('timestamp')
+            
+            # Para estadísticas detalladas, procesar los 1000 logs más recientes
+            sample_size = min(1000, total)
+            sample_keys = self.redis_client.zrevrange(LOGS_INDEX_KEY, 0, sample_size - 1)
+            
+            for log_data in self._mget_logs(sample_keys):
+                if log_data is None:
+                    continue
                 
-                timestamps = []
-                for key in sample_keys:
-                    try:
-                        data = self.redis_client.get(key)
-                        if data:
-                            log_data = self._deserialize_data(data)
-                            timestamps.append(log_data.get('timestamp', '1970-01-01T00:00:00.000Z'))
-                    except Exception:
-                        continue
+                # Contadores por categoría
+                cliente_id = log_data.get('cliente_id')
+                if cliente_id:
+                    stats['logs_by_cliente'][str(cliente_id)] = stats['logs_by_cliente'].get(str(cliente_id), 0) + 1
                 
-                if timestamps:
-                    timestamps.sort()
-                    stats['oldest_log'] = timestamps[0]
-                    stats['newest_log'] = timestamps[-1]
-            
-            # Para estadísticas detalladas, procesar una muestra o todos si son pocos
-            sample_size = min(1000, len(log_keys))  # Limitar a 1000 para performance
-            sample_keys = log_keys[-sample_size:] if sample_size < len(log_keys) else log_keys
-            
-            for key in sample_keys:
-                try:
-                    data = self.redis_client.get(key)
-                    if not data:
-                        continue
-                    
-                    log_data = self._deserialize_data(data)
-                    
-                    # Contadores por categoría
-                    cliente_id = log_data.get('cliente_id')
-                    if cliente_id:
-                        stats['logs_by_cliente'][str(cliente_id)] = stats['logs_by_cliente'].get(str(cliente_id), 0) + 1
-                    
-                    tarjeta = log_data.get('tarjeta')
-                    if tarjeta:
-                        stats['logs_by_tarjeta'][tarjeta] = stats['logs_by_tarjeta'].get(tarjeta, 0) + 1
-                    
-                    accion = log_data.get('accion')
-                    if accion:
-                        stats['logs_by_accion'][accion] = stats['logs_by_accion'].get(accion, 0) + 1
-                    
-                    resultado = log_data.get('resultado', 'exito')
-                    stats['logs_by_resultado'][resultado] = stats['logs_by_resultado'].get(resultado, 0) + 1
-                    
-                except Exception as e:
-                    logger.warning(f"Error procesando estadísticas de log {key}: {e}")
-                    continue
+                tarjeta = log_data.get('tarjeta')
+                if tarjeta:
+                    stats['logs_by_tarjeta'][tarjeta] = stats['logs_by_tarjeta'].get(tarjeta, 0) + 1
+                
+                accion = log_data.get('accion')
+                if accion:
+                    stats['logs_by_accion'][accion] = stats['logs_by_accion'].get(accion, 0) + 1
+                
+                resultado = log_data.get('resultado', 'exito')
+                stats['logs_by_resultado'][resultado] = stats['logs_by_resultado'].get(resultado, 0) + 1
             
             # Indicar si es una muestra
-            if sample_size < len(log_keys):
-                stats['_note'] = f"Estadísticas basadas en muestra de {sample_size} logs de {len(log_keys)} totales"
+            if sample_size < total:
+                stats['_note'] = f"Estadísticas basadas en muestra de {sample_size} logs de {total} totales"
             
             return stats
             
@@ -848,14 +1162,13 @@ class SGMCacheSystem:
     
     def get_logs_count(self) -> int:
         """
-        Obtener el número total de logs de forma eficiente
+        Obtener el número total de logs de forma eficiente (ZCARD del índice)
         
         Returns:
             int: Número total de logs
         """
         try:
-            log_keys = self.redis_client.keys("sgm:logs:*")
-            return len(log_keys)
+            return self._ensure_logs_index()
         except Exception as e:
             logger.error(f"Error contando logs: {e}")
             return 0
@@ -896,7 +1209,7 @@ class SGMCacheSystem:
             }
             
             serialized_data = self._serialize_data(prueba_data)
-            self.redis_client.setex(key, ttl, serialized_data)
+            self._set_registrado(key, ttl, serialized_data, cliente_id, periodo)
             
             self._increment_stat("cache_writes")
             self._increment_stat("pruebas_cached")
@@ -924,7 +1237,7 @@ class SGMCacheSystem:
         key = self._get_key(cliente_id, periodo, f"pruebas:esf:{test_type}")
         
         try:
-            data = self.redis_client.get(key)
+            data = self.redis_bin.get(key)
             if data:
                 esf_prueba = self._deserialize_data(data)
                 self._increment_stat("cache_hits")
@@ -978,7 +1291,7 @@ class SGMCacheSystem:
             }
             
             serialized_data = self._serialize_data(prueba_data)
-            self.redis_client.setex(key, ttl, serialized_data)
+            self._set_registrado(key, ttl, serialized_data, cliente_id, periodo)
             
             self._increment_stat("cache_writes")
             self._increment_stat("pruebas_cached")
@@ -1008,7 +1321,7 @@ class SGMCacheSystem:
         key = self._get_key(cliente_id, periodo, f"pruebas:{data_type}:{test_type}")
         
         try:
-            data = self.redis_client.get(key)
+            data = self.redis_bin.get(key)
             if data:
                 prueba_data = self._deserialize_data(data)
                 self._increment_stat("cache_hits")
@@ -1038,12 +1351,7 @@ class SGMCacheSystem:
             Lista de pruebas disponibles con metadata
         """
         try:
-            if periodo:
-                pattern = f"sgm:contabilidad:{cliente_id}:{periodo}:pruebas:*"
-            else:
-                pattern = f"sgm:contabilidad:{cliente_id}:*:pruebas:*"
-            
-            keys = self.redis_client.keys(pattern)
+            keys = [k for k in self.get_client_keys(cliente_id, periodo) if ':pruebas:' in k]
             pruebas = []
             
             for key in keys:
@@ -1077,15 +1385,10 @@ class SGMCacheSystem:
             int: Número de claves eliminadas
         """
         try:
-            if periodo:
-                pattern = f"sgm:contabilidad:{cliente_id}:{periodo}:pruebas:*"
-            else:
-                pattern = f"sgm:contabilidad:{cliente_id}:*:pruebas:*"
-            
-            keys = self.redis_client.keys(pattern)
+            keys = [k for k in self.get_client_keys(cliente_id, periodo) if ':pruebas:' in k]
             
             if keys:
-                deleted_count = self.redis_client.delete(*keys)
+                deleted_count = self._delete_registradas(cliente_id, keys)
                 self._increment_stat("cache_invalidations")
                 self._increment_stat("pruebas_invalidated")
                 
@@ -1109,17 +1412,17 @@ class SGMCacheSystem:
         Returns:
             int: Número de claves eliminadas
         """
-        pattern = f"sgm:contabilidad:{cliente_id}:{periodo}:*"
-        
         try:
-            keys = self.redis_client.keys(pattern)
+            keys = self.get_client_keys(cliente_id, periodo)
             
             if keys:
-                deleted_count = self.redis_client.delete(*keys)
+                deleted_count = self._delete_registradas(cliente_id, keys)
+                self._forget_periodo(cliente_id, periodo)
                 self._increment_stat("cache_invalidations")
                 
                 logger.info(f"Cache invalidado: cliente={cliente_id}, periodo={periodo}, claves_eliminadas={deleted_count}")
                 return deleted_count
+            self._forget_periodo(cliente_id, periodo)
             return 0
             
         except Exception as e:
@@ -1136,18 +1439,28 @@ class SGMCacheSystem:
         Returns:
             int: Número de claves eliminadas
         """
-        pattern = f"sgm:contabilidad:{cliente_id}:*"
-        
         try:
-            keys = self.redis_client.keys(pattern)
-            
-            if keys:
-                deleted_count = self.redis_client.delete(*keys)
+            keys = self.get_client_keys(cliente_id)
+            
+            deleted_count = self.redis_client.delete(*keys) if keys else 0
+            
+            # Limpiar el registro completo del cliente
+            periodos = self.redis_client.smembers(self._registry_cliente_key(cliente_id))
+            pipe = self.redis_client.pipeline()
+            for periodo in periodos:
+                pipe.delete(self._registry_periodo_key(cliente_id, periodo))
+            pipe.delete(self._registry_cliente_key(cliente_id))
+            pipe.srem(f"{REGISTRY_PREFIX}:clientes", cliente_id)
+            prefijo = self._get_key(cliente_id, '', '')[:-1]
+            self._publicar_invalidacion(prefijos=[prefijo], pipe=pipe)
+            pipe.execute()
+            self._invalidar_local(prefijos=[prefijo])
+            
+            if deleted_count:
                 self._increment_stat("cache_invalidations")
                 
                 logger.info(f"Cache completo invalidado: cliente={cliente_id}, claves_eliminadas={deleted_count}")
-                return deleted_count
-            return 0
+            return deleted_count
             
         except Exception as e:
             logger.error(f"Error invalidando cache completo: {e}")
@@ -1185,8 +1498,13 @@ class SGMCacheSystem:
                 'pruebas_esf_retrieved': int(self.redis_client.get('sgm:stats:pruebas_esf_retrieved') or 0),
             }
             
-            # Contadores de claves por tipo
-            contabilidad_keys = self.redis_client.keys('sgm:contabilidad:*')
+            # Contadores de claves por tipo (desde el registro de cada cliente)
+            contabilidad_keys = []
+            if self._registro_disponible():
+                for cliente_id in self.redis_client.smembers(f"{REGISTRY_PREFIX}:clientes"):
+                    contabilidad_keys.extend(self.get_client_keys(cliente_id))
+            else:
+                contabilidad_keys = list(self.redis_client.scan_iter(match='sgm:contabilidad:*', count=SCAN_COUNT))
             key_counts = {
                 'total_keys': len(contabilidad_keys),
                 'kpis_keys': len([k for k in contabilidad_keys if ':kpis' in k]),
@@ -1216,6 +1534,8 @@ class SGMCacheSystem:
                 **key_counts,
                 **memory_stats,
                 'hit_rate_percent': hit_rate,
+                'serializer': self.get_serializer_stats(),
+                'local_tier': self._local_cache.stats() if self._local_cache else None,
                 'last_updated': datetime.now().isoformat(),
                 'db_index': 1,
                 'cache_system_version': '1.0.0'
@@ -1236,8 +1556,7 @@ class SGMCacheSystem:
             Lista de períodos disponibles en cache
         """
         try:
-            pattern = f"sgm:contabilidad:{cliente_id}:*"
-            keys = self.redis_client.keys(pattern)
+            keys = self.get_client_keys(cliente_id)
             
             # Extraer períodos únicos
             periods = set()
@@ -1464,11 +1783,9 @@ class SGMCacheSystem:
         """
         try:
             # Obtener todas las claves ESF y ERI del cliente
-            pattern_esf = f"sgm:contabilidad:{cliente_id}:*:esf"
-            pattern_eri = f"sgm:contabilidad:{cliente_id}:*:eri"
-            
-            claves_esf = self.redis_client.keys(pattern_esf)
-            claves_eri = self.redis_client.keys(pattern_eri)
+            claves = self.get_client_keys(cliente_id)
+            claves_esf = [k for k in claves if k.endswith(':esf')]
+            claves_eri = [k for k in claves if k.endswith(':eri')]
             
             # Extraer períodos de las claves
             periodos_esf = set()
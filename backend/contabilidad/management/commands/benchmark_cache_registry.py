@@ -0,0 +1,127 @@
+# backend/contabilidad/management/commands/benchmark_cache_registry.py
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la latencia de listar/invalidar claves de un cliente con el registro '
+        'de claves vs KEYS y SCAN, con el keyspace poblado con N claves sintéticas'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sistema',
+            choices=['contabilidad', 'nomina'],
+            default='contabilidad',
+            help='Sistema de cache a medir (default: contabilidad)'
+        )
+        parser.add_argument(
+            '--keys',
+            type=int,
+            default=1_000_000,
+            help='Número de claves sintéticas a crear (default: 1000000)'
+        )
+        parser.add_argument(
+            '--clientes',
+            type=int,
+            default=1000,
+            help='Clientes sintéticos entre los que repartir las claves (default: 1000)'
+        )
+        parser.add_argument(
+            '--periodos',
+            type=int,
+            default=12,
+            help='Períodos por cliente (default: 12)'
+        )
+        parser.add_argument(
+            '--cliente-base',
+            type=int,
+            default=900000,
+            help='ID del primer cliente sintético, fuera del rango real (default: 900000)'
+        )
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=5,
+            help='Repeticiones por medición; se reporta la mediana (default: 5)'
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='No eliminar las claves sintéticas al terminar'
+        )
+
+    def handle(self, *args, **options):
+        if options['sistema'] == 'nomina':
+            from nomina.cache_redis import get_cache_system_nomina
+            cache = get_cache_system_nomina()
+        else:
+            from contabilidad.cache_redis import get_cache_system
+            cache = get_cache_system()
+
+        clientes = [options['cliente_base'] + i for i in range(options['clientes'])]
+        periodos = [f"2000-{m:02d}" for m in range(1, options['periodos'] + 1)]
+        por_periodo = max(1, options['keys'] // (len(clientes) * len(periodos)))
+        repeticiones = options['repeticiones']
+
+        # Inicializar el registro antes de poblar (evita reconstruirlo sobre las claves sintéticas)
+        cache._registro_disponible()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Poblando {len(clientes) * len(periodos) * por_periodo} claves en {options['sistema']}..."
+        ))
+        inicio = time.perf_counter()
+        for cliente_id in clientes:
+            pipe = cache.redis_client.pipeline(transaction=False)
+            for periodo in periodos:
+                self._poblar_periodo(cache, pipe, cliente_id, periodo, por_periodo)
+            pipe.execute()
+        self.stdout.write(f"Poblado en {time.perf_counter() - inicio:.1f}s")
+
+        cliente_id, periodo = clientes[len(clientes) // 2], periodos[0]
+        pattern = cache._get_key(cliente_id, periodo, '*')
+
+        def medir(nombre, funcion, preparar=None):
+            tiempos = []
+            for _ in range(repeticiones):
+                if preparar:
+                    preparar()
+                t0 = time.perf_counter()
+                resultado = funcion()
+                tiempos.append((time.perf_counter() - t0) * 1000)
+            self.stdout.write(f"  {nombre:<42} {statistics.median(tiempos):>10.2f} ms   ({resultado})")
+
+        def repoblar():
+            pipe = cache.redis_client.pipeline(transaction=False)
+            self._poblar_periodo(cache, pipe, cliente_id, periodo, por_periodo)
+            pipe.execute()
+
+        def scan():
+            return len(list(cache.redis_client.scan_iter(match=pattern, count=1000)))
+
+        try:
+            self.stdout.write(f"\nCliente {cliente_id}, período {periodo} (mediana de {repeticiones}):")
+            medir('KEYS (anterior)', lambda: len(cache.redis_client.keys(pattern)))
+            medir('SCAN (fallback)', scan)
+            medir('Registro: get_client_keys(cliente, periodo)', lambda: len(cache.get_client_keys(cliente_id, periodo)))
+            medir('Registro: get_client_periods(cliente)', lambda: len(cache.get_client_periods(cliente_id)))
+            medir('Registro: invalidate_cliente_periodo', lambda: cache.invalidate_cliente_periodo(cliente_id, periodo), repoblar)
+        finally:
+            if not options['keep']:
+                self.stdout.write('\nEliminando claves sintéticas...')
+                for cliente_sintetico in clientes:
+                    cache.invalidate_cliente_all(cliente_sintetico)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completado'))
+
+    def _poblar_periodo(self, cache, pipe, cliente_id, periodo, cantidad):
+        """Escribir claves sintéticas registradas igual que _set_registrado"""
+        for i in range(cantidad):
+            key = cache._get_key(cliente_id, periodo, f"benchmark_{i}")
+            pipe.setex(key, 3600, '{}')
+            pipe.sadd(cache._registry_periodo_key(cliente_id, periodo), key)
+        pipe.sadd(cache._registry_cliente_key(cliente_id), periodo)
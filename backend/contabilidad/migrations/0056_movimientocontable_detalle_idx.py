@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contabilidad', '0055_remove_incidencia_incid_cuenta_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimientocontable',
+            index=models.Index(fields=['cierre', 'cuenta', 'fecha', 'id'], name='mov_cierre_cuenta_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contabilidad', '0056_movimientocontable_detalle_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aperturacuenta',
+            name='upload_log',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='contabilidad.uploadlog'),
+        ),
+        migrations.AddField(
+            model_name='movimientocontable',
+            name='upload_log',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='contabilidad.uploadlog'),
+        ),
+    ]
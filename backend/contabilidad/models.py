@@ -364,6 +364,10 @@ class AperturaCuenta(models.Model):
     cierre = models.ForeignKey(CierreContabilidad, on_delete=models.CASCADE)
     cuenta = models.ForeignKey(CuentaContable, on_delete=models.CASCADE)
     saldo_anterior = models.DecimalField(max_digits=20, decimal_places=2)
+    # Carga del libro mayor que insertó la fila (para revertirla si falla)
+    upload_log = models.ForeignKey(
+        "UploadLog", null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
 
 
 class MovimientoContable(models.Model):
@@ -398,6 +402,16 @@ class MovimientoContable(models.Model):
     haber = models.DecimalField(max_digits=20, decimal_places=2, default=0)
     descripcion = models.TextField(blank=True)
     flag_incompleto = models.BooleanField(default=False)
+    # Carga del libro mayor que insertó la fila (para revertirla si falla)
+    upload_log = models.ForeignKey(
+        "UploadLog", null=True, blank=True, on_delete=models.SET_NULL, related_name="+"
+    )
+
+    class Meta:
+        indexes = [
+            # Detalle paginado por cuenta: keyset sobre (fecha, id) dentro del cierre
+            models.Index(fields=["cierre", "cuenta", "fecha", "id"], name="mov_cierre_cuenta_fecha_idx"),
+        ]
 
 
 # ======================================
@@ -0,0 +1,43 @@
+# contabilidad/signals.py
+
+import logging
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import ClasificacionOption, ClasificacionSet
+
+logger = logging.getLogger(__name__)
+
+
+def _invalidar_molde_clasificacion(cliente_id):
+    """Invalida el molde de clasificación compilado del cliente al confirmar la transacción"""
+    def invalidar():
+        try:
+            from .cache_redis import get_cache_system
+            get_cache_system().invalidate_molde_clasificacion(cliente_id)
+        except Exception as e:
+            logger.warning(f"[SIGNAL] No se pudo invalidar el molde de clasificación del cliente {cliente_id}: {e}")
+
+    transaction.on_commit(invalidar)
+
+
+@receiver([post_save, post_delete], sender=ClasificacionSet)
+def invalidar_molde_por_set(sender, instance, **kwargs):
+    """
+    Crear, renombrar o eliminar un set cambia los sets resueltos de ESF/ERI/ECP y
+    los de agrupación del cliente
+    """
+    _invalidar_molde_clasificacion(instance.cliente_id)
+
+
+@receiver([post_save, post_delete], sender=ClasificacionOption)
+def invalidar_molde_por_opcion(sender, instance, **kwargs):
+    """Las opciones definen las categorías y nombres bilingües del molde"""
+    if ClasificacionOption._meta.get_field('set_clas').is_cached(instance):
+        cliente_id = instance.set_clas.cliente_id
+    else:
+        cliente_id = (
+            ClasificacionSet.objects.filter(id=instance.set_clas_id).values_list('cliente_id', flat=True).first()
+        )
+    if cliente_id is not None:
+        _invalidar_molde_clasificacion(cliente_id)
@@ -27,13 +27,21 @@ Archivos con bypasses similares:
 - /backend/contabilidad/tasks_finalizacion.py (este archivo)
 """
 
-from celery import shared_task, group
+from celery import shared_task, chord
+from celery.exceptions import Ignore
 from django.utils import timezone
 import time
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Estados financieros de la finalización: tipo → (nombre, tarea en tasks_reportes)
+REPORTES_FINALES = {
+    'esf': ('Estado de Situación Financiera', 'generar_estado_situacion_financiera'),
+    'eri': ('Estado de Resultado Integral', 'generar_estado_resultados_integral'),
+    'ecp': ('Estado de Cambios en el Patrimonio', 'generar_estado_cambios_patrimonio'),
+}
+
 
 @shared_task(bind=True, name='contabilidad.iniciar_finalizacion')
 def iniciar_finalizacion(self=None, cierre_id=None, usuario_id=None):
@@ -139,7 +147,7 @@ def iniciar_finalizacion(self=None, cierre_id=None, usuario_id=None):
                     'mensaje': 'Proceso de finalización iniciado y completado exitosamente',
                     'cierre_id': cierre_id,
                     'estado_inicial': 'en_revision',
-                    'estado_final': 'finalizado',
+                    'estado_final': resultado_finalizacion.get('estado', 'finalizado'),
                     'total_movimientos': total_movimientos,
                     'sets_clasificacion': sets_disponibles,
                     'resultado_finalizacion': resultado_finalizacion
@@ -206,18 +214,25 @@ def finalizar_cierre_y_generar_reportes(self=None, cierre_id=None, usuario_id=No
     """
     Tarea principal para finalizar un cierre contable y generar reportes.
     
+    ESF, ERI y ECP son independientes una vez que existe el snapshot de saldos del
+    cierre: se arma una vez y los tres se generan como un group de Celery. El chord
+    que los une (cerrar_finalizacion_cierre) valida el balance, calcula ratios,
+    guarda en BD/Redis y marca el cierre como finalizado. Fuera de un worker
+    (llamada directa, apply o Celery no disponible) los mismos pasos corren en serie.
+    
     Args:
         self: Contexto de Celery (puede ser None si se ejecuta sincrónicamente)
         cierre_id (int): ID del cierre a finalizar
         usuario_id (int, optional): ID del usuario que inició la finalización
         
     Returns:
-        dict: Resultado del procesamiento
+        dict: Resultado del procesamiento (en un worker, el de cerrar_finalizacion_cierre
+        bajo el mismo task_id)
     """
     from .models import CierreContabilidad
     from api.models import Usuario
     
-    inicio = timezone.now()
+    inicio = time.time()
     
     # Función auxiliar para actualizar progreso
     def actualizar_progreso(paso, total, descripcion, porcentaje):
@@ -251,61 +266,177 @@ def finalizar_cierre_y_generar_reportes(self=None, cierre_id=None, usuario_id=No
         # La validación se hace en iniciar_finalizacion() antes de cambiar a 'generando_reportes'
         print(f"🔍 Estado del cierre: {cierre.estado} (validación ya realizada)")
         
-        # Simular procesamiento (por ahora solo prints)
         print(f"🚀 INICIANDO FINALIZACIÓN DEL CIERRE")
         print(f"   Cliente: {cierre.cliente.nombre}")
         print(f"   Período: {cierre.periodo}")
         print(f"   Usuario: {usuario.correo_bdo if usuario else 'Sistema'}")
-        print(f"   Fecha inicio: {inicio}")
+        print(f"   Fecha inicio: {timezone.now()}")
         
         # =================== STEP 1: VALIDACIONES FINALES ===================
         actualizar_progreso(1, 5, 'Ejecutando validaciones finales...', 20)
         print(f"📋 STEP 1: Ejecutando validaciones finales...")
+        
+        # =================== STEP 2: SNAPSHOT DE SALDOS COMPARTIDO ===================
+        actualizar_progreso(2, 5, 'Preparando snapshot de saldos...', 40)
+        print(f"📸 STEP 2: Preparando snapshot de saldos del cierre...")
+        t0 = time.time()
+        total_cuentas = preparar_snapshot_saldos(cierre)
+        tiempos = {'snapshot': round(time.time() - t0, 3)}
+        print(f"   ✅ Snapshot listo: {total_cuentas} cuentas")
+        
+        # =================== STEP 3: ESF, ERI Y ECP EN PARALELO ===================
+        actualizar_progreso(3, 5, 'Generando reportes finales en paralelo...', 60)
+        print(f"📈 STEP 3: Generando ESF, ERI y ECP...")
+        marcas = {'inicio': inicio, 'reportes': time.time(), 'tiempos': tiempos}
+        
+        if _en_worker(self):
+            try:
+                # La tarea se reemplaza por el chord: el callback hereda su task_id, así
+                # que progreso_tarea sigue en PROGRESS hasta que el cierre queda finalizado
+                logger.info(f"🔗 Iniciando chord de reportes finales para cierre {cierre_id}")
+                self.replace(chord(
+                    [generar_reporte_financiero.s(cierre_id, tipo, usuario_id) for tipo in REPORTES_FINALES],
+                    cerrar_finalizacion_cierre.s(cierre_id, usuario_id, marcas)
+                ))
+            except Ignore:
+                raise
+            except Exception as e:
+                print(f"   ⚠️ Celery paralelo falló ({str(e)}), ejecutando secuencialmente...")
+        
+        resultados = [generar_reporte_financiero(cierre_id, tipo, usuario_id) for tipo in REPORTES_FINALES]
+        return cerrar_finalizacion_cierre(resultados, cierre_id, usuario_id, marcas)
+        
+    except Ignore:
+        raise
+    except Exception as e:
+        logger.error(f"[FINALIZACIÓN] Error en cierre {cierre_id}: {str(e)}")
+        print(f"❌ ERROR EN FINALIZACIÓN: {str(e)}")
+        _revertir_finalizacion(
+            cierre_id, usuario_id, e,
+            getattr(self, 'request', {}).get('id') if self else 'sync'
+        )
+        
+        return {
+            'success': False,
+            'error': str(e),
+            'cierre_id': cierre_id
+        }
 
 
+@shared_task(name='contabilidad.generar_reporte_financiero')
+def generar_reporte_financiero(cierre_id, tipo, usuario_id=None):
+    """
+    Genera uno de los estados financieros de la finalización (REPORTES_FINALES) y
+    devuelve su resumen con la duración en segundos. Nunca lanza excepción: un
+    error queda en el resumen para que el chord de finalización siempre se ejecute.
+    
+    Args:
+        cierre_id (int): ID del cierre
+        tipo (str): 'esf', 'eri' o 'ecp'
+        usuario_id (int, optional): ID del usuario, para registrar el reporte
         
-        # =================== STEP 2: PROCESAMIENTO PARALELO ===================
-        # Estos pasos pueden ejecutarse en paralelo ya que no dependen entre sí
-        #actualizar_progreso(2, 5, 'Ejecutando cálculos en paralelo...', 40)
-        #print(f"🔄 STEP 2: Ejecutando tareas en paralelo...")
-        
-       # try:
-        #    # Intentar ejecución paralela con Celery
-         #   job = group([
-          #      ejecutar_calculos_contables.s(cierre_id, usuario_id),
-           # ])
-            #resultados_paralelos = job.apply_async().get(timeout=300)  # 5 min timeout
-            #resultado_calculos = resultados_paralelos[0]  # Solo hay 1 resultado ahora
-            #print(f"   ✅ Ejecución paralela completada")
-        #except Exception as e:
-            # Fallback a ejecución secuencial
-          #  print(f"   ⚠️ Celery paralelo falló ({str(e)}), ejecutando secuencialmente...")
-          #  resultado_calculos = ejecutar_calculos_contables(cierre_id, usuario_id)
-        
-      #  print(f"   ✅ Cálculos completados: {resultado_calculos['total_cuentas']} cuentas procesadas")
-        
-        # =================== STEP 3: GENERACIÓN DE REPORTES ===================
-        actualizar_progreso(4, 5, 'Generando reportes finales...', 80)
-        print(f"📈 STEP 3: Generando reportes finales...")
-        resultado_reportes = generar_reportes_finales(cierre_id, usuario_id)
-        print(f"   ✅ Reportes generados: {len(resultado_reportes['reportes'])} archivos")
+    Returns:
+        dict: Resumen del reporte (nombre, tipo, estado, segundos, ...)
+    """
+    from . import tasks_reportes
+    
+    nombre, tarea = REPORTES_FINALES[tipo]
+    t0 = time.time()
+    print(f"   📋 Generando {nombre}...")
+    try:
+        # IMPORTANTE: Pasar usuario_id para que el reporte quede registrado correctamente
+        resultado = getattr(tasks_reportes, tarea).apply(args=[cierre_id, usuario_id], throw=True).result
+        if resultado.get('success'):
+            metadata = resultado.get('metadata') or {}
+            print(f"   ✅ {nombre} generado exitosamente")
+            return {
+                'nombre': nombre,
+                'tipo': tipo,
+                'formato': 'JSON',
+                'estado': 'generado',
+                'reporte_id': resultado.get('reporte_id'),
+                'total_cuentas': resultado.get('total_cuentas', metadata.get('total_cuentas')),
+                'tiempo_generacion': resultado.get('tiempo_generacion', metadata.get('tiempo_generacion')),
+                'segundos': round(time.time() - t0, 3)
+            }
+        print(f"   ❌ Error generando {nombre}: {resultado.get('error')}")
+        error = resultado.get('error')
+    except Exception as e:
+        print(f"   ❌ Excepción generando {nombre}: {str(e)}")
+        error = str(e)
+    return {
+        'nombre': nombre,
+        'tipo': tipo,
+        'estado': 'error',
+        'error': error,
+        'segundos': round(time.time() - t0, 3)
+    }
+
+
+@shared_task(bind=True, name='contabilidad.cerrar_finalizacion_cierre')
+def cerrar_finalizacion_cierre(self, resultados, cierre_id, usuario_id=None, marcas=None):
+    """
+    Cierre del chord de finalización: con ESF, ERI y ECP ya generados, valida el
+    balance, calcula ratios, guarda en BD y Redis (sobre el mismo snapshot de
+    saldos) y marca el cierre como finalizado, registrando los tiempos por etapa.
+    
+    Args:
+        resultados (list): Resúmenes de generar_reporte_financiero
+        cierre_id (int): ID del cierre
+        usuario_id (int, optional): ID del usuario que inició la finalización
+        marcas (dict): 'inicio' y 'reportes' (epoch) y 'tiempos' de etapas previas
+        
+    Returns:
+        dict: Resultado de la finalización
+    """
+    from .models import CierreContabilidad, TarjetaActivityLog
+    
+    marcas = marcas or {}
+    ahora = time.time()
+    tiempos = dict(marcas.get('tiempos') or {})
+    tiempos.update({r['tipo']: r.get('segundos') for r in resultados})
+    if marcas.get('reportes'):
+        tiempos['reportes'] = round(ahora - marcas['reportes'], 3)
+    
+    try:
+        cierre = CierreContabilidad.objects.get(id=cierre_id)
+        resultado_reportes = _resumir_reportes_finales(resultados)
+        print(f"   ✅ Reportes generados: {resultado_reportes['reportes_exitosos']}/{resultado_reportes['total_reportes']}")
+        
+        # =================== STEP 4: BALANCE, RATIOS Y GUARDADO ===================
+        if _en_worker(self):
+            # Corre con el task_id de finalizar_cierre_y_generar_reportes (self.replace)
+            self.update_state(state='PROGRESS', meta={
+                'paso_actual': 4,
+                'total_pasos': 5,
+                'descripcion': 'Validando balance y guardando reportes...',
+                'porcentaje': 80,
+                'cierre_id': cierre_id
+            })
+        print(f"🧮 STEP 4: Validando balance, calculando ratios y guardando en BD/Redis...")
+        t0 = time.time()
+        try:
+            # Los estados financieros ya quedaron en Redis: aquí solo KPIs
+            resultado_calculos = ejecutar_calculos_contables(cierre_id, usuario_id, incluir_estados_redis=False)
+        except Exception as e:
+            resultado_calculos = {'error': str(e)}
+        tiempos['calculos'] = round(time.time() - t0, 3)
         
         # =================== STEP 5: FINALIZACIÓN ===================
-        actualizar_progreso(5, 5, 'Finalizando proceso...', 100)
         print(f"🏁 STEP 5: Marcando cierre como finalizado...")
         cierre.marcar_como_finalizado()
         
-        fin = timezone.now()
-        duracion = (fin - inicio).total_seconds()
+        duracion = round(time.time() - marcas['inicio'], 3) if marcas.get('inicio') else tiempos['calculos']
+        tiempos['total'] = duracion
         
         print(f"✅ FINALIZACIÓN COMPLETADA EXITOSAMENTE")
         print(f"   Duración total: {duracion:.2f} segundos")
         print(f"   Estado final: {cierre.estado}")
         print(f"   Fecha finalización: {cierre.fecha_finalizacion}")
+        logger.info(f"⏱️ Finalización cierre {cierre_id} - tiempos por etapa: {tiempos}")
         
         # Crear log de actividad
         try:
-            from .models import TarjetaActivityLog
             TarjetaActivityLog.objects.create(
                 cierre=cierre,
                 tarjeta='revision',
@@ -314,7 +445,9 @@ def finalizar_cierre_y_generar_reportes(self=None, cierre_id=None, usuario_id=No
                 descripcion=f'Cierre finalizado y reportes generados exitosamente',
                 detalles={
                     'duracion_segundos': duracion,
-                    'reportes': resultado_reportes
+                    'tiempos': tiempos,
+                    'reportes': resultado_reportes,
+                    'calculos': resultado_calculos
                 },
                 resultado='exito'
             )
@@ -325,58 +458,102 @@ def finalizar_cierre_y_generar_reportes(self=None, cierre_id=None, usuario_id=No
             'success': True,
             'mensaje': 'Cierre finalizado exitosamente',
             'cierre_id': cierre_id,
+            'estado': cierre.estado,
             'duracion_segundos': duracion,
+            'tiempos': tiempos,
             'resultados': {
-                'reportes': resultado_reportes
+                'reportes': resultado_reportes,
+                'calculos': resultado_calculos
             }
         }
         
     except Exception as e:
-        logger.error(f"[FINALIZACIÓN] Error en cierre {cierre_id}: {str(e)}")
+        logger.error(f"[FINALIZACIÓN] Error cerrando finalización del cierre {cierre_id}: {str(e)}")
         print(f"❌ ERROR EN FINALIZACIÓN: {str(e)}")
-        
-        # Revertir estado si es necesario
-        try:
-            cierre = CierreContabilidad.objects.get(id=cierre_id)
-            if cierre.estado == 'generando_reportes':
-                cierre.estado = 'sin_incidencias'
-                cierre.save(update_fields=['estado'])
-                print(f"🔄 Estado revertido a 'sin_incidencias'")
-        except:
-            pass
-        
-        # Crear log de error
-        try:
-            from .models import TarjetaActivityLog
-            TarjetaActivityLog.objects.create(
-                cierre_id=cierre_id,
-                tarjeta='revision',
-                accion='process_complete',
-                usuario_id=usuario_id,
-                descripcion=f'Error en finalización del cierre: {str(e)}',
-                detalles={'error': str(e), 'task_id': getattr(self, 'request', {}).get('id') if self else 'sync'},
-                resultado='error'
-            )
-        except:
-            pass
-        
+        _revertir_finalizacion(cierre_id, usuario_id, e, 'chord')
         return {
             'success': False,
             'error': str(e),
-            'cierre_id': cierre_id
+            'cierre_id': cierre_id,
+            'tiempos': tiempos
         }
 
 
+def preparar_snapshot_saldos(cierre):
+    """
+    Arma (o reutiliza) el snapshot de saldos del cierre antes de repartir ESF, ERI y
+    ECP, para que los tres y los cálculos de finalización lo lean de cache.
+    
+    Returns:
+        int: Cantidad de cuentas del snapshot
+    """
+    from .tasks_reportes import _cache_snapshot, obtener_snapshot_cuentas
+    
+    return len(obtener_snapshot_cuentas(cierre, _cache_snapshot())['cuentas'])
+
+
+def _en_worker(tarea):
+    """True si la tarea corre en un worker (no llamada directa, apply ni modo eager)"""
+    request = getattr(tarea, 'request', None)
+    if request is None:
+        return False
+    return not getattr(request, 'called_directly', True) and not getattr(request, 'is_eager', False)
+
+
+def _revertir_finalizacion(cierre_id, usuario_id, error, task_id):
+    """Devuelve el cierre a 'sin_incidencias' y registra el error de finalización"""
+    from .models import CierreContabilidad, TarjetaActivityLog
+    
+    # Revertir estado si es necesario
+    try:
+        cierre = CierreContabilidad.objects.get(id=cierre_id)
+        if cierre.estado == 'generando_reportes':
+            cierre.estado = 'sin_incidencias'
+            cierre.save(update_fields=['estado'])
+            print(f"🔄 Estado revertido a 'sin_incidencias'")
+    except:
+        pass
+    
+    # Crear log de error
+    try:
+        TarjetaActivityLog.objects.create(
+            cierre_id=cierre_id,
+            tarjeta='revision',
+            accion='process_complete',
+            usuario_id=usuario_id,
+            descripcion=f'Error en finalización del cierre: {str(error)}',
+            detalles={'error': str(error), 'task_id': task_id},
+            resultado='error'
+        )
+    except:
+        pass
+
+
+def _resumir_reportes_finales(resultados):
+    """Totales de los resúmenes de generar_reporte_financiero"""
+    reportes_exitosos = sum(1 for r in resultados if r.get('estado') == 'generado')
+    total_reportes = len(resultados)
+    
+    print(f"   📊 Resumen: {reportes_exitosos}/{total_reportes} reportes generados exitosamente")
+    
+    return {
+        'reportes': resultados,
+        'total_reportes': total_reportes,
+        'reportes_exitosos': reportes_exitosos,
+        'reportes_fallidos': total_reportes - reportes_exitosos,
+        'reportes_financieros_generados': reportes_exitosos 
+    }
 
 
 @shared_task(name='contabilidad.ejecutar_calculos_contables')
-def ejecutar_calculos_contables(cierre_id, usuario_id=None):
+def ejecutar_calculos_contables(cierre_id, usuario_id=None, incluir_estados_redis=True):
     """
     Ejecuta cálculos contables reales y los guarda en BD y Redis.
     
     Args:
         cierre_id (int): ID del cierre
         usuario_id (int, optional): ID del usuario que ejecuta la finalización
+        incluir_estados_redis (bool): Si False, en Redis solo se guardan los KPIs
         
     Returns:
         dict: Resultado de los cálculos
@@ -421,7 +598,10 @@ def ejecutar_calculos_contables(cierre_id, usuario_id=None):
         
         # =================== GUARDAR EN REDIS ===================
         print(f"   ⚡ Guardando en Redis cache...")
-        guardar_datos_en_redis(cierre, balance_general_esf, estado_resultados, ratios, cuentas_saldos)
+        guardar_datos_en_redis(
+            cierre, balance_general_esf, estado_resultados, ratios, cuentas_saldos,
+            incluir_estados=incluir_estados_redis
+        )
         print(f"   ✅ Datos cacheados en Redis para Streamlit")
         
         return {
@@ -445,7 +625,8 @@ def ejecutar_calculos_contables(cierre_id, usuario_id=None):
 @shared_task(name='contabilidad.generar_reportes_finales')
 def generar_reportes_finales(cierre_id, usuario_id=None):
     """
-    Genera los reportes finales del cierre.
+    Genera los reportes finales del cierre en serie (ESF, ERI y ECP). La
+    finalización los genera en paralelo con finalizar_cierre_y_generar_reportes.
     
     Args:
         cierre_id (int): ID del cierre
@@ -453,135 +634,9 @@ def generar_reportes_finales(cierre_id, usuario_id=None):
     Returns:
         dict: Resultado de la generación de reportes
     """
-    from .tasks_reportes import generar_estado_situacion_financiera
-    
-    reportes_generados = []
-    reportes_exitosos = 0
-    reportes_fallidos = 0
-    
-    # 1. Generar Estado de Situación Financiera
-    print(f"   📋 Generando Estado de Situación Financiera...")
-    try:
-        # Ejecutar la tarea de forma síncrona dentro de esta tarea
-        # IMPORTANTE: Pasar usuario_id para que el reporte quede registrado correctamente
-        resultado_esf = generar_estado_situacion_financiera.apply(args=[cierre_id, usuario_id]).result
-        if resultado_esf.get('success'):
-            reportes_generados.append({
-                'nombre': 'Estado de Situación Financiera',
-                'tipo': 'esf',
-                'formato': 'JSON',
-                'estado': 'generado',
-                'reporte_id': resultado_esf.get('reporte_id'),
-                'total_cuentas': resultado_esf.get('total_cuentas'),
-                'tiempo_generacion': resultado_esf.get('tiempo_generacion')
-            })
-            reportes_exitosos += 1
-            print(f"   ✅ Estado de Situación Financiera generado exitosamente")
-        else:
-            reportes_generados.append({
-                'nombre': 'Estado de Situación Financiera',
-                'tipo': 'esf',
-                'estado': 'error',
-                'error': resultado_esf.get('error')
-            })
-            reportes_fallidos += 1
-            print(f"   ❌ Error generando Estado de Situación Financiera: {resultado_esf.get('error')}")
-    except Exception as e:
-        print(f"   ❌ Excepción generando Estado de Situación Financiera: {str(e)}")
-        reportes_generados.append({
-            'nombre': 'Estado de Situación Financiera',
-            'tipo': 'esf',
-            'estado': 'error',
-            'error': str(e)
-        })
-        reportes_fallidos += 1
-    
-    # 2. Generar Estado de Resultado Integral
-    print(f"   📋 Generando Estado de Resultado Integral...")
-    try:
-        # Ejecutar la tarea de forma síncrona dentro de esta tarea
-        # IMPORTANTE: Pasar usuario_id para que el reporte quede registrado correctamente
-        from .tasks_reportes import generar_estado_resultados_integral
-        resultado_eri = generar_estado_resultados_integral.apply(args=[cierre_id, usuario_id]).result
-        if resultado_eri.get('success'):
-            reportes_generados.append({
-                'nombre': 'Estado de Resultado Integral',
-                'tipo': 'eri',
-                'formato': 'JSON',
-                'estado': 'generado',
-                'reporte_id': resultado_eri.get('reporte_id'),
-                'total_cuentas': resultado_eri.get('total_cuentas'),
-                'tiempo_generacion': resultado_eri.get('tiempo_generacion')
-            })
-            reportes_exitosos += 1
-            print(f"   ✅ Estado de Resultado Integral generado exitosamente")
-        else:
-            reportes_generados.append({
-                'nombre': 'Estado de Resultado Integral',
-                'tipo': 'eri',
-                'estado': 'error',
-                'error': resultado_eri.get('error')
-            })
-            reportes_fallidos += 1
-            print(f"   ❌ Error generando Estado de Resultado Integral: {resultado_eri.get('error')}")
-    except Exception as e:
-        print(f"   ❌ Excepción generando Estado de Resultado Integral: {str(e)}")
-        reportes_generados.append({
-            'nombre': 'Estado de Resultado Integral',
-            'tipo': 'eri',
-            'estado': 'error',
-            'error': str(e)
-        })
-        reportes_fallidos += 1
-    
-    # 3. TODO: Generar Estado de Cambios en el Patrimonio
-    try:
-        from .tasks_reportes import generar_estado_cambios_patrimonio
-        resultado_ecp = generar_estado_cambios_patrimonio.apply(args=[cierre_id, usuario_id]).result
-        if resultado_ecp.get('success'):
-            reportes_generados.append({
-                'nombre': 'Estado de Cambios en el Patrimonio',
-                'tipo': 'ecp',
-                'formato': 'JSON',
-                'estado': 'generado',
-                'reporte_id': resultado_ecp.get('reporte_id'),
-                'total_cuentas': resultado_ecp.get('total_cuentas'),
-                'tiempo_generacion': resultado_ecp.get('tiempo_generacion')
-            })
-            reportes_exitosos += 1
-            print(f"   ✅ Estado de Cambios en el Patrimonio generado exitosamente")
-        else:
-            reportes_generados.append({
-                'nombre': 'Estado de Cambios en el Patrimonio',
-                'tipo': 'ecp',
-                'estado': 'error',
-                'error': resultado_ecp.get('error')
-            })
-            reportes_fallidos += 1
-            print(f"   ❌ Error generando Estado de Cambios en el Patrimonio: {resultado_ecp.get('error')}")
-    except Exception as e:
-        print(f"   ❌ Excepción generando Estado de Cambios en el Patrimonio: {str(e)}")
-        reportes_generados.append({
-            'nombre': 'Estado de Cambios en el Patrimonio',
-            'tipo': 'ecp',
-            'estado': 'error',
-            'error': str(e)
-        })
-        reportes_fallidos += 1
-    
-    
-    
-    total_reportes = len(reportes_generados)
-    
-    print(f"   📊 Resumen: {reportes_exitosos}/{total_reportes} reportes generados exitosamente")
-    
-    return {
-        'reportes': reportes_generados,
-        'total_reportes': total_reportes,
-        'reportes_exitosos': reportes_exitosos,
-        'reportes_fallidos': reportes_fallidos,
-        'reportes_financieros_generados': reportes_exitosos 
-    }
+    return _resumir_reportes_finales([
+        generar_reporte_financiero(cierre_id, tipo, usuario_id) for tipo in REPORTES_FINALES
+    ])
 
 
 @shared_task(name='contabilidad.notificar_finalizacion')
@@ -611,93 +666,116 @@ def notificar_finalizacion(cierre_id, usuario_id):
 #                           FUNCIONES AUXILIARES DE CÁLCULO
 # ===============================================================================
 
+def calcular_balance_comprobacion(cierre):
+    """
+    Balance de comprobación del cierre en una sola consulta agrupada: por cada cuenta
+    del cliente, saldo inicial (AperturaCuenta del cierre), debe, haber y cantidad de
+    movimientos del período. Los movimientos se unen filtrados por cierre
+    (LEFT JOIN ... AND cierre_id = X) y la apertura entra como subconsulta.
+    
+    Args:
+        cierre: Instancia de CierreContabilidad
+        
+    Returns:
+        list: un registro por cuenta (ordenado por código) con cuenta_id, codigo, nombre,
+        nombre_en, tiene_apertura, saldo_inicial, debe, haber, movimientos y saldo
+        (saldo inicial + debe - haber)
+    """
+    from .models import CuentaContable, AperturaCuenta
+    from decimal import Decimal
+    from django.db.models import Count, DecimalField, Exists, FilteredRelation, OuterRef, Q, Subquery, Sum, Value
+    from django.db.models.functions import Coalesce
+    
+    cero = Value(Decimal('0'), output_field=DecimalField(max_digits=20, decimal_places=2))
+    apertura = (
+        AperturaCuenta.objects
+        .filter(cierre=cierre, cuenta=OuterRef('pk'))
+        .order_by('id')
+        .values('saldo_anterior')[:1]
+    )
+    
+    filas = (
+        CuentaContable.objects
+        .filter(cliente_id=cierre.cliente_id)
+        .annotate(
+            movs_cierre=FilteredRelation('movimientocontable', condition=Q(movimientocontable__cierre=cierre)),
+            saldo_inicial=Coalesce(Subquery(apertura), cero),
+            tiene_apertura=Exists(AperturaCuenta.objects.filter(cierre=cierre, cuenta=OuterRef('pk'))),
+        )
+        .values('id', 'codigo', 'nombre', 'nombre_en', 'saldo_inicial', 'tiene_apertura')
+        .annotate(
+            debe=Coalesce(Sum('movs_cierre__debe'), cero),
+            haber=Coalesce(Sum('movs_cierre__haber'), cero),
+            movimientos=Count('movs_cierre__id'),
+        )
+        .order_by('codigo')
+    )
+    
+    return [
+        {
+            'cuenta_id': fila['id'],
+            'codigo': fila['codigo'],
+            'nombre': fila['nombre'],
+            'nombre_en': fila['nombre_en'],
+            'tiene_apertura': bool(fila['tiene_apertura']),
+            'saldo_inicial': fila['saldo_inicial'],
+            'debe': fila['debe'],
+            'haber': fila['haber'],
+            'movimientos': fila['movimientos'],
+            # Fórmula universal: Saldo Final = Saldo inicial + (Debe Total - Haber Total)
+            'saldo': fila['saldo_inicial'] + fila['debe'] - fila['haber'],
+        }
+        for fila in filas
+    ]
+
+
 def calcular_saldos_por_cuenta(cierre):
     """
     Calcula los saldos finales de todas las cuentas para el cierre dado.
     Incluye saldo inicial + movimientos del período = saldo final.
     
+    Se arma desde el snapshot de cuentas del cierre (balance de comprobación en una
+    consulta, compartido con los reportes ESF/ERI/ECP) y solo incluye cuentas con
+    saldo inicial o movimientos en el período.
+    
     Args:
         cierre: Instancia de CierreContabilidad
         
     Returns:
-        dict: {codigo_cuenta: {'saldo': Decimal, 'cuenta_obj': CuentaContable, 'movimientos': int}}
+        dict: {codigo_cuenta: {'saldo': Decimal, 'movimientos': int, 'saldo_inicial', 'debe_total',
+        'haber_total', 'cuenta_id', 'nombre', 'nombre_en'}}
     """
-    from .models import MovimientoContable, CuentaContable, AperturaCuenta
+    from .tasks_reportes import _cache_snapshot, obtener_snapshot_cuentas
     from decimal import Decimal
-    from django.db.models import Sum, Count
     
     print(f"   📊 Calculando saldos por cuenta para cierre {cierre.id}...")
-    print(f"   📊 Incluyendo saldos iniciales + movimientos del período...")
     
-    # Obtener todas las cuentas del cliente
-    cuentas = CuentaContable.objects.filter(cliente=cierre.cliente)
+    snapshot = obtener_snapshot_cuentas(cierre, _cache_snapshot())
     saldos_por_cuenta = {}
     
-    for cuenta in cuentas:
-        # =================== OBTENER SALDO INICIAL ===================
-        # Buscar saldo inicial en AperturaCuenta para este período
-        try:
-            apertura = AperturaCuenta.objects.filter(
-                cuenta=cuenta,
-                cierre=cierre
-            ).first()
-            
-            if apertura:
-                saldo_inicial = apertura.saldo_anterior or Decimal('0')
-                print(f"   📋 Cuenta {cuenta.codigo}: Saldo inicial: ${saldo_inicial:,.2f}")
-            else:
-                # Si no hay apertura específica, asumir saldo inicial cero
-                saldo_inicial = Decimal('0')
-                print(f"   ⚠️ Cuenta {cuenta.codigo}: Sin apertura registrada, asumiendo saldo inicial cero")
-                
-        except Exception as e:
-            print(f"   ⚠️ Error obteniendo apertura para cuenta {cuenta.codigo}: {e}")
-            saldo_inicial = Decimal('0')
-        
-        # =================== OBTENER MOVIMIENTOS DEL PERÍODO ===================
-        movimientos_qs = MovimientoContable.objects.filter(
-            cierre=cierre,
-            cuenta=cuenta
-        )
-        
-        agregados = movimientos_qs.aggregate(
-            total_debe=Sum('debe') or Decimal('0'),
-            total_haber=Sum('haber') or Decimal('0'),
-            total_movimientos=Count('id')
-        )
-        
-        # Movimientos del período
-        debe_movimientos = agregados['total_debe'] or Decimal('0')
-        haber_movimientos = agregados['total_haber'] or Decimal('0')
-        
-        # =================== CALCULAR SALDO FINAL ===================
+    for cuenta_id, codigo, nombre, nombre_en, saldo_anterior, debe, haber, movimientos in snapshot['cuentas']:
+        saldo_inicial = Decimal(saldo_anterior)
+        if saldo_inicial == Decimal('0') and movimientos == 0:
+            continue
+        debe = Decimal(debe)
+        haber = Decimal(haber)
         # Fórmula universal: Saldo Final = Saldo inicial + (Debe Total - Haber Total)
-        # Esta fórmula aplica para todas las cuentas independientemente de su naturaleza
-        saldo_final = saldo_inicial + debe_movimientos - haber_movimientos
-        
-        # =================== MOSTRAR DETALLE DE CÁLCULO ===================
-        if saldo_inicial != Decimal('0') or agregados['total_movimientos'] > 0:
-            print(f"   💰 CÁLCULO DETALLADO - Cuenta {cuenta.codigo} ({cuenta.nombre}):")
-            print(f"      📅 Saldo Inicial: ${saldo_inicial:,.2f}")
-            print(f"      📊 Movimientos del Período:")
-            print(f"         Debe movimientos: ${debe_movimientos:,.2f} ({agregados['total_movimientos']} movimientos)")
-            print(f"         Haber movimientos: ${haber_movimientos:,.2f}")
-            print(f"      🏁 Cálculo Final (Universal):")
-            print(f"         Fórmula: Saldo Inicial + (Debe Total - Haber Total)")
-            print(f"         Cálculo: ${saldo_inicial:,.2f} + (${debe_movimientos:,.2f} - ${haber_movimientos:,.2f})")
-            print(f"         Saldo Final: ${saldo_final:,.2f}")
-            print(f"      ────────────────────────────────────────")
-            
-            saldos_por_cuenta[cuenta.codigo] = {
-                'saldo': saldo_final,
-                'cuenta_obj': cuenta,
-                'movimientos': agregados['total_movimientos'],
-                'debe_total': debe_movimientos,
-                'haber_total': haber_movimientos,
-                'saldo_inicial': saldo_inicial,
-                'debe_movimientos': debe_movimientos,
-                'haber_movimientos': haber_movimientos
-            }
+        saldo = saldo_inicial + debe - haber
+        saldos_por_cuenta[codigo] = {
+            'saldo': saldo,
+            'movimientos': movimientos,
+            'debe_total': debe,
+            'haber_total': haber,
+            'saldo_inicial': saldo_inicial,
+            'debe_movimientos': debe,
+            'haber_movimientos': haber,
+            'cuenta_id': cuenta_id,
+            'nombre': nombre,
+            'nombre_en': nombre_en,
+        }
+        logger.debug(
+            f"Cuenta {codigo}: inicial={saldo_inicial} debe={debe} haber={haber} ({movimientos} movs) final={saldo}"
+        )
     
     print(f"   ✅ Calculados saldos de {len(saldos_por_cuenta)} cuentas (con saldos iniciales + movimientos)")
     return saldos_por_cuenta
@@ -881,33 +959,13 @@ def calcular_balance_general_esf(cierre, cuentas_saldos):
         contadores_clasificacion[opcion]['cuentas'] += 1
         contadores_clasificacion[opcion]['saldo_total'] += saldo
         
-        # Mostrar detalle de cada cuenta
-        print(f"   📋 {opcion}:")
-        print(f"      Cuenta: {codigo_cuenta} - {clasificacion.cuenta.nombre}")
-        print(f"      💰 COMPOSICIÓN DEL SALDO:")
-        print(f"         Saldo Inicial: ${saldo_inicial:,.2f}")
-        print(f"         Movimientos - Debe: ${debe_movimientos:,.2f}")
-        print(f"         Movimientos - Haber: ${haber_movimientos:,.2f}")
-        print(f"      🏁 TOTALES:")
-        print(f"         Debe Total: ${debe_total:,.2f} | Haber Total: ${haber_total:,.2f}")
-        print(f"         Saldo Final: ${saldo:,.2f}")
-        print(f"         Total Movimientos: {num_movimientos}")
-        
-        # Mostrar algunos movimientos específicos de esta cuenta (solo si tiene movimientos)
-        if num_movimientos > 0:
-            from .models import MovimientoContable
-            movimientos_muestra = MovimientoContable.objects.filter(
-                cierre=cierre,
-                cuenta=clasificacion.cuenta
-            ).order_by('-fecha', '-id')[:3]  # Últimos 3 movimientos
-            
-            if movimientos_muestra.exists():
-                print(f"      📝 Últimos 3 movimientos del período:")
-                for mov in movimientos_muestra:
-                    print(f"         {mov.fecha} | Debe: ${mov.debe:,.2f} | Haber: ${mov.haber:,.2f} | {mov.descripcion[:50]}...")
-        else:
-            print(f"      📝 Esta cuenta NO tiene movimientos en el período")
-        print(f"      ════════════════════════════════════════════════════════════")
+        # Detalle por cuenta (el balance de comprobación ya trae la composición del saldo,
+        # sin consultas adicionales por cuenta)
+        logger.debug(
+            f"ESF {opcion} | {codigo_cuenta} - {clasificacion.cuenta.nombre}: inicial={saldo_inicial} "
+            f"debe={debe_movimientos} haber={haber_movimientos} (totales {debe_total}/{haber_total}) "
+            f"final={saldo} movs={num_movimientos}"
+        )
         
         # Mapear a estructura del ESF (incluir todas las cuentas, incluso con saldo 0)
         if opcion == "Activo Corriente":
@@ -1508,7 +1566,7 @@ def guardar_reportes_en_bd(cierre, esf, estado_resultados, ratios, usuario_id=No
         print(f"   📋 Traceback completo: {traceback.format_exc()}")
 
 
-def guardar_datos_en_redis(cierre, esf, estado_resultados, ratios, cuentas_saldos):
+def guardar_datos_en_redis(cierre, esf, estado_resultados, ratios, cuentas_saldos, incluir_estados=True):
     """
     Guarda los datos calculados en Redis para consulta rápida por Streamlit.
     También guarda el ESF en la carpeta de pruebas para comparaciones futuras.
@@ -1519,6 +1577,8 @@ def guardar_datos_en_redis(cierre, esf, estado_resultados, ratios, cuentas_saldo
         estado_resultados: Dict con datos del Estado de Resultados Integral
         ratios: Dict con ratios calculados
         cuentas_saldos: Dict con saldos por cuenta
+        incluir_estados: Si False solo guarda los KPIs (los estados financieros
+            ya los guardaron las tareas de ESF/ERI/ECP de la finalización)
     """
     import json
     from decimal import Decimal
@@ -1539,6 +1599,32 @@ def guardar_datos_en_redis(cierre, esf, estado_resultados, ratios, cuentas_saldo
                 return float(obj)
             return obj
         
+        # Índice de movimientos para las vistas de Movimientos/Análisis de Streamlit,
+        # con el mismo TTL de los estados financieros (90 días si se guardan aquí, 30
+        # si ya los guardaron las tareas de ESF/ERI/ECP). El detalle se pide paginado.
+        try:
+            from .tasks_reportes import indice_movimientos_por_codigo
+            if cache_system.set_movimientos_cierre(
+                cliente_id=cierre.cliente.id,
+                periodo=cierre.periodo,
+                indice=indice_movimientos_por_codigo(cierre),
+                ttl=(24*90 if incluir_estados else 24*30) * 3600
+            ):
+                print(f"       📒 Movimientos: sgm:contabilidad:{cierre.cliente.id}:{cierre.periodo}:movimientos_cierre")
+        except Exception as e:
+            print(f"       ⚠️ Error guardando índice de movimientos: {e}")
+        
+        if not incluir_estados:
+            if cache_system.set_kpis(
+                cliente_id=cierre.cliente.id,
+                periodo=cierre.periodo,
+                kpis=decimal_to_float(ratios)
+            ):
+                print(f"       📈 KPIs: sgm:contabilidad:{cierre.cliente.id}:{cierre.periodo}:kpis")
+            else:
+                print(f"       ⚠️ Error guardando KPIs")
+            return
+        
         # ========================================
         # 2. GUARDAR DATOS PRINCIPALES EN REDIS CON RETENCIÓN
         # ========================================
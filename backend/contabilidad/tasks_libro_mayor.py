@@ -2,6 +2,8 @@
 
 import os
 import re
+import pickle
+import shutil
 import hashlib
 import datetime
 from decimal import Decimal
@@ -20,12 +22,13 @@ from .models import (
     ExcepcionClasificacionSet,
 )
 
+from django.conf import settings
 from django.utils import timezone
 from django.core.cache import cache
 from django.core.files.storage import default_storage
 from django.db import transaction
 from django.db.models import Q
-from celery import shared_task, chain
+from celery import shared_task, chain, chord, group
 from celery.utils.log import get_task_logger
 from openpyxl import load_workbook
 from django.contrib.auth import get_user_model
@@ -48,6 +51,19 @@ from .models import (
 
 logger = get_task_logger(__name__)
 
+# Tamaño del lote de aperturas/movimientos que se vuelca a la BD durante la
+# lectura del libro mayor. Mantiene la memoria del worker acotada sin importar
+# el tamaño del archivo.
+LIBRO_MAYOR_BATCH_SIZE = getattr(settings, 'LIBRO_MAYOR_BATCH_SIZE', 5000)
+
+# Libros con al menos esta cantidad de filas se procesan en chunks paralelos
+LIBRO_MAYOR_PARALELO_MIN_FILAS = getattr(settings, 'LIBRO_MAYOR_PARALELO_MIN_FILAS', 100000)
+LIBRO_MAYOR_CHUNK_FILAS = getattr(settings, 'LIBRO_MAYOR_CHUNK_FILAS', 50000)
+# Filas del libro repartidas por chunk (se parsea el Excel una vez por carga).
+# Los chunks del chord corren en cualquier worker: el directorio debe estar en el
+# mismo almacenamiento compartido que MEDIA_ROOT, de donde ya leen el archivo subido.
+# Se resuelve en cada llamada para respetar LIBRO_MAYOR_PARSEADO_DIR / MEDIA_ROOT.
+
 
 def crear_chain_libro_mayor(upload_log_id, user_correo_bdo):
     """
@@ -59,7 +75,7 @@ def crear_chain_libro_mayor(upload_log_id, user_correo_bdo):
         validar_nombre_archivo_libro_mayor.s(upload_log_id, user_correo_bdo),
         verificar_archivo_libro_mayor.si(upload_log_id, user_correo_bdo),
         validar_contenido_libro_mayor.si(upload_log_id, user_correo_bdo),
-        procesar_libro_mayor_raw.si(upload_log_id, user_correo_bdo),
+        procesar_libro_mayor_paralelo.si(upload_log_id, user_correo_bdo),
         generar_incidencias_libro_mayor.si(upload_log_id, user_correo_bdo),
         finalizar_procesamiento_libro_mayor.si(upload_log_id, user_correo_bdo),
     )
@@ -87,6 +103,226 @@ def _parse_fecha(value, fecha_cierre=None):
     return timezone.now().date()
 
 
+# Valores de opción que identifican directamente cuentas ESF / ERI
+VALORES_ESF = {
+    'ACTIVO CORRIENTE', 'ACTIVO NO CORRIENTE', 'PASIVO CORRIENTE', 'PASIVO NO CORRIENTE', 'PATRIMONIO',
+    'CASH AND CASH EQUIVALENT', 'OTHER CURRENT FINANCIAL ASSETS', 'INVENTORIES',
+    'COMMERCIAL DEBTORS AND OTHER RECEIVABLES, CURRENT', 'CURRENT TAX RECEIVABLE',
+    'OTHER CURRENT ASSETS', 'PROPERTIES, FACILITY AND EQUIPMENT', 'DEFERRED TAX ASSETS',
+    'OTHER NON-CURRENT ASSETS', 'OTHER FINANCIAL, NON-CURRENT ASSETS',
+    'COMMERCIAL ACCOUNTS AND OTHER ACCOUNTS PAYABLE, CURRENT', 'LIABILITY FOR CURRENT TAXES',
+    'OTHER LIABILITY, CURRENT', 'PROVISIONS', 'ACCOUNTS PAYABLE TO RELATED ENTITIES, NO CURRENT',
+    'DEFERRED TAX LIABILITY', 'PAID-IN CAPITAL', 'OTHER RESERVES',
+}
+VALORES_ERI = {
+    'INGRESOS', 'GASTOS', 'COSTOS', 'OTROS INGRESOS', 'OTROS GASTOS',
+    'ADMINISTRATION EXPENSES', 'COST SALE', 'FINANCIAL EXPENSES', 'FINANCIAL INCOME',
+    'OTHER EXPENSES', 'INCOME', 'GANANCIAS', 'PERDIDAS', 'GAINS (LOSSES) ACCUMULATED',
+    'GANANCIAS (ANTES DE IMPUESTOS)', 'GANANCIAS (PERDIDAS)', 'GANANCIAS BRUTAS',
+    'INCOME / (LOSS) OF THE OPERATION', 'OTHER EXPENSES, BY FUNCTION', 'DIFFERENCE IN CHANGES',
+}
+
+
+def _clasificar_esf_eri(set_nombre, valor):
+    """
+    Clasifica un par (set, opción) como 'ESF', 'ERI' o None.
+    """
+    set_nombre = set_nombre.upper()
+    valor = valor.upper()
+    if ('ESTADO' in set_nombre and 'SITUACION' in set_nombre and 'FINANCIERA' in set_nombre) or \
+       ('BALANCE' in set_nombre) or valor in VALORES_ESF:
+        return 'ESF'
+    if ('RESULTADO' in set_nombre) or ('INCOME' in set_nombre) or valor in VALORES_ERI:
+        return 'ERI'
+    if valor in ('ESF', 'ERI'):
+        return valor
+    return None
+
+
+def _construir_mapa_esf_eri(clasif_existentes, nombres_cuentas=None):
+    """
+    Resuelve una sola vez la categoría ESF/ERI de cada cuenta del cliente.
+
+    Args:
+        clasif_existentes: {codigo_cuenta: {set_nombre: opcion_valor}}
+        nombres_cuentas: {codigo_cuenta: nombre}, opcional, sólo para logging
+
+    Returns:
+        dict: {codigo_cuenta: 'ESF' | 'ERI'} (las cuentas sin categoría no aparecen)
+    """
+    nombres_cuentas = nombres_cuentas or {}
+    mapa = {}
+    for codigo, clasificaciones in clasif_existentes.items():
+        for set_nombre, valor in clasificaciones.items():
+            if not valor:
+                continue
+            categoria = _clasificar_esf_eri(set_nombre, valor)
+            if categoria is None:
+                continue
+            mapa[codigo] = categoria
+
+            nombre = (nombres_cuentas.get(codigo) or '').upper()
+            valor_upper = valor.upper()
+            if categoria == 'ESF' and ('PATRIMONIO' in valor_upper or 'CAPITAL' in valor_upper or 'RESERVES' in valor_upper):
+                logger.info(f"🏛️  CUENTA PATRIMONIO ESF: {codigo} ({nombres_cuentas.get(codigo)}) | Set: '{set_nombre}' | Valor: '{valor}'")
+            elif categoria == 'ERI' and ('PATRIMONIO' in nombre or 'CAPITAL' in nombre):
+                logger.warning(f"⚠️  POSIBLE ERROR: Cuenta aparentemente de PATRIMONIO clasificada como ERI: {codigo} ({nombres_cuentas.get(codigo)}) | Set: '{set_nombre}' | Valor: '{valor}'")
+            break
+    return mapa
+
+
+def _parse_saldo_anterior(cell):
+    """
+    Extrae (codigo, nombre) de una fila "SALDO ANTERIOR DE LA CUENTA: <codigo>  <nombre>".
+    Retorna None si la celda no inicia un bloque de cuenta.
+    """
+    if not (isinstance(cell, str) and cell.startswith("SALDO ANTERIOR")):
+        return None
+    texto_completo = cell.split(":", 1)[1].strip()
+    partes = texto_completo.split(" ", 1)
+    code = partes[0].strip()
+    nombre_real = partes[1].strip() if len(partes) > 1 else f"Cuenta {code}"
+    return code, nombre_real
+
+
+def _recolectar_cuentas_libro(ws, col_cuenta):
+    """
+    Primera pasada: recorre sólo la columna CUENTA.
+
+    Returns:
+        dict: {codigo: nombre_real} con los códigos distintos del libro en orden de aparición
+    """
+    cuentas = {}
+    for (cell,) in ws.iter_rows(min_row=11, min_col=col_cuenta + 1, max_col=col_cuenta + 1, values_only=True):
+        parsed = _parse_saldo_anterior(cell)
+        if parsed and parsed[0] not in cuentas:
+            cuentas[parsed[0]] = parsed[1]
+    return cuentas
+
+
+def _directorio_libro_mayor_parseado(upload_log_id):
+    """Directorio con las filas del libro ya repartidas por chunk, visible para todos los workers"""
+    base = getattr(
+        settings,
+        'LIBRO_MAYOR_PARSEADO_DIR',
+        os.path.join(settings.MEDIA_ROOT, 'temp', 'libros_mayores_parseados')
+    )
+    return os.path.join(str(base), str(upload_log_id))
+
+
+def _particionar_libro_mayor(filas, col_cuenta, headers, chunk_filas, directorio):
+    """
+    Recorre una sola vez las filas de datos (desde la fila 11) y las deja en disco
+    por chunk, de modo que cada chunk lee sólo su rango sin volver a parsear el Excel.
+    Cada chunk lleva la cuenta cuyo bloque está abierto al comenzar (para asignar sus
+    movimientos sin ver la fila SALDO ANTERIOR) y los códigos de cuenta que usa.
+
+    Returns:
+        tuple: ({codigo: nombre_real} con los códigos distintos del libro en orden
+               de aparición, [chunk] con fila_inicio, fila_fin, cuenta_inicial,
+               codigos y archivo)
+    """
+    os.makedirs(directorio, exist_ok=True)
+    cuentas = {}
+    chunks = []
+    buffer = []
+    codigos = set()
+    cuenta_abierta = None
+    fila_inicio = 11
+
+    def cerrar_chunk(fila_fin, cuenta_inicial):
+        archivo = os.path.join(directorio, f"chunk_{len(chunks):05d}.pkl")
+        with open(archivo, 'wb') as f:
+            pickle.dump({'headers': headers, 'filas': buffer}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        chunks.append({
+            'fila_inicio': fila_inicio,
+            'fila_fin': fila_fin,
+            'cuenta_inicial': cuenta_inicial,
+            'codigos': sorted(codigos),
+            'archivo': archivo,
+        })
+
+    cuenta_inicial = None
+    fila = 10
+    for fila, row in enumerate(filas, start=11):
+        parsed = _parse_saldo_anterior(row[col_cuenta] if len(row) > col_cuenta else None)
+        if parsed:
+            cuenta_abierta = parsed[0]
+            cuentas.setdefault(parsed[0], parsed[1])
+            codigos.add(parsed[0])
+        buffer.append(row)
+        if len(buffer) >= chunk_filas:
+            cerrar_chunk(fila, cuenta_inicial)
+            buffer, codigos = [], {cuenta_abierta} if cuenta_abierta else set()
+            cuenta_inicial, fila_inicio = cuenta_abierta, fila + 1
+    if buffer:
+        cerrar_chunk(fila, cuenta_inicial)
+    return cuentas, chunks
+
+
+def _leer_chunk_libro_mayor(archivo):
+    """Filas de un chunk ya particionado; el archivo se elimina al leerlo"""
+    try:
+        with open(archivo, 'rb') as f:
+            return pickle.load(f)
+    finally:
+        try:
+            os.remove(archivo)
+        except OSError:
+            pass
+
+
+def _resolver_cuentas_bulk(cliente, cuentas_libro, nombres_ingles_map):
+    """
+    Crea en bloque las CuentaContable faltantes y completa nombres vacíos.
+
+    Args:
+        cliente: Cliente dueño de las cuentas
+        cuentas_libro: {codigo: nombre_real} recolectado del libro
+        nombres_ingles_map: {codigo: nombre_en} precargado
+
+    Returns:
+        tuple: ({codigo[:50]: CuentaContable}, cantidad_cuentas_nuevas)
+    """
+    nombres_por_codigo = {}
+    for code, nombre_real in cuentas_libro.items():
+        nombres_por_codigo.setdefault(code[:50], nombre_real)
+
+    existentes = {
+        c.codigo: c
+        for c in CuentaContable.objects.filter(cliente=cliente, codigo__in=list(nombres_por_codigo))
+    }
+    nuevas = [
+        CuentaContable(cliente=cliente, codigo=codigo, nombre=nombre[:50])
+        for codigo, nombre in nombres_por_codigo.items()
+        if codigo not in existentes
+    ]
+    if nuevas:
+        CuentaContable.objects.bulk_create(nuevas, batch_size=1000, ignore_conflicts=True)
+        cuentas = {
+            c.codigo: c
+            for c in CuentaContable.objects.filter(cliente=cliente, codigo__in=list(nombres_por_codigo))
+        }
+    else:
+        cuentas = existentes
+
+    # Completar nombre real y nombre en inglés de cuentas existentes
+    por_actualizar = {}
+    for codigo, cuenta in existentes.items():
+        if not cuenta.nombre or cuenta.nombre.startswith("Cuenta "):
+            cuenta.nombre = nombres_por_codigo[codigo][:50]
+            por_actualizar[codigo] = cuenta
+    for codigo, cuenta in cuentas.items():
+        ing = nombres_ingles_map.get(codigo)
+        if ing and not cuenta.nombre_en:
+            cuenta.nombre_en = ing
+            por_actualizar[codigo] = cuenta
+    if por_actualizar:
+        CuentaContable.objects.bulk_update(list(por_actualizar.values()), ["nombre", "nombre_en"], batch_size=1000)
+
+    return cuentas, len(cuentas) - len(existentes)
+
+
 def _clean_header(h):
     if not isinstance(h, str):
         return ""
@@ -187,16 +423,39 @@ def validar_contenido_libro_mayor(upload_log_id, user_correo_bdo):
 
 # ─── Task 4: Procesar aperturas y movimientos ─────────────────────────────────
 
-@shared_task
-def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
+def _procesar_libro_mayor(task, upload_log_id, chunk=None):
+    """
+    Lee el libro mayor en modo streaming (iterador read_only de openpyxl) y
+    vuelca aperturas y movimientos en lotes de LIBRO_MAYOR_BATCH_SIZE, de modo
+    que la memoria del worker no crece con el tamaño del archivo. Cada lote se
+    inserta en su propia transacción y reporta progreso. Las filas quedan marcadas
+    con la carga (upload_log); si el procesamiento falla se eliminan las de la carga.
+
+    Sin chunk procesa el libro completo, incluida la primera pasada que crea las
+    cuentas. Con chunk (ver _particionar_libro_mayor) procesa sólo sus filas, ya
+    extraídas del Excel por procesar_libro_mayor_paralelo, con sus cuentas.
+
+    Returns:
+        dict: resultado parcial serializable (ver _combinar_parciales_libro_mayor)
+    """
     upload = UploadLog.objects.get(pk=upload_log_id)
-    inicio = timezone.now()
-    full = default_storage.path(upload.ruta_archivo)
-    wb = load_workbook(full, read_only=True, data_only=True)
-    ws = wb.active
+    es_chunk = chunk is not None
+    if es_chunk:
+        wb = None
+        try:
+            datos_chunk = _leer_chunk_libro_mayor(chunk['archivo'])
+        except Exception as e:
+            _revertir_carga_libro_mayor(upload, f"Error leyendo filas {chunk['fila_inicio']}-{chunk['fila_fin']}: {e}")
+            raise
+        headers = datos_chunk['headers']
+        fila_inicio, cuenta_inicial = chunk['fila_inicio'], chunk['cuenta_inicial']
+    else:
+        wb = load_workbook(default_storage.path(upload.ruta_archivo), read_only=True, data_only=True)
+        ws = wb.active
+        headers = next(ws.iter_rows(min_row=9, max_row=9, values_only=True))
+        fila_inicio, cuenta_inicial = 11, None
 
     # -- índices de columnas --
-    headers = next(ws.iter_rows(min_row=9, max_row=9, values_only=True))
     idx = {_clean_header(h): i for i,h in enumerate(headers) if isinstance(h, str)}
     C, F, D, H, DS = idx["CUENTA"], idx["FECHA"], idx["DEBE"], idx["HABER"], idx["DESCRIPCION"]
     S = idx.get("SALDO")  # Column for SALDO
@@ -228,12 +487,17 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
     # Mapeo de clasificaciones existentes (fuente única de verdad)
     # Usamos AccountClassification en lugar del modelo obsoleto
     clasif_existentes = {}
+    nombres_cuentas_clasificadas = {}
     for ac in AccountClassification.objects.filter(cliente=cliente).select_related('set_clas', 'opcion', 'cuenta'):
         codigo_cuenta = ac.codigo_cuenta_display  # Ahora siempre proviene de la FK cuenta
         logger.debug(f"Clasificación: cuenta {ac.cuenta.codigo} - set {ac.set_clas.nombre}")
         if codigo_cuenta not in clasif_existentes:
             clasif_existentes[codigo_cuenta] = {}
         clasif_existentes[codigo_cuenta][ac.set_clas.nombre] = ac.opcion.valor
+        nombres_cuentas_clasificadas[codigo_cuenta] = ac.cuenta.nombre
+
+    # Categoría ESF/ERI por cuenta, resuelta una vez por cliente (O(cuentas))
+    mapa_esf_eri = _construir_mapa_esf_eri(clasif_existentes, nombres_cuentas_clasificadas)
     
     # Sets de clasificación con sus opciones precargadas
     sets_clasificacion = list(ClasificacionSet.objects.filter(cliente=cliente).prefetch_related('opciones'))
@@ -282,11 +546,11 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
         ).values_list('codigo_cuenta', flat=True)
     )
     
-    # Arrays de trabajo
+    # Arrays de trabajo (aperturas/movimientos son buffers del lote en curso)
     processed_accounts = {}
     aperturas = []
     movimientos = []
-    incidencias_pendientes = []  # Array para recopilar incidencias
+    saldos_anteriores = {}  # {cuenta_codigo: saldo_anterior} para el detalle final
     
     # Sets para agrupar incidencias por cuenta (evitar duplicados por cuenta)
     cuentas_sin_clasificacion_por_set = {}  # {set_id: {cuenta_codigo: set_nombre}}
@@ -317,6 +581,7 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
     logger.info(f"CARGA INICIAL COMPLETADA:")
     logger.info(f"  - {len(nombres_ingles_map)} nombres en inglés")
     logger.info(f"  - {len(clasif_existentes)} cuentas con clasificaciones")
+    logger.info(f"  - {len(mapa_esf_eri)} cuentas con categoría ESF/ERI")
     logger.info(f"  - {len(sets_clasificacion)} sets de clasificación")
     logger.info(f"  - {len(excepciones_por_set)} sets con excepciones")
     logger.info(f"  - {len(tipos_documento_map)} tipos de documento")
@@ -349,70 +614,10 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
     # -- helper para identificar clasificación ESF/ERI --
     def identificar_clasificacion_esf_eri(cuenta_obj):
         """
-        Identifica si una cuenta es ESF o ERI basándose en sus clasificaciones
+        Identifica si una cuenta es ESF o ERI usando el mapa precalculado
         Retorna: 'ESF', 'ERI' o None
         """
-        try:
-            # Obtener todas las clasificaciones de la cuenta
-            clasificaciones = AccountClassification.objects.filter(
-                cuenta=cuenta_obj
-            ).select_related('set_clas', 'opcion')
-            
-            if not clasificaciones.exists():
-                logger.debug(f"Cuenta {cuenta_obj.codigo}: Sin clasificaciones")
-                return None
-            
-            for clasificacion in clasificaciones:
-                if not clasificacion.opcion:
-                    continue
-                    
-                set_nombre = clasificacion.set_clas.nombre.upper()
-                valor = clasificacion.opcion.valor.upper()
-                
-                logger.debug(f"Cuenta {cuenta_obj.codigo}: Set='{set_nombre}' | Valor='{valor}'")
-                
-                # Identificar ESF (Estado de Situación Financiera)
-                if ('ESTADO' in set_nombre and 'SITUACION' in set_nombre and 'FINANCIERA' in set_nombre) or \
-                   ('BALANCE' in set_nombre) or \
-                   (valor in ['ACTIVO CORRIENTE', 'ACTIVO NO CORRIENTE', 'PASIVO CORRIENTE', 'PASIVO NO CORRIENTE', 'PATRIMONIO']) or \
-                   (valor in ['CASH AND CASH EQUIVALENT', 'OTHER CURRENT FINANCIAL ASSETS', 'INVENTORIES',
-                             'COMMERCIAL DEBTORS AND OTHER RECEIVABLES, CURRENT', 'CURRENT TAX RECEIVABLE',
-                             'OTHER CURRENT ASSETS', 'PROPERTIES, FACILITY AND EQUIPMENT', 'DEFERRED TAX ASSETS',
-                             'OTHER NON-CURRENT ASSETS', 'OTHER FINANCIAL, NON-CURRENT ASSETS',
-                             'COMMERCIAL ACCOUNTS AND OTHER ACCOUNTS PAYABLE, CURRENT', 'LIABILITY FOR CURRENT TAXES',
-                             'OTHER LIABILITY, CURRENT', 'PROVISIONS', 'ACCOUNTS PAYABLE TO RELATED ENTITIES, NO CURRENT',
-                             'DEFERRED TAX LIABILITY', 'PAID-IN CAPITAL', 'OTHER RESERVES']):
-                    # LOGGING ESPECIAL PARA PATRIMONIO Y ESF
-                    if 'PATRIMONIO' in valor or 'CAPITAL' in valor or 'RESERVES' in valor:
-                        logger.info(f"🏛️  CUENTA PATRIMONIO ESF: {cuenta_obj.codigo} ({cuenta_obj.nombre}) | Set: '{set_nombre}' | Valor: '{valor}'")
-                    else:
-                        logger.debug(f"Cuenta {cuenta_obj.codigo}: Identificada como ESF por Set='{set_nombre}' | Valor='{valor}'")
-                    return 'ESF'
-                
-                # Identificar ERI (Estado de Resultados Integrales)
-                elif ('RESULTADO' in set_nombre) or ('INCOME' in set_nombre) or \
-                     (valor in ['INGRESOS', 'GASTOS', 'COSTOS', 'OTROS INGRESOS', 'OTROS GASTOS']) or \
-                     (valor in ['ADMINISTRATION EXPENSES', 'COST SALE', 'FINANCIAL EXPENSES', 'FINANCIAL INCOME', 
-                               'OTHER EXPENSES', 'INCOME', 'GANANCIAS', 'PERDIDAS', 'GAINS (LOSSES) ACCUMULATED',
-                               'GANANCIAS (ANTES DE IMPUESTOS)', 'GANANCIAS (PERDIDAS)', 'GANANCIAS BRUTAS',
-                               'INCOME / (LOSS) OF THE OPERATION', 'OTHER EXPENSES, BY FUNCTION', 'DIFFERENCE IN CHANGES']):
-                    # LOGGING ESPECIAL para detectar si alguna cuenta patrimonio está clasificada como ERI
-                    if 'PATRIMONIO' in cuenta_obj.nombre.upper() or 'CAPITAL' in cuenta_obj.nombre.upper():
-                        logger.warning(f"⚠️  POSIBLE ERROR: Cuenta aparentemente de PATRIMONIO clasificada como ERI: {cuenta_obj.codigo} ({cuenta_obj.nombre}) | Set: '{set_nombre}' | Valor: '{valor}'")
-                    else:
-                        logger.debug(f"Cuenta {cuenta_obj.codigo}: Identificada como ERI por Set='{set_nombre}' | Valor='{valor}'")
-                    return 'ERI'
-                
-                # Búsqueda por valores específicos que identifiquen ESF/ERI
-                elif valor in ['ESF', 'ERI']:
-                    logger.debug(f"Cuenta {cuenta_obj.codigo}: Identificada como {valor} por valor directo")
-                    return valor
-            
-            logger.debug(f"Cuenta {cuenta_obj.codigo}: No identificada como ESF/ERI")
-            return None
-        except Exception as e:
-            logger.debug(f"Error identificando clasificación ESF/ERI para cuenta {cuenta_obj.codigo}: {e}")
-            return None
+        return mapa_esf_eri.get(cuenta_obj.codigo)
 
     # 2. FUNCIONES AUXILIARES
     def procesar_saldo_anterior(row, cierre, code, aperturas, stats, totales_esf_eri, identificar_clasificacion_esf_eri):
@@ -432,9 +637,11 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
             apertura = AperturaCuenta(
                 cierre=cierre,
                 cuenta=cuenta_obj,
-                saldo_anterior=saldo
+                saldo_anterior=saldo,
+                upload_log_id=upload_log_id,
             )
             aperturas.append(apertura)
+            saldos_anteriores.setdefault(code, saldo)
             stats["aperturas"] += 1
             
             # NUEVO: Acumular en totales ESF/ERI si corresponde, o en NO_CLASIFICADAS
@@ -514,6 +721,7 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
                 numero_comprobante=str(row[NC])[:50] if (NC is not None and row[NC]) else "",
                 numero_interno=str(row[NI])[:50] if (NI is not None and row[NI]) else "",
                 detalle_gasto=str(row[DG]) if (DG is not None and row[DG]) else "",
+                upload_log_id=upload_log_id,
             )
             
             # TODO: Manejar centro_costo y auxiliar si hay columnas disponibles
@@ -537,32 +745,95 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
                     debe=Decimal(row[D] or 0),
                     haber=Decimal(row[H] or 0),
                     descripcion="Error procesando campos adicionales",
-                    flag_incompleto=True
+                    flag_incompleto=True,
+                    upload_log_id=upload_log_id,
                 )
                 movimientos.append(mov_minimo)
                 stats["movimientos"] += 1
             except Exception as e2:
                 logger.error(f"Error creando movimiento mínimo: {e2}")
 
-    # 3. BUCLE PRINCIPAL
-    current_code = None
-    fila_numero = 10  # Empezamos en fila 11 del Excel (10 + 1)
+    # -- volcado por lotes --
+    if es_chunk:
+        total_filas = chunk['fila_fin'] - fila_inicio + 1
+    else:
+        total_filas = max((ws.max_row or 0) - 10, 0)  # 0 si el archivo no declara dimensiones
+    lotes = {"volcados": 0, "filas_leidas": 0}
+
+    def volcar_lote():
+        """Inserta el lote en curso, libera los buffers y reporta progreso"""
+        if not aperturas and not movimientos:
+            return
+        with transaction.atomic():
+            if aperturas:
+                AperturaCuenta.objects.bulk_create(aperturas, batch_size=500)
+            if movimientos:
+                MovimientoContable.objects.bulk_create(movimientos, batch_size=500)
+        aperturas.clear()
+        movimientos.clear()
+        lotes["volcados"] += 1
+        # En modo chunk se aborta si otro chunk ya marcó el upload con error. Se revisa
+        # después de insertar: el chunk que falla marca el error antes de borrar, así que
+        # un lote insertado tras ese borrado lo detecta aquí y lo revierte el except
+        if es_chunk and UploadLog.objects.filter(pk=upload_log_id, estado="error").exists():
+            raise RuntimeError("Procesamiento cancelado: otro chunk del libro mayor falló")
+
+        progreso = {
+            'lote': lotes["volcados"],
+            'filas_leidas': lotes["filas_leidas"],
+            'total_filas': total_filas,
+            'aperturas': stats["aperturas"],
+            'movimientos': stats["movimientos"],
+            'porcentaje': round(lotes["filas_leidas"] * 100 / total_filas, 1) if total_filas else None,
+        }
+        try:
+            task.update_state(state='PROGRESS', meta={'upload_log_id': upload_log_id, 'fila_inicio': fila_inicio, **progreso})
+        except Exception as e:
+            logger.debug(f"No se pudo actualizar progreso de la task: {e}")
+        logger.info(f"💾 Lote {progreso['lote']} volcado: {progreso['filas_leidas']} filas leídas, "
+                    f"{progreso['aperturas']} aperturas, {progreso['movimientos']} movimientos")
+
+    # 3. PRIMERA PASADA: cuentas del libro, upsert en bloque y clasificaciones
+    if es_chunk:
+        # Las cuentas ya fueron creadas por el despachador; sólo las que usa el chunk
+        cuentas_por_codigo = {
+            c.codigo: c
+            for c in CuentaContable.objects.filter(cliente=cliente, codigo__in=[c[:50] for c in chunk['codigos']])
+        }
+        filas = datos_chunk['filas']
+    else:
+        cuentas_libro = _recolectar_cuentas_libro(ws, C)
+        cuentas_por_codigo, stats["cuentas_nuevas"] = _resolver_cuentas_bulk(cliente, cuentas_libro, nombres_ingles_map)
+        filas = ws.iter_rows(min_row=11, values_only=True)
+    sets_por_cuenta = {}  # {cuenta_id: {set_clas_id, ...}}
+    for cuenta_id, set_id in AccountClassification.objects.filter(
+        cliente=cliente, cuenta_id__in=[c.id for c in cuentas_por_codigo.values()]
+    ).values_list('cuenta_id', 'set_clas_id'):
+        sets_por_cuenta.setdefault(cuenta_id, set()).add(set_id)
+    if not es_chunk:
+        logger.info(f"Primera pasada: {len(cuentas_libro)} cuentas en el libro, {stats['cuentas_nuevas']} nuevas")
+
+    # Un chunk puede comenzar a mitad del bloque de una cuenta
+    if cuenta_inicial:
+        processed_accounts[cuenta_inicial] = cuentas_por_codigo[cuenta_inicial[:50]]
+
+    # 4. SEGUNDA PASADA: BUCLE PRINCIPAL (sólo búsquedas en diccionarios)
+    current_code = cuenta_inicial
+    fila_numero = fila_inicio - 1  # Por defecto empezamos en fila 11 del Excel
     
-    with transaction.atomic():
-        for row in ws.iter_rows(min_row=11, values_only=True):
+    try:
+        for row in filas:
             fila_numero += 1
+            if len(aperturas) + len(movimientos) >= LIBRO_MAYOR_BATCH_SIZE:
+                lotes["filas_leidas"] = fila_numero - fila_inicio
+                volcar_lote()
             cell = row[C]
             
             # SALDO ANTERIOR → nuevo bloque de cuenta
-            if isinstance(cell, str) and cell.startswith("SALDO ANTERIOR"):
-                # Extrae code y nombre real de la cuenta
-                # Formato: "SALDO ANTERIOR DE LA CUENTA: 5-04-004-002-0002  Comisiones y gastos bancarios"
-                texto_completo = cell.split(":", 1)[1].strip()  # "5-04-004-002-0002  Comisiones y gastos bancarios"
-                
-                # Separar código y nombre
-                partes = texto_completo.split(" ", 1)  # ["5-04-004-002-0002", "Comisiones y gastos bancarios"]
-                code = partes[0].strip()
-                nombre_real = partes[1].strip() if len(partes) > 1 else f"Cuenta {code}"
+            # Formato: "SALDO ANTERIOR DE LA CUENTA: 5-04-004-002-0002  Comisiones y gastos bancarios"
+            saldo_anterior_cuenta = _parse_saldo_anterior(cell)
+            if saldo_anterior_cuenta:
+                code, nombre_real = saldo_anterior_cuenta
                 
                 current_code = code
                 logger.info(f"🆕 NUEVA CUENTA DETECTADA en fila {fila_numero}: {code} - {nombre_real}")
@@ -572,39 +843,12 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
                 
                 # Si code no está en processed_accounts
                 if code not in processed_accounts:
-                    # get_or_create la CuentaContable CON EL NOMBRE REAL
-                    cuenta, created = CuentaContable.objects.get_or_create(
-                        cliente=cliente,
-                        codigo=code[:50],
-                        defaults={"nombre": nombre_real[:50]}  # Usar el nombre real del Excel
-                    )
-                    # Si la cuenta ya existía pero no tenía nombre, actualizarlo
-                    if not created and (not cuenta.nombre or cuenta.nombre.startswith("Cuenta ")):
-                        cuenta.nombre = nombre_real[:50]
-                        cuenta.save(update_fields=["nombre"])
-                        logger.debug(f"Actualizado nombre de cuenta existente {cuenta.codigo}: {nombre_real}")
-                    
-                    # Incrementar stats["cuentas_nuevas"] si es nueva
-                    if created:
-                        stats["cuentas_nuevas"] += 1
-                        logger.debug(f"Cuenta nueva creada: {code} - {nombre_real}")
-                    
-                    # Aplicar nombre en inglés UNA SOLA VEZ usando nombres_ingles_map
-                    ing = nombres_ingles_map.get(cuenta.codigo)
-                    if ing and not cuenta.nombre_en:
-                        cuenta.nombre_en = ing
-                        cuenta.save(update_fields=["nombre_en"])
-                        logger.debug(f"Aplicado nombre en inglés a cuenta {cuenta.codigo}: {ing}")
-                    
-                    # Aplicar clasificaciones existentes (si las hay)
-                    clasificaciones_cuenta = clasif_existentes.get(cuenta.codigo)
-                    if clasificaciones_cuenta:
-                        logger.debug(f"Encontradas clasificaciones existentes para cuenta {cuenta.codigo}: {list(clasificaciones_cuenta.keys())}")
-                        # Las clasificaciones ya están aplicadas en AccountClassification
-                        # Solo registramos que esta cuenta ya tiene clasificaciones
+                    # Cuenta ya resuelta en la primera pasada
+                    cuenta = cuentas_por_codigo[code[:50]]
                     
                     # VALIDACIÓN DE CLASIFICACIONES EN LÍNEA - Solo si hay sets configurados
                     if sets_clasificacion:
+                        sets_cuenta = sets_por_cuenta.get(cuenta.id, set())
                         cuentas_exceptuadas = 0
                         for set_clas in sets_clasificacion:
                             # Verificar si la cuenta tiene excepción para este set
@@ -614,13 +858,7 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
                                 logger.debug(f"Cuenta {cuenta.codigo} tiene excepción para set {set_clas.nombre} - NO se validará clasificación")
                                 continue  # Esta cuenta está excenta de clasificación en este set
                             
-                            # Verificar clasificación usando únicamente FK (nuevo diseño sin temporales)
-                            tiene_clasificacion = AccountClassification.objects.filter(
-                                cuenta=cuenta,
-                                cliente=cliente,
-                                set_clas=set_clas
-                            ).exists()
-                            if not tiene_clasificacion:
+                            if set_clas.id not in sets_cuenta:
                                 # Agregar cuenta y set específico al diccionario de incidencias
                                 if set_clas.id not in cuentas_sin_clasificacion_por_set:
                                     cuentas_sin_clasificacion_por_set[set_clas.id] = {}
@@ -682,40 +920,152 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
             
             # Ignorar el resto de filas
 
-        # 4. BULK-CREATE Y RESUMEN
-        # Al final, bulk-create de aperturas y movimientos
-        if aperturas:
-            AperturaCuenta.objects.bulk_create(aperturas, batch_size=500)
-        if movimientos:
-            MovimientoContable.objects.bulk_create(movimientos, batch_size=500)
-        
-        # NUEVO: Resumen de movimientos por cuenta
-        logger.info("="*80)
-        logger.info("📊 RESUMEN DE MOVIMIENTOS PROCESADOS POR CUENTA")
-        logger.info("="*80)
-        
-        for cuenta_codigo, cantidad in sorted(movimientos_por_cuenta.items()):
-            cuenta_obj = processed_accounts.get(cuenta_codigo)
-            nombre_cuenta = cuenta_obj.nombre if cuenta_obj else "N/A"
-            logger.info(f"  {cuenta_codigo} | {nombre_cuenta} | {cantidad} movimientos procesados")
-        
-        logger.info(f"TOTAL: {len(movimientos_por_cuenta)} cuentas con movimientos | {sum(movimientos_por_cuenta.values())} movimientos totales")
-        logger.info("="*80)
+        # 5. VOLCADO DEL ÚLTIMO LOTE
+        lotes["filas_leidas"] = fila_numero - fila_inicio + 1
+        volcar_lote()
+    except Exception as e:
+        logger.error(f"Error procesando libro mayor {upload_log_id} en fila {fila_numero}: {e}")
+        _revertir_carga_libro_mayor(upload, f"Error procesando libro mayor en fila {fila_numero}: {str(e)}")
+        raise
+    finally:
+        if wb is not None:
+            wb.close()
+
+    return {
+        'stats': stats,
+        'totales_esf_eri': {
+            categoria: {campo: str(valor) for campo, valor in totales.items()}
+            for categoria, totales in totales_esf_eri.items()
+        },
+        'contadores_clasificacion': contadores_clasificacion,
+        'movimientos_por_cuenta': movimientos_por_cuenta,
+        'saldos_anteriores': {codigo: str(saldo) for codigo, saldo in saldos_anteriores.items()},
+        'cuentas': {
+            codigo: {'nombre': cuenta.nombre, 'clasificacion': mapa_esf_eri.get(cuenta.codigo)}
+            for codigo, cuenta in processed_accounts.items()
+        },
+        # Claves str: el resultado viaja como JSON entre tasks
+        'cuentas_sin_clasificacion_por_set': {
+            str(set_id): cuentas for set_id, cuentas in cuentas_sin_clasificacion_por_set.items()
+        },
+        'cuentas_sin_nombre_ingles': sorted(cuentas_sin_nombre_ingles),
+        'cuentas_con_tipo_doc_null': sorted(cuentas_con_tipo_doc_null),
+        'cuentas_con_tipo_doc_no_reconocido': cuentas_con_tipo_doc_no_reconocido,
+        'excepciones_aplicadas': {
+            "clasificacion_sets": sum(len(excepciones) for excepciones in excepciones_por_set.values()),
+            "nombres_ingles": len(excepciones_nombres_ingles),
+            "tipo_doc_null": len(excepciones_tipo_doc_null),
+            "tipo_doc_no_reconocido": len(excepciones_tipo_doc_no_reconocido)
+        },
+    }
+
+
+def _revertir_carga_libro_mayor(upload, errores):
+    """
+    Marca la carga con error y elimina sus aperturas, movimientos y filas parseadas.
+    Primero el estado: los chunks en curso lo ven tras su próximo lote y revierten
+    lo que hayan insertado después de este borrado
+    """
+    upload.estado = "error"
+    upload.errores = errores
+    upload.save(update_fields=["estado", "errores"])
+    MovimientoContable.objects.filter(upload_log_id=upload.id).delete()
+    AperturaCuenta.objects.filter(upload_log_id=upload.id).delete()
+    shutil.rmtree(_directorio_libro_mayor_parseado(upload.id), ignore_errors=True)
+
 
-    # 5. CONVERTIR SETS AGRUPADOS A INCIDENCIAS INDIVIDUALES
+def _combinar_parciales_libro_mayor(parciales):
+    """
+    Fusiona los resultados parciales de los chunks en uno solo, con la
+    misma forma que el resultado de _procesar_libro_mayor.
+    """
+    combinado = {
+        'stats': {"cuentas_nuevas": 0, "aperturas": 0, "movimientos": 0, "incidencias_detectadas": 0},
+        'totales_esf_eri': {
+            categoria: {'saldo_ant': Decimal('0'), 'debe': Decimal('0'), 'haber': Decimal('0')}
+            for categoria in ('ESF', 'ERI', 'NO_CLASIFICADAS')
+        },
+        'contadores_clasificacion': {'ESF': 0, 'ERI': 0, 'NO_CLASIFICADAS': 0, 'Sin_clasificacion': 0},
+        'movimientos_por_cuenta': {},
+        'saldos_anteriores': {},
+        'cuentas': {},
+        'cuentas_sin_clasificacion_por_set': {},
+        'cuentas_sin_nombre_ingles': set(),
+        'cuentas_con_tipo_doc_null': set(),
+        'cuentas_con_tipo_doc_no_reconocido': {},
+        'excepciones_aplicadas': {},
+    }
+    for parcial in parciales:
+        for campo, valor in parcial['stats'].items():
+            combinado['stats'][campo] = combinado['stats'].get(campo, 0) + valor
+        for categoria, totales in parcial['totales_esf_eri'].items():
+            for campo, valor in totales.items():
+                combinado['totales_esf_eri'][categoria][campo] += Decimal(valor)
+        for categoria, cantidad in parcial['contadores_clasificacion'].items():
+            combinado['contadores_clasificacion'][categoria] += cantidad
+        for codigo, cantidad in parcial['movimientos_por_cuenta'].items():
+            combinado['movimientos_por_cuenta'][codigo] = combinado['movimientos_por_cuenta'].get(codigo, 0) + cantidad
+        for codigo, saldo in parcial['saldos_anteriores'].items():
+            combinado['saldos_anteriores'].setdefault(codigo, saldo)
+        combinado['cuentas'].update(parcial['cuentas'])
+        for set_id, cuentas in parcial['cuentas_sin_clasificacion_por_set'].items():
+            combinado['cuentas_sin_clasificacion_por_set'].setdefault(set_id, {}).update(cuentas)
+        combinado['cuentas_sin_nombre_ingles'].update(parcial['cuentas_sin_nombre_ingles'])
+        combinado['cuentas_con_tipo_doc_null'].update(parcial['cuentas_con_tipo_doc_null'])
+        combinado['cuentas_con_tipo_doc_no_reconocido'].update(parcial['cuentas_con_tipo_doc_no_reconocido'])
+        combinado['excepciones_aplicadas'] = parcial['excepciones_aplicadas']
+
+    combinado['totales_esf_eri'] = {
+        categoria: {campo: str(valor) for campo, valor in totales.items()}
+        for categoria, totales in combinado['totales_esf_eri'].items()
+    }
+    combinado['cuentas_sin_nombre_ingles'] = sorted(combinado['cuentas_sin_nombre_ingles'])
+    combinado['cuentas_con_tipo_doc_null'] = sorted(combinado['cuentas_con_tipo_doc_null'])
+    return combinado
+
+
+def _guardar_resumen_libro_mayor(upload, parcial, inicio):
+    """
+    Convierte el resultado del procesamiento en incidencias pendientes y
+    totales ESF/ERI, y los guarda en upload.resumen para los tasks siguientes.
+    """
+    stats = parcial['stats']
+    movimientos_por_cuenta = parcial['movimientos_por_cuenta']
+    cuentas_procesadas = parcial['cuentas']
+    incidencias_pendientes = []
+    totales_esf_eri = {
+        categoria: {campo: Decimal(valor) for campo, valor in totales.items()}
+        for categoria, totales in parcial['totales_esf_eri'].items()
+    }
+    contadores_clasificacion = parcial['contadores_clasificacion']
+
+    # NUEVO: Resumen de movimientos por cuenta
+    logger.info("="*80)
+    logger.info("📊 RESUMEN DE MOVIMIENTOS PROCESADOS POR CUENTA")
+    logger.info("="*80)
+    
+    for cuenta_codigo, cantidad in sorted(movimientos_por_cuenta.items()):
+        cuenta_info = cuentas_procesadas.get(cuenta_codigo)
+        nombre_cuenta = cuenta_info['nombre'] if cuenta_info else "N/A"
+        logger.info(f"  {cuenta_codigo} | {nombre_cuenta} | {cantidad} movimientos procesados")
+    
+    logger.info(f"TOTAL: {len(movimientos_por_cuenta)} cuentas con movimientos | {sum(movimientos_por_cuenta.values())} movimientos totales")
+    logger.info("="*80)
+
+    # CONVERTIR SETS AGRUPADOS A INCIDENCIAS INDIVIDUALES
     # Convertir cuentas sin clasificación por set específico
-    for set_id, cuentas_por_set in cuentas_sin_clasificacion_por_set.items():
+    for set_id, cuentas_por_set in parcial['cuentas_sin_clasificacion_por_set'].items():
         for cuenta_codigo, set_nombre in cuentas_por_set.items():
             incidencias_pendientes.append({
                 'tipo': 'cuenta_no_clasificada',
                 'cuenta_codigo': cuenta_codigo,
-                'set_clasificacion_id': set_id,
+                'set_clasificacion_id': int(set_id),
                 'set_clasificacion_nombre': set_nombre,
                 'descripcion': f"Cuenta {cuenta_codigo} sin clasificación en set '{set_nombre}'"
             })
     
     # Convertir cuentas sin nombre en inglés
-    for cuenta_codigo in cuentas_sin_nombre_ingles:
+    for cuenta_codigo in parcial['cuentas_sin_nombre_ingles']:
         incidencias_pendientes.append({
             'tipo': 'cuenta_sin_ingles',
             'cuenta_codigo': cuenta_codigo,
@@ -723,7 +1073,7 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
         })
     
     # Convertir cuentas con tipo documento null
-    for cuenta_codigo in cuentas_con_tipo_doc_null:
+    for cuenta_codigo in parcial['cuentas_con_tipo_doc_null']:
         incidencias_pendientes.append({
             'tipo': 'movimiento_tipo_doc_null',
             'cuenta_codigo': cuenta_codigo,
@@ -731,7 +1081,7 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
         })
     
     # Convertir cuentas con tipo documento no reconocido
-    for cuenta_codigo, tipo_doc_codigo in cuentas_con_tipo_doc_no_reconocido.items():
+    for cuenta_codigo, tipo_doc_codigo in parcial['cuentas_con_tipo_doc_no_reconocido'].items():
         incidencias_pendientes.append({
             'tipo': 'movimiento_tipo_doc_no_reconocido',
             'cuenta_codigo': cuenta_codigo,
@@ -741,12 +1091,7 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
     
     # Actualizar estadísticas
     stats["incidencias_detectadas"] = len(incidencias_pendientes)
-    stats["excepciones_aplicadas"] = {
-        "clasificacion_sets": sum(len(excepciones) for excepciones in excepciones_por_set.values()),
-        "nombres_ingles": len(excepciones_nombres_ingles),
-        "tipo_doc_null": len(excepciones_tipo_doc_null),
-        "tipo_doc_no_reconocido": len(excepciones_tipo_doc_no_reconocido)
-    }
+    stats["excepciones_aplicadas"] = parcial['excepciones_aplicadas']
 
     # Calcular balances ESF/ERI + NO_CLASIFICADAS
     balance_esf = float(totales_esf_eri['ESF']['saldo_ant'] + totales_esf_eri['ESF']['debe'] - totales_esf_eri['ESF']['haber'])
@@ -792,29 +1137,25 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
     cuentas_eri_procesadas = []
     
     # Recorrer todas las cuentas procesadas y clasificarlas
-    for codigo, cuenta_obj in processed_accounts.items():
-        clasificacion = identificar_clasificacion_esf_eri(cuenta_obj)
+    for codigo, cuenta_info in cuentas_procesadas.items():
+        clasificacion = cuenta_info['clasificacion']
+        saldo_anterior = parcial['saldos_anteriores'].get(codigo)
+        if saldo_anterior is None:
+            continue
+        saldo_anterior = Decimal(saldo_anterior)
         if clasificacion == 'ESF':
-            # Buscar el saldo anterior de esta cuenta
-            for apertura in aperturas:
-                if apertura.cuenta.codigo == codigo:
-                    cuentas_esf_procesadas.append({
-                        'codigo': codigo,
-                        'nombre': cuenta_obj.nombre,
-                        'saldo_anterior': apertura.saldo_anterior
-                    })
-                    logger.info(f"  {codigo} | {cuenta_obj.nombre} | Saldo: ${apertura.saldo_anterior:,.2f}")
-                    break
+            cuentas_esf_procesadas.append({
+                'codigo': codigo,
+                'nombre': cuenta_info['nombre'],
+                'saldo_anterior': saldo_anterior
+            })
+            logger.info(f"  {codigo} | {cuenta_info['nombre']} | Saldo: ${saldo_anterior:,.2f}")
         elif clasificacion == 'ERI':
-            # Buscar el saldo anterior de esta cuenta
-            for apertura in aperturas:
-                if apertura.cuenta.codigo == codigo:
-                    cuentas_eri_procesadas.append({
-                        'codigo': codigo,
-                        'nombre': cuenta_obj.nombre,
-                        'saldo_anterior': apertura.saldo_anterior
-                    })
-                    break
+            cuentas_eri_procesadas.append({
+                'codigo': codigo,
+                'nombre': cuenta_info['nombre'],
+                'saldo_anterior': saldo_anterior
+            })
     
     logger.info(f"TOTAL CUENTAS ESF PROCESADAS: {len(cuentas_esf_procesadas)}")
     logger.info("="*80)
@@ -871,6 +1212,98 @@ def procesar_libro_mayor_raw(upload_log_id, user_correo_bdo):
                f"Nombres inglés: {stats['excepciones_aplicadas']['nombres_ingles']}, "
                f"Tipo doc null: {stats['excepciones_aplicadas']['tipo_doc_null']}, "
                f"Tipo doc no reconocido: {stats['excepciones_aplicadas']['tipo_doc_no_reconocido']}")
+
+
+@shared_task(bind=True)
+def procesar_libro_mayor_raw(self, upload_log_id, user_correo_bdo):
+    """
+    Procesa el libro mayor completo en un solo worker (modo secuencial).
+    """
+    inicio = timezone.now()
+    parcial = _procesar_libro_mayor(self, upload_log_id)
+    _guardar_resumen_libro_mayor(UploadLog.objects.get(pk=upload_log_id), parcial, inicio)
+    return upload_log_id
+
+
+@shared_task(bind=True)
+def procesar_libro_mayor_paralelo(self, upload_log_id, user_correo_bdo):
+    """
+    Despacha el procesamiento del libro mayor.
+
+    Libros con menos de LIBRO_MAYOR_PARALELO_MIN_FILAS filas se delegan a
+    procesar_libro_mayor_raw. Los más grandes se dividen en rangos de filas
+    que se procesan en paralelo (group) y se consolidan en un chord antes de
+    continuar con la generación de incidencias.
+    """
+    upload = UploadLog.objects.get(pk=upload_log_id)
+    full = default_storage.path(upload.ruta_archivo)
+    directorio = _directorio_libro_mayor_parseado(upload_log_id)
+    wb = load_workbook(full, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        total_filas = max((ws.max_row or 0) - 10, 0)
+        if total_filas < LIBRO_MAYOR_PARALELO_MIN_FILAS:
+            logger.info(f"Libro mayor {upload_log_id}: {total_filas} filas, procesamiento secuencial")
+            return self.replace(procesar_libro_mayor_raw.si(upload_log_id, user_correo_bdo))
+
+        inicio = timezone.now()
+        headers = next(ws.iter_rows(min_row=9, max_row=9, values_only=True))
+        idx = {_clean_header(h): i for i, h in enumerate(headers) if isinstance(h, str)}
+        # Única lectura del Excel: cada chunk recibe sus filas ya extraídas
+        cuentas_libro, chunks = _particionar_libro_mayor(
+            ws.iter_rows(min_row=11, values_only=True), idx["CUENTA"], headers, LIBRO_MAYOR_CHUNK_FILAS, directorio
+        )
+    except Exception:
+        shutil.rmtree(directorio, ignore_errors=True)
+        raise
+    finally:
+        wb.close()
+
+    # Las cuentas se crean una sola vez aquí para que los chunks no compitan
+    cliente = upload.cliente
+    nombres_ingles_map = {
+        c.codigo: c.nombre_en
+        for c in CuentaContable.objects.filter(cliente=cliente).exclude(Q(nombre_en__isnull=True) | Q(nombre_en=""))
+    }
+    _, cuentas_nuevas = _resolver_cuentas_bulk(cliente, cuentas_libro, nombres_ingles_map)
+
+    resumen = upload.resumen or {}
+    resumen["procesamiento_paralelo"] = {
+        "inicio": inicio.isoformat(),
+        "total_filas": total_filas,
+        "chunks": len(chunks),
+        "cuentas_nuevas": cuentas_nuevas,
+    }
+    upload.resumen = resumen
+    upload.save(update_fields=["resumen"])
+
+    logger.info(f"Libro mayor {upload_log_id}: {total_filas} filas en {len(chunks)} chunks paralelos")
+    tareas_chunks = group(procesar_chunk_libro_mayor.si(upload_log_id, chunk) for chunk in chunks)
+    return self.replace(chord(tareas_chunks, consolidar_chunks_libro_mayor.s(upload_log_id, user_correo_bdo)))
+
+
+@shared_task(bind=True)
+def procesar_chunk_libro_mayor(self, upload_log_id, chunk):
+    """
+    Procesa un rango de filas del libro mayor y retorna su resultado parcial.
+    """
+    return _procesar_libro_mayor(self, upload_log_id, chunk)
+
+
+@shared_task
+def consolidar_chunks_libro_mayor(parciales, upload_log_id, user_correo_bdo):
+    """
+    Callback del chord: fusiona totales ESF/ERI, movimientos por cuenta e
+    incidencias pendientes de todos los chunks y guarda el resumen.
+    """
+    upload = UploadLog.objects.get(pk=upload_log_id)
+    info = (upload.resumen or {}).get("procesamiento_paralelo", {})
+    shutil.rmtree(_directorio_libro_mayor_parseado(upload_log_id), ignore_errors=True)
+    parcial = _combinar_parciales_libro_mayor(parciales)
+    parcial['stats']['cuentas_nuevas'] = info.get("cuentas_nuevas", 0)
+    inicio = datetime.datetime.fromisoformat(info["inicio"]) if info.get("inicio") else timezone.now()
+    _guardar_resumen_libro_mayor(upload, parcial, inicio)
+    logger.info(f"Libro mayor {upload_log_id}: {len(parciales)} chunks consolidados")
     return upload_log_id
 
 # ─── Task 5: Generar incidencias ───────────────────────────────────────────────
@@ -3,6 +3,7 @@ Tareas Celery para generación de reportes financieros
 """
 from celery import shared_task
 from django.db import transaction, models
+from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth.models import User
 from datetime import datetime
@@ -12,12 +13,12 @@ import json
 from .models import (
     CierreContabilidad, 
     ReporteFinanciero, 
-    CuentaContable, 
     MovimientoContable,
     AperturaCuenta,
     AccountClassification,
     ClasificacionSet,
-    ClasificacionOption
+    ClasificacionOption,
+    UploadLog
 )
 from .cache_redis import get_cache_system
 
@@ -144,14 +145,12 @@ def _obtener_periodos_completos(cache_system, cliente_id):
         list: Lista de períodos únicos que tienen ambos reportes
     """
     try:
-        # Obtener todas las claves del cliente
-        pattern_esf = f"sgm:contabilidad:{cliente_id}:*:esf"
-        pattern_eri = f"sgm:contabilidad:{cliente_id}:*:eri"
-        pattern_ecp = f"sgm:contabilidad:{cliente_id}:*:ecp"
+        # Obtener todas las claves del cliente (registro de claves, sin KEYS)
+        claves = cache_system.get_client_keys(cliente_id)
 
-        claves_esf = cache_system.redis_client.keys(pattern_esf)
-        claves_eri = cache_system.redis_client.keys(pattern_eri)
-        claves_ecp = cache_system.redis_client.keys(pattern_ecp)
+        claves_esf = [k for k in claves if k.endswith(':esf')]
+        claves_eri = [k for k in claves if k.endswith(':eri')]
+        claves_ecp = [k for k in claves if k.endswith(':ecp')]
 
         # Extraer períodos de las claves
         periodos_esf = set()
@@ -470,8 +469,8 @@ def generar_estado_resultados_integral(self, cierre_id, usuario_id=None, regener
             meta={'step': 'Obteniendo clasificaciones ERI', 'progress': 10}
         )
         
-        # Obtener el set de clasificación ERI de forma robusta
-        set_eri = _obtener_set_eri_del_cierre(cierre)
+        # Obtener el set de clasificación ERI desde el molde compilado del cliente
+        set_eri, _ = _sets_del_molde(obtener_molde_clasificacion(cierre, _cache_snapshot()), 'eri', cierre.cliente_id)
         
         if not set_eri:
             raise Exception("No se encontró set de clasificación Estado de Resultados Integral para este cliente")
@@ -752,11 +751,9 @@ def _estructurar_datos_ecp(cuentas_data, clasificaciones, cierre):
     Estructura los datos en el formato del Estado de Cambios en el Patrimonio
     usando el set predefinido como molde y los sets del cliente para agrupación detallada
     """
-    # Obtener el set ECP para usar sus opciones como molde
-    set_ecp = _obtener_set_ecp_del_cierre(cierre)
-    
-    # Obtener todos los sets de clasificación del cliente (excluyendo ESF, ERI y ECP)
-    sets_cliente = _obtener_sets_cliente_para_agrupacion_ecp(cierre.cliente, set_ecp)
+    # Set ECP (molde) y sets del cliente para agrupación, desde el molde compilado del cliente
+    molde = obtener_molde_clasificacion(cierre, _cache_snapshot())
+    set_ecp, sets_cliente = _sets_del_molde(molde, 'ecp', cierre.cliente_id)
     
     # Obtener todas las clasificaciones de las cuentas para todos los sets
     clasificaciones_completas = _obtener_clasificaciones_completas_ecp(cuentas_data.keys(), cierre.cliente, set_ecp, sets_cliente)
@@ -820,7 +817,9 @@ def _estructurar_datos_ecp(cuentas_data, clasificaciones, cierre):
         opcion_valor_ecp = clasificacion_ecp['opcion_valor']
         
         # Determinar la categoría usando el valor exacto del set
-        categoria, nombres_bilingues = _determinar_categoria_ecp_con_molde(opcion_valor_ecp, set_ecp, cierre.cliente.bilingue)
+        categoria, nombres_bilingues = _categoria_desde_molde(
+            molde, 'ecp', opcion_valor_ecp, set_ecp, cierre.cliente.bilingue
+        )
         
         if categoria:
             # Asegurar que la estructura existe
@@ -828,7 +827,9 @@ def _estructurar_datos_ecp(cuentas_data, clasificaciones, cierre):
                 continue  # Saltar si no es una categoría válida
             
             # Determinar el nombre del grupo usando sets del cliente
-            grupo_nombre = _determinar_nombre_grupo_detallado(clasificacion_cuenta, sets_cliente, opcion_valor_ecp)
+            grupo_nombre = _determinar_nombre_grupo_detallado(
+                clasificacion_cuenta, sets_cliente, opcion_valor_ecp, molde['grupos']
+            )
             grupo_nombre_es = grupo_nombre['nombre_es']
             grupo_nombre_en = grupo_nombre['nombre_en']
             
@@ -857,7 +858,8 @@ def _estructurar_datos_ecp(cuentas_data, clasificaciones, cierre):
                 'total_haber': datos_cuenta['total_haber'],
                 'cambios': cambios,
                 'saldo_final': datos_cuenta['saldo_final'],
-                'movimientos': datos_cuenta['movimientos'],
+                'movimientos_count': datos_cuenta['movimientos_count'],
+                'detalle_movimientos': datos_cuenta['detalle_movimientos'],
                 'clasificaciones_cliente': {
                     set_nombre: cls_data['opcion_valor'] 
                     for set_nombre, cls_data in clasificacion_cuenta['cliente_sets'].items()
@@ -1029,8 +1031,8 @@ def generar_estado_cambios_patrimonio(self, cierre_id, usuario_id=None, regenera
             meta={'step': 'Obteniendo clasificaciones ECP', 'progress': 10}
         )
         
-        # Obtener el set de clasificación ECP de forma robusta
-        set_ecp = _obtener_set_ecp_del_cierre(cierre)
+        # Obtener el set de clasificación ECP desde el molde compilado del cliente
+        set_ecp, _ = _sets_del_molde(obtener_molde_clasificacion(cierre, _cache_snapshot()), 'ecp', cierre.cliente_id)
         
         if not set_ecp:
             raise Exception("No se encontró set de clasificación Estado de Cambio Patrimonial para este cliente")
@@ -1132,111 +1134,334 @@ def generar_estado_cambios_patrimonio(self, cierre_id, usuario_id=None, regenera
         raise Exception(error_msg)
 
 
-def _obtener_cuentas_con_datos(cierre):
+# Columnas de cada cuenta en el snapshot (montos como str para no perder precisión)
+COLUMNAS_SNAPSHOT_CUENTAS = [
+    'cuenta_id', 'codigo', 'nombre', 'nombre_en', 'saldo_anterior', 'total_debe', 'total_haber', 'movimientos'
+]
+# Columnas de cada movimiento en el detalle del snapshot
+COLUMNAS_SNAPSHOT_MOVIMIENTOS = [
+    'fecha', 'descripcion', 'debe', 'haber', 'numero_documento', 'tipo_documento'
+]
+
+
+def _version_datos_cierre(cierre):
     """
-    Obtiene todas las cuentas del cierre con sus datos calculados
+    Versión de los datos contables del cierre: id y estado de la última carga de libro
+    mayor (una consulta por índice). Cada carga o reproceso crea su UploadLog y lo deja
+    en completado o error, así que la versión cambia con cada ingesta. Las demás
+    escrituras (ediciones por API, limpieza para reprocesar, borrado desde el admin)
+    invalidan el snapshot explícitamente (invalidar_snapshot_cuentas)
     """
-    # Obtener cuentas con movimientos
-    cuentas_con_movimientos = MovimientoContable.objects.filter(
-        cierre=cierre
-    ).values_list('cuenta_id', flat=True).distinct()
-    
-    # Obtener cuentas con saldo de apertura
-    cuentas_con_apertura = AperturaCuenta.objects.filter(
-        cierre=cierre
-    ).values_list('cuenta_id', flat=True).distinct()
-    
-    # Unir ambos conjuntos
-    cuenta_ids = set(cuentas_con_movimientos) | set(cuentas_con_apertura)
-    
-    # Obtener datos de las cuentas
-    cuentas = CuentaContable.objects.filter(
-        id__in=cuenta_ids,
-        cliente=cierre.cliente
-    ).values('id', 'codigo', 'nombre', 'nombre_en')
-    
-    # Crear diccionario con datos de cuentas
+    ultima_carga = (
+        UploadLog.objects.filter(cierre=cierre, tipo_upload='libro_mayor')
+        .order_by('-id')
+        .values_list('id', 'estado')
+        .first()
+    )
+    if ultima_carga is None:
+        return "u0"
+    return f"u{ultima_carga[0]}.{ultima_carga[1]}"
+
+
+def invalidar_snapshot_cuentas(cliente_id, periodo=None):
+    """
+    Invalida el snapshot de cuentas del cliente/período al confirmar la transacción.
+    Sin período se invalidan todos los del cliente (nombres y códigos de cuenta)
+    """
+    def invalidar():
+        cache = _cache_snapshot()
+        if cache is not None:
+            cache.invalidate_snapshot_cierre(cliente_id, periodo)
+
+    transaction.on_commit(invalidar)
+
+
+def _cache_snapshot():
+    """Sistema de cache de contabilidad (snapshot y molde), o None si Redis no está disponible"""
+    try:
+        return get_cache_system()
+    except Exception as e:
+        logger.warning(f"⚠️ Cache no disponible para el snapshot de cuentas y el molde de clasificación: {e}")
+        return None
+
+
+def _snapshot_vigente(cache, cierre, parte, version):
+    """Parte del snapshot guardada en cache si corresponde al cierre y versión actuales"""
+    if cache is None:
+        return None
+    snapshot = cache.get_snapshot_cierre(cierre.cliente_id, cierre.periodo, parte)
+    if snapshot and snapshot.get('cierre_id') == cierre.id and snapshot.get('version') == version:
+        return snapshot
+    return None
+
+
+def obtener_snapshot_cuentas(cierre, cache=None, version=None):
+    """
+    Snapshot de las cuentas del cierre: saldo anterior, debe, haber y cantidad de
+    movimientos de cada cuenta con apertura o movimientos, en forma compacta
+    (COLUMNAS_SNAPSHOT_CUENTAS). Se arma una vez por versión de datos con el balance de
+    comprobación (una consulta agrupada) y se comparte en cache entre ESF, ERI, ECP y
+    los cálculos de finalización.
+
+    Returns:
+        dict: {'cierre_id', 'version', 'columnas', 'cuentas': [[...], ...]}
+    """
+    from .tasks_finalizacion import calcular_balance_comprobacion
+
+    version = version or _version_datos_cierre(cierre)
+    snapshot = _snapshot_vigente(cache, cierre, 'cuentas', version)
+    if snapshot is not None:
+        logger.info(f"♻️ Snapshot de cuentas del cierre {cierre.id} reutilizado ({version})")
+        return snapshot
+
+    snapshot = {
+        'cierre_id': cierre.id,
+        'version': version,
+        'columnas': COLUMNAS_SNAPSHOT_CUENTAS,
+        'cuentas': [
+            [
+                registro['cuenta_id'], registro['codigo'], registro['nombre'], registro['nombre_en'],
+                str(registro['saldo_inicial']), str(registro['debe']), str(registro['haber']),
+                registro['movimientos'],
+            ]
+            for registro in calcular_balance_comprobacion(cierre)
+            if registro['movimientos'] or registro['tiene_apertura']
+        ],
+    }
+    if cache is not None:
+        cache.set_snapshot_cierre(cierre.cliente_id, cierre.periodo, 'cuentas', snapshot)
+    logger.info(f"📸 Snapshot de cuentas del cierre {cierre.id}: {len(snapshot['cuentas'])} cuentas ({version})")
+    return snapshot
+
+
+def obtener_movimientos_snapshot(cierre, cache=None, version=None):
+    """
+    Detalle de movimientos del cierre por cuenta (COLUMNAS_SNAPSHOT_MOVIMIENTOS), leído
+    una sola vez por versión de datos y compartido en cache. Solo se carga cuando un
+    reporte lo pide.
+
+    Returns:
+        dict: {'cierre_id', 'version', 'columnas', 'por_cuenta': {str(cuenta_id): [[...], ...]}}
+    """
+    version = version or _version_datos_cierre(cierre)
+    snapshot = _snapshot_vigente(cache, cierre, 'movimientos', version)
+    if snapshot is not None:
+        return snapshot
+
+    por_cuenta = {}
+    detalle = MovimientoContable.objects.filter(cierre=cierre).order_by('cuenta_id', 'fecha', 'id').values_list(
+        'cuenta_id', 'fecha', 'descripcion', 'debe', 'haber', 'numero_documento', 'tipo_doc_codigo'
+    )
+    for cuenta_id, fecha, descripcion, debe, haber, numero_documento, tipo_doc_codigo in detalle.iterator(chunk_size=5000):
+        por_cuenta.setdefault(str(cuenta_id), []).append([
+            fecha.isoformat(), descripcion, float(debe), float(haber), numero_documento, tipo_doc_codigo
+        ])
+
+    snapshot = {
+        'cierre_id': cierre.id,
+        'version': version,
+        'columnas': COLUMNAS_SNAPSHOT_MOVIMIENTOS,
+        'por_cuenta': por_cuenta,
+    }
+    if cache is not None:
+        cache.set_snapshot_cierre(cierre.cliente_id, cierre.periodo, 'movimientos', snapshot)
+    return snapshot
+
+
+def indice_movimientos_por_codigo(cierre):
+    """
+    Índice del detalle de movimientos del cierre por código de cuenta, como lo cruzan
+    las vistas de Streamlit con las cuentas de ESF/ERI/ECP. No lleva las filas: cada
+    cuenta apunta a su endpoint paginado (detalle_movimientos) y Streamlit pide las
+    páginas solo de las cuentas que muestra.
+
+    Returns:
+        dict: {'cierre_id', 'cuentas': {codigo: {'cuenta_id', 'movimientos_count', 'detalle_movimientos'}}}
+    """
+    snapshot = obtener_snapshot_cuentas(cierre, _cache_snapshot(), _version_datos_cierre(cierre))
+    return {
+        'cierre_id': cierre.id,
+        'cuentas': {
+            str(codigo): {
+                'cuenta_id': cuenta_id,
+                'movimientos_count': movimientos,
+                'detalle_movimientos': _url_detalle_movimientos(cierre.id, cuenta_id),
+            }
+            for cuenta_id, codigo, _, _, _, _, _, movimientos in snapshot['cuentas']
+            if movimientos
+        },
+    }
+
+
+def _url_detalle_movimientos(cierre_id, cuenta_id):
+    """Endpoint paginado con el detalle de movimientos de una cuenta del cierre"""
+    return reverse('cierres-detalle-movimientos', kwargs={'pk': cierre_id, 'cuenta_id': cuenta_id})
+
+
+def _obtener_cuentas_con_datos(cierre, incluir_movimientos=False):
+    """
+    Obtiene todas las cuentas del cierre con sus datos calculados, desde el snapshot
+    compartido del cierre (obtener_snapshot_cuentas).
+
+    Los reportes solo llevan agregados: cada cuenta trae movimientos_count y
+    detalle_movimientos (URL del detalle paginado). Con incluir_movimientos=True se
+    agrega además la lista completa de movimientos de cada cuenta.
+    """
+    cache = _cache_snapshot()
+    version = _version_datos_cierre(cierre)
+    snapshot = obtener_snapshot_cuentas(cierre, cache, version)
+    por_cuenta = None
+    if incluir_movimientos:
+        por_cuenta = obtener_movimientos_snapshot(cierre, cache, version)['por_cuenta']
+
     cuentas_data = {}
-    for cuenta in cuentas:
-        cuentas_data[cuenta['id']] = {
-            'codigo': cuenta['codigo'],
-            'nombre_es': cuenta['nombre'],
-            'nombre_en': cuenta['nombre_en'] or cuenta['nombre'],
-            'movimientos': [],
-            'saldo_anterior': 0,
-            'total_debe': 0,
-            'total_haber': 0,
-            'saldo_final': 0
+    for cuenta_id, codigo, nombre, nombre_en, saldo_anterior, total_debe, total_haber, movimientos in snapshot['cuentas']:
+        saldo_anterior = float(saldo_anterior)
+        total_debe = float(total_debe)
+        total_haber = float(total_haber)
+        cuentas_data[cuenta_id] = {
+            'codigo': codigo,
+            'nombre_es': nombre,
+            'nombre_en': nombre_en or nombre,
+            'movimientos_count': movimientos,
+            'detalle_movimientos': _url_detalle_movimientos(cierre.id, cuenta_id),
+            'saldo_anterior': saldo_anterior,
+            'total_debe': total_debe,
+            'total_haber': total_haber,
+            'saldo_final': saldo_anterior + total_debe - total_haber,
         }
-    
-    # Obtener saldos de apertura
-    aperturas = AperturaCuenta.objects.filter(
-        cierre=cierre,
-        cuenta_id__in=cuenta_ids
-    ).values('cuenta_id', 'saldo_anterior')
-    
-    for apertura in aperturas:
-        if apertura['cuenta_id'] in cuentas_data:
-            cuentas_data[apertura['cuenta_id']]['saldo_anterior'] = float(apertura['saldo_anterior'])
-    
-    # Obtener movimientos agrupados por cuenta
-    movimientos = MovimientoContable.objects.filter(
-        cierre=cierre,
-        cuenta_id__in=cuenta_ids
-    ).values(
-        'cuenta_id'
-    ).annotate(
-        total_debe=models.Sum('debe'),
-        total_haber=models.Sum('haber')
-    )
-    
-    # También obtener movimientos detallados
-    movimientos_detalle = MovimientoContable.objects.filter(
-        cierre=cierre,
-        cuenta_id__in=cuenta_ids
-    ).select_related('tipo_documento').values(
-        'cuenta_id', 'fecha', 'descripcion', 'debe', 'haber',
-        'numero_documento', 'tipo_doc_codigo'
-    ).order_by('cuenta_id', 'fecha')
-    
-    # Agrupar movimientos por cuenta
-    movimientos_por_cuenta = {}
-    for mov in movimientos_detalle:
-        cuenta_id = mov['cuenta_id']
-        if cuenta_id not in movimientos_por_cuenta:
-            movimientos_por_cuenta[cuenta_id] = []
-        
-        movimientos_por_cuenta[cuenta_id].append({
-            'fecha': mov['fecha'].isoformat(),
-            'descripcion': mov['descripcion'],
-            'debe': float(mov['debe']),
-            'haber': float(mov['haber']),
-            'numero_documento': mov['numero_documento'],
-            'tipo_documento': mov['tipo_doc_codigo']
-        })
-    
-    # Calcular totales y asignar movimientos para cuentas con movimientos
-    for mov in movimientos:
-        cuenta_id = mov['cuenta_id']
-        if cuenta_id in cuentas_data:
-            cuentas_data[cuenta_id]['total_debe'] = float(mov['total_debe'] or 0)
-            cuentas_data[cuenta_id]['total_haber'] = float(mov['total_haber'] or 0)
-            cuentas_data[cuenta_id]['movimientos'] = movimientos_por_cuenta.get(cuenta_id, [])
-    
-    # ✅ CORREGIDO: Calcular saldo final para TODAS las cuentas (con y sin movimientos)
-    for cuenta_id, datos_cuenta in cuentas_data.items():
-        saldo_anterior = datos_cuenta['saldo_anterior']
-        total_debe = datos_cuenta['total_debe']
-        total_haber = datos_cuenta['total_haber']
-        datos_cuenta['saldo_final'] = saldo_anterior + total_debe - total_haber
-        
-        # Asegurar que las cuentas sin movimientos tengan lista vacía
-        if 'movimientos' not in datos_cuenta:
-            datos_cuenta['movimientos'] = []
+        if por_cuenta is not None:
+            cuentas_data[cuenta_id]['movimientos'] = [
+                dict(zip(COLUMNAS_SNAPSHOT_MOVIMIENTOS, movimiento))
+                for movimiento in por_cuenta.get(str(cuenta_id), [])
+            ]
     
     return cuentas_data
 
 
+# Formato del molde de clasificación; cambiarlo invalida los moldes ya guardados
+MOLDE_CLASIFICACION_FORMATO = 1
+
+
+def _compilar_molde_clasificacion(cierre):
+    """
+    Compila el molde de clasificación del cliente: sets de ESF/ERI/ECP resueltos,
+    sets de agrupación de cada estado, y por cada opción de esos sets su categoría
+    (con nombres bilingües) y su nombre de grupo predefinido. Usa las mismas
+    funciones _determinar_* y _obtener_set_*, así que el resultado es idéntico al
+    cálculo por cuenta.
+    """
+    cliente = cierre.cliente
+    sets = {
+        'esf': _obtener_set_esf_del_cierre(cierre),
+        'eri': _obtener_set_eri_del_cierre(cierre),
+        'ecp': _obtener_set_ecp_del_cierre(cierre),
+    }
+    agrupacion = {
+        'esf': _obtener_sets_cliente_para_agrupacion(cliente, sets['esf']),
+        'eri': _obtener_sets_cliente_para_agrupacion(cliente, sets['eri']),
+        'ecp': _obtener_sets_cliente_para_agrupacion_ecp(cliente, sets['ecp']),
+    }
+    determinar = {
+        'esf': _determinar_categoria_esf_con_molde,
+        'eri': _determinar_categoria_eri_con_molde,
+        'ecp': _determinar_categoria_ecp_con_molde,
+    }
+
+    # Nombres bilingües de la primera opción con cada valor (como .first() por set)
+    nombres_opciones = {}
+    opciones = ClasificacionOption.objects.filter(
+        set_clas_id__in=[s.id for s in sets.values() if s]
+    ).order_by('id').values_list('set_clas_id', 'valor', 'valor_en', 'descripcion', 'descripcion_en')
+    for set_id, valor, valor_en, descripcion, descripcion_en in opciones:
+        nombres_opciones.setdefault(set_id, {}).setdefault(valor, {
+            'valor_es': valor,
+            'valor_en': valor_en if cliente.bilingue and valor_en else valor,
+            'descripcion_es': descripcion,
+            'descripcion_en': descripcion_en if cliente.bilingue and descripcion_en else descripcion
+        })
+
+    categorias = {}
+    grupos = {}
+    for estado, set_clas in sets.items():
+        categorias[estado] = {}
+        if not set_clas:
+            continue
+        for valor, nombres in nombres_opciones.get(set_clas.id, {}).items():
+            # Sin set la función no consulta la BD; los nombres de la opción van primero
+            *categoria, nombres_categoria = determinar[estado](valor, None, cliente.bilingue)
+            categorias[estado][valor] = [*categoria, {**nombres, **nombres_categoria}]
+            if valor not in grupos:
+                grupos[valor] = _determinar_nombre_grupo_detallado(None, [], valor)
+
+    return {
+        'formato': MOLDE_CLASIFICACION_FORMATO,
+        'cliente_id': cliente.id,
+        'bilingue': cliente.bilingue,
+        'sets': {
+            estado: {'id': s.id, 'nombre': s.nombre} if s else None for estado, s in sets.items()
+        },
+        'agrupacion': {
+            estado: [{'id': s.id, 'nombre': s.nombre} for s in sets_estado]
+            for estado, sets_estado in agrupacion.items()
+        },
+        'categorias': categorias,
+        'grupos': grupos,
+    }
+
+
+def obtener_molde_clasificacion(cierre, cache=None):
+    """
+    Molde de clasificación del cliente del cierre, compartido en cache entre cierres
+    y reportes. Las señales de ClasificacionSet/ClasificacionOption lo invalidan al
+    editar la clasificación; un cambio de bilingüe del cliente lo recompila.
+    """
+    cliente = cierre.cliente
+    if cache is not None:
+        molde = cache.get_molde_clasificacion(cliente.id)
+        if (
+            molde and molde.get('formato') == MOLDE_CLASIFICACION_FORMATO
+            and molde.get('bilingue') == cliente.bilingue
+        ):
+            return molde
+
+    molde = _compilar_molde_clasificacion(cierre)
+    if cache is not None:
+        cache.set_molde_clasificacion(cliente.id, molde)
+    logger.info(
+        f"🧩 Molde de clasificación compilado para cliente {cliente.id}: "
+        f"{sum(len(c) for c in molde['categorias'].values())} opciones"
+    )
+    return molde
+
+
+def _sets_del_molde(molde, estado, cliente_id):
+    """Set principal y sets de agrupación del estado como instancias livianas (id y nombre)"""
+    principal = molde['sets'][estado]
+    return (
+        ClasificacionSet(cliente_id=cliente_id, **principal) if principal else None,
+        [ClasificacionSet(cliente_id=cliente_id, **s) for s in molde['agrupacion'][estado]],
+    )
+
+
+def _categoria_desde_molde(molde, estado, opcion_valor, set_clas, es_bilingue):
+    """
+    Categoría compilada de la opción (lista con la misma forma que la tupla de
+    _determinar_categoria_<estado>_con_molde). Un valor fuera del molde se
+    calcula y se agrega al molde en memoria
+    """
+    compilada = molde['categorias'][estado].get(opcion_valor)
+    if compilada is None:
+        determinar = {
+            'esf': _determinar_categoria_esf_con_molde,
+            'eri': _determinar_categoria_eri_con_molde,
+            'ecp': _determinar_categoria_ecp_con_molde,
+        }[estado]
+        compilada = list(determinar(opcion_valor, set_clas, es_bilingue))
+        molde['categorias'][estado][opcion_valor] = compilada
+    return compilada
+
+
 def _obtener_clasificaciones_esf(set_esf, cuenta_ids):
     """
     Obtiene las clasificaciones ESF para las cuentas especificadas
@@ -1264,11 +1489,9 @@ def _estructurar_datos_esf(cuentas_data, clasificaciones, cierre):
     Estructura los datos en el formato del Estado de Situación Financiera
     usando el set predefinido ESF como molde y los sets del cliente para agrupación detallada
     """
-    # Obtener el set ESF para usar sus opciones como molde
-    set_esf = _obtener_set_esf_del_cierre(cierre)
-    
-    # Obtener todos los sets de clasificación del cliente (excluyendo ESF y ERI)
-    sets_cliente = _obtener_sets_cliente_para_agrupacion(cierre.cliente, set_esf)
+    # Set ESF (molde) y sets del cliente para agrupación, desde el molde compilado del cliente
+    molde = obtener_molde_clasificacion(cierre, _cache_snapshot())
+    set_esf, sets_cliente = _sets_del_molde(molde, 'esf', cierre.cliente_id)
     
     # Obtener todas las clasificaciones de las cuentas para todos los sets
     clasificaciones_completas = _obtener_clasificaciones_completas(cuentas_data.keys(), cierre.cliente, set_esf, sets_cliente)
@@ -1343,8 +1566,8 @@ def _estructurar_datos_esf(cuentas_data, clasificaciones, cierre):
         opcion_valor_esf = clasificacion_esf['opcion_valor']
         
         # Determinar la categoría principal y subcategoría usando ESF
-        categoria_principal, subcategoria, nombres_bilingues = _determinar_categoria_esf_con_molde(
-            opcion_valor_esf, set_esf, cierre.cliente.bilingue
+        categoria_principal, subcategoria, nombres_bilingues = _categoria_desde_molde(
+            molde, 'esf', opcion_valor_esf, set_esf, cierre.cliente.bilingue
         )
         
         if categoria_principal and subcategoria:
@@ -1365,7 +1588,9 @@ def _estructurar_datos_esf(cuentas_data, clasificaciones, cierre):
                 esf_data[categoria_principal][subcategoria]['grupos'] = {}
             
             # Determinar el nombre del grupo usando sets del cliente
-            grupo_nombre = _determinar_nombre_grupo_detallado(clasificacion_cuenta, sets_cliente, opcion_valor_esf)
+            grupo_nombre = _determinar_nombre_grupo_detallado(
+                clasificacion_cuenta, sets_cliente, opcion_valor_esf, molde['grupos']
+            )
             grupo_nombre_es = grupo_nombre['nombre_es']
             grupo_nombre_en = grupo_nombre['nombre_en']
             
@@ -1388,7 +1613,8 @@ def _estructurar_datos_esf(cuentas_data, clasificaciones, cierre):
                 'total_debe': datos_cuenta['total_debe'],
                 'total_haber': datos_cuenta['total_haber'],
                 'saldo_final': datos_cuenta['saldo_final'],
-                'movimientos': datos_cuenta['movimientos'],
+                'movimientos_count': datos_cuenta['movimientos_count'],
+                'detalle_movimientos': datos_cuenta['detalle_movimientos'],
                 'clasificaciones_cliente': {
                     set_nombre: cls_data['opcion_valor'] 
                     for set_nombre, cls_data in clasificacion_cuenta['cliente_sets'].items()
@@ -1439,7 +1665,7 @@ def _estructurar_datos_esf(cuentas_data, clasificaciones, cierre):
     return esf_data
 
 
-def _determinar_nombre_grupo_detallado(clasificacion_cuenta, sets_cliente, opcion_valor):
+def _determinar_nombre_grupo_detallado(clasificacion_cuenta, sets_cliente, opcion_valor, grupos=None):
     """
     Determina el nombre del grupo detallado para organizar las cuentas en los reportes.
     
@@ -1452,6 +1678,7 @@ def _determinar_nombre_grupo_detallado(clasificacion_cuenta, sets_cliente, opcio
         }
         sets_cliente: Lista de sets de clasificación del cliente  
         opcion_valor: Valor de la opción de clasificación ESF/ERI
+        grupos: Nombres de grupo ya compilados por opción (molde de clasificación)
         
     Returns:
         dict: {'nombre_es': str, 'nombre_en': str, 'origen': str}
@@ -1471,7 +1698,10 @@ def _determinar_nombre_grupo_detallado(clasificacion_cuenta, sets_cliente, opcio
                         'origen': set_nombre
                     }
         
-        # 2. Fallback: usar mapeo predefinido basado en opcion_valor ESF/ERI
+        # 2. Fallback: nombre compilado en el molde o mapeo predefinido basado en opcion_valor ESF/ERI
+        if grupos is not None and opcion_valor in grupos:
+            return grupos[opcion_valor]
+        
         mapeo_nombres = {
             'Activo Corriente': {
                 'nombre_es': 'Activos Corrientes',
@@ -1750,11 +1980,9 @@ def _estructurar_datos_eri(cuentas_data, clasificaciones, cierre):
     Estructura los datos en el formato del Estado de Resultados Integral
     usando el set predefinido como molde y los sets del cliente para agrupación detallada
     """
-    # Obtener el set ERI para usar sus opciones como molde
-    set_eri = _obtener_set_eri_del_cierre(cierre)
-    
-    # Obtener todos los sets de clasificación del cliente (excluyendo ESF y ERI)
-    sets_cliente = _obtener_sets_cliente_para_agrupacion(cierre.cliente, set_eri)
+    # Set ERI (molde) y sets del cliente para agrupación, desde el molde compilado del cliente
+    molde = obtener_molde_clasificacion(cierre, _cache_snapshot())
+    set_eri, sets_cliente = _sets_del_molde(molde, 'eri', cierre.cliente_id)
     
     # Obtener todas las clasificaciones de las cuentas para todos los sets
     clasificaciones_completas = _obtener_clasificaciones_completas_eri(cuentas_data.keys(), cierre.cliente, set_eri, sets_cliente)
@@ -1809,7 +2037,9 @@ def _estructurar_datos_eri(cuentas_data, clasificaciones, cierre):
         opcion_valor_eri = clasificacion_eri['opcion_valor']
         
         # Determinar la categoría usando el valor exacto del set
-        categoria, nombres_bilingues = _determinar_categoria_eri_con_molde(opcion_valor_eri, set_eri, cierre.cliente.bilingue)
+        categoria, nombres_bilingues = _categoria_desde_molde(
+            molde, 'eri', opcion_valor_eri, set_eri, cierre.cliente.bilingue
+        )
         
         if categoria:
             # Asegurar que la estructura existe
@@ -1826,7 +2056,9 @@ def _estructurar_datos_eri(cuentas_data, clasificaciones, cierre):
                 eri_data[categoria]['grupos'] = {}
             
             # Determinar el nombre del grupo usando sets del cliente
-            grupo_nombre = _determinar_nombre_grupo_detallado(clasificacion_cuenta, sets_cliente, opcion_valor_eri)
+            grupo_nombre = _determinar_nombre_grupo_detallado(
+                clasificacion_cuenta, sets_cliente, opcion_valor_eri, molde['grupos']
+            )
             grupo_nombre_es = grupo_nombre['nombre_es']
             grupo_nombre_en = grupo_nombre['nombre_en']
             
@@ -1849,7 +2081,8 @@ def _estructurar_datos_eri(cuentas_data, clasificaciones, cierre):
                 'total_debe': datos_cuenta['total_debe'],
                 'total_haber': datos_cuenta['total_haber'],
                 'saldo_final': datos_cuenta['saldo_final'],
-                'movimientos': datos_cuenta['movimientos'],
+                'movimientos_count': datos_cuenta['movimientos_count'],
+                'detalle_movimientos': datos_cuenta['detalle_movimientos'],
                 'clasificaciones_cliente': {
                     set_nombre: cls_data['opcion_valor'] 
                     for set_nombre, cls_data in clasificacion_cuenta['cliente_sets'].items()
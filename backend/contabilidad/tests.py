@@ -1,4 +1,10 @@
-from django.test import TestCase
+import os
+from decimal import Decimal
+from tempfile import mkdtemp
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from api.models import Cliente, Usuario, Area
 from contabilidad.models import (
@@ -14,6 +20,44 @@ from contabilidad.models import (
     Incidencia,
     TarjetaActivityLog,
 )
+import fakeredis
+from contabilidad.cache_redis import (
+    LOGS_INDEX_BUILT_KEY,
+    PERIODO_CLIENTE,
+    REGISTRY_CHECK_SECONDS,
+    REGISTRY_READY_KEY,
+    FORMATO_JSON_ZLIB,
+    FORMATO_MSGPACK,
+    FORMATO_MSGPACK_ZLIB,
+    SERIALIZADORES,
+    SGMCacheSystem,
+    _LocalLRUCache,
+)
+from contabilidad.tasks_finalizacion import (
+    calcular_balance_comprobacion,
+    calcular_saldos_por_cuenta,
+    finalizar_cierre_y_generar_reportes,
+)
+from contabilidad.tasks_reportes import (
+    _categoria_desde_molde,
+    _determinar_categoria_ecp_con_molde,
+    _determinar_categoria_esf_con_molde,
+    _determinar_nombre_grupo_detallado,
+    _obtener_cuentas_con_datos,
+    _sets_del_molde,
+    indice_movimientos_por_codigo,
+    obtener_molde_clasificacion,
+    obtener_snapshot_cuentas,
+)
+from unittest import mock
+from celery.exceptions import Ignore
+from contabilidad.tasks_libro_mayor import (
+    _combinar_parciales_libro_mayor,
+    _construir_mapa_esf_eri,
+    _leer_chunk_libro_mayor,
+    _particionar_libro_mayor,
+    procesar_chunk_libro_mayor,
+)
 
 
 class MovimientosResumenTests(TestCase):
@@ -222,3 +266,557 @@ class ReprocesarIncompletosTests(TestCase):
         self.assertEqual(len(data), 2)
         first = data[0]
         self.assertIn("incidencias", first)
+
+
+class MapaEsfEriTests(SimpleTestCase):
+    def test_categoria_por_set_y_valor(self):
+        clasif = {
+            "1001": {"Estado de Situacion Financiera": "Activo Corriente"},
+            "4001": {"Estado de Resultados": "Ingresos"},
+            "9001": {"Centro": "Norte"},
+            "9002": {"Tipo": "ERI"},
+        }
+        mapa = _construir_mapa_esf_eri(clasif)
+        self.assertEqual(mapa["1001"], "ESF")
+        self.assertEqual(mapa["4001"], "ERI")
+        self.assertEqual(mapa["9002"], "ERI")
+        self.assertNotIn("9001", mapa)
+
+    def test_primera_clasificacion_que_coincide_gana(self):
+        clasif = {"2001": {"Centro": "Sur", "Balance": "Pasivo Corriente", "Resultado": "Gastos"}}
+        self.assertEqual(_construir_mapa_esf_eri(clasif), {"2001": "ESF"})
+
+
+HEADERS_LIBRO = (None, "CUENTA", "FECHA", "DESCRIPCION", "DEBE", "HABER", "SALDO")
+
+
+def _filas_libro():
+    filas = []
+    for codigo, movimientos in (("1001", 3), ("1002", 4), ("1003", 1)):
+        filas.append((None, f"SALDO ANTERIOR DE LA CUENTA: {codigo}  Cuenta {codigo}", None, None, None, None, 10))
+        filas.extend((None, None, "2024-03-01", "mov", 5, 0, None) for _ in range(movimientos))
+    return filas
+
+
+class ChunksLibroMayorTests(SimpleTestCase):
+    def test_particion_arrastra_cuenta_abierta_y_se_lee_una_vez(self):
+        directorio = mkdtemp()
+        cuentas, chunks = _particionar_libro_mayor(_filas_libro(), 1, HEADERS_LIBRO, 5, directorio)
+        self.assertEqual(list(cuentas), ["1001", "1002", "1003"])
+        self.assertEqual(
+            [(c["fila_inicio"], c["fila_fin"], c["cuenta_inicial"], c["codigos"]) for c in chunks],
+            [(11, 15, None, ["1001", "1002"]), (16, 20, "1002", ["1002", "1003"]), (21, 21, "1003", ["1003"])],
+        )
+        datos = _leer_chunk_libro_mayor(chunks[1]["archivo"])
+        self.assertEqual((datos["headers"], len(datos["filas"])), (HEADERS_LIBRO, 5))
+        self.assertFalse(os.path.exists(chunks[1]["archivo"]))
+
+    def test_combinar_parciales(self):
+        def parcial(codigo, debe):
+            return {
+                "stats": {"cuentas_nuevas": 0, "aperturas": 1, "movimientos": 2, "incidencias_detectadas": 0},
+                "totales_esf_eri": {
+                    "ESF": {"saldo_ant": "0", "debe": debe, "haber": "0"},
+                    "ERI": {"saldo_ant": "0", "debe": "0", "haber": "0"},
+                    "NO_CLASIFICADAS": {"saldo_ant": "0", "debe": "0", "haber": "0"},
+                },
+                "contadores_clasificacion": {"ESF": 1, "ERI": 0, "NO_CLASIFICADAS": 0, "Sin_clasificacion": 0},
+                "movimientos_por_cuenta": {codigo: 2},
+                "saldos_anteriores": {codigo: "10"},
+                "cuentas": {codigo: {"nombre": codigo, "clasificacion": "ESF"}},
+                "cuentas_sin_clasificacion_por_set": {"7": {codigo: "Tipo"}},
+                "cuentas_sin_nombre_ingles": [],
+                "cuentas_con_tipo_doc_null": [codigo],
+                "cuentas_con_tipo_doc_no_reconocido": {},
+                "excepciones_aplicadas": {},
+            }
+
+        combinado = _combinar_parciales_libro_mayor([parcial("1001", "5.50"), parcial("1002", "4.50")])
+        self.assertEqual(combinado["stats"]["movimientos"], 4)
+        self.assertEqual(combinado["totales_esf_eri"]["ESF"]["debe"], "10.00")
+        self.assertEqual(combinado["cuentas_sin_clasificacion_por_set"], {"7": {"1001": "Tipo", "1002": "Tipo"}})
+        self.assertEqual(combinado["cuentas_con_tipo_doc_null"], ["1001", "1002"])
+
+
+class RevertirChunksLibroMayorTests(TestCase):
+    def setUp(self):
+        user = Usuario.objects.create_user(
+            correo_bdo="chunks@test.com", password="pass", nombre="C", apellido="T", tipo_usuario="gerente",
+        )
+        cliente = Cliente.objects.create(nombre="ClienteChunks", rut="7-7")
+        self.cierre = CierreContabilidad.objects.create(cliente=cliente, usuario=user, periodo="2024-03")
+        self.upload = UploadLog.objects.create(
+            tipo_upload="libro_mayor", cliente=cliente, cierre=self.cierre, nombre_archivo_original="lm.xlsx",
+            tamaño_archivo=1, estado="procesando",
+        )
+        cuentas, self.chunks = _particionar_libro_mayor(_filas_libro(), 1, HEADERS_LIBRO, 5, mkdtemp())
+        for codigo, nombre in cuentas.items():
+            CuentaContable.objects.create(cliente=cliente, codigo=codigo, nombre=nombre)
+        # Movimiento de una carga anterior: no se toca al revertir
+        MovimientoContable.objects.create(
+            cierre=self.cierre, cuenta=CuentaContable.objects.get(codigo="1001"), fecha="2024-02-01", debe=1,
+        )
+
+    def test_chunk_que_inserta_tras_el_error_revierte_toda_la_carga(self):
+        parcial = procesar_chunk_libro_mayor.apply(args=(self.upload.id, self.chunks[0])).get()
+        self.assertEqual((parcial["stats"]["aperturas"], parcial["stats"]["movimientos"]), (2, 3))
+        self.assertEqual(MovimientoContable.objects.filter(upload_log=self.upload).count(), 3)
+
+        # Otro chunk falló mientras este leía sus filas
+        UploadLog.objects.filter(pk=self.upload.id).update(estado="error")
+        with self.assertRaises(RuntimeError):
+            procesar_chunk_libro_mayor.apply(args=(self.upload.id, self.chunks[1])).get()
+
+        self.assertFalse(MovimientoContable.objects.filter(upload_log=self.upload).exists())
+        self.assertFalse(AperturaCuenta.objects.filter(upload_log=self.upload).exists())
+        self.assertEqual(MovimientoContable.objects.filter(cierre=self.cierre).count(), 1)
+
+
+class LocalLRUCacheTests(SimpleTestCase):
+    def test_expulsa_por_entradas_y_bytes(self):
+        lru = _LocalLRUCache(max_entries=2, max_bytes=100, ttl=60)
+        lru.set("a", 1, 10)
+        lru.set("b", 2, 10)
+        lru.get("a")
+        lru.set("c", 3, 10)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.get("a"), 1)
+        lru.set("d", 4, 95)
+        self.assertEqual((lru.get("a"), lru.get("c"), lru.get("d")), (None, None, 4))
+        lru.set("e", 5, 101)
+        self.assertIsNone(lru.get("e"))
+
+    def test_ttl_e_invalidacion_por_prefijo(self):
+        lru = _LocalLRUCache(max_entries=10, max_bytes=100, ttl=0)
+        lru.set("sgm:contabilidad:1:2025-01:kpis", 1, 1)
+        self.assertIsNone(lru.get("sgm:contabilidad:1:2025-01:kpis"))
+        lru.ttl = 60
+        lru.set("sgm:contabilidad:1:2025-01:kpis", 1, 1)
+        lru.set("sgm:contabilidad:12:2025-01:kpis", 2, 1)
+        lru.invalidate_prefix("sgm:contabilidad:1:")
+        self.assertIsNone(lru.get("sgm:contabilidad:1:2025-01:kpis"))
+        self.assertEqual(lru.get("sgm:contabilidad:12:2025-01:kpis"), 2)
+        self.assertEqual(lru.stats()["bytes"], 1)
+
+
+def _cache_en_fakeredis(**ajustes):
+    """SGMCacheSystem sobre un fakeredis propio, con los settings SGM_CACHE_* dados"""
+    servidor = fakeredis.FakeServer()
+
+    def conectar(**kwargs):
+        return fakeredis.FakeRedis(server=servidor, decode_responses=kwargs.get("decode_responses", False))
+
+    with mock.patch("redis.Redis", side_effect=conectar), override_settings(**ajustes):
+        return SGMCacheSystem()
+
+
+class SerializadorCacheTests(SimpleTestCase):
+    DATOS = {"cuentas": {1001: {"nombre": "Caja ñandú", "saldo": 1.5}}, "filas": [[1, "a", None]] * 200}
+
+    CABECERAS = {
+        ("json", True): b"{", ("json", False): b"{",
+        ("json-zlib", True): FORMATO_JSON_ZLIB, ("json-zlib", False): b"{",
+        ("msgpack", True): FORMATO_MSGPACK, ("msgpack", False): FORMATO_MSGPACK,
+        ("msgpack-zlib", True): FORMATO_MSGPACK_ZLIB, ("msgpack-zlib", False): FORMATO_MSGPACK,
+    }
+
+    def test_ida_y_vuelta_en_cada_formato(self):
+        for formato in SERIALIZADORES:
+            for comprimir in (True, False):
+                with self.subTest(formato=formato, comprimir=comprimir):
+                    cache = _cache_en_fakeredis(
+                        SGM_CACHE_SERIALIZER=formato, SGM_CACHE_COMPRESS_MIN_BYTES=0 if comprimir else 10**9
+                    )
+                    self.assertEqual(cache._serialize_data(self.DATOS)[:1], self.CABECERAS[formato, comprimir])
+                    self.assertTrue(cache.set_estado_financiero(1, "2024-01", "esf", self.DATOS))
+
+                    leido = cache.get_estado_financiero(1, "2024-01", "esf")
+                    self.assertEqual(leido["filas"], self.DATOS["filas"])
+                    # msgpack conserva las claves int; JSON las deja como str
+                    clave = 1001 if formato.startswith("msgpack") else "1001"
+                    self.assertEqual(leido["cuentas"], {clave: {"nombre": "Caja ñandú", "saldo": 1.5}})
+
+    def test_lee_entradas_json_sin_cabecera(self):
+        cache = _cache_en_fakeredis(SGM_CACHE_SERIALIZER="msgpack-zlib")
+        cache.redis_client.set("sgm:contabilidad:1:2024-01:kpis", '{"1": [2, 3]}')
+        self.assertEqual(cache._deserialize_data(cache.redis_bin.get("sgm:contabilidad:1:2024-01:kpis")), {"1": [2, 3]})
+
+
+class RegistroClavesTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = _cache_en_fakeredis()
+        self.redis = self.cache.redis_client
+
+    def test_registra_busca_e_invalida_por_cliente_y_periodo(self):
+        self.redis.set("sgm:contabilidad:1:2023-12:kpis", "{}")  # anterior al registro
+        self.cache.set_kpis(1, "2024-01", {"a": 1})
+        self.cache.set_estado_financiero(1, "2024-02", "esf", {})
+        self.cache.set_kpis(2, "2024-01", {"a": 2})
+
+        self.assertEqual(sorted(self.cache.get_client_keys(1)), [
+            "sgm:contabilidad:1:2023-12:kpis", "sgm:contabilidad:1:2024-01:kpis", "sgm:contabilidad:1:2024-02:esf",
+        ])
+        self.assertEqual(self.cache.get_client_keys(2, "2024-01"), ["sgm:contabilidad:2:2024-01:kpis"])
+
+        self.redis.delete("sgm:contabilidad:1:2024-02:esf")  # expiró por TTL
+        self.assertEqual(len(self.cache.get_client_keys(1)), 2)
+        self.assertFalse(self.redis.sismember(self.cache._registry_periodo_key(1, "2024-02"), "sgm:contabilidad:1:2024-02:esf"))
+
+        self.assertEqual(self.cache.invalidate_cliente_periodo(1, "2024-01"), 1)
+        self.assertEqual(self.cache.get_client_keys(1), ["sgm:contabilidad:1:2023-12:kpis"])
+        self.assertEqual(self.cache.invalidate_cliente_all(1), 1)
+        self.assertEqual(self.cache.get_client_keys(1), [])
+        self.assertEqual(self.cache.get_client_keys(2), ["sgm:contabilidad:2:2024-01:kpis"])
+
+    def test_marcador_y_sets_caducan_juntos_y_se_reconstruyen(self):
+        self.cache.set_kpis(1, "2024-01", {"a": 1})
+        self.cache.get_client_keys(1)
+        registro = self.cache._registry_periodo_key(1, "2024-01")
+        self.assertGreater(self.redis.ttl(REGISTRY_READY_KEY), 0)
+        self.assertGreaterEqual(self.redis.ttl(registro), self.redis.ttl(REGISTRY_READY_KEY))
+
+        # Vence el registro (marcador y sets) y llega una clave escrita por fuera
+        self.redis.delete(REGISTRY_READY_KEY, registro, self.cache._registry_cliente_key(1))
+        self.redis.set("sgm:contabilidad:1:2024-01:esf", "{}")
+        self.cache._registro_verificado -= REGISTRY_CHECK_SECONDS
+        self.assertEqual(sorted(self.cache.get_client_keys(1)), [
+            "sgm:contabilidad:1:2024-01:esf", "sgm:contabilidad:1:2024-01:kpis",
+        ])
+        self.assertTrue(self.redis.exists(REGISTRY_READY_KEY))
+
+    def test_molde_del_cliente_entra_al_registro(self):
+        self.cache.set_kpis(1, "2024-01", {"a": 1})
+        self.cache.set_molde_clasificacion(1, {"sets": {}})
+        molde = self.cache._molde_key(1)
+        self.assertIn(molde, self.cache.get_client_keys(1))
+        self.assertEqual(self.cache.get_client_keys(1, "2024-01"), ["sgm:contabilidad:1:2024-01:kpis"])
+
+        self.redis.delete(REGISTRY_READY_KEY, self.cache._registry_periodo_key(1, PERIODO_CLIENTE))
+        self.cache.rebuild_key_registry()
+        self.assertIn(molde, self.cache.get_client_keys(1))
+
+        self.assertEqual(self.cache.invalidate_cliente_all(1), 2)
+        self.assertIsNone(self.cache.get_molde_clasificacion(1))
+
+
+class LogsIndexadosTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = _cache_en_fakeredis()
+
+    def _log(self, i, **campos):
+        return {"id": i, "timestamp": f"2024-01-01T00:{i // 60:02d}:{i % 60:02d}", "cliente_id": 1,
+                "periodo_cierre": "2024-01", "tarjeta": "libro_mayor", **campos}
+
+    def test_indice_vacio_no_repite_el_scan(self):
+        with mock.patch.object(self.cache.redis_client, "scan_iter", wraps=self.cache.redis_client.scan_iter) as scan:
+            self.assertIsNone(self.cache.get_all_logs())
+            self.assertEqual(self.cache.get_logs_filtered(cliente_id=1), [])
+            self.assertEqual(self.cache.get_logs_stats()["total_logs"], 0)
+        self.assertEqual(scan.call_count, 1)
+        self.assertGreater(self.cache.redis_client.ttl(LOGS_INDEX_BUILT_KEY), 0)
+
+    def test_indexa_logs_previos_al_indice(self):
+        self.cache.redis_client.set("sgm:logs:1", self.cache._serialize_data(self._log(1)))
+        self.assertEqual([log["id"] for log in self.cache.get_all_logs()], [1])
+        self.assertEqual([log["id"] for log in self.cache.get_logs_filtered(tarjeta="libro_mayor")], [1])
+
+    def test_paginas_en_orden_descendente_saltando_logs_perdidos(self):
+        for i in range(120):
+            self.cache.add_log(self._log(i, cliente_id=1 if i % 2 else 2))
+        self.assertEqual([log["id"] for log in self.cache.get_all_logs(limit=3)], [119, 118, 117])
+        # Logs borrados por fuera del índice: quedan huecos en la primera página
+        self.cache.redis_client.delete(*[f"sgm:logs:{i}" for i in range(101, 120, 2)])
+
+        logs = self.cache.get_logs_filtered(cliente_id=1, periodo="2024-01", limit=45)
+        self.assertEqual([log["id"] for log in logs], list(range(99, 9, -2)))
+        self.assertEqual(len(self.cache.get_logs_filtered(cliente_id=1, limit=None)), 50)
+
+        self.assertEqual(self.cache.delete_logs([118]), 1)
+        self.assertFalse(self.cache.redis_client.zscore("sgm:logs_index:cliente:2", "sgm:logs:118"))
+        self.cache.add_log(self._log(200), max_logs=100)
+        self.assertEqual(self.cache.redis_client.zcard("sgm:logs_index"), 100)
+
+
+class SnapshotEnMemoria:
+    def __init__(self):
+        self.datos = {}
+
+    def get_snapshot_cierre(self, cliente_id, periodo, parte):
+        return self.datos.get(parte)
+
+    def set_snapshot_cierre(self, cliente_id, periodo, parte, snapshot, ttl=None):
+        self.datos[parte] = snapshot
+        return True
+
+
+class BalanceComprobacionTests(TestCase):
+    def setUp(self):
+        self.user = user = Usuario.objects.create_user(
+            correo_bdo="balance@test.com", password="pass", nombre="B", apellido="T", tipo_usuario="gerente",
+        )
+        cliente = Cliente.objects.create(nombre="Cliente3", rut="3-5")
+        self.cierre = CierreContabilidad.objects.create(cliente=cliente, usuario=user, periodo="2024-03")
+        otro_cierre = CierreContabilidad.objects.create(cliente=cliente, usuario=user, periodo="2024-02")
+
+        caja, banco, ventas, vacia = (
+            CuentaContable.objects.create(cliente=cliente, codigo=codigo, nombre=nombre)
+            for codigo, nombre in (("1001", "Caja"), ("1002", "Banco"), ("4001", "Ventas"), ("9001", "Sin uso"))
+        )
+        AperturaCuenta.objects.create(cierre=self.cierre, cuenta=caja, saldo_anterior=100)
+        AperturaCuenta.objects.create(cierre=self.cierre, cuenta=banco, saldo_anterior=200)
+        AperturaCuenta.objects.create(cierre=otro_cierre, cuenta=ventas, saldo_anterior=999)
+        for cierre, cuenta, debe, haber in (
+            (self.cierre, caja, 50, 0),
+            (self.cierre, caja, 0, 20),
+            (self.cierre, ventas, 0, 300),
+            (otro_cierre, caja, 1000, 0),
+            (otro_cierre, vacia, 5, 0),
+        ):
+            MovimientoContable.objects.create(cierre=cierre, cuenta=cuenta, fecha="2024-03-01", debe=debe, haber=haber)
+        self.caja = caja
+
+    def _cargar_libro_mayor(self, estado="completado"):
+        return UploadLog.objects.create(
+            tipo_upload="libro_mayor", cliente=self.cierre.cliente, cierre=self.cierre,
+            nombre_archivo_original="lm.xlsx", tamaño_archivo=1, estado=estado,
+        )
+
+    def test_una_consulta_para_todas_las_cuentas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            balance = calcular_balance_comprobacion(self.cierre)
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(
+            [(r["codigo"], r["saldo_inicial"], r["debe"], r["haber"], r["movimientos"], r["saldo"]) for r in balance],
+            [
+                ("1001", Decimal("100"), Decimal("50"), Decimal("20"), 2, Decimal("130")),
+                ("1002", Decimal("200"), Decimal("0"), Decimal("0"), 0, Decimal("200")),
+                ("4001", Decimal("0"), Decimal("0"), Decimal("300"), 1, Decimal("-300")),
+                ("9001", Decimal("0"), Decimal("0"), Decimal("0"), 0, Decimal("0")),
+            ],
+        )
+
+    def test_saldos_solo_cuentas_con_apertura_o_movimientos(self):
+        saldos = calcular_saldos_por_cuenta(self.cierre)
+        self.assertEqual(sorted(saldos), ["1001", "1002", "4001"])
+        self.assertEqual(
+            (saldos["1001"]["saldo"], saldos["1001"]["debe_total"], saldos["1001"]["nombre"]),
+            (Decimal("130"), Decimal("50"), "Caja"),
+        )
+
+    def test_snapshot_compartido_por_version_de_datos(self):
+        cache = SnapshotEnMemoria()
+        with mock.patch("contabilidad.tasks_reportes._cache_snapshot", return_value=cache):
+            cuentas_data = _obtener_cuentas_con_datos(self.cierre)
+            with CaptureQueriesContext(connection) as consultas:
+                self.assertEqual(_obtener_cuentas_con_datos(self.cierre), cuentas_data)
+            # Solo la consulta de versión: agregados y detalle salen del snapshot
+            self.assertEqual(len(consultas), 1)
+
+            caja = cuentas_data[self.caja.id]
+            self.assertEqual(
+                (caja["saldo_anterior"], caja["total_debe"], caja["total_haber"], caja["saldo_final"]),
+                (100.0, 50.0, 20.0, 130.0),
+            )
+            self.assertEqual(caja["movimientos_count"], 2)
+            self.assertEqual(
+                caja["detalle_movimientos"],
+                f"/api/contabilidad/cierres/{self.cierre.id}/cuentas/{self.caja.id}/detalle-movimientos/",
+            )
+            self.assertNotIn("movimientos", caja)
+            detalle = _obtener_cuentas_con_datos(self.cierre, incluir_movimientos=True)[self.caja.id]
+            self.assertEqual([m["debe"] for m in detalle["movimientos"]], [50.0, 0.0])
+            self.assertEqual(sorted(c["codigo"] for c in cuentas_data.values()), ["1001", "1002", "4001"])
+
+            # Una nueva carga del libro mayor cambia la versión
+            MovimientoContable.objects.create(cierre=self.cierre, cuenta=self.caja, fecha="2024-03-02", debe=1, haber=0)
+            self._cargar_libro_mayor()
+            self.assertEqual(_obtener_cuentas_con_datos(self.cierre)[self.caja.id]["saldo_final"], 131.0)
+            self.assertEqual(calcular_saldos_por_cuenta(self.cierre)["1001"]["movimientos"], 3)
+        self.assertEqual(obtener_snapshot_cuentas(self.cierre)["cuentas"], cache.datos["cuentas"]["cuentas"])
+
+    def test_indice_de_movimientos_por_codigo_para_streamlit(self):
+        cache = SnapshotEnMemoria()
+        with mock.patch("contabilidad.tasks_reportes._cache_snapshot", return_value=cache):
+            indice = indice_movimientos_por_codigo(self.cierre)
+        self.assertEqual(sorted(indice["cuentas"]), ["1001", "4001"])
+        caja = indice["cuentas"]["1001"]
+        self.assertEqual(caja["movimientos_count"], 2)
+        self.assertEqual(caja["detalle_movimientos"],
+                         f"/api/contabilidad/cierres/{self.cierre.id}/cuentas/{self.caja.id}/detalle-movimientos/")
+        # Solo el snapshot de cuentas: las filas se piden al endpoint paginado
+        self.assertEqual(set(cache.datos), {"cuentas"})
+
+    def test_indice_no_pisa_la_lista_de_movimientos(self):
+        cache = _cache_en_fakeredis()
+        cache.set_movimientos(self.cierre.cliente_id, self.cierre.periodo, [{"id": 1}])
+        cache.set_movimientos_cierre(self.cierre.cliente_id, self.cierre.periodo, {"cierre_id": self.cierre.id, "cuentas": {}})
+        self.assertEqual(cache.get_movimientos(self.cierre.cliente_id, self.cierre.periodo), [{"id": 1}])
+        self.assertEqual(cache.get_movimientos_cierre(self.cierre.cliente_id, self.cierre.periodo)["cierre_id"], self.cierre.id)
+
+    def test_version_sigue_a_la_ultima_carga_del_libro_mayor(self):
+        cache = SnapshotEnMemoria()
+        with mock.patch("contabilidad.tasks_reportes._cache_snapshot", return_value=cache):
+            _obtener_cuentas_con_datos(self.cierre)
+            carga = self._cargar_libro_mayor(estado="procesando")
+            MovimientoContable.objects.filter(cierre=self.cierre, cuenta=self.caja, debe=50).update(debe=70)
+            self.assertEqual(_obtener_cuentas_con_datos(self.cierre)[self.caja.id]["saldo_final"], 150.0)
+
+            # Al terminar (o revertirse) la carga cambia su estado y con él la versión
+            AperturaCuenta.objects.filter(cierre=self.cierre, cuenta=self.caja).update(saldo_anterior=10)
+            UploadLog.objects.filter(pk=carga.pk).update(estado="completado")
+            self.assertEqual(_obtener_cuentas_con_datos(self.cierre)[self.caja.id]["saldo_final"], 60.0)
+
+    def test_edicion_por_api_invalida_snapshot(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        with mock.patch("contabilidad.tasks_reportes._cache_snapshot") as cache_snapshot:
+            with self.captureOnCommitCallbacks(execute=True):
+                respuesta = api.patch(f"/api/contabilidad/cuentas/{self.caja.id}/", {"nombre": "Caja chica"}, format="json")
+        self.assertEqual(respuesta.status_code, 200)
+        cache_snapshot.return_value.invalidate_snapshot_cierre.assert_called_with(self.caja.cliente_id, None)
+
+    def test_detalle_movimientos_paginado_con_cursor(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = f"/api/contabilidad/cierres/{self.cierre.id}/cuentas/{self.caja.id}/detalle-movimientos/"
+
+        pagina = client.get(url, {"limit": 1}).json()
+        self.assertEqual(pagina["saldo_inicial"], 100.0)
+        self.assertEqual([(m["debe"], m["saldo"]) for m in pagina["movimientos"]], [(50.0, 150.0)])
+
+        siguiente = client.get(url, {"limit": 1, "cursor": pagina["siguiente"]}).json()
+        self.assertEqual([(m["haber"], m["saldo"]) for m in siguiente["movimientos"]], [(20.0, 130.0)])
+        self.assertIsNone(siguiente["siguiente"])
+
+        self.assertEqual(client.get(url, {"cursor": "no-es-un-cursor"}).status_code, 400)
+
+
+class FinalizacionReportesTests(TestCase):
+    def setUp(self):
+        self.user = user = Usuario.objects.create_user(
+            correo_bdo="final@test.com", password="pass", nombre="F", apellido="T", tipo_usuario="gerente",
+        )
+        cliente = Cliente.objects.create(nombre="Cliente4", rut="4-4")
+        self.cierre = CierreContabilidad.objects.create(
+            cliente=cliente, usuario=user, periodo="2024-04", estado="generando_reportes"
+        )
+        cuenta = CuentaContable.objects.create(cliente=cliente, codigo="1001", nombre="Caja")
+        MovimientoContable.objects.create(cierre=self.cierre, cuenta=cuenta, fecha="2024-04-01", debe=10, haber=0)
+
+    def test_fuera_de_worker_genera_en_serie_y_cierra_con_tiempos(self):
+        def reporte(cierre_id, tipo, usuario_id=None):
+            if tipo == "eri":
+                return {"tipo": tipo, "estado": "error", "error": "sin set", "segundos": 0.1}
+            return {"tipo": tipo, "estado": "generado", "segundos": 0.2}
+
+        with mock.patch("contabilidad.tasks_finalizacion.generar_reporte_financiero", side_effect=reporte) as generar, \
+                mock.patch("contabilidad.tasks_finalizacion.ejecutar_calculos_contables", return_value={"ok": True}) as calculos, \
+                mock.patch("contabilidad.tasks_reportes._cache_snapshot", return_value=None):
+            resultado = finalizar_cierre_y_generar_reportes(cierre_id=self.cierre.id)
+
+        self.assertTrue(resultado["success"])
+        self.assertEqual([c.args[1] for c in generar.call_args_list], ["esf", "eri", "ecp"])
+        calculos.assert_called_once_with(self.cierre.id, None, incluir_estados_redis=False)
+        self.assertEqual(resultado["resultados"]["reportes"]["reportes_fallidos"], 1)
+        self.assertEqual(
+            set(resultado["tiempos"]), {"snapshot", "esf", "eri", "ecp", "reportes", "calculos", "total"}
+        )
+        self.cierre.refresh_from_db()
+        self.assertEqual(self.cierre.estado, "finalizado")
+        log = TarjetaActivityLog.objects.get(cierre=self.cierre, accion="process_complete")
+        self.assertEqual(log.detalles["tiempos"]["esf"], 0.2)
+
+
+    def test_en_worker_se_reemplaza_por_el_chord_de_reportes(self):
+        with mock.patch("contabilidad.tasks_finalizacion._en_worker", return_value=True), \
+                mock.patch("contabilidad.tasks_finalizacion.chord") as chord, \
+                mock.patch.object(finalizar_cierre_y_generar_reportes, "replace", side_effect=Ignore()) as replace, \
+                mock.patch("contabilidad.tasks_reportes._cache_snapshot", return_value=None):
+            with self.assertRaises(Ignore):
+                finalizar_cierre_y_generar_reportes(cierre_id=self.cierre.id, usuario_id=self.user.id)
+
+        (reportes, callback), _ = chord.call_args
+        self.assertEqual(
+            [(s.task, s.args) for s in reportes],
+            [("contabilidad.generar_reporte_financiero", (self.cierre.id, tipo, self.user.id)) for tipo in ("esf", "eri", "ecp")],
+        )
+        self.assertEqual(callback.task, "contabilidad.cerrar_finalizacion_cierre")
+        self.assertEqual(callback.args[:2], (self.cierre.id, self.user.id))
+        self.assertEqual(set(callback.args[2]), {"inicio", "reportes", "tiempos"})
+        replace.assert_called_once_with(chord.return_value)
+        self.cierre.refresh_from_db()
+        self.assertEqual(self.cierre.estado, "generando_reportes")
+        self.assertFalse(TarjetaActivityLog.objects.filter(cierre=self.cierre).exists())
+
+class MoldeEnMemoria:
+    def __init__(self):
+        self.moldes = {}
+
+    def get_molde_clasificacion(self, cliente_id):
+        return self.moldes.get(cliente_id)
+
+    def set_molde_clasificacion(self, cliente_id, molde, ttl=None):
+        self.moldes[cliente_id] = molde
+        return True
+
+    def invalidate_molde_clasificacion(self, cliente_id):
+        return self.moldes.pop(cliente_id, None) is not None
+
+
+class MoldeClasificacionTests(TestCase):
+    def setUp(self):
+        user = Usuario.objects.create_user(
+            correo_bdo="molde@test.com", password="pass", nombre="M", apellido="T", tipo_usuario="gerente",
+        )
+        self.cliente = Cliente.objects.create(nombre="Cliente5", rut="5-5", bilingue=True)
+        self.cierre = CierreContabilidad.objects.create(cliente=self.cliente, usuario=user, periodo="2024-05")
+        self.set_esf = ClasificacionSet.objects.create(cliente=self.cliente, nombre="Estado de Situación Financiera")
+        self.set_ecp = ClasificacionSet.objects.create(cliente=self.cliente, nombre="Estado de Cambio Patrimonial")
+        self.rubro = ClasificacionSet.objects.create(cliente=self.cliente, nombre="Rubro")
+        for set_clas, valor, valor_en in (
+            (self.set_esf, "Activo Corriente", "Current Asset"),
+            (self.set_esf, "Efectivo y equivalentes", "Cash"),
+            (self.set_esf, "Deuda largo plazo", None),
+            (self.set_ecp, "Otras reservas", "Other reserves"),
+            (self.set_ecp, "Sin categoría", None),
+            (self.rubro, "Caja", None),
+        ):
+            ClasificacionOption.objects.create(set_clas=set_clas, valor=valor, valor_en=valor_en)
+
+    def test_molde_equivale_al_calculo_por_opcion(self):
+        molde = obtener_molde_clasificacion(self.cierre)
+        set_esf, sets_cliente = _sets_del_molde(molde, "esf", self.cliente.id)
+        self.assertEqual((set_esf.id, set_esf.nombre), (self.set_esf.id, self.set_esf.nombre))
+        self.assertEqual([s.nombre for s in sets_cliente], ["Estado de Cambio Patrimonial", "Rubro"])
+        self.assertIsNone(molde["sets"]["eri"])
+
+        for valor in ("Activo Corriente", "Efectivo y equivalentes", "Deuda largo plazo"):
+            self.assertEqual(
+                _categoria_desde_molde(molde, "esf", valor, set_esf, True),
+                list(_determinar_categoria_esf_con_molde(valor, self.set_esf, True)),
+            )
+            self.assertEqual(
+                _determinar_nombre_grupo_detallado({"cliente_sets": {}}, [], valor, molde["grupos"]),
+                _determinar_nombre_grupo_detallado({"cliente_sets": {}}, [], valor),
+            )
+        for valor in ("Otras reservas", "Sin categoría"):
+            self.assertEqual(
+                _categoria_desde_molde(molde, "ecp", valor, None, True),
+                list(_determinar_categoria_ecp_con_molde(valor, self.set_ecp, True)),
+            )
+
+    def test_cache_reutiliza_y_edicion_invalida(self):
+        cache = MoldeEnMemoria()
+        molde = obtener_molde_clasificacion(self.cierre, cache)
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(obtener_molde_clasificacion(self.cierre, cache), molde)
+        self.assertEqual(len(consultas), 0)
+
+        with mock.patch("contabilidad.cache_redis.get_cache_system", return_value=cache), \
+                self.captureOnCommitCallbacks(execute=True):
+            ClasificacionOption.objects.create(set_clas=self.set_esf, valor="Pasivo Corriente")
+        self.assertNotIn(self.cliente.id, cache.moldes)
+        self.assertEqual(
+            obtener_molde_clasificacion(self.cierre, cache)["categorias"]["esf"]["Pasivo Corriente"][:2],
+            ["pasivos", "corrientes"],
+        )
@@ -247,16 +247,11 @@ class ActivityLogStorage:
                 
                 if logs_cliente:
                     # Obtener IDs de logs a eliminar
-                    logs_to_delete = []
-                    for log in logs_cliente:
-                        log_id = log.get('id')
-                        if log_id:
-                            log_key = f"sgm:logs:{log_id}"
-                            logs_to_delete.append(log_key)
+                    logs_to_delete = [log.get('id') for log in logs_cliente if log.get('id')]
                     
-                    # Eliminar logs específicos del cliente
+                    # Eliminar logs específicos del cliente (y sus entradas en los índices)
                     if logs_to_delete:
-                        deleted_count = sgm_cache.redis_client.delete(*logs_to_delete)
+                        deleted_count = sgm_cache.delete_logs(logs_to_delete)
                         logger.info(f"Limpiados {deleted_count} logs de cliente {cliente_id} en SGM Cache")
                     else:
                         logger.info(f"No se encontraron logs para eliminar del cliente {cliente_id}")
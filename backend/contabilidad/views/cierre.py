@@ -5,6 +5,9 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from datetime import date
+from decimal import Decimal, InvalidOperation
+import base64
+import json
 
 from ..models import (
     CierreContabilidad,
@@ -17,6 +20,21 @@ from ..serializers import CierreContabilidadSerializer
 from ..utils.activity_logger import registrar_actividad_tarjeta
 from ..utils.mixins import ActivityLoggerMixin
 
+# Filas por página del detalle de movimientos de una cuenta (detalle_movimientos)
+DETALLE_MOVIMIENTOS_LIMITE = 200
+DETALLE_MOVIMIENTOS_LIMITE_MAXIMO = 1000
+
+
+def _escribir_cursor_movimientos(fecha, ultimo_id, saldo):
+    """Cursor opaco: último (fecha, id) entregado y saldo acumulado hasta él"""
+    contenido = json.dumps({"f": fecha.isoformat(), "i": ultimo_id, "s": str(saldo)})
+    return base64.urlsafe_b64encode(contenido.encode()).decode()
+
+
+def _leer_cursor_movimientos(cursor):
+    contenido = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return date.fromisoformat(contenido["f"]), int(contenido["i"]), Decimal(contenido["s"])
+
 
 class CierreContabilidadViewSet(ActivityLoggerMixin, viewsets.ModelViewSet):
     queryset = CierreContabilidad.objects.all()
@@ -466,6 +484,79 @@ class CierreContabilidadViewSet(ActivityLoggerMixin, viewsets.ModelViewSet):
         
         return Response(response_data)
 
+    @action(detail=True, methods=["get"], url_path="cuentas/(?P<cuenta_id>[^/.]+)/detalle-movimientos")
+    def detalle_movimientos(self, request, pk=None, cuenta_id=None):
+        """
+        Detalle de movimientos de una cuenta por páginas con cursor (keyset sobre fecha, id).
+
+        Es el destino de 'detalle_movimientos' en las cuentas de ESF/ERI/ECP, que solo
+        guardan agregados. El cursor lleva el último (fecha, id) y el saldo acumulado,
+        así que cada página lee únicamente sus filas.
+        Parámetros: cursor (opcional, el 'siguiente' de la página anterior) y limit.
+        """
+        cierre = self.get_object()
+
+        try:
+            cuenta = CuentaContable.objects.get(id=cuenta_id, cliente=cierre.cliente)
+        except (CuentaContable.DoesNotExist, ValueError):
+            return Response({"error": "Cuenta no encontrada"}, status=404)
+
+        try:
+            limite = int(request.query_params.get("limit", DETALLE_MOVIMIENTOS_LIMITE))
+        except ValueError:
+            return Response({"error": "limit inválido"}, status=400)
+        limite = max(1, min(limite, DETALLE_MOVIMIENTOS_LIMITE_MAXIMO))
+
+        movimientos = MovimientoContable.objects.filter(cierre=cierre, cuenta=cuenta)
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            try:
+                fecha, ultimo_id, saldo = _leer_cursor_movimientos(cursor)
+            except (ValueError, KeyError, TypeError, InvalidOperation):
+                return Response({"error": "cursor inválido"}, status=400)
+            movimientos = movimientos.filter(Q(fecha__gt=fecha) | Q(fecha=fecha, id__gt=ultimo_id))
+            saldo_inicial = None
+        else:
+            apertura = AperturaCuenta.objects.filter(cierre=cierre, cuenta=cuenta).order_by("id").first()
+            saldo = apertura.saldo_anterior if apertura else Decimal("0")
+            saldo_inicial = float(saldo)
+
+        filas = list(
+            movimientos.order_by("fecha", "id").values_list(
+                "id", "fecha", "descripcion", "debe", "haber", "numero_documento", "tipo_doc_codigo"
+            )[:limite + 1]
+        )
+        hay_siguiente = len(filas) > limite
+        filas = filas[:limite]
+
+        movimientos_data = []
+        for mov_id, fecha, descripcion, debe, haber, numero_documento, tipo_doc_codigo in filas:
+            saldo += debe - haber
+            movimientos_data.append({
+                "id": mov_id,
+                "fecha": fecha.isoformat(),
+                "descripcion": descripcion,
+                "debe": float(debe),
+                "haber": float(haber),
+                "saldo": float(saldo),  # Saldo acumulado después de este movimiento
+                "numero_documento": numero_documento,
+                "tipo_documento": tipo_doc_codigo,
+            })
+
+        return Response({
+            "cuenta": {
+                "id": cuenta.id,
+                "codigo": cuenta.codigo,
+                "nombre": cuenta.nombre,
+                "nombre_en": cuenta.nombre_en,
+            },
+            "cierre_id": cierre.id,
+            "saldo_inicial": saldo_inicial,
+            "movimientos": movimientos_data,
+            "siguiente": _escribir_cursor_movimientos(filas[-1][1], filas[-1][0], saldo) if hay_siguiente else None,
+            "limit": limite,
+        })
+
     @action(detail=True, methods=["post"], url_path="finalizar")
     def finalizar(self, request, pk=None):
         """
@@ -15,9 +15,34 @@ from ..serializers import (
     CentroCostoSerializer,
     AuxiliarSerializer,
 )
+from ..tasks_reportes import invalidar_snapshot_cuentas
 
 
-class CuentaContableViewSet(viewsets.ModelViewSet):
+class InvalidarSnapshotMixin:
+    """
+    Las ediciones por API no pasan por una carga de libro mayor, así que no alteran la
+    versión del snapshot de cuentas: se invalida explícitamente
+    """
+
+    def _invalidar_snapshot(self, instance):
+        cierre = instance.cierre
+        invalidar_snapshot_cuentas(cierre.cliente_id, cierre.periodo)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self._invalidar_snapshot(serializer.instance)
+
+    def perform_update(self, serializer):
+        self._invalidar_snapshot(serializer.instance)
+        super().perform_update(serializer)
+        self._invalidar_snapshot(serializer.instance)
+
+    def perform_destroy(self, instance):
+        self._invalidar_snapshot(instance)
+        super().perform_destroy(instance)
+
+
+class CuentaContableViewSet(InvalidarSnapshotMixin, viewsets.ModelViewSet):
     queryset = CuentaContable.objects.all()
     serializer_class = CuentaContableSerializer
     permission_classes = [IsAuthenticated]
@@ -29,14 +54,18 @@ class CuentaContableViewSet(viewsets.ModelViewSet):
             qs = qs.filter(cliente=cliente)
         return qs.order_by("codigo")
 
+    def _invalidar_snapshot(self, instance):
+        # El snapshot guarda código y nombres de la cuenta en todos los períodos
+        invalidar_snapshot_cuentas(instance.cliente_id)
+
 
-class AperturaCuentaViewSet(viewsets.ModelViewSet):
+class AperturaCuentaViewSet(InvalidarSnapshotMixin, viewsets.ModelViewSet):
     queryset = AperturaCuenta.objects.all()
     serializer_class = AperturaCuentaSerializer
     permission_classes = [IsAuthenticated]
 
 
-class MovimientoContableViewSet(viewsets.ModelViewSet):
+class MovimientoContableViewSet(InvalidarSnapshotMixin, viewsets.ModelViewSet):
     queryset = MovimientoContable.objects.all()
     serializer_class = MovimientoContableSerializer
     permission_classes = [IsAuthenticated]
@@ -18,6 +18,7 @@ from ..models import (
     ExcepcionClasificacionSet
 )
 from ..tasks_libro_mayor import crear_chain_libro_mayor
+from ..tasks_reportes import invalidar_snapshot_cuentas
 
 logger = logging.getLogger(__name__)
 
@@ -248,6 +249,9 @@ def limpiar_datos_cierre_para_reprocesamiento(cierre):
             incidencias_eliminadas = Incidencia.objects.filter(cierre=cierre).count()
             Incidencia.objects.filter(cierre=cierre).delete()
             
+            # Borrado fuera de una carga: el snapshot de cuentas no cambia de versión
+            invalidar_snapshot_cuentas(cierre.cliente_id, cierre.periodo)
+            
             logger.info(f"Limpieza completada para cierre {cierre.id}: "
                        f"{movimientos_eliminados} movimientos, "
                        f"{aperturas_eliminadas} aperturas, "
@@ -10,6 +10,24 @@ sgm:nomina:{cliente_id}:{periodo}/
 ├── incidencias
 └── estadisticas
 
+Registro de claves (sets, evita KEYS sobre todo el keyspace):
+sgm:registry:nomina:clientes -> Clientes con datos en cache
+sgm:registry:nomina:{cliente_id} -> Períodos del cliente
+sgm:registry:nomina:{cliente_id}:{periodo} -> Claves del cliente/periodo
+
+Serialización (SGM_CACHE_SERIALIZER):
+json | json-zlib | msgpack | msgpack-zlib. Los formatos compactos guardan un
+byte de cabecera para detectar el formato al leer; las entradas JSON sin
+cabecera se siguen leyendo igual.
+
+Serialización, tier local y registro de claves vienen de SGMCacheBase
+(api/cache_redis_base.py), compartida con el otro sistema de cache.
+
+Tier local (SGM_CACHE_LOCAL_TIER):
+LRU en memoria de cada proceso delante de Redis para las lecturas calientes,
+acotado por entradas, bytes y TTL. set_*/invalidate_* publican en
+sgm:cache:invalidaciones:nomina para invalidarlo en todos los procesos.
+
 Logs de actividad:
 sgm:logs:nomina:{timestamp}:{id} -> Logs individuales con claves separadas
 
@@ -24,12 +42,39 @@ from datetime import datetime, timedelta
 from django.conf import settings
 from typing import Dict, Any, Optional, List, Union
 
+# Serialización, tier local y registro de claves comunes con el otro sistema de
+# cache; los formatos y _LocalLRUCache se re-exportan para quien los importe de aquí
+from api.cache_redis_base import (  # noqa: F401
+    FORMATO_JSON_ZLIB,
+    FORMATO_MSGPACK,
+    FORMATO_MSGPACK_ZLIB,
+    REGISTRY_CHECK_SECONDS,
+    SCAN_COUNT,
+    SERIALIZADORES,
+    SGMCacheBase,
+    _LocalLRUCache,
+)
+
 # Configurar logging
 logger = logging.getLogger(__name__)
 
-class SGMCacheSystemNomina:
+# Registro de claves por cliente/periodo (ver _set_registrado)
+REGISTRY_PREFIX = "sgm:registry:nomina"
+REGISTRY_READY_KEY = f"{REGISTRY_PREFIX}:_ready"
+
+# Canal pub/sub para mantener coherentes los tiers locales (LRU) de cada proceso
+LOCAL_INVALIDATION_CHANNEL = "sgm:cache:invalidaciones:nomina"
+
+
+class SGMCacheSystemNomina(SGMCacheBase):
     """Sistema de cache Redis para SGM - Nómina"""
     
+    KEY_PREFIX = "sgm:nomina"
+    REGISTRY_PREFIX = REGISTRY_PREFIX
+    REGISTRY_READY_KEY = REGISTRY_READY_KEY
+    LOCAL_INVALIDATION_CHANNEL = LOCAL_INVALIDATION_CHANNEL
+    SERIALIZER_STATS_PREFIX = "sgm:nomina:stats:serializer"
+    
     def __init__(self):
         """Inicializar conexión a Redis DB 2 (nómina)"""
         try:
@@ -44,6 +89,18 @@ class SGMCacheSystemNomina:
                 retry_on_timeout=True
             )
             
+            # Cliente binario para leer payloads (pueden venir comprimidos o en msgpack)
+            self.redis_bin = redis.Redis(
+                host='redis',
+                port=6379,
+                db=2,
+                password=getattr(settings, 'REDIS_PASSWORD', ''),
+                decode_responses=False,
+                socket_connect_timeout=5,
+                socket_timeout=5,
+                retry_on_timeout=True
+            )
+            
             # Verificar conexión
             if not self.redis_client.ping():
                 raise ConnectionError("No se pudo conectar a Redis DB 2")
@@ -59,29 +116,8 @@ class SGMCacheSystemNomina:
         self.long_ttl = 86400    # 24 horas para informes
         self.short_ttl = 300     # 5 minutos para datos temporales
         
-    def _get_key(self, cliente_id: int, periodo: str, tipo_dato: str) -> str:
-        """
-        Generar clave Redis siguiendo el patrón del sistema SGM
-        Formato: sgm:nomina:{cliente_id}:{periodo}:{tipo_dato}
-        """
-        return f"sgm:nomina:{cliente_id}:{periodo}:{tipo_dato}"
-    
-    def _serialize_data(self, data: Any) -> str:
-        """Serializar datos para almacenar en Redis"""
-        try:
-            return json.dumps(data, ensure_ascii=False, default=str)
-        except Exception as e:
-            logger.error(f"Error serializando datos: {e}")
-            raise
-    
-    def _deserialize_data(self, data: str) -> Any:
-        """Deserializar datos desde Redis"""
-        try:
-            return json.loads(data)
-        except Exception as e:
-            logger.error(f"Error deserializando datos: {e}")
-            raise
-    
+        self._configurar_cache()
+        
     def _evict_oldest_informe_if_needed(self, cliente_id: int, max_informes_per_cliente: int = 12) -> None:
         """
         Elimina el informe más antiguo de un cliente si se excede el límite de informes
@@ -92,8 +128,7 @@ class SGMCacheSystemNomina:
         """
         try:
             # Obtener todos los informes del cliente específico
-            pattern = f"sgm:nomina:{cliente_id}:*:informe"
-            keys = self.redis_client.keys(pattern)
+            keys = [k for k in self.get_client_keys(cliente_id) if k.endswith(':informe')]
             
             if len(keys) < max_informes_per_cliente:
                 return  # No hay que eliminar nada
@@ -103,7 +138,7 @@ class SGMCacheSystemNomina:
             for key in keys:
                 try:
                     # Extraer periodo de la llave: sgm:nomina:13:2025-08:informe
-                    parts = key.decode('utf-8').split(':')
+                    parts = key.split(':')
                     if len(parts) >= 4:
                         periodo = parts[3]  # 2025-08
                         informes_con_periodo.append((key, periodo))
@@ -116,8 +151,8 @@ class SGMCacheSystemNomina:
             # Eliminar el más antiguo
             if informes_con_periodo:
                 oldest_key = informes_con_periodo[0][0]
-                self.redis_client.delete(oldest_key)
-                logger.info(f"🗑️ Cache eviction: Eliminado informe antiguo {oldest_key.decode('utf-8')} para cliente {cliente_id} (límite: {max_informes_per_cliente} por cliente)")
+                self._delete_registradas(cliente_id, [oldest_key])
+                logger.info(f"🗑️ Cache eviction: Eliminado informe antiguo {oldest_key} para cliente {cliente_id} (límite: {max_informes_per_cliente} por cliente)")
                 
         except Exception as e:
             logger.warning(f"⚠️ Error en evicción de cache: {e}")
@@ -160,11 +195,8 @@ class SGMCacheSystemNomina:
             }
             
             serialized_data = self._serialize_data(informe_with_meta)
-            if ttl_effective is None:
-                # Sin expiración
-                self.redis_client.set(key, serialized_data)
-            else:
-                self.redis_client.setex(key, ttl_effective, serialized_data)
+            # Sin expiración si ttl_effective es None
+            self._set_registrado(key, ttl_effective, serialized_data, cliente_id, periodo)
             
             self._increment_stat("informes_cached")
             self._increment_stat("cache_writes")
@@ -217,31 +249,32 @@ class SGMCacheSystemNomina:
             for per in candidates:
                 # clave estándar singular
                 key = self._get_key(cliente_id, per, "informe")
-                data = self.redis_client.get(key)
-                if data:
-                    self._increment_stat("cache_hits")
-                    return self._deserialize_data(data)
+                informe, desde_local = self._get_con_tier_local(key)
+                if informe is not None:
+                    if not desde_local:
+                        self._increment_stat("cache_hits")
+                    return informe
 
                 # variante plural histórica
                 key_plural = self._get_key(cliente_id, per, "informes")
-                data = self.redis_client.get(key_plural)
+                data = self.redis_bin.get(key_plural)
                 if data:
                     self._increment_stat("cache_hits")
                     return self._deserialize_data(data)
 
             # 2) Búsqueda por patrón limitada (compatibilidad)
             # Evitar barridos grandes: buscamos solo por el período normalizado
-            pattern = f"sgm:nomina:{cliente_id}:{norm}:informe*"
-            keys = self.redis_client.keys(pattern)
+            prefijo = self._get_key(cliente_id, norm, "informe")
+            keys = [k for k in self.get_client_keys(cliente_id, norm) if k.startswith(prefijo)]
             for k in keys:
-                data = self.redis_client.get(k)
+                data = self.redis_bin.get(k)
                 if data:
                     self._increment_stat("cache_hits")
                     return self._deserialize_data(data)
 
             # 3) Último intento: clave base sin sufijo (algunos dumps guardaron el JSON crudo así)
             base_key = f"sgm:nomina:{cliente_id}:{norm}"
-            data = self.redis_client.get(base_key)
+            data = self.redis_bin.get(base_key)
             if data:
                 obj = None
                 try:
@@ -293,7 +326,7 @@ class SGMCacheSystemNomina:
             }
             
             serialized_data = self._serialize_data(kpis_with_meta)
-            self.redis_client.setex(key, ttl, serialized_data)
+            self._set_registrado(key, ttl, serialized_data, cliente_id, periodo)
             
             self._increment_stat("kpis_cached")
             self._increment_stat("cache_writes")
@@ -319,10 +352,10 @@ class SGMCacheSystemNomina:
         key = self._get_key(cliente_id, periodo, "kpis")
         
         try:
-            data = self.redis_client.get(key)
-            if data:
-                kpis = self._deserialize_data(data)
-                self._increment_stat("cache_hits")
+            kpis, desde_local = self._get_con_tier_local(key)
+            if kpis is not None:
+                if not desde_local:
+                    self._increment_stat("cache_hits")
                 return kpis
             else:
                 self._increment_stat("cache_misses")
@@ -331,7 +364,7 @@ class SGMCacheSystemNomina:
         except Exception as e:
             logger.error(f"Error obteniendo KPIs de nómina: {e}")
             return None
-    
+
     # ========== DATOS CONSOLIDADOS ==========
     def set_datos_consolidados(self, cliente_id: int, periodo: str, datos: Dict[str, Any],
                               ttl: int = None) -> bool:
@@ -363,7 +396,7 @@ class SGMCacheSystemNomina:
             }
             
             serialized_data = self._serialize_data(datos_with_meta)
-            self.redis_client.setex(key, ttl, serialized_data)
+            self._set_registrado(key, ttl, serialized_data, cliente_id, periodo)
             
             self._increment_stat("consolidados_cached")
             
@@ -387,7 +420,7 @@ class SGMCacheSystemNomina:
         """
         key = self._get_key(cliente_id, periodo, "consolidados")
         try:
-            data = self.redis_client.get(key)
+            data = self.redis_bin.get(key)
             if data:
                 self._increment_stat("cache_hits")
                 return self._deserialize_data(data)
@@ -412,7 +445,7 @@ class SGMCacheSystemNomina:
         """
         key = self._get_key(cliente_id, periodo, "consolidados")
         try:
-            result = self.redis_client.delete(key)
+            result = self._delete_registradas(cliente_id, [key])
             if result:
                 self._increment_stat("cache_deletions")
                 logger.info(f"Cache consolidados eliminado: cliente={cliente_id}, periodo={periodo}")
@@ -436,14 +469,14 @@ class SGMCacheSystemNomina:
         Returns:
             int: Número de claves eliminadas
         """
-        pattern = f"sgm:nomina:{cliente_id}:{periodo}:*"
-        
         try:
-            keys = self.redis_client.keys(pattern)
+            keys = self.get_client_keys(cliente_id, periodo)
             if keys:
-                deleted = self.redis_client.delete(*keys)
+                deleted = self._delete_registradas(cliente_id, keys)
+                self._forget_periodo(cliente_id, periodo)
                 logger.info(f"Cache invalidado para cliente {cliente_id}, periodo {periodo}: {deleted} claves eliminadas")
                 return deleted
+            self._forget_periodo(cliente_id, periodo)
             return 0
             
         except Exception as e:
@@ -460,15 +493,25 @@ class SGMCacheSystemNomina:
         Returns:
             int: Número de claves eliminadas
         """
-        pattern = f"sgm:nomina:{cliente_id}:*"
-        
         try:
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                deleted = self.redis_client.delete(*keys)
+            keys = self.get_client_keys(cliente_id)
+            deleted = self.redis_client.delete(*keys) if keys else 0
+            
+            # Limpiar el registro completo del cliente
+            periodos = self.redis_client.smembers(self._registry_cliente_key(cliente_id))
+            pipe = self.redis_client.pipeline()
+            for periodo in periodos:
+                pipe.delete(self._registry_periodo_key(cliente_id, periodo))
+            pipe.delete(self._registry_cliente_key(cliente_id))
+            pipe.srem(f"{REGISTRY_PREFIX}:clientes", cliente_id)
+            prefijo = self._get_key(cliente_id, '', '')[:-1]
+            self._publicar_invalidacion(prefijos=[prefijo], pipe=pipe)
+            pipe.execute()
+            self._invalidar_local(prefijos=[prefijo])
+            
+            if deleted:
                 logger.info(f"Cache completo invalidado para cliente {cliente_id}: {deleted} claves eliminadas")
-                return deleted
-            return 0
+            return deleted
             
         except Exception as e:
             logger.error(f"Error invalidando cache completo: {e}")
@@ -485,8 +528,7 @@ class SGMCacheSystemNomina:
             Lista de períodos disponibles en cache
         """
         try:
-            pattern = f"sgm:nomina:{cliente_id}:*:informe"
-            keys = self.redis_client.keys(pattern)
+            keys = [k for k in self.get_client_keys(cliente_id) if k.endswith(':informe')]
             
             periods = []
             for key in keys:
@@ -533,22 +575,22 @@ class SGMCacheSystemNomina:
                 value = self.redis_client.get(f"sgm:nomina:stats:{counter}")
                 stats['nomina_counters'][counter] = int(value) if value else 0
             
-            # Claves por cliente
-            pattern = "sgm:nomina:*"
-            keys = self.redis_client.keys(pattern)
-            stats['total_keys'] = len(keys)
-            
+            # Claves por cliente (desde el registro de cada cliente)
             clientes = {}
-            for key in keys:
-                if not key.startswith('sgm:nomina:stats:'):
-                    parts = key.split(':')
-                    if len(parts) >= 3:
-                        cliente_id = parts[2]
-                        if cliente_id not in clientes:
-                            clientes[cliente_id] = 0
-                        clientes[cliente_id] += 1
+            if self._registro_disponible():
+                for cliente_id in self.redis_client.smembers(f"{REGISTRY_PREFIX}:clientes"):
+                    clientes[cliente_id] = len(self.get_client_keys(cliente_id))
+            else:
+                for key in self.redis_client.scan_iter(match="sgm:nomina:*", count=SCAN_COUNT):
+                    if not key.startswith('sgm:nomina:stats:'):
+                        parts = key.split(':')
+                        if len(parts) >= 3:
+                            clientes[parts[2]] = clientes.get(parts[2], 0) + 1
             
+            stats['total_keys'] = sum(clientes.values())
             stats['keys_by_client'] = clientes
+            stats['serializer'] = self.get_serializer_stats()
+            stats['local_tier'] = self._local_cache.stats() if self._local_cache else None
             
             return stats
             
@@ -639,15 +681,19 @@ class SGMCacheSystemNomina:
                 # Asumir formato YYYY-MM-DD o similar, extraer YYYY-MM
                 norm = periodo_norm[:7] if len(periodo_norm) >= 7 else periodo_norm
 
-            # Patrón base para todas las claves de este cierre
-            pattern = f"sgm:nomina:{cliente_id}:{norm}*"
-            
-            # Buscar todas las claves que coincidan
-            keys = self.redis_client.keys(pattern)
+            # Todas las claves registradas de este cierre (incluye períodos YYYY-MM-DD)
+            keys = [
+                k for k in self.get_client_keys(cliente_id)
+                if k.split(':')[3].startswith(norm)
+            ]
+            # Clave base sin sufijo (dumps históricos, fuera del registro)
+            base_key = f"sgm:nomina:{cliente_id}:{norm}"
+            if self.redis_client.exists(base_key):
+                keys.append(base_key)
             
             if keys:
                 # Eliminar todas las claves encontradas
-                deleted_count = self.redis_client.delete(*keys)
+                deleted_count = self._delete_registradas(cliente_id, keys)
                 logger.info(f"🗑️ Cache limpiado para cierre: cliente={cliente_id}, periodo={periodo} - {deleted_count} claves eliminadas")
                 self._increment_stat("cache_clears")
                 return True
@@ -0,0 +1,167 @@
+# backend/nomina/management/commands/benchmark_informe_libro.py
+
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from nomina.models import CierreNomina, Cliente, ConceptoConsolidado, NominaConsolidada
+from nomina.tasks_refactored.informes import (
+    CATEGORIAS_LIBRO,
+    agregados_conceptos_libro,
+    serializar_conceptos_libro,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la construcción de los agregados del Libro de Remuneraciones sobre un cierre '
+        'sintético (se revierte al terminar): tres consultas + bucle anidado vs una '
+        'consulta agrupada'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empleados',
+            type=int,
+            default=20_000,
+            help='Empleados del cierre sintético (default: 20000)'
+        )
+        parser.add_argument(
+            '--conceptos',
+            type=int,
+            default=500,
+            help='Conceptos distintos del cierre (default: 500)'
+        )
+        parser.add_argument(
+            '--conceptos-por-empleado',
+            type=int,
+            default=60,
+            help='Conceptos presentes por empleado (default: 60)'
+        )
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=3,
+            help='Repeticiones por medición; se reporta la mediana (default: 3)'
+        )
+        parser.add_argument(
+            '--semilla',
+            type=int,
+            default=42,
+            help='Semilla del generador de datos (default: 42)'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            cierre = self._poblar(options)
+            try:
+                self._medir(cierre, options['repeticiones'])
+            finally:
+                transaction.set_rollback(True)
+                self.stdout.write('Cierre sintético revertido')
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completado'))
+
+    def _medir(self, cierre, repeticiones):
+        def anterior():
+            # Tres group-by sobre ConceptoConsolidado y bucle categorías × conceptos
+            conceptos_qs = ConceptoConsolidado.objects.filter(nomina_consolidada__cierre=cierre)
+            zero_dec_2 = Value(0, output_field=DecimalField(max_digits=20, decimal_places=2))
+            zero_dec_4 = Value(0, output_field=DecimalField(max_digits=20, decimal_places=4))
+            totales = {c: 0.0 for c in CATEGORIAS_LIBRO}
+            for row in conceptos_qs.values('tipo_concepto').annotate(total=Coalesce(Sum('monto_total'), zero_dec_2)):
+                if row['tipo_concepto'] in totales:
+                    totales[row['tipo_concepto']] = float(row['total'])
+            conceptos_base = list(
+                conceptos_qs.values('tipo_concepto', 'nombre_concepto')
+                .annotate(
+                    total_monto=Coalesce(Sum('monto_total'), zero_dec_2),
+                    total_cantidad=Coalesce(Sum('cantidad'), zero_dec_4),
+                )
+                .order_by('tipo_concepto', '-total_monto')
+            )
+            emp_map = {
+                (e['tipo_concepto'], e['nombre_concepto']): int(e['empleados'] or 0)
+                for e in conceptos_qs.values('tipo_concepto', 'nombre_concepto').annotate(
+                    empleados=Count('nomina_consolidada', distinct=True, filter=~Q(monto_total=0))
+                )
+            }
+            serializados = []
+            for tipo in CATEGORIAS_LIBRO:
+                for it in conceptos_base:
+                    if it['tipo_concepto'] == tipo:
+                        serializados.append({
+                            'nombre': it['nombre_concepto'],
+                            'categoria': tipo,
+                            'total': float(it['total_monto'] or 0),
+                            'empleados': emp_map.get((tipo, it['nombre_concepto']), 0),
+                        })
+            return len(serializados)
+
+        def agrupada():
+            agregados = agregados_conceptos_libro(cierre)
+            return len(serializar_conceptos_libro(agregados['conceptos'])[1])
+
+        self.stdout.write(
+            f"{NominaConsolidada.objects.filter(cierre=cierre).count()} empleados, "
+            f"{ConceptoConsolidado.objects.filter(nomina_consolidada__cierre=cierre).count()} filas de conceptos "
+            f"(mediana de {repeticiones}):"
+        )
+        for nombre, funcion in (
+            ('Anterior (3 consultas + bucle anidado)', anterior),
+            ('Una consulta agrupada', agrupada),
+        ):
+            tiempos = []
+            for _ in range(repeticiones):
+                t0 = time.perf_counter()
+                resultado = funcion()
+                tiempos.append(time.perf_counter() - t0)
+            self.stdout.write(
+                f"  {nombre:<40} {statistics.median(tiempos) * 1000:>10.1f} ms   ({resultado} conceptos)"
+            )
+
+    def _poblar(self, options):
+        """Cierre con N empleados, cada uno con un subconjunto de los conceptos del cierre"""
+        aleatorio = random.Random(options['semilla'])
+        cliente = Cliente.objects.create(nombre='Benchmark informe libro', rut=f"B{aleatorio.randint(0, 10**9)}")
+        cierre = CierreNomina.objects.create(cliente=cliente, periodo='2000-01')
+        catalogo = [
+            (f'CONCEPTO {i}', CATEGORIAS_LIBRO[i % len(CATEGORIAS_LIBRO)])
+            for i in range(options['conceptos'])
+        ]
+        por_empleado = min(options['conceptos_por_empleado'], len(catalogo))
+
+        inicio = time.perf_counter()
+        nominas = NominaConsolidada.objects.bulk_create([
+            NominaConsolidada(
+                cierre=cierre,
+                rut_empleado=f'{10_000_000 + i}-{i % 10}',
+                nombre_empleado=f'Empleado {i}',
+                haberes_imponibles=Decimal(aleatorio.randint(500_000, 3_000_000)),
+            )
+            for i in range(options['empleados'])
+        ], batch_size=2000)
+        if not all(n.pk for n in nominas):
+            nominas = list(NominaConsolidada.objects.filter(cierre=cierre).order_by('id'))
+
+        lote = []
+        for nomina in nominas:
+            for nombre, tipo in aleatorio.sample(catalogo, por_empleado):
+                lote.append(ConceptoConsolidado(
+                    nomina_consolidada=nomina,
+                    nombre_concepto=nombre,
+                    tipo_concepto=tipo,
+                    monto_total=Decimal(aleatorio.randint(0, 2_000_000)),
+                ))
+            if len(lote) >= 10_000:
+                ConceptoConsolidado.objects.bulk_create(lote)
+                lote = []
+        ConceptoConsolidado.objects.bulk_create(lote)
+        self.stdout.write(f"Cierre sintético poblado en {time.perf_counter() - inicio:.1f}s")
+        return cierre
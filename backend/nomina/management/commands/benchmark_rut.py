@@ -0,0 +1,98 @@
+# backend/nomina/management/commands/benchmark_rut.py
+
+import random
+import statistics
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from nomina.utils import rut as rut_utils
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el throughput de validación/normalización/formato de RUT y del cálculo '
+        'de dígito verificador: versión por fila vs vectorizada sobre una columna'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ruts',
+            type=int,
+            default=100_000,
+            help='Cantidad de RUTs sintéticos (default: 100000)'
+        )
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=5,
+            help='Repeticiones por medición; se reporta la mediana (default: 5)'
+        )
+        parser.add_argument(
+            '--semilla',
+            type=int,
+            default=42,
+            help='Semilla del generador de datos (default: 42)'
+        )
+
+    def handle(self, *args, **options):
+        cantidad = options['ruts']
+        repeticiones = options['repeticiones']
+        serie = self._generar_columna(cantidad, options['semilla'])
+        cuerpos = np.random.default_rng(options['semilla']).integers(1_000_000, 99_999_999, cantidad)
+
+        def por_fila():
+            ruts = []
+            for valor in serie:
+                if rut_utils.es_rut_valido(valor) and rut_utils.es_rut_chileno_valido(valor):
+                    ruts.append(rut_utils.formatear_rut_con_guion(valor))
+            return len(ruts)
+
+        def vectorizado():
+            validos, ruts = rut_utils.validar_y_formatear_ruts(serie)
+            return len(ruts[validos])
+
+        def dv_por_fila():
+            return len([rut_utils.calcular_dv(n) for n in cuerpos])
+
+        def dv_vectorizado():
+            return len(rut_utils.calcular_dv_vectorizado(cuerpos))
+
+        self.stdout.write(f"{cantidad} RUTs (mediana de {repeticiones}):")
+        for nombre, funcion in (
+            ('Validar + formatear, por fila', por_fila),
+            ('Validar + formatear, vectorizado', vectorizado),
+            ('Dígito verificador, por fila', dv_por_fila),
+            ('Dígito verificador, vectorizado', dv_vectorizado),
+        ):
+            tiempos = []
+            for _ in range(repeticiones):
+                t0 = time.perf_counter()
+                resultado = funcion()
+                tiempos.append(time.perf_counter() - t0)
+            mediana = statistics.median(tiempos)
+            self.stdout.write(
+                f"  {nombre:<36} {mediana * 1000:>9.1f} ms  {cantidad / mediana:>12,.0f} RUT/s   ({resultado})"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completado'))
+
+    def _generar_columna(self, cantidad, semilla):
+        """Columna con los formatos que llegan en los Excel: con/sin puntos, numéricos y totales"""
+        aleatorio = random.Random(semilla)
+        valores = []
+        for _ in range(cantidad):
+            cuerpo = aleatorio.randint(1_000_000, 99_999_999)
+            dv = rut_utils.calcular_dv(cuerpo)
+            formato = aleatorio.random()
+            if formato < 0.4:
+                valores.append(f"{cuerpo:,}".replace(',', '.') + f"-{dv}")
+            elif formato < 0.8:
+                valores.append(f" {cuerpo}-{dv.lower()} ")
+            elif formato < 0.97:
+                valores.append(int(f"{cuerpo}{dv}") if dv != 'K' else f"{cuerpo}K")
+            else:
+                valores.append(aleatorio.choice(["Total", "subtotal", "", None]))
+        return pd.Series(valores, dtype=object)
@@ -0,0 +1,126 @@
+# backend/nomina/management/commands/benchmark_variaciones.py
+
+import statistics
+import time
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from nomina.utils import variaciones
+from nomina.utils.DetectarIncidenciasConsolidadas import (
+    calcular_variacion_porcentual,
+    obtener_umbral_individual,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide el análisis de variaciones (empleado × concepto) entre dos períodos: '
+        'recorrido por empleado con Decimal vs matrices vectorizadas'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--empleados',
+            type=int,
+            default=10_000,
+            help='Empleados sintéticos por período (default: 10000)'
+        )
+        parser.add_argument(
+            '--conceptos',
+            type=int,
+            default=150,
+            help='Conceptos por empleado (default: 150)'
+        )
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=3,
+            help='Repeticiones por medición; se reporta la mediana (default: 3)'
+        )
+        parser.add_argument(
+            '--semilla',
+            type=int,
+            default=42,
+            help='Semilla del generador de datos (default: 42)'
+        )
+
+    def handle(self, *args, **options):
+        montos_actual, montos_anterior = self._generar_periodos(
+            options['empleados'], options['conceptos'], options['semilla']
+        )
+
+        def por_empleado():
+            # Los montos llegan como Decimal desde el ORM, igual que en la versión por empleado
+            mapa_actual, mapa_anterior = {}, {}
+            for mapa, montos in ((mapa_actual, montos_actual), (mapa_anterior, montos_anterior)):
+                for rut, nombre, tipo, centavos in montos.itertuples(index=False):
+                    mapa.setdefault(rut, {})[(nombre, tipo)] = variaciones.desde_centavos(centavos)
+            marcadas = 0
+            for rut, conceptos_actuales in mapa_actual.items():
+                conceptos_anteriores = mapa_anterior.get(rut)
+                if conceptos_anteriores is None:
+                    continue
+                for clave in conceptos_actuales.keys() | conceptos_anteriores.keys():
+                    variacion = calcular_variacion_porcentual(
+                        conceptos_actuales.get(clave, Decimal('0')), conceptos_anteriores.get(clave, Decimal('0'))
+                    )
+                    if abs(float(variacion)) >= obtener_umbral_individual(clave[1]):
+                        marcadas += 1
+            return marcadas
+
+        def vectorizado():
+            matrices = variaciones.construir_matrices(montos_actual, montos_anterior)
+            celdas, _ = variaciones.detectar_variaciones_individuales(matrices, obtener_umbral_individual)
+            return len(celdas)
+
+        repeticiones = options['repeticiones']
+        self.stdout.write(
+            f"{options['empleados']} empleados × {options['conceptos']} conceptos "
+            f"({len(montos_actual) + len(montos_anterior)} montos, mediana de {repeticiones}):"
+        )
+        for nombre, funcion in (
+            ('Por empleado (Decimal)', por_empleado),
+            ('Vectorizado (matrices)', vectorizado),
+        ):
+            tiempos = []
+            for _ in range(repeticiones):
+                t0 = time.perf_counter()
+                resultado = funcion()
+                tiempos.append(time.perf_counter() - t0)
+            self.stdout.write(
+                f"  {nombre:<26} {statistics.median(tiempos) * 1000:>9.1f} ms   ({resultado} celdas marcadas)"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completado'))
+
+    def _generar_periodos(self, empleados, conceptos, semilla):
+        """Dos períodos con ~5% de rotación, ~3% de conceptos faltantes y ~10% de montos que cambian"""
+        generador = np.random.default_rng(semilla)
+        tipos = np.array(['haber_imponible', 'haber_no_imponible', 'descuento_legal', 'otro_descuento'])
+        nombres = np.array([f'CONCEPTO {i}' for i in range(conceptos)], dtype=object)
+        tipo_por_concepto = tipos.astype(object)[np.arange(conceptos) % len(tipos)]
+
+        rotacion = int(empleados * 0.05)
+        ruts = np.array([f'{10_000_000 + i}-{i % 10}' for i in range(empleados + rotacion)], dtype=object)
+        base = generador.integers(10_000, 500_000_000, (len(ruts), conceptos))
+
+        def _periodo(desde, factor):
+            centavos = np.rint(base[desde:desde + empleados] * factor).astype(np.int64).ravel()
+            presentes = generador.random(centavos.size) > 0.03
+            columna = np.tile(np.arange(conceptos), empleados)[presentes]
+            return pd.DataFrame({
+                'rut_empleado': np.repeat(ruts[desde:desde + empleados], conceptos)[presentes],
+                'nombre_concepto': nombres[columna],
+                'tipo_concepto': tipo_por_concepto[columna],
+                'centavos': centavos[presentes],
+            })
+
+        cambios = np.where(
+            generador.random((empleados, conceptos)) < 0.1,
+            generador.uniform(0.2, 2.0, (empleados, conceptos)),
+            1.0
+        )
+        return _periodo(rotacion, cambios), _periodo(0, 1.0)
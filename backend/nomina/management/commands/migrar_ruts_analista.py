@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from nomina.models import AnalistaFiniquito, AnalistaIncidencia, AnalistaIngreso
-from nomina.utils.GenerarIncidencias import formatear_rut_con_guion
+from nomina.utils.rut import formatear_rut_con_guion
 
 
 class Command(BaseCommand):
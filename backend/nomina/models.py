@@ -3,6 +3,7 @@ from api.models import Cliente
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
 from django.conf import settings
 import unicodedata
 import hashlib
@@ -40,6 +41,33 @@ def novedades_upload_to(instance, filename):
     now = datetime.now().strftime("%Y%m%d_%H%M%S")
     return f"remuneraciones/{instance.cierre.cliente.id}/{instance.cierre.periodo}/novedades/{now}_{filename}"
 
+def monto_a_numero(monto):
+    """
+    Convierte un monto (texto del Excel) a número (peso) redondeado a entero con HALF_UP.
+    Criterio único para Libro y Novedades, así sus montos se comparan sin diferencias por decimales.
+    """
+    try:
+        if monto is None or monto == "":
+            return 0
+        d = Decimal(str(monto))
+        d0 = d.quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+        return float(d0)
+    except (InvalidOperation, ValueError, TypeError):
+        # Fallback: intentar como float y redondear con round estándar
+        try:
+            val = float(monto)
+            return float(int(val + 0.5)) if val >= 0 else float(int(val - 0.5))
+        except Exception:
+            return 0
+
+def monto_es_numerico(monto):
+    """Verifica si el monto puede convertirse a número"""
+    try:
+        float(monto) if monto else 0
+        return True
+    except (ValueError, TypeError):
+        return False
+
 
 class CierreNomina(models.Model):
     cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE)
@@ -409,28 +437,12 @@ class RegistroConceptoEmpleado(models.Model):
     @property
     def monto_numerico(self):
         """Convierte el monto a número (peso) redondeado a entero con HALF_UP para comparaciones."""
-        try:
-            from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
-            if self.monto is None or self.monto == "":
-                return 0
-            d = Decimal(str(self.monto))
-            d0 = d.quantize(Decimal('1'), rounding=ROUND_HALF_UP)
-            return float(d0)
-        except (InvalidOperation, ValueError, TypeError):
-            try:
-                val = float(self.monto)
-                return float(int(val + 0.5)) if val >= 0 else float(int(val - 0.5))
-            except Exception:
-                return 0
+        return monto_a_numero(self.monto)
     
     @property
     def es_numerico(self):
         """Verifica si el monto puede convertirse a número"""
-        try:
-            float(self.monto) if self.monto else 0
-            return True
-        except (ValueError, TypeError):
-            return False
+        return monto_es_numerico(self.monto)
 
 
 # Modelos para Movimientos_Mes completos
@@ -766,29 +778,12 @@ class RegistroConceptoEmpleadoNovedades(models.Model):
         """Convierte el monto a número para cálculos, redondeando a entero (peso) con HALF_UP.
         Esto alinea los montos de Novedades con los del Libro, evitando discrepancias por decimales.
         """
-        try:
-            from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
-            if self.monto is None or self.monto == "":
-                return 0
-            d = Decimal(str(self.monto))
-            d0 = d.quantize(Decimal('1'), rounding=ROUND_HALF_UP)
-            return float(d0)
-        except (InvalidOperation, ValueError, TypeError):
-            # Fallback: intentar como float y redondear con round estándar
-            try:
-                val = float(self.monto)
-                return float(int(val + 0.5)) if val >= 0 else float(int(val - 0.5))
-            except Exception:
-                return 0
+        return monto_a_numero(self.monto)
     
     @property
     def es_numerico(self):
         """Verifica si el monto puede convertirse a número"""
-        try:
-            float(self.monto) if self.monto else 0
-            return True
-        except (ValueError, TypeError):
-            return False
+        return monto_es_numerico(self.monto)
     
     @property
     def concepto_libro_equivalente(self):
@@ -21,39 +21,63 @@ Patrones de Logging:
 - consolidacion_error → Data_Integration_Error (error)
 """
 
+import calendar
 import logging
-import re
+from datetime import date
+from hashlib import sha1
+
+import pandas as pd
 from celery import shared_task, chord, chain
 from django.utils import timezone
 from django.db import transaction
-from decimal import Decimal, InvalidOperation
+from decimal import Decimal
+
+from nomina.utils.rut import normalizar_rut, normalizar_ruts
 
 logger = logging.getLogger(__name__)
 
+# Filas de RegistroConceptoEmpleado procesadas por lote en la consolidación
+CONSOLIDACION_LOTE_REGISTROS = 20000
+
+# Máximo de subtareas en que se reparte la consolidación de empleados
+CONSOLIDACION_MAX_SUBTAREAS = 16
+
+# Filas de MovimientoPersonal / NominaConsolidada escritas por lote al consolidar movimientos
+UPSERT_MOVIMIENTOS_BATCH_SIZE = 1000
+
+# Filas de ConceptoConsolidado / NominaConsolidada escritas por lote al consolidar conceptos
+CONSOLIDACION_LOTE_CONCEPTOS = 2000
+
+# Clasificación del analista (ConceptoRemuneracion) → tipo_concepto de ConceptoConsolidado;
+# las demás (p.ej. horas_extras) quedan como 'informativo'
+TIPO_CONCEPTO_POR_CLASIFICACION = {
+    'haberes_imponibles': 'haber_imponible',
+    'haberes_no_imponibles': 'haber_no_imponible',
+    'descuentos_legales': 'descuento_legal',
+    'otros_descuentos': 'otro_descuento',
+    'aportes_patronales': 'aporte_patronal',
+    'impuestos': 'impuesto',
+}
+
+# Clasificación del analista → campo de total por categoría en NominaConsolidada
+CAMPO_TOTAL_POR_CLASIFICACION = {
+    'haberes_imponibles': 'haberes_imponibles',
+    'haberes_no_imponibles': 'haberes_no_imponibles',
+    'descuentos_legales': 'dctos_legales',
+    'otros_descuentos': 'otros_dctos',
+    'impuestos': 'impuestos',
+    'horas_extras': 'horas_extras_cantidad',
+    'aportes_patronales': 'aportes_patronales',
+}
+
+# Monto numérico tras quitar '$' y ',': mismo criterio que el chequeo con isdigit()
+_MONTO_NUMERICO_RE = r'^-?(?:[0-9]+\.?[0-9]*|\.[0-9]+)$'
+
 
 # ==============================================================================
 # FUNCIONES AUXILIARES (INDEPENDIENTES)
 # ==============================================================================
 
-def normalizar_rut(rut):
-    """
-    Normaliza RUT para comparaciones removiendo puntos, guiones y espacios
-    """
-    if not rut:
-        return ""
-    
-    # Convertir a string y limpiar
-    rut_limpio = str(rut).strip()
-    
-    # Remover puntos, guiones, espacios
-    rut_limpio = re.sub(r'[.\-\s]', '', rut_limpio)
-    
-    # Convertir a mayúsculas (por si el dígito verificador es 'k')
-    rut_limpio = rut_limpio.upper()
-    
-    return rut_limpio
-
-
 def calcular_chunk_size_dinamico(empleados_count):
     """
     🧮 Calcula el tamaño de chunk óptimo basado en el número de empleados
@@ -76,6 +100,149 @@ def calcular_chunk_size_dinamico(empleados_count):
         return 200  # Chunks extremos para corporaciones
 
 
+def calcular_rangos_empleados(empleado_ids, chunk_size):
+    """
+    🧮 Particiona IDs de empleados ordenados en rangos contiguos
+
+    Args:
+        empleado_ids: IDs de EmpleadoCierre ordenados ascendentemente
+        chunk_size: Empleados por rango
+
+    Returns:
+        list: [(id_desde, id_hasta), ...] con límites inclusivos
+    """
+    return [
+        (empleado_ids[i], empleado_ids[min(i + chunk_size, len(empleado_ids)) - 1])
+        for i in range(0, len(empleado_ids), chunk_size)
+    ]
+
+
+def parsear_montos_vectorizado(montos):
+    """
+    🔢 Parsea montos del libro (texto) en una sola pasada vectorizada
+
+    Criterio idéntico al usado por empleado: se quitan '$' y ',', y el valor es
+    numérico si queda un número decimal con signo opcional.
+
+    Args:
+        montos: Secuencia de montos (str o None)
+
+    Returns:
+        tuple: (valores Decimal o None, flags es_numerico)
+    """
+    if not len(montos):
+        return [], []
+    limpios = (
+        pd.Series(montos, dtype=object)
+        .fillna('')
+        .astype(str)
+        .str.replace('$', '', regex=False)
+        .str.replace(',', '', regex=False)
+        .str.strip()
+    )
+    es_numerico = limpios.str.match(_MONTO_NUMERICO_RE).tolist()
+    valores = [
+        Decimal(valor) if numerico else None
+        for valor, numerico in zip(limpios.tolist(), es_numerico)
+    ]
+    return valores, es_numerico
+
+
+def consolidar_empleados_libro(cierre, fuente_datos, empleados=None):
+    """
+    📚 Consolida empleados del libro y sus valores por concepto por conjuntos
+
+    Crea todas las NominaConsolidada con un bulk_create, resuelve sus IDs con una
+    sola consulta y genera los HeaderValorEmpleado recorriendo los
+    RegistroConceptoEmpleado del cierre en lotes (sin consultas por empleado).
+
+    Args:
+        cierre: CierreNomina a consolidar
+        fuente_datos: dict guardado en NominaConsolidada.fuente_datos
+        empleados: QuerySet de EmpleadoCierre a consolidar (default: todos los del cierre)
+
+    Returns:
+        dict: {'empleados_consolidados': int, 'headers_consolidados': int}
+    """
+    from nomina.models import NominaConsolidada, HeaderValorEmpleado, RegistroConceptoEmpleado
+
+    if empleados is None:
+        empleados = cierre.empleados.all()
+    ahora = timezone.now()
+
+    # 1. Nóminas consolidadas en bloque
+    filas_empleados = list(empleados.values_list(
+        'id', 'rut', 'nombre', 'apellido_paterno', 'apellido_materno', 'dias_trabajados'
+    ))
+    ruts_normalizados = normalizar_ruts([fila[1] for fila in filas_empleados]).tolist()
+    rut_por_empleado = {}
+    nominas = []
+    for (emp_id, _, nombre, ap_paterno, ap_materno, dias), rut_norm in zip(filas_empleados, ruts_normalizados):
+        rut_por_empleado[emp_id] = rut_norm
+        nominas.append(NominaConsolidada(
+            cierre=cierre,
+            rut_empleado=rut_norm,
+            nombre_empleado=f"{nombre} {ap_paterno} {ap_materno}".strip(),
+            estado_empleado='activo',
+            dias_trabajados=dias,
+            fecha_consolidacion=ahora,
+            fuente_datos=fuente_datos,
+        ))
+    NominaConsolidada.objects.bulk_create(nominas, batch_size=1000, ignore_conflicts=True)
+
+    # 2. IDs de las nóminas (ignore_conflicts no los devuelve)
+    nomina_por_rut = dict(
+        NominaConsolidada.objects.filter(
+            cierre=cierre, rut_empleado__in=set(rut_por_empleado.values())
+        ).values_list('rut_empleado', 'id')
+    )
+    nomina_por_empleado = {
+        emp_id: nomina_por_rut.get(rut_norm) for emp_id, rut_norm in rut_por_empleado.items()
+    }
+
+    # 3. Headers desde los registros del libro, por lotes y con parseo vectorizado
+    headers_consolidados = 0
+    registros = (
+        RegistroConceptoEmpleado.objects
+        .filter(empleado__in=empleados)
+        .values_list('empleado_id', 'nombre_concepto_original', 'concepto_id', 'monto')
+        .iterator(chunk_size=CONSOLIDACION_LOTE_REGISTROS)
+    )
+
+    def volcar(lote):
+        valores, numericos = parsear_montos_vectorizado([fila[3] for fila in lote])
+        headers = [
+            HeaderValorEmpleado(
+                nomina_consolidada_id=nomina_por_empleado[emp_id],
+                nombre_header=nombre_header,
+                concepto_remuneracion_id=concepto_id,
+                valor_original=monto or '',
+                valor_numerico=valor,
+                es_numerico=numerico,
+                fuente_archivo='libro_remuneraciones',
+                fecha_consolidacion=ahora,
+            )
+            for (emp_id, nombre_header, concepto_id, monto), valor, numerico in zip(lote, valores, numericos)
+            if nomina_por_empleado.get(emp_id)
+        ]
+        HeaderValorEmpleado.objects.bulk_create(headers, batch_size=2000, ignore_conflicts=True)
+        return len(headers)
+
+    lote = []
+    for fila in registros:
+        lote.append(fila)
+        if len(lote) >= CONSOLIDACION_LOTE_REGISTROS:
+            headers_consolidados += volcar(lote)
+            lote = []
+    if lote:
+        headers_consolidados += volcar(lote)
+
+    return {
+        'empleados_consolidados': len(nominas),
+        'headers_consolidados': headers_consolidados,
+    }
+
+
 # ==============================================================================
 # FUNCIONES DE LOGGING DUAL
 # ==============================================================================
@@ -490,20 +657,45 @@ def consolidar_datos_nomina_task_optimizado(cierre_id):
         else:
             logger.info("ℹ️ No hay consolidación anterior que eliminar")
         
-        # 5. CÁLCULO DINÁMICO DE CHUNKS
+        # 5. PARTICIÓN DE EMPLEADOS POR RANGO DE ID
         from nomina.models import EmpleadoCierre
-        empleados_count = EmpleadoCierre.objects.filter(cierre=cierre).count()
-        chunk_size = calcular_chunk_size_dinamico(empleados_count)
-        logger.info(f"📊 Procesando {empleados_count} empleados con chunk size dinámico: {chunk_size}")
+        empleado_ids = list(
+            EmpleadoCierre.objects.filter(cierre=cierre).order_by('id').values_list('id', flat=True)
+        )
+        empleados_count = len(empleado_ids)
+        chunk_size = max(
+            calcular_chunk_size_dinamico(empleados_count),
+            -(-empleados_count // CONSOLIDACION_MAX_SUBTAREAS)
+        )
+        rangos = calcular_rangos_empleados(empleado_ids, chunk_size)
+        logger.info(f"📊 Procesando {empleados_count} empleados en {len(rangos)} subtareas de hasta {chunk_size}")
         
         # 6. INICIAR ORQUESTACIÓN: EMPLEADOS → MOVIMIENTOS → CONCEPTOS
         logger.info("🎯 Iniciando orquestación: empleados → movimientos → conceptos")
 
+        if rangos:
+            fuente_datos = {
+                'libro_id': libro.id,
+                'consolidacion_version': '3.0_optimizada_refactored',
+                'procesamiento': 'paralelo'
+            }
+            # Chord: un rango de empleados por subtarea, agregación al terminar todas
+            etapa_empleados = chord(
+                [
+                    consolidar_rango_empleados_task.s(cierre_id, id_desde, id_hasta, fuente_datos)
+                    for id_desde, id_hasta in rangos
+                ],
+                agregar_consolidacion_empleados.s(cierre_id)
+            )
+        else:
+            etapa_empleados = procesar_empleados_libro_paralelo.si(cierre_id, chunk_size)
+
         flujo = chain(
-            # Empleados del libro (usa su propio procesamiento batch interno)
-            procesar_empleados_libro_paralelo.s(cierre_id, chunk_size),
-            # Movimientos deben correr después de que existan las nóminas consolidadas
-            procesar_movimientos_personal_paralelo.si(cierre_id),
+            # Empleados del libro en paralelo por rangos de ID
+            etapa_empleados,
+            # Movimientos deben correr después de que existan las nóminas consolidadas;
+            # cada tipo de movimiento en su propia subtarea
+            flujo_movimientos_personal(cierre_id),
             # Finalización: conceptos y cambio de estado
             finalizar_consolidacion_post_movimientos.si(cierre_id)
         )
@@ -516,7 +708,8 @@ def consolidar_datos_nomina_task_optimizado(cierre_id):
             'success': True,
             'cierre_id': cierre_id,
             'chain_id': getattr(resultado_flujo, 'id', None),
-            'modo': 'optimizado_empleados_paralelo_movs_secuencial',
+            'modo': 'optimizado_empleados_y_movimientos_paralelo',
+            'subtareas_empleados': len(rangos),
             'timestamp': timezone.now().isoformat()
         }
         
@@ -546,12 +739,12 @@ def procesar_empleados_libro_paralelo(cierre_id, chunk_size=50):
     
     Args:
         cierre_id: ID del cierre a procesar
-        chunk_size: Tamaño dinámico de chunks para optimizar el procesamiento
+        chunk_size: Se conserva por compatibilidad; la consolidación es por conjuntos
     """
     logger.info(f"📚 [PARALELO] Procesando empleados del libro para cierre {cierre_id} (chunk_size: {chunk_size})")
     
     try:
-        from nomina.models import CierreNomina, NominaConsolidada, HeaderValorEmpleado
+        from nomina.models import CierreNomina
         
         cierre = CierreNomina.objects.get(id=cierre_id)
         libro = cierre.libros_remuneraciones.filter(estado='procesado').first()
@@ -559,109 +752,19 @@ def procesar_empleados_libro_paralelo(cierre_id, chunk_size=50):
         if not libro:
             raise ValueError("No hay libro de remuneraciones procesado")
         
-        empleados_consolidados = 0
-        headers_consolidados = 0
-        
-        # Procesar empleados del libro en lotes para optimizar
-        empleados = cierre.empleados.all()
-        total_empleados = empleados.count()
-        logger.info(f"👥 Procesando {total_empleados} empleados en lotes (chunk_size: {chunk_size})")
+        total_empleados = cierre.empleados.count()
+        logger.info(f"👥 Consolidando {total_empleados} empleados por conjuntos")
         
-        # Procesar en lotes usando el chunk_size dinámico
-        for i in range(0, total_empleados, chunk_size):
-            batch_empleados = empleados[i:i + chunk_size]
-            
-            # Crear registros de nómina consolidada en lote
-            nominas_batch = []
-            headers_batch = []
-            
-            for empleado in batch_empleados:
-                # Crear registro de nómina consolidada
-                nomina_consolidada = NominaConsolidada(
-                    cierre=cierre,
-                    rut_empleado=normalizar_rut(empleado.rut),
-                    nombre_empleado=f"{empleado.nombre} {empleado.apellido_paterno} {empleado.apellido_materno}".strip(),
-                    estado_empleado='activo',
-                    dias_trabajados=empleado.dias_trabajados,
-                    fecha_consolidacion=timezone.now(),
-                    fuente_datos={
-                        'libro_id': libro.id,
-                        'consolidacion_version': '3.0_optimizada_refactored',
-                        'procesamiento': 'paralelo'
-                    }
-                )
-                nominas_batch.append(nomina_consolidada)
-            
-            # Bulk create nóminas con manejo de duplicados
-            NominaConsolidada.objects.bulk_create(nominas_batch, ignore_conflicts=True)
-            empleados_consolidados += len(nominas_batch)
-            
-            # Procesar headers para este lote
-            for j, empleado in enumerate(batch_empleados):
-                try:
-                    # Obtener o crear la nómina consolidada (manejo de duplicados)
-                    nomina_consolidada, created = NominaConsolidada.objects.get_or_create(
-                        cierre=cierre, 
-                        rut_empleado=normalizar_rut(empleado.rut),
-                        defaults={
-                            'nombre_empleado': f"{empleado.nombre} {empleado.apellido_paterno} {empleado.apellido_materno}".strip(),
-                            'estado_empleado': 'activo',
-                            'dias_trabajados': empleado.dias_trabajados,
-                            'fecha_consolidacion': timezone.now(),
-                            'fuente_datos': {
-                                'libro_id': libro.id,
-                                'consolidacion_version': '3.0_optimizada_refactored',
-                                'procesamiento': 'paralelo'
-                            }
-                        }
-                    )
-                
-                    # Crear HeaderValorEmpleado para cada concepto
-                    conceptos_empleado = empleado.registroconceptoempleado_set.all()
-                    
-                    for concepto in conceptos_empleado:
-                        # Determinar si es numérico
-                        valor_numerico = None
-                        es_numerico = False
-                        
-                        if concepto.monto:
-                            try:
-                                valor_limpio = str(concepto.monto).replace('$', '').replace(',', '').strip()
-                                if valor_limpio and (valor_limpio.replace('-', '').replace('.', '').isdigit()):
-                                    valor_numerico = Decimal(valor_limpio)
-                                    es_numerico = True
-                            except (ValueError, InvalidOperation, AttributeError):
-                                pass
-                        
-                        # Crear registro HeaderValorEmpleado
-                        header = HeaderValorEmpleado(
-                            nomina_consolidada=nomina_consolidada,
-                            nombre_header=concepto.nombre_concepto_original,
-                            concepto_remuneracion=concepto.concepto,
-                            valor_original=concepto.monto or '',
-                            valor_numerico=valor_numerico,
-                            es_numerico=es_numerico,
-                            fuente_archivo='libro_remuneraciones',
-                            fecha_consolidacion=timezone.now()
-                        )
-                        headers_batch.append(header)
-                        
-                except Exception as e:
-                    logger.error(f"❌ Error procesando empleado {empleado.rut}: {e}")
-                    continue
-            
-            # Bulk create headers cada cierto número para evitar memoria excesiva
-            if len(headers_batch) >= 500:
-                HeaderValorEmpleado.objects.bulk_create(headers_batch)
-                headers_consolidados += len(headers_batch)
-                headers_batch = []
-                
-            logger.info(f"📊 Progreso: {empleados_consolidados}/{total_empleados} empleados procesados")
-        
-        # Insertar headers restantes
-        if headers_batch:
-            HeaderValorEmpleado.objects.bulk_create(headers_batch)
-            headers_consolidados += len(headers_batch)
+        resultado = consolidar_empleados_libro(
+            cierre,
+            fuente_datos={
+                'libro_id': libro.id,
+                'consolidacion_version': '3.0_optimizada_refactored',
+                'procesamiento': 'paralelo'
+            }
+        )
+        empleados_consolidados = resultado['empleados_consolidados']
+        headers_consolidados = resultado['headers_consolidados']
         
         logger.info(f"✅ [PARALELO] Empleados procesados: {empleados_consolidados}, Headers: {headers_consolidados}")
         
@@ -683,25 +786,454 @@ def procesar_empleados_libro_paralelo(cierre_id, chunk_size=50):
         }
 
 
+@shared_task(queue='nomina_queue')
+def consolidar_rango_empleados_task(cierre_id, id_desde, id_hasta, fuente_datos):
+    """
+    📦 SUBTAREA DEL CHORD: Consolida los empleados del cierre con ID en [id_desde, id_hasta]
+    """
+    logger.info(f"📦 [PARALELO] Consolidando empleados {id_desde}-{id_hasta} del cierre {cierre_id}")
+
+    try:
+        from nomina.models import CierreNomina
+
+        cierre = CierreNomina.objects.get(id=cierre_id)
+        resultado = consolidar_empleados_libro(
+            cierre,
+            fuente_datos=fuente_datos,
+            empleados=cierre.empleados.filter(id__gte=id_desde, id__lte=id_hasta)
+        )
+
+        return {
+            'success': True,
+            'rango': [id_desde, id_hasta],
+            **resultado
+        }
+
+    except Exception as e:
+        logger.error(f"❌ [PARALELO] Error consolidando empleados {id_desde}-{id_hasta} del cierre {cierre_id}: {e}")
+        return {
+            'success': False,
+            'rango': [id_desde, id_hasta],
+            'error': str(e)
+        }
+
+
+@shared_task(queue='nomina_queue')
+def agregar_consolidacion_empleados(resultados, cierre_id):
+    """
+    🧮 CALLBACK DEL CHORD: Suma los resultados de las subtareas de empleados
+    """
+    fallidos = [r for r in resultados if not r.get('success', False)]
+    empleados_consolidados = sum(r.get('empleados_consolidados', 0) for r in resultados)
+    headers_consolidados = sum(r.get('headers_consolidados', 0) for r in resultados)
+
+    for fallido in fallidos:
+        logger.error(
+            f"❌ [PARALELO] Rango {fallido.get('rango')} del cierre {cierre_id} falló: {fallido.get('error')}"
+        )
+    logger.info(
+        f"✅ [PARALELO] Empleados procesados: {empleados_consolidados}, Headers: {headers_consolidados} "
+        f"({len(resultados) - len(fallidos)}/{len(resultados)} subtareas)"
+    )
+
+    return {
+        'success': not fallidos,
+        'task': 'procesar_empleados_libro',
+        'empleados_consolidados': empleados_consolidados,
+        'headers_consolidados': headers_consolidados,
+        'subtareas': len(resultados),
+        'subtareas_fallidas': len(fallidos),
+        'cierre_id': cierre_id
+    }
+
+
+# ==============================================================================
+# MOVIMIENTOS DE PERSONAL
+# ==============================================================================
+
+# Orden en que se aplican los cambios de estado: el último gana (ausentismo sobre alta/baja)
+MOVIMIENTOS_PERSONAL_TIPOS = (
+    'altas_bajas',
+    'ausentismos',
+    'vacaciones',
+    'variaciones_sueldo',
+    'variaciones_contrato',
+)
+
+
+def _archivo_movimientos_procesado(cierre):
+    return cierre.movimientos_mes.filter(estado='procesado').first()
+
+
+def _nominas_consolidadas_por_rut(cierre):
+    """Nóminas consolidadas del cierre indexadas por RUT (una consulta)"""
+    from nomina.models import NominaConsolidada
+
+    return {
+        nomina.rut_empleado: nomina
+        for nomina in NominaConsolidada.objects.filter(cierre=cierre).only('id', 'rut_empleado', 'fuente_datos')
+    }
+
+
+def _nuevo_movimiento_personal(nomina_consolidada, **campos):
+    from nomina.models import MovimientoPersonal
+
+    return MovimientoPersonal(
+        nomina_consolidada=nomina_consolidada,
+        fecha_deteccion=timezone.now(),
+        detectado_por_sistema='consolidacion_refactored_v3',
+        **campos
+    )
+
+
+def _recortar_al_periodo(cierre, fecha_inicio, fecha_fin, dias_por_defecto):
+    """Días del evento dentro del mes del cierre y si el evento cruza el mes"""
+    try:
+        year, month = map(int, cierre.periodo.split('-'))
+        start_periodo = date(year, month, 1)
+        end_periodo = date(year, month, calendar.monthrange(year, month)[1])
+        clip_start = fecha_inicio if fecha_inicio > start_periodo else start_periodo
+        clip_end = fecha_fin if fecha_fin < end_periodo else end_periodo
+        dias_en_periodo = (clip_end - clip_start).days + 1 if clip_end >= clip_start else 0
+        multi_mes_flag = (fecha_inicio < start_periodo) or (fecha_fin > end_periodo)
+        return dias_en_periodo, multi_mes_flag
+    except Exception:
+        return dias_por_defecto, False
+
+
+def _hashes_evento(cierre, rut, subtipo, fecha_inicio, fecha_fin):
+    base_hash = f"{rut}:ausencia:{subtipo}:{fecha_inicio}:{fecha_fin}".lower()
+    hash_evento = sha1(base_hash.encode('utf-8')).hexdigest()
+    return hash_evento, sha1(f"{hash_evento}:{cierre.periodo}".encode('utf-8')).hexdigest()
+
+
+def _crear_nominas_finiquito(cierre):
+    """
+    Crea la nómina consolidada de los empleados con BAJA que no vienen en el libro,
+    antes de repartir los tipos de movimiento (todos deben poder encontrarlos)
+    """
+    from nomina.models import MovimientoAltaBaja, NominaConsolidada
+
+    existentes = set(NominaConsolidada.objects.filter(cierre=cierre).values_list('rut_empleado', flat=True))
+    nuevas = {}
+    for rut, nombres_apellidos in MovimientoAltaBaja.objects.filter(
+        cierre=cierre, alta_o_baja='BAJA'
+    ).order_by('id').values_list('rut', 'nombres_apellidos'):
+        rut_normalizado = normalizar_rut(rut)
+        if rut_normalizado not in existentes and rut_normalizado not in nuevas:
+            nuevas[rut_normalizado] = NominaConsolidada(
+                cierre=cierre,
+                rut_empleado=rut_normalizado,
+                nombre_empleado=nombres_apellidos,
+                estado_empleado='finiquito',
+                fecha_consolidacion=timezone.now(),
+                fuente_datos={'movimiento_finiquito': True}
+            )
+    NominaConsolidada.objects.bulk_create(nuevas.values())
+    return len(nuevas)
+
+
+def _movimientos_altas_bajas(cierre, nominas):
+    from nomina.models import MovimientoAltaBaja
+
+    movimientos, estados = [], {}
+    altas_bajas = list(MovimientoAltaBaja.objects.filter(cierre=cierre))
+    logger.info(f"📊 [PARALELO] Encontrados {len(altas_bajas)} registros de altas/bajas en BD")
+
+    for movimiento in altas_bajas:
+        nomina_consolidada = nominas.get(normalizar_rut(movimiento.rut))
+        if nomina_consolidada is None:
+            continue
+
+        # Actualizar estado del empleado
+        if movimiento.alta_o_baja == 'ALTA':
+            estados[nomina_consolidada.id] = 'nueva_incorporacion'
+        elif movimiento.alta_o_baja == 'BAJA':
+            estados[nomina_consolidada.id] = 'finiquito'
+
+        fecha_evt = movimiento.fecha_ingreso if movimiento.alta_o_baja == 'ALTA' else movimiento.fecha_retiro
+        categoria = 'ingreso' if movimiento.alta_o_baja == 'ALTA' else 'finiquito'
+        # Finiquitos creados desde movimientos (no estaban en el libro) no llevan datos de contrato
+        observaciones = None
+        if not (nomina_consolidada.fuente_datos or {}).get('movimiento_finiquito'):
+            observaciones = f"Tipo contrato: {movimiento.tipo_contrato}, Sueldo base: ${movimiento.sueldo_base:,.0f}"
+        movimientos.append(_nuevo_movimiento_personal(
+            nomina_consolidada,
+            categoria=categoria,
+            subtipo=None,
+            descripcion=(movimiento.motivo or '')[:300],
+            fecha_inicio=fecha_evt,
+            fecha_fin=fecha_evt,
+            dias_evento=1,
+            dias_en_periodo=1,
+            multi_mes=False,
+            observaciones=observaciones
+        ))
+    return movimientos, estados
+
+
+def _movimientos_ausentismos(cierre, nominas):
+    from nomina.models import MovimientoAusentismo
+
+    movimientos, estados = [], {}
+    ausentismos = list(MovimientoAusentismo.objects.filter(cierre=cierre))
+    logger.info(f"📊 [PARALELO] Encontrados {len(ausentismos)} registros de ausentismo en BD")
+
+    for ausentismo in ausentismos:
+        nomina_consolidada = nominas.get(normalizar_rut(ausentismo.rut))
+        if nomina_consolidada is None:
+            logger.warning(f"⚠️ No se encontró empleado consolidado para RUT {ausentismo.rut} en ausentismo")
+            continue
+
+        # Actualizar estado si es ausencia total
+        estados[nomina_consolidada.id] = 'ausente_total' if ausentismo.dias >= 30 else 'ausente_parcial'
+
+        subtipo = ausentismo.tipo.lower().replace(' ', '_')[:40] if ausentismo.tipo else 'sin_justificar'
+        fecha_inicio = ausentismo.fecha_inicio_ausencia
+        fecha_fin = ausentismo.fecha_fin_ausencia
+        dias_evento = (fecha_fin - fecha_inicio).days + 1 if fecha_inicio and fecha_fin else ausentismo.dias
+        dias_en_periodo, multi_mes_flag = _recortar_al_periodo(cierre, fecha_inicio, fecha_fin, ausentismo.dias)
+        hash_evento, hash_registro_periodo = _hashes_evento(
+            cierre, nomina_consolidada.rut_empleado, subtipo, fecha_inicio, fecha_fin
+        )
+        movimientos.append(_nuevo_movimiento_personal(
+            nomina_consolidada,
+            categoria='ausencia',
+            subtipo=subtipo or 'sin_justificar',
+            descripcion=f"{ausentismo.tipo} - {ausentismo.motivo}".strip(' -'),
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            dias_evento=dias_evento,
+            dias_en_periodo=dias_en_periodo,
+            multi_mes=multi_mes_flag,
+            hash_evento=hash_evento,
+            hash_registro_periodo=hash_registro_periodo,
+            observaciones=f"Desde: {ausentismo.fecha_inicio_ausencia} hasta: {ausentismo.fecha_fin_ausencia}"
+        ))
+    return movimientos, estados
+
+
+def _movimientos_vacaciones(cierre, nominas):
+    from nomina.models import MovimientoVacaciones
+
+    movimientos = []
+    vacaciones = list(MovimientoVacaciones.objects.filter(cierre=cierre))
+    logger.info(f"📊 [PARALELO] Encontrados {len(vacaciones)} registros de vacaciones en BD")
+
+    for vacacion in vacaciones:
+        rut_normalizado = normalizar_rut(vacacion.rut)
+        nomina_consolidada = nominas.get(rut_normalizado)
+        if nomina_consolidada is None:
+            logger.warning(f"⚠️ No se encontró empleado consolidado para RUT {vacacion.rut} → {rut_normalizado} en vacaciones")
+            continue
+
+        fecha_inicio = vacacion.fecha_inicio
+        fecha_fin = vacacion.fecha_fin_vacaciones
+        dias_evento = (fecha_fin - fecha_inicio).days + 1 if fecha_inicio and fecha_fin else vacacion.cantidad_dias
+        dias_en_periodo, multi_mes_flag = _recortar_al_periodo(cierre, fecha_inicio, fecha_fin, vacacion.cantidad_dias)
+        hash_evento, hash_registro_periodo = _hashes_evento(
+            cierre, nomina_consolidada.rut_empleado, 'vacaciones', fecha_inicio, fecha_fin
+        )
+        movimientos.append(_nuevo_movimiento_personal(
+            nomina_consolidada,
+            categoria='ausencia',
+            subtipo='vacaciones',
+            descripcion='Vacaciones',
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            dias_evento=dias_evento,
+            dias_en_periodo=dias_en_periodo,
+            multi_mes=multi_mes_flag,
+            hash_evento=hash_evento,
+            hash_registro_periodo=hash_registro_periodo,
+            observaciones=f"Vacaciones desde: {vacacion.fecha_inicio} hasta: {vacacion.fecha_fin_vacaciones}"
+        ))
+    return movimientos, {}
+
+
+def _movimientos_variaciones(cierre, nominas, modelo, subtipo, etiqueta, describir):
+    movimientos = []
+    variaciones = list(modelo.objects.filter(cierre=cierre))
+    logger.info(f"📊 [PARALELO] Encontrados {len(variaciones)} registros de variaciones de {etiqueta} en BD")
+
+    for variacion in variaciones:
+        nomina_consolidada = nominas.get(normalizar_rut(variacion.rut))
+        if nomina_consolidada is None:
+            logger.warning(f"⚠️ No se encontró empleado consolidado para RUT {variacion.rut} en variación {etiqueta}")
+            continue
+
+        motivo_text, observaciones = describir(variacion)
+        fecha = getattr(variacion, 'fecha_cambio', getattr(variacion, 'fecha_ingreso', timezone.now()))
+        movimientos.append(_nuevo_movimiento_personal(
+            nomina_consolidada,
+            categoria='cambio_datos',
+            subtipo=subtipo,
+            descripcion=motivo_text,
+            fecha_inicio=fecha,
+            fecha_fin=fecha,
+            dias_evento=1,
+            dias_en_periodo=1,
+            multi_mes=False,
+            observaciones=observaciones
+        ))
+    return movimientos, {}
+
+
+def _movimientos_variaciones_sueldo(cierre, nominas):
+    from nomina.models import MovimientoVariacionSueldo
+
+    return _movimientos_variaciones(
+        cierre, nominas, MovimientoVariacionSueldo, 'cambio_sueldo', 'sueldo',
+        lambda v: (
+            f"Cambio de sueldo: de ${v.sueldo_base_anterior:,.0f} a ${v.sueldo_base_actual:,.0f}",
+            f"De ${v.sueldo_base_anterior:,.0f} a ${v.sueldo_base_actual:,.0f}",
+        )
+    )
+
+
+def _movimientos_variaciones_contrato(cierre, nominas):
+    from nomina.models import MovimientoVariacionContrato
+
+    return _movimientos_variaciones(
+        cierre, nominas, MovimientoVariacionContrato, 'cambio_contrato', 'contrato',
+        lambda v: (
+            f"Cambio de contrato: de {v.tipo_contrato_anterior} a {v.tipo_contrato_actual}",
+            f"De {v.tipo_contrato_anterior} a {v.tipo_contrato_actual}",
+        )
+    )
+
+
+_PROCESADORES_MOVIMIENTOS = {
+    'altas_bajas': _movimientos_altas_bajas,
+    'ausentismos': _movimientos_ausentismos,
+    'vacaciones': _movimientos_vacaciones,
+    'variaciones_sueldo': _movimientos_variaciones_sueldo,
+    'variaciones_contrato': _movimientos_variaciones_contrato,
+}
+
+
+def procesar_movimientos_tipo(cierre, tipo, nominas=None):
+    """
+    Genera y guarda los MovimientoPersonal de un tipo de movimiento.
+
+    Los cambios de estado del empleado NO se escriben aquí: se devuelven para que
+    agregar_movimientos_personal los aplique en un solo bulk_update y en el orden
+    de MOVIMIENTOS_PERSONAL_TIPOS.
+
+    Returns:
+        dict: tipo, movimientos_creados y estados ([[nomina_id, estado], ...])
+    """
+    from nomina.models import MovimientoPersonal
+
+    if nominas is None:
+        nominas = _nominas_consolidadas_por_rut(cierre)
+    movimientos, estados = _PROCESADORES_MOVIMIENTOS[tipo](cierre, nominas)
+    MovimientoPersonal.objects.bulk_create(movimientos, batch_size=UPSERT_MOVIMIENTOS_BATCH_SIZE)
+    logger.info(f"✅ [PARALELO] {len(movimientos)} movimientos de {tipo} procesados")
+    return {
+        'success': True,
+        'tipo': tipo,
+        'movimientos_creados': len(movimientos),
+        'estados': [[nomina_id, estado] for nomina_id, estado in estados.items()],
+    }
+
+
+@shared_task(queue='nomina_queue')
+def preparar_movimientos_personal(cierre_id):
+    """
+    🧾 PASO PREVIO: Crea las nóminas de finiquitos que no vienen en el libro
+    """
+    from nomina.models import CierreNomina
+
+    cierre = CierreNomina.objects.get(id=cierre_id)
+    if not _archivo_movimientos_procesado(cierre):
+        return {'success': True, 'nominas_finiquito': 0, 'cierre_id': cierre_id}
+    creadas = _crear_nominas_finiquito(cierre)
+    if creadas:
+        logger.info(f"✅ [PARALELO] {creadas} nóminas de finiquito creadas desde movimientos")
+    return {'success': True, 'nominas_finiquito': creadas, 'cierre_id': cierre_id}
+
+
+@shared_task(queue='nomina_queue')
+def procesar_movimientos_tipo_task(cierre_id, tipo):
+    """
+    📦 SUBTAREA DEL CHORD: Procesa un tipo de movimiento de personal del cierre
+    """
+    try:
+        from nomina.models import CierreNomina
+
+        cierre = CierreNomina.objects.get(id=cierre_id)
+        if not _archivo_movimientos_procesado(cierre):
+            return {'success': True, 'tipo': tipo, 'movimientos_creados': 0, 'estados': []}
+        return procesar_movimientos_tipo(cierre, tipo)
+
+    except Exception as e:
+        logger.error(f"❌ [PARALELO] Error procesando movimientos de {tipo} para cierre {cierre_id}: {e}")
+        return {'success': False, 'tipo': tipo, 'error': str(e), 'movimientos_creados': 0, 'estados': []}
+
+
+@shared_task(queue='nomina_queue')
+def agregar_movimientos_personal(resultados, cierre_id):
+    """
+    🧮 CALLBACK DEL CHORD: Aplica los cambios de estado en bloque y resume los movimientos
+    """
+    from nomina.models import NominaConsolidada
+
+    por_tipo = {r.get('tipo'): r for r in resultados}
+    estados = {}
+    for tipo in MOVIMIENTOS_PERSONAL_TIPOS:
+        estados.update((nomina_id, estado) for nomina_id, estado in por_tipo.get(tipo, {}).get('estados', []))
+    NominaConsolidada.objects.bulk_update(
+        [NominaConsolidada(id=nomina_id, estado_empleado=estado) for nomina_id, estado in estados.items()],
+        ['estado_empleado'],
+        batch_size=UPSERT_MOVIMIENTOS_BATCH_SIZE
+    )
+
+    fallidos = [r for r in resultados if not r.get('success', False)]
+    for fallido in fallidos:
+        logger.error(f"❌ [PARALELO] Movimientos de {fallido.get('tipo')} del cierre {cierre_id} fallaron: {fallido.get('error')}")
+    movimientos_creados = sum(r.get('movimientos_creados', 0) for r in resultados)
+
+    logger.info("📋 [PARALELO] RESUMEN DETALLADO DE MOVIMIENTOS:")
+    for tipo in MOVIMIENTOS_PERSONAL_TIPOS:
+        logger.info(f"    {tipo}: {por_tipo.get(tipo, {}).get('movimientos_creados', 0)}")
+    logger.info(f"    🔁 Estados de empleado actualizados: {len(estados)}")
+    logger.info(f"    ✅ TOTAL CREADOS: {movimientos_creados}")
+
+    return {
+        'success': not fallidos,
+        'task': 'procesar_movimientos_personal',
+        'movimientos_creados': movimientos_creados,
+        'cierre_id': cierre_id
+    }
+
+
+def flujo_movimientos_personal(cierre_id):
+    """Firma Celery: paso previo y luego los tipos de movimiento en paralelo (chord)"""
+    return chain(
+        preparar_movimientos_personal.si(cierre_id),
+        chord(
+            [procesar_movimientos_tipo_task.si(cierre_id, tipo) for tipo in MOVIMIENTOS_PERSONAL_TIPOS],
+            agregar_movimientos_personal.s(cierre_id)
+        )
+    )
+
+
 @shared_task
 def procesar_movimientos_personal_paralelo(cierre_id):
     """
-    🔄 TAREA PARALELA: Procesar movimientos de personal
+    🔄 Procesar movimientos de personal en el mismo proceso (modo secuencial).
+    El modo optimizado usa flujo_movimientos_personal, con un tipo por subtarea.
     """
     logger.info(f"🔄 [PARALELO] Procesando movimientos de personal para cierre {cierre_id}")
     
     try:
-        from nomina.models import (
-            CierreNomina, NominaConsolidada, MovimientoPersonal,
-            MovimientoAltaBaja, MovimientoAusentismo, MovimientoVacaciones,
-            MovimientoVariacionSueldo, MovimientoVariacionContrato
-        )
+        from nomina.models import CierreNomina
         
         cierre = CierreNomina.objects.get(id=cierre_id)
-        movimientos_creados = 0
         
         # Verificar si hay archivo de movimientos procesado
-        movimientos_archivo = cierre.movimientos_mes.filter(estado='procesado').first()
+        movimientos_archivo = _archivo_movimientos_procesado(cierre)
         if not movimientos_archivo:
             logger.warning(f"⚠️ [PARALELO] No hay archivo de movimientos procesado para cierre {cierre_id}")
             return {
@@ -714,320 +1246,10 @@ def procesar_movimientos_personal_paralelo(cierre_id):
         
         logger.info(f"📁 [PARALELO] Archivo de movimientos encontrado: {movimientos_archivo.archivo.name}")
         
-        # Crear lista para bulk_create y contadores
-        movimientos_batch = []
-        contador_altas_bajas = 0
-        contador_ausentismos = 0
-        contador_vacaciones = 0
-        contador_variaciones_sueldo = 0
-        contador_variaciones_contrato = 0
-        
-        # 1. Procesar ALTAS y BAJAS
-        altas_bajas = MovimientoAltaBaja.objects.filter(cierre=cierre)
-        logger.info(f"📊 [PARALELO] Encontrados {altas_bajas.count()} registros de altas/bajas en BD")
-        
-        for movimiento in altas_bajas:
-            try:
-                nomina_consolidada = NominaConsolidada.objects.get(
-                    cierre=cierre, 
-                    rut_empleado=normalizar_rut(movimiento.rut)
-                )
-                
-                # Actualizar estado del empleado
-                if movimiento.alta_o_baja == 'ALTA':
-                    nomina_consolidada.estado_empleado = 'nueva_incorporacion'
-                elif movimiento.alta_o_baja == 'BAJA':
-                    nomina_consolidada.estado_empleado = 'finiquito'
-                
-                nomina_consolidada.save(update_fields=['estado_empleado'])
-                
-                # Crear MovimientoPersonal
-                fecha_evt = movimiento.fecha_ingreso if movimiento.alta_o_baja == 'ALTA' else movimiento.fecha_retiro
-                categoria = 'ingreso' if movimiento.alta_o_baja == 'ALTA' else 'finiquito'
-                _desc = (movimiento.motivo or '')
-                if _desc and len(_desc) > 300:
-                    _desc = _desc[:300]
-                mov_personal = MovimientoPersonal(
-                    nomina_consolidada=nomina_consolidada,
-                    categoria=(categoria[:20] if categoria else None),
-                    subtipo=None,
-                    descripcion=_desc,
-                    fecha_inicio=fecha_evt,
-                    fecha_fin=fecha_evt,
-                    dias_evento=1,
-                    dias_en_periodo=1,
-                    multi_mes=False,
-                    observaciones=f"Tipo contrato: {movimiento.tipo_contrato}, Sueldo base: ${movimiento.sueldo_base:,.0f}",
-                    fecha_deteccion=timezone.now(),
-                    detectado_por_sistema='consolidacion_refactored_v3'
-                )
-                movimientos_batch.append(mov_personal)
-                contador_altas_bajas += 1
-                
-            except NominaConsolidada.DoesNotExist:
-                # Crear empleado si no existe (caso de finiquitos)
-                if movimiento.alta_o_baja == 'BAJA':
-                    nomina_consolidada = NominaConsolidada.objects.create(
-                        cierre=cierre,
-                        rut_empleado=normalizar_rut(movimiento.rut),
-                        nombre_empleado=movimiento.nombres_apellidos,
-                        estado_empleado='finiquito',
-                        fecha_consolidacion=timezone.now(),
-                        fuente_datos={'movimiento_finiquito': True}
-                    )
-                    
-                    _desc2 = (movimiento.motivo or '')
-                    if _desc2 and len(_desc2) > 300:
-                        _desc2 = _desc2[:300]
-                    mov_personal = MovimientoPersonal(
-                        nomina_consolidada=nomina_consolidada,
-                        categoria='finiquito',
-                        subtipo=None,
-                        descripcion=_desc2,
-                        fecha_inicio=movimiento.fecha_retiro,
-                        fecha_fin=movimiento.fecha_retiro,
-                        dias_evento=1,
-                        dias_en_periodo=1,
-                        multi_mes=False,
-                        fecha_deteccion=timezone.now(),
-                        detectado_por_sistema='consolidacion_refactored_v3'
-                    )
-                    movimientos_batch.append(mov_personal)
-                    contador_altas_bajas += 1
-        
-        logger.info(f"✅ [PARALELO] {contador_altas_bajas} movimientos de altas/bajas procesados")
-        
-        # 2. Procesar AUSENTISMOS
-        ausentismos = MovimientoAusentismo.objects.filter(cierre=cierre)
-        logger.info(f"📊 [PARALELO] Encontrados {ausentismos.count()} registros de ausentismo en BD")
-        
-        for ausentismo in ausentismos:
-            try:
-                nomina_consolidada = NominaConsolidada.objects.get(
-                    cierre=cierre, 
-                    rut_empleado=normalizar_rut(ausentismo.rut)
-                )
-                
-                # Actualizar estado si es ausencia total
-                if ausentismo.dias >= 30:
-                    nomina_consolidada.estado_empleado = 'ausente_total'
-                else:
-                    nomina_consolidada.estado_empleado = 'ausente_parcial'
-                nomina_consolidada.save(update_fields=['estado_empleado'])
-                
-                # Crear MovimientoPersonal
-                descripcion = f"{ausentismo.tipo} - {ausentismo.motivo}".strip(' -')
-                subtipo = ausentismo.tipo.lower().replace(' ', '_') if ausentismo.tipo else 'sin_justificar'
-                if subtipo and len(subtipo) > 40:
-                    subtipo = subtipo[:40]
-                fecha_inicio = ausentismo.fecha_inicio_ausencia
-                fecha_fin = ausentismo.fecha_fin_ausencia
-                dias_evento = (fecha_fin - fecha_inicio).days + 1 if fecha_inicio and fecha_fin else ausentismo.dias
-                
-                # Clipping al periodo
-                try:
-                    year, month = map(int, cierre.periodo.split('-'))
-                    from datetime import date
-                    import calendar
-                    start_periodo = date(year, month, 1)
-                    last_day = calendar.monthrange(year, month)[1]
-                    end_periodo = date(year, month, last_day)
-                    clip_start = fecha_inicio if fecha_inicio > start_periodo else start_periodo
-                    clip_end = fecha_fin if fecha_fin < end_periodo else end_periodo
-                    dias_en_periodo = (clip_end - clip_start).days + 1 if clip_end >= clip_start else 0
-                    multi_mes_flag = (fecha_inicio < start_periodo) or (fecha_fin > end_periodo)
-                except Exception:
-                    dias_en_periodo = ausentismo.dias
-                    multi_mes_flag = False
-                
-                from hashlib import sha1
-                base_hash = f"{nomina_consolidada.rut_empleado}:ausencia:{subtipo}:{fecha_inicio}:{fecha_fin}".lower()
-                hash_evento = sha1(base_hash.encode('utf-8')).hexdigest()
-                hash_registro_periodo = sha1(f"{hash_evento}:{cierre.periodo}".encode('utf-8')).hexdigest()
-                
-                mov_personal = MovimientoPersonal(
-                    nomina_consolidada=nomina_consolidada,
-                    categoria='ausencia',
-                    subtipo=subtipo or 'sin_justificar',
-                    descripcion=descripcion,
-                    fecha_inicio=fecha_inicio,
-                    fecha_fin=fecha_fin,
-                    dias_evento=dias_evento,
-                    dias_en_periodo=dias_en_periodo,
-                    multi_mes=multi_mes_flag,
-                    hash_evento=hash_evento,
-                    hash_registro_periodo=hash_registro_periodo,
-                    observaciones=f"Desde: {ausentismo.fecha_inicio_ausencia} hasta: {ausentismo.fecha_fin_ausencia}",
-                    fecha_deteccion=timezone.now(),
-                    detectado_por_sistema='consolidacion_refactored_v3'
-                )
-                movimientos_batch.append(mov_personal)
-                contador_ausentismos += 1
-                
-            except NominaConsolidada.DoesNotExist:
-                logger.warning(f"⚠️ No se encontró empleado consolidado para RUT {ausentismo.rut} en ausentismo")
-                continue
-        
-        logger.info(f"✅ [PARALELO] {contador_ausentismos} movimientos de ausentismo procesados")
-        
-        # 3. Procesar VACACIONES
-        vacaciones = MovimientoVacaciones.objects.filter(cierre=cierre)
-        logger.info(f"📊 [PARALELO] Encontrados {vacaciones.count()} registros de vacaciones en BD")
-        
-        for vacacion in vacaciones:
-            try:
-                nomina_consolidada = NominaConsolidada.objects.get(
-                    cierre=cierre, 
-                    rut_empleado=normalizar_rut(vacacion.rut)
-                )
-                
-                # Crear MovimientoPersonal
-                fecha_inicio = vacacion.fecha_inicio
-                fecha_fin = vacacion.fecha_fin_vacaciones
-                dias_evento = (fecha_fin - fecha_inicio).days + 1 if fecha_inicio and fecha_fin else vacacion.cantidad_dias
-                
-                # Clipping al periodo
-                try:
-                    year, month = map(int, cierre.periodo.split('-'))
-                    from datetime import date
-                    import calendar
-                    start_periodo = date(year, month, 1)
-                    last_day = calendar.monthrange(year, month)[1]
-                    end_periodo = date(year, month, last_day)
-                    clip_start = fecha_inicio if fecha_inicio > start_periodo else start_periodo
-                    clip_end = fecha_fin if fecha_fin < end_periodo else end_periodo
-                    dias_en_periodo = (clip_end - clip_start).days + 1 if clip_end >= clip_start else 0
-                    multi_mes_flag = (fecha_inicio < start_periodo) or (fecha_fin > end_periodo)
-                except Exception:
-                    dias_en_periodo = vacacion.cantidad_dias
-                    multi_mes_flag = False
-                
-                from hashlib import sha1
-                base_hash = f"{nomina_consolidada.rut_empleado}:ausencia:vacaciones:{fecha_inicio}:{fecha_fin}".lower()
-                hash_evento = sha1(base_hash.encode('utf-8')).hexdigest()
-                hash_registro_periodo = sha1(f"{hash_evento}:{cierre.periodo}".encode('utf-8')).hexdigest()
-                
-                mov_personal = MovimientoPersonal(
-                    nomina_consolidada=nomina_consolidada,
-                    categoria='ausencia',
-                    subtipo='vacaciones',
-                    descripcion='Vacaciones',
-                    fecha_inicio=fecha_inicio,
-                    fecha_fin=fecha_fin,
-                    dias_evento=dias_evento,
-                    dias_en_periodo=dias_en_periodo,
-                    multi_mes=multi_mes_flag,
-                    hash_evento=hash_evento,
-                    hash_registro_periodo=hash_registro_periodo,
-                    observaciones=f"Vacaciones desde: {vacacion.fecha_inicio} hasta: {vacacion.fecha_fin_vacaciones}",
-                    fecha_deteccion=timezone.now(),
-                    detectado_por_sistema='consolidacion_refactored_v3'
-                )
-                movimientos_batch.append(mov_personal)
-                contador_vacaciones += 1
-                
-            except NominaConsolidada.DoesNotExist:
-                rut_normalizado = normalizar_rut(vacacion.rut)
-                logger.warning(f"⚠️ No se encontró empleado consolidado para RUT {vacacion.rut} → {rut_normalizado} en vacaciones")
-                continue
-        
-        logger.info(f"✅ [PARALELO] {contador_vacaciones} movimientos de vacaciones procesados")
-        
-        # 4. Procesar VARIACIONES DE SUELDO
-        variaciones_sueldo = MovimientoVariacionSueldo.objects.filter(cierre=cierre)
-        logger.info(f"📊 [PARALELO] Encontrados {variaciones_sueldo.count()} registros de variaciones de sueldo en BD")
-        
-        for variacion in variaciones_sueldo:
-            try:
-                nomina_consolidada = NominaConsolidada.objects.get(
-                    cierre=cierre, 
-                    rut_empleado=normalizar_rut(variacion.rut)
-                )
-                
-                motivo_text = f"Cambio de sueldo: de ${variacion.sueldo_base_anterior:,.0f} a ${variacion.sueldo_base_actual:,.0f}"
-                mov_personal = MovimientoPersonal(
-                    nomina_consolidada=nomina_consolidada,
-                    categoria='cambio_datos',
-                    subtipo='cambio_sueldo',
-                    descripcion=motivo_text,
-                    fecha_inicio=getattr(variacion, 'fecha_cambio', getattr(variacion, 'fecha_ingreso', timezone.now())),
-                    fecha_fin=getattr(variacion, 'fecha_cambio', getattr(variacion, 'fecha_ingreso', timezone.now())),
-                    dias_evento=1,
-                    dias_en_periodo=1,
-                    multi_mes=False,
-                    observaciones=f"De ${variacion.sueldo_base_anterior:,.0f} a ${variacion.sueldo_base_actual:,.0f}",
-                    fecha_deteccion=timezone.now(),
-                    detectado_por_sistema='consolidacion_refactored_v3'
-                )
-                movimientos_batch.append(mov_personal)
-                contador_variaciones_sueldo += 1
-                
-            except NominaConsolidada.DoesNotExist:
-                logger.warning(f"⚠️ No se encontró empleado consolidado para RUT {variacion.rut} en variación sueldo")
-                continue
-        
-        logger.info(f"✅ [PARALELO] {contador_variaciones_sueldo} movimientos de variación de sueldo procesados")
-        
-        # 5. Procesar VARIACIONES DE CONTRATO
-        variaciones_contrato = MovimientoVariacionContrato.objects.filter(cierre=cierre)
-        logger.info(f"📊 [PARALELO] Encontrados {variaciones_contrato.count()} registros de variaciones de contrato en BD")
-        
-        for variacion in variaciones_contrato:
-            try:
-                nomina_consolidada = NominaConsolidada.objects.get(
-                    cierre=cierre, 
-                    rut_empleado=normalizar_rut(variacion.rut)
-                )
-                
-                motivo_text = f"Cambio de contrato: de {variacion.tipo_contrato_anterior} a {variacion.tipo_contrato_actual}"
-                mov_personal = MovimientoPersonal(
-                    nomina_consolidada=nomina_consolidada,
-                    categoria='cambio_datos',
-                    subtipo='cambio_contrato',
-                    descripcion=motivo_text,
-                    fecha_inicio=getattr(variacion, 'fecha_cambio', getattr(variacion, 'fecha_ingreso', timezone.now())),
-                    fecha_fin=getattr(variacion, 'fecha_cambio', getattr(variacion, 'fecha_ingreso', timezone.now())),
-                    dias_evento=1,
-                    dias_en_periodo=1,
-                    multi_mes=False,
-                    observaciones=f"De {variacion.tipo_contrato_anterior} a {variacion.tipo_contrato_actual}",
-                    fecha_deteccion=timezone.now(),
-                    detectado_por_sistema='consolidacion_refactored_v3'
-                )
-                movimientos_batch.append(mov_personal)
-                contador_variaciones_contrato += 1
-                
-            except NominaConsolidada.DoesNotExist:
-                logger.warning(f"⚠️ No se encontró empleado consolidado para RUT {variacion.rut} en variación contrato")
-                continue
-        
-        logger.info(f"✅ [PARALELO] {contador_variaciones_contrato} movimientos de variación de contrato procesados")
-        
-        # Bulk create movimientos en lotes
-        if movimientos_batch:
-            batch_size = 100
-            for i in range(0, len(movimientos_batch), batch_size):
-                batch = movimientos_batch[i:i + batch_size]
-                MovimientoPersonal.objects.bulk_create(batch)
-                movimientos_creados += len(batch)
-        
-        # Resumen detallado
-        total_tipos = contador_altas_bajas + contador_ausentismos + contador_vacaciones + contador_variaciones_sueldo + contador_variaciones_contrato
-        logger.info(f"📋 [PARALELO] RESUMEN DETALLADO DE MOVIMIENTOS:")
-        logger.info(f"    ⬆️ Altas/Bajas: {contador_altas_bajas}")
-        logger.info(f"    🏥 Ausentismos: {contador_ausentismos}")
-        logger.info(f"    🏖️ Vacaciones: {contador_vacaciones}")
-        logger.info(f"    💰 Variaciones Sueldo: {contador_variaciones_sueldo}")
-        logger.info(f"    📑 Variaciones Contrato: {contador_variaciones_contrato}")
-        logger.info(f"    📊 TOTAL TIPOS: {total_tipos}")
-        logger.info(f"    ✅ TOTAL CREADOS: {movimientos_creados}")
-        
-        return {
-            'success': True,
-            'task': 'procesar_movimientos_personal',
-            'movimientos_creados': movimientos_creados,
-            'cierre_id': cierre_id
-        }
+        _crear_nominas_finiquito(cierre)
+        nominas = _nominas_consolidadas_por_rut(cierre)
+        resultados = [procesar_movimientos_tipo(cierre, tipo, nominas) for tipo in MOVIMIENTOS_PERSONAL_TIPOS]
+        return agregar_movimientos_personal(resultados, cierre_id)
         
     except Exception as e:
         logger.error(f"❌ [PARALELO] Error procesando movimientos para cierre {cierre_id}: {e}")
@@ -1047,117 +1269,73 @@ def procesar_conceptos_consolidados_paralelo(cierre_id):
     logger.info(f"💰 [PARALELO] Procesando conceptos consolidados para cierre {cierre_id}")
     
     try:
+        from django.db.models import Count, Q, Sum
         from nomina.models import CierreNomina, NominaConsolidada, HeaderValorEmpleado, ConceptoConsolidado
         
         cierre = CierreNomina.objects.get(id=cierre_id)
         conceptos_consolidados = 0
         
-        # Obtener todas las nóminas consolidadas
-        nominas = NominaConsolidada.objects.filter(cierre=cierre).prefetch_related(
-            'header_valores__concepto_remuneracion'
+        # Headers numéricos con concepto clasificado del cierre; todo se agrega en la base de datos
+        headers = HeaderValorEmpleado.objects.filter(
+            nomina_consolidada__cierre=cierre,
+            es_numerico=True,
+            concepto_remuneracion__isnull=False
+        ).order_by()
+        
+        logger.info(f"📊 Procesando conceptos para {NominaConsolidada.objects.filter(cierre=cierre).count()} empleados")
+        
+        # 1. Un ConceptoConsolidado por (empleado, concepto): GROUP BY con SUM/COUNT
+        agrupados = headers.values(
+            'nomina_consolidada_id',
+            'concepto_remuneracion_id',
+            'concepto_remuneracion__nombre_concepto',
+            'concepto_remuneracion__clasificacion',
+        ).annotate(
+            monto_total=Sum('valor_numerico'),
+            cantidad=Count('id')
         )
         
         conceptos_batch = []
-        
-        logger.info(f"📊 Procesando conceptos para {nominas.count()} empleados")
-        
-        for nomina_consolidada in nominas:
-            # Obtener todos los headers para este empleado
-            headers_empleado = nomina_consolidada.header_valores.filter(
+        for fila in agrupados.iterator(chunk_size=CONSOLIDACION_LOTE_CONCEPTOS):
+            conceptos_batch.append(ConceptoConsolidado(
+                nomina_consolidada_id=fila['nomina_consolidada_id'],
+                codigo_concepto=str(fila['concepto_remuneracion_id']),
+                nombre_concepto=fila['concepto_remuneracion__nombre_concepto'],
+                tipo_concepto=TIPO_CONCEPTO_POR_CLASIFICACION.get(
+                    fila['concepto_remuneracion__clasificacion'], 'informativo'
+                ),
+                monto_total=fila['monto_total'] or Decimal('0'),
+                cantidad=fila['cantidad'],
                 es_numerico=True,
-                concepto_remuneracion__isnull=False
-            )
-            
-            # Totales por nuevas categorías
-            total_haberes_imponibles = Decimal('0')
-            total_haberes_no_imponibles = Decimal('0')
-            total_dctos_legales = Decimal('0')
-            total_otros_dctos = Decimal('0')
-            total_impuestos = Decimal('0')
-            total_horas_extras = Decimal('0')
-            total_aportes_patronales = Decimal('0')
-            
-            # Agrupar por concepto y sumar
-            conceptos_agrupados = {}
-            
-            for header in headers_empleado:
-                concepto_nombre = header.concepto_remuneracion.nombre_concepto
-                clasificacion = header.concepto_remuneracion.clasificacion
-                
-                if concepto_nombre not in conceptos_agrupados:
-                    conceptos_agrupados[concepto_nombre] = {
-                        'clasificacion': clasificacion,
-                        'monto_total': Decimal('0'),
-                        'cantidad': 0,
-                        'concepto_obj': header.concepto_remuneracion
-                    }
-                
-                conceptos_agrupados[concepto_nombre]['monto_total'] += header.valor_numerico
-                conceptos_agrupados[concepto_nombre]['cantidad'] += 1
-                
-                # Sumar a la categoría correspondiente según clasificación proporcionada por analista
-                if clasificacion == 'haberes_imponibles':
-                    total_haberes_imponibles += header.valor_numerico
-                elif clasificacion == 'haberes_no_imponibles':
-                    total_haberes_no_imponibles += header.valor_numerico
-                elif clasificacion == 'horas_extras':
-                    try:
-                        total_horas_extras += Decimal(header.valor_numerico) if header.valor_numerico is not None else Decimal('0')
-                    except Exception:
-                        total_horas_extras += Decimal('0')
-                elif clasificacion == 'descuentos_legales':
-                    total_dctos_legales += header.valor_numerico
-                elif clasificacion == 'otros_descuentos':
-                    total_otros_dctos += header.valor_numerico
-                elif clasificacion == 'impuestos':
-                    total_impuestos += header.valor_numerico
-                elif clasificacion == 'aportes_patronales':
-                    total_aportes_patronales += header.valor_numerico
-            
-            # Crear ConceptoConsolidado para cada concepto agrupado
-            for concepto_nombre, datos in conceptos_agrupados.items():
-                # Mapear clasificación a tipo_concepto
-                clasificacion_mapping = {
-                    'haberes_imponibles': 'haber_imponible',
-                    'haberes_no_imponibles': 'haber_no_imponible',
-                    'descuentos_legales': 'descuento_legal',
-                    'otros_descuentos': 'otro_descuento',
-                    'aportes_patronales': 'aporte_patronal',
-                    'impuestos': 'impuesto'
-                }
-                
-                tipo_concepto = clasificacion_mapping.get(datos['clasificacion'], 'informativo')
-                codigo_concepto = str(datos['concepto_obj'].id) if datos['concepto_obj'] else None
-                
-                concepto_consolidado = ConceptoConsolidado(
-                    nomina_consolidada=nomina_consolidada,
-                    codigo_concepto=codigo_concepto,
-                    nombre_concepto=concepto_nombre,
-                    tipo_concepto=tipo_concepto,
-                    monto_total=datos['monto_total'],
-                    cantidad=datos['cantidad'],
-                    es_numerico=True,
-                    fuente_archivo='libro_remuneraciones'
-                )
-                conceptos_batch.append(concepto_consolidado)
-            
-            # Actualizar nuevos campos por categoría en la nómina consolidada
-            nomina_consolidada.haberes_imponibles = total_haberes_imponibles
-            nomina_consolidada.haberes_no_imponibles = total_haberes_no_imponibles
-            nomina_consolidada.dctos_legales = total_dctos_legales
-            nomina_consolidada.otros_dctos = total_otros_dctos
-            nomina_consolidada.impuestos = total_impuestos
-            nomina_consolidada.horas_extras_cantidad = total_horas_extras
-            nomina_consolidada.aportes_patronales = total_aportes_patronales
-            nomina_consolidada.save(update_fields=['haberes_imponibles', 'haberes_no_imponibles', 'dctos_legales', 'otros_dctos', 'impuestos', 'horas_extras_cantidad', 'aportes_patronales'])
-        
-        # Bulk create conceptos
+                fuente_archivo='libro_remuneraciones'
+            ))
+            if len(conceptos_batch) >= CONSOLIDACION_LOTE_CONCEPTOS:
+                ConceptoConsolidado.objects.bulk_create(conceptos_batch)
+                conceptos_consolidados += len(conceptos_batch)
+                conceptos_batch = []
         if conceptos_batch:
-            batch_size = 200
-            for i in range(0, len(conceptos_batch), batch_size):
-                batch = conceptos_batch[i:i + batch_size]
-                ConceptoConsolidado.objects.bulk_create(batch)
-                conceptos_consolidados += len(batch)
+            ConceptoConsolidado.objects.bulk_create(conceptos_batch)
+            conceptos_consolidados += len(conceptos_batch)
+        
+        # 2. Totales por categoría de cada empleado: una consulta con agregación condicional
+        totales_por_nomina = {
+            fila.pop('nomina_consolidada_id'): fila
+            for fila in headers.values('nomina_consolidada_id').annotate(**{
+                campo: Sum('valor_numerico', filter=Q(concepto_remuneracion__clasificacion=clasificacion))
+                for clasificacion, campo in CAMPO_TOTAL_POR_CLASIFICACION.items()
+            })
+        }
+        
+        # Empleados sin headers quedan en 0, igual que antes
+        campos_totales = list(CAMPO_TOTAL_POR_CLASIFICACION.values())
+        nominas = []
+        for nomina_id in NominaConsolidada.objects.filter(cierre=cierre).values_list('id', flat=True):
+            totales = totales_por_nomina.get(nomina_id, {})
+            nominas.append(NominaConsolidada(
+                id=nomina_id,
+                **{campo: totales.get(campo) or Decimal('0') for campo in campos_totales}
+            ))
+        NominaConsolidada.objects.bulk_update(nominas, campos_totales, batch_size=CONSOLIDACION_LOTE_CONCEPTOS)
         
         logger.info(f"✅ [PARALELO] Conceptos consolidados procesados: {conceptos_consolidados}")
         
@@ -1259,7 +1437,7 @@ def consolidar_datos_nomina_task_secuencial(cierre_id):
     
     try:
         from nomina.models import (
-            CierreNomina, NominaConsolidada, HeaderValorEmpleado, MovimientoPersonal,
+            CierreNomina, MovimientoPersonal,
             MovimientoAltaBaja, MovimientoAusentismo, MovimientoVacaciones,
             MovimientoVariacionSueldo, MovimientoVariacionContrato, ConceptoConsolidado
         )
@@ -1310,62 +1488,17 @@ def consolidar_datos_nomina_task_secuencial(cierre_id):
             cierre.nomina_consolidada.all().delete()
         
         # Procesar empleados del libro
-        empleados_consolidados = 0
-        headers_consolidados = 0
-        
-        empleados = cierre.empleados.all()
-        logger.info(f"👥 Procesando {empleados.count()} empleados")
-        
-        for empleado in empleados:
-            # Crear registro de nómina consolidada
-            nomina_consolidada = NominaConsolidada.objects.create(
-                cierre=cierre,
-                rut_empleado=normalizar_rut(empleado.rut),
-                nombre_empleado=f"{empleado.nombre} {empleado.apellido_paterno} {empleado.apellido_materno}".strip(),
-                estado_empleado='activo',
-                dias_trabajados=empleado.dias_trabajados,
-                fecha_consolidacion=timezone.now(),
-                fuente_datos={
-                    'libro_id': libro.id,
-                    'movimientos_id': movimientos.id,
-                    'consolidacion_version': '3.0_secuencial_refactored'
-                }
-            )
-            
-            # Crear HeaderValorEmpleado para cada concepto
-            conceptos_empleado = empleado.registroconceptoempleado_set.all()
-            
-            for concepto in conceptos_empleado:
-                # Determinar si es numérico
-                valor_numerico = None
-                es_numerico = False
-                
-                if concepto.monto:
-                    try:
-                        valor_limpio = str(concepto.monto).replace('$', '').replace(',', '').strip()
-                        if valor_limpio and (valor_limpio.replace('-', '').replace('.', '').isdigit()):
-                            valor_numerico = Decimal(valor_limpio)
-                            es_numerico = True
-                    except (ValueError, InvalidOperation, AttributeError):
-                        pass
-                
-                # Crear registro HeaderValorEmpleado
-                HeaderValorEmpleado.objects.create(
-                    nomina_consolidada=nomina_consolidada,
-                    nombre_header=concepto.nombre_concepto_original,
-                    concepto_remuneracion=concepto.concepto,
-                    valor_original=concepto.monto or '',
-                    valor_numerico=valor_numerico,
-                    es_numerico=es_numerico,
-                    fuente_archivo='libro_remuneraciones',
-                    fecha_consolidacion=timezone.now()
-                )
-                headers_consolidados += 1
-            
-            empleados_consolidados += 1
-            
-            if empleados_consolidados % 100 == 0:
-                logger.info(f"📊 Progreso: {empleados_consolidados} empleados consolidados")
+        logger.info(f"👥 Procesando {cierre.empleados.count()} empleados")
+        resultado_empleados = consolidar_empleados_libro(
+            cierre,
+            fuente_datos={
+                'libro_id': libro.id,
+                'movimientos_id': movimientos.id,
+                'consolidacion_version': '3.0_secuencial_refactored'
+            }
+        )
+        empleados_consolidados = resultado_empleados['empleados_consolidados']
+        headers_consolidados = resultado_empleados['headers_consolidados']
         
         logger.info(f"✅ Empleados consolidados: {empleados_consolidados}")
         logger.info(f"✅ Headers consolidados: {headers_consolidados}")
@@ -13,11 +13,9 @@ Fecha: 28 de octubre de 2025
 
 from celery import shared_task
 from django.utils import timezone
-from django.db.models import (
-    Count, Sum, Q, F, DecimalField, IntegerField,
-    ExpressionWrapper, Value
-)
+from django.db.models import Count, Sum, Q, F, DecimalField, IntegerField, Value
 from django.db.models.functions import Coalesce
+from decimal import Decimal
 import logging
 
 logger = logging.getLogger(__name__)
@@ -43,13 +41,91 @@ def _json_safe(obj):
     return json.loads(json.dumps(obj, default=default_handler))
 
 
+# Categorías del Libro de Remuneraciones, en el orden en que se presentan
+CATEGORIAS_LIBRO = [
+    'haber_imponible',
+    'haber_no_imponible',
+    'descuento_legal',
+    'otro_descuento',
+    'impuesto',
+    'aporte_patronal',
+]
+
+# Filas por ida a la base al recorrer los agregados por concepto
+INFORME_LOTE_FILAS = 2000
+
+
+def agregados_conceptos_libro(cierre) -> dict:
+    """
+    Total, cantidad y empleados (monto != 0) por concepto del Libro de Remuneraciones
+    en una sola consulta agrupada sobre ConceptoConsolidado.
+
+    Como (nomina_consolidada, nombre_concepto) es único, los empleados por concepto
+    se cuentan como filas con monto != 0 (agregación condicional, sin COUNT DISTINCT).
+
+    Returns:
+        dict con total_empleados y conceptos {(tipo, nombre): [total, cantidad, empleados]}
+        (total y cantidad Decimal)
+    """
+    from nomina.models import ConceptoConsolidado
+
+    filas = (
+        ConceptoConsolidado.objects
+        .filter(nomina_consolidada__cierre=cierre)
+        .order_by()
+        .values('tipo_concepto', 'nombre_concepto')
+        .annotate(
+            total=Coalesce(Sum('monto_total'), Value(0, output_field=DecimalField(max_digits=20, decimal_places=2))),
+            cantidad=Coalesce(Sum('cantidad'), Value(0, output_field=DecimalField(max_digits=20, decimal_places=4))),
+            empleados=Count('id', filter=~Q(monto_total=0)),
+        )
+        .values_list('tipo_concepto', 'nombre_concepto', 'total', 'cantidad', 'empleados')
+    )
+    conceptos = {
+        (tipo, nombre): [total, cantidad, int(empleados or 0)]
+        for tipo, nombre, total, cantidad, empleados in filas.iterator(chunk_size=INFORME_LOTE_FILAS)
+    }
+
+    return {
+        'total_empleados': cierre.nomina_consolidada.count(),
+        'conceptos': conceptos,
+    }
+
+
+def serializar_conceptos_libro(conceptos: dict) -> tuple:
+    """
+    Conceptos agregados → (totales_categorias, conceptos) con el formato de libro_v2,
+    en una pasada: por categoría en el orden de CATEGORIAS_LIBRO y de mayor a menor
+    total dentro de cada una. Los totales por categoría son la suma de sus conceptos
+    """
+    orden = {tipo: i for i, tipo in enumerate(CATEGORIAS_LIBRO)}
+    totales_categorias = {tipo: Decimal('0') for tipo in CATEGORIAS_LIBRO}
+    conceptos_serializados = []
+    for (tipo, nombre), (total, cantidad, empleados) in sorted(
+        ((clave, valores) for clave, valores in conceptos.items() if clave[0] in orden),
+        key=lambda item: (orden[item[0][0]], -item[1][0], item[0][1])
+    ):
+        totales_categorias[tipo] += total
+        conceptos_serializados.append({
+            'nombre': nombre,
+            'categoria': tipo,
+            'total': float(total),
+            'cantidad': float(cantidad),
+            'empleados': empleados,
+        })
+    return {tipo: float(total) for tipo, total in totales_categorias.items()}, conceptos_serializados
+
+
 @shared_task(name='nomina.build_informe_libro', bind=True)
 def build_informe_libro(self, cierre_id: int) -> dict:
     """
     Construye payload del Libro de Remuneraciones desde NominaConsolidada,
     equivalente a la data que consumen las páginas (detalle + resumen).
+
+    Los agregados por concepto salen de una sola consulta agrupada
+    (ver agregados_conceptos_libro).
     """
-    from nomina.models import CierreNomina, NominaConsolidada, ConceptoConsolidado
+    from nomina.models import CierreNomina
     
     cierre = CierreNomina.objects.get(id=cierre_id)
 
@@ -60,89 +136,18 @@ def build_informe_libro(self, cierre_id: int) -> dict:
             'resumen': None,
         }
 
-    # 🔥 CAMBIO: Usar ConceptoConsolidado como single source of truth (igual que dashboard)
-    conceptos_qs = ConceptoConsolidado.objects.filter(nomina_consolidada__cierre=cierre)
-    
-    # Categorías esperadas
-    CATEGORIAS = [
-        'haber_imponible',
-        'haber_no_imponible', 
-        'descuento_legal',
-        'otro_descuento',
-        'impuesto',
-        'aporte_patronal',
-    ]
-
-    # Resumen general (totales por categoría desde ConceptoConsolidado)
-    zero_dec_2 = Value(0, output_field=DecimalField(max_digits=20, decimal_places=2))
-    zero_dec_4 = Value(0, output_field=DecimalField(max_digits=20, decimal_places=4))
-    
-    # Total empleados únicos
-    total_empleados = NominaConsolidada.objects.filter(cierre=cierre).count()
-    
-    # Totales por categoría (igual que dashboard)
-    totales_categorias_raw = conceptos_qs.values('tipo_concepto').annotate(
-        total=Coalesce(
-            Sum('monto_total'),
-            zero_dec_2,
-            output_field=DecimalField(max_digits=20, decimal_places=2)
-        )
-    )
-    totales_categorias_dict = {c: 0.0 for c in CATEGORIAS}
-    for row in totales_categorias_raw:
-        tipo = row.get('tipo_concepto')
-        if tipo in totales_categorias_dict:
-            totales_categorias_dict[tipo] = float(row['total'])
-
-    # Desglose por concepto (por tipo_concepto)
-    conceptos_base = (
-        ConceptoConsolidado.objects
-        .filter(nomina_consolidada__cierre=cierre)
-        .values('tipo_concepto', 'nombre_concepto')
-        .annotate(
-            total_monto=Coalesce(Sum('monto_total'), zero_dec_2),
-            total_cantidad=Coalesce(Sum('cantidad'), zero_dec_4),
-        )
-        .order_by('tipo_concepto', '-total_monto')
-    )
+    # 🔥 ConceptoConsolidado como single source of truth (igual que dashboard)
+    agregados = agregados_conceptos_libro(cierre)
 
     # Formato esperado por LibroRemuneraciones.jsx (libro_resumen_v2)
-    # Calcular empleados por concepto (distinct nomina_consolidada con monto != 0)
-    empleados_aggr = (
-        ConceptoConsolidado.objects
-        .filter(nomina_consolidada__cierre=cierre)
-        .values('tipo_concepto', 'nombre_concepto')
-        .annotate(empleados=Count('nomina_consolidada', distinct=True, filter=~Q(monto_total=0)))
-    )
-    emp_map = {(e['tipo_concepto'], e['nombre_concepto']): int(e['empleados'] or 0) for e in empleados_aggr}
-
-    conceptos_serializados = []
-    for tipo in ['haber_imponible', 'haber_no_imponible', 'descuento_legal', 'otro_descuento', 'impuesto', 'aporte_patronal']:
-        for it in conceptos_base:
-            if it['tipo_concepto'] == tipo:
-                conceptos_serializados.append({
-                    'nombre': it['nombre_concepto'],
-                    'categoria': tipo,
-                    'total': float(it['total_monto'] or 0),
-                    'empleados': emp_map.get((tipo, it['nombre_concepto']), 0),
-                })
-
-    # 🔥 CAMBIO: Usar totales calculados desde ConceptoConsolidado
-    totales_categorias = {
-        'haber_imponible': totales_categorias_dict['haber_imponible'],
-        'haber_no_imponible': totales_categorias_dict['haber_no_imponible'],
-        'descuento_legal': totales_categorias_dict['descuento_legal'],
-        'otro_descuento': totales_categorias_dict['otro_descuento'],
-        'impuesto': totales_categorias_dict['impuesto'],
-        'aporte_patronal': totales_categorias_dict['aporte_patronal'],
-    }
+    totales_categorias, conceptos_serializados = serializar_conceptos_libro(agregados['conceptos'])
 
     libro_v2 = {
         'cierre': {
             'id': cierre.id,
             'cliente': getattr(cierre.cliente, 'nombre', str(cierre.cliente)),
             'periodo': cierre.periodo,
-            'total_empleados': total_empleados,
+            'total_empleados': agregados['total_empleados'],
         },
         'totales_categorias': totales_categorias,
         'conceptos': conceptos_serializados,
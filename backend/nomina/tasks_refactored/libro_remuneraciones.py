@@ -14,7 +14,6 @@ Fecha: 18 de octubre de 2025
 """
 
 import logging
-import pandas as pd
 from celery import shared_task, chord
 from django.contrib.auth import get_user_model
 from django.utils import timezone
@@ -36,6 +35,8 @@ from ..utils.LibroRemuneraciones import (
 )
 from ..utils.LibroRemuneracionesOptimizado import (
     dividir_dataframe_empleados,
+    preparar_libro_parseado,
+    eliminar_libro_parseado,
     consolidar_stats_empleados,
     consolidar_stats_registros,
 )
@@ -560,15 +561,14 @@ def actualizar_empleados_desde_libro_optimizado(self, result, usuario_id=None, u
                 "empleados_actualizados": count
             }
         
-        # Calcular chunk size dinámico
-        df = pd.read_excel(libro.archivo.path, engine="openpyxl")
-        total_filas = len(df)
+        # Calcular chunk size dinámico (parsea el Excel una sola vez para todo el flujo)
+        total_filas = preparar_libro_parseado(libro)['filas']
         chunk_size = _calcular_chunk_size_dinamico(total_filas)
         
         logger.info(f"[LIBRO] Total: {total_filas} filas, Chunk size: {chunk_size}")
         
         # Dividir en chunks
-        chunks = dividir_dataframe_empleados(libro.archivo.path, chunk_size)
+        chunks = dividir_dataframe_empleados(libro, chunk_size)
         
         if not chunks:
             logger.warning(f"[LIBRO] No hay chunks válidos")
@@ -615,6 +615,8 @@ def actualizar_empleados_desde_libro_optimizado(self, result, usuario_id=None, u
             }
         except Exception as fallback_error:
             logger.error(f"[LIBRO] ❌ Error en fallback: {fallback_error}")
+            # La cadena se corta aquí: el parseo intermedio ya no se usará
+            eliminar_libro_parseado(libro_id)
             raise
 
 
@@ -651,6 +653,9 @@ def guardar_registros_nomina_optimizado(self, result, usar_chord=True):
     
     logger.info(f"[LIBRO] Guardando registros (optimizado) libro_id={libro_id}, usuario_id={usuario_id}")
     
+    # Si no se lanza el chord (secuencial, sin chunks o error), nadie más
+    # leerá el parseo intermedio: se elimina al salir de la tarea
+    chord_lanzado = False
     try:
         libro = LibroRemuneracionesUpload.objects.get(id=libro_id)
         
@@ -667,15 +672,14 @@ def guardar_registros_nomina_optimizado(self, result, usar_chord=True):
                 "estado": "procesado"
             }
         
-        # Calcular chunk size dinámico
-        df = pd.read_excel(libro.archivo.path, engine="openpyxl")
-        total_filas = len(df)
+        # Calcular chunk size dinámico (parsea el Excel una sola vez para todo el flujo)
+        total_filas = preparar_libro_parseado(libro)['filas']
         chunk_size = _calcular_chunk_size_dinamico(total_filas)
         
         logger.info(f"[LIBRO] Total: {total_filas} filas, Chunk size: {chunk_size}")
         
         # Dividir en chunks
-        chunks = dividir_dataframe_empleados(libro.archivo.path, chunk_size)
+        chunks = dividir_dataframe_empleados(libro, chunk_size)
         
         if not chunks:
             logger.warning(f"[LIBRO] No hay chunks válidos")
@@ -703,6 +707,7 @@ def guardar_registros_nomina_optimizado(self, result, usar_chord=True):
         # Necesitamos pasar usuario_id de alguna forma al callback
         callback = consolidar_registros_task.s(usuario_id=usuario_id)
         resultado_chord = chord(tasks_paralelas)(callback)
+        chord_lanzado = True
         
         logger.info(f"[LIBRO] 🚀 Chord de registros iniciado: {len(chunks)} chunks con usuario_id={usuario_id}")
         
@@ -744,6 +749,9 @@ def guardar_registros_nomina_optimizado(self, result, usar_chord=True):
         except Exception as fallback_error:
             logger.error(f"[LIBRO] ❌ Error en fallback: {fallback_error}")
             raise
+    finally:
+        if not chord_lanzado:
+            eliminar_libro_parseado(libro_id)
 
 
 # ============================================================================
@@ -867,5 +875,8 @@ def consolidar_registros_task(resultados_chunks, usuario_id=None):
             logger.error(f"[LIBRO] No se encontró libro {libro_id} para actualizar estado")
         except Exception as e:
             logger.error(f"[LIBRO] Error actualizando estado/log para libro {libro_id}: {e}")
+        finally:
+            # Los chunks ya terminaron (con o sin error): liberar el parseo intermedio
+            eliminar_libro_parseado(libro_id)
     
     return stats
@@ -1,4 +1,4 @@
-from django.test import SimpleTestCase, TestCase
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from nomina.models import (
     Cliente,
@@ -7,12 +7,116 @@ from nomina.models import (
     EmpleadoCierre,
     ConceptoRemuneracion,
     RegistroConceptoEmpleado,
+    EmpleadoCierreNovedades,
+    ConceptoRemuneracionNovedades,
+    RegistroConceptoEmpleadoNovedades,
+    DiscrepanciaCierre,
+    NominaConsolidada,
+    ConceptoConsolidado,
+    MovimientoPersonal,
+    IncidenciaCierre,
+    HeaderValorEmpleado,
+    MovimientosMesUpload,
+    MovimientoAltaBaja,
+    MovimientoAusentismo,
 )
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from nomina.tasks import actualizar_empleados_desde_libro, guardar_registros_nomina
+import os
+import shutil
 import pandas as pd
-from tempfile import NamedTemporaryFile
+from decimal import Decimal
+from tempfile import NamedTemporaryFile, mkdtemp
+from datetime import date
+from unittest import mock
 
 from nomina.utils.LibroRemuneraciones import obtener_headers_libro_remuneraciones
+from nomina.utils import LibroRemuneracionesOptimizado
+from nomina.utils import rut as rut_utils
+from nomina.utils.GenerarDiscrepancias import generar_discrepancias_libro_vs_novedades
+from nomina.utils.DetectarIncidenciasConsolidadas import (
+    calcular_variacion_porcentual,
+    procesar_chunk_comparacion_individual,
+    procesar_incidencias_suma_total_simple,
+)
+from nomina.utils import variaciones
+from nomina.tasks_refactored.consolidacion import (
+    calcular_rangos_empleados,
+    parsear_montos_vectorizado,
+    procesar_conceptos_consolidados_paralelo,
+    procesar_movimientos_personal_paralelo,
+    flujo_movimientos_personal,
+)
+from nomina.tasks_refactored.informes import build_informe_libro
+from nomina.tasks_refactored import libro_remuneraciones as libro_tasks
+import fakeredis
+from nomina.cache_redis import (
+    REGISTRY_CHECK_SECONDS,
+    REGISTRY_READY_KEY,
+    FORMATO_JSON_ZLIB,
+    FORMATO_MSGPACK,
+    FORMATO_MSGPACK_ZLIB,
+    SERIALIZADORES,
+    SGMCacheSystemNomina,
+)
+
+
+_SQL_SOBRE_TABLA = {
+    "SELECT": 'FROM "{}"',
+    "INSERT": 'INSERT INTO "{}"',
+    "UPDATE": 'UPDATE "{}"',
+}
+
+
+def _consultas_a_tabla(consultas, tabla, verbo="SELECT"):
+    """Cuenta las consultas capturadas de un tipo (SELECT, INSERT, UPDATE) cuya tabla principal es `tabla`"""
+    patron = _SQL_SOBRE_TABLA[verbo].format(tabla)
+    return sum(
+        q["sql"].startswith(verbo) and patron in q["sql"]
+        for q in consultas.captured_queries
+    )
+
+
+class ConsultasPorVolumenMixin:
+    """
+    Procesa una tanda pequeña y otra grande de empleados y verifica que el número
+    de consultas no crece con el volumen. Cada test define _crear_empleados y _procesar.
+    """
+
+    def _crear_empleados(self, cantidad, desde=0):
+        raise NotImplementedError
+
+    def _procesar(self, creados):
+        raise NotImplementedError
+
+    def _procesar_capturando(self, creados):
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = self._procesar(creados)
+        return resultado, consultas
+
+    def assertConsultasConstantes(self, pocos, muchos):
+        """Devuelve el resultado y las consultas de la tanda grande"""
+        _, consultas_pocos = self._procesar_capturando(self._crear_empleados(pocos))
+        resultado, consultas_muchos = self._procesar_capturando(self._crear_empleados(muchos, desde=pocos))
+        self.assertEqual(len(consultas_pocos), len(consultas_muchos))
+        return resultado, consultas_muchos
+
+
+class MediaTemporalMixin:
+    """
+    Guarda los Excel subidos (y el parseo intermedio, que vive bajo MEDIA_ROOT) en un
+    directorio temporal que se elimina al terminar la clase.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        media_root = mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=media_root)
+        ajuste.enable()
+        cls.addClassCleanup(ajuste.disable)
+        super().setUpClass()
 
 
 class ObtenerHeadersLibroRemuneracionesTests(SimpleTestCase):
@@ -38,7 +142,7 @@ class ObtenerHeadersLibroRemuneracionesTests(SimpleTestCase):
         self.assertEqual(headers, ["SUELDO BASE", "BONO"])
 
 
-class GuardarRegistrosNominaTests(TestCase):
+class GuardarRegistrosNominaTests(MediaTemporalMixin, TestCase):
     databases = {"default"}
 
     def setUp(self):
@@ -84,3 +188,525 @@ class GuardarRegistrosNominaTests(TestCase):
         )
         self.assertEqual(registro.monto, 1000)
         self.assertIsNotNone(registro.concepto)
+
+
+class ParsearMontosVectorizadoTests(SimpleTestCase):
+    def test_mismo_criterio_que_parseo_por_fila(self):
+        from decimal import Decimal
+
+        montos = ["1000", "$1,234.50", "-35", " 7 ", "", None, "N/A", "1.2.3", "--5", ".5", "12abc"]
+        valores, numericos = parsear_montos_vectorizado(montos)
+        self.assertEqual(
+            numericos,
+            [True, True, True, True, False, False, False, False, False, True, False],
+        )
+        self.assertEqual(valores[1], Decimal("1234.50"))
+        self.assertEqual(valores[2], Decimal("-35"))
+        self.assertIsNone(valores[6])
+
+    def test_lista_vacia(self):
+        self.assertEqual(parsear_montos_vectorizado([]), ([], []))
+
+
+class CalcularRangosEmpleadosTests(SimpleTestCase):
+    def test_rangos_contiguos_con_ultimo_parcial(self):
+        ids = [3, 4, 7, 8, 10, 15, 21]
+        self.assertEqual(
+            calcular_rangos_empleados(ids, 3),
+            [(3, 7), (8, 15), (21, 21)],
+        )
+
+    def test_sin_empleados(self):
+        self.assertEqual(calcular_rangos_empleados([], 50), [])
+
+
+class LibroParseadoTests(MediaTemporalMixin, TestCase):
+    databases = {"default"}
+
+    def setUp(self):
+        cliente = Cliente.objects.create(nombre="Test")
+        cierre = CierreNomina.objects.create(cliente=cliente, periodo="2025-01")
+        self.df = pd.DataFrame(
+            {
+                "Rut del Trabajador": [f"1111111{i}" for i in range(7)],
+                "SUELDO BASE": [1000, 2000.5, "$1,500", None, 7, "x", 9],
+            }
+        )
+        with NamedTemporaryFile(suffix=".xlsx") as tmp:
+            self.df.to_excel(tmp.name, index=False)
+            content = open(tmp.name, "rb").read()
+        self.libro = LibroRemuneracionesUpload.objects.create(
+            cierre=cierre,
+            archivo=SimpleUploadedFile("libro.xlsx", content),
+        )
+
+    def tearDown(self):
+        LibroRemuneracionesOptimizado.eliminar_libro_parseado(self.libro.id)
+
+    @mock.patch.object(LibroRemuneracionesOptimizado, "LIBRO_BLOQUE_FILAS", 3)
+    def test_excel_se_parsea_una_vez_y_se_lee_por_filas(self):
+        original = pd.read_excel
+        with mock.patch.object(
+            LibroRemuneracionesOptimizado.pd, "read_excel", side_effect=original
+        ) as read_excel:
+            meta = LibroRemuneracionesOptimizado.preparar_libro_parseado(self.libro)
+            filas = LibroRemuneracionesOptimizado.leer_filas_libro(self.libro, [2, 3, 6])
+            todas = LibroRemuneracionesOptimizado.leer_filas_libro(self.libro)
+
+        self.assertEqual(read_excel.call_count, 1)
+        self.assertEqual((meta["filas"], meta["bloques"]), (7, 3))
+        self.assertEqual(list(filas.index), [2, 3, 6])
+        self.assertEqual(filas.loc[2, "SUELDO BASE"], "$1,500")
+        self.assertEqual(filas.loc[6, "SUELDO BASE"], 9)
+        self.assertEqual(len(todas), 7)
+
+    def test_parseo_se_elimina_si_el_guardado_falla(self):
+        LibroRemuneracionesOptimizado.preparar_libro_parseado(self.libro)
+        directorio = LibroRemuneracionesOptimizado._directorio_libro_parseado(self.libro.id)
+        self.assertTrue(os.path.isdir(directorio))
+
+        with mock.patch.object(
+            libro_tasks, "dividir_dataframe_empleados", side_effect=RuntimeError("chunks")
+        ), mock.patch.object(
+            libro_tasks, "guardar_registros_nomina_util", side_effect=RuntimeError("fallback")
+        ):
+            with self.assertRaises(RuntimeError):
+                libro_tasks.guardar_registros_nomina_optimizado({"libro_id": self.libro.id})
+
+        self.assertFalse(os.path.exists(directorio))
+
+
+class ReprocesarChunkLibroTests(MediaTemporalMixin, TestCase):
+    databases = {"default"}
+
+    def setUp(self):
+        self.cliente = Cliente.objects.create(nombre="Test")
+        cierre = CierreNomina.objects.create(cliente=self.cliente, periodo="2025-01")
+        ConceptoRemuneracion.objects.create(cliente=self.cliente, nombre_concepto="SUELDO BASE", clasificacion="haber")
+        self.libro = LibroRemuneracionesUpload.objects.create(
+            cierre=cierre, archivo=self._excel("Ana", 1000), header_json=["SUELDO BASE", "BONO"]
+        )
+
+    def tearDown(self):
+        LibroRemuneracionesOptimizado.eliminar_libro_parseado(self.libro.id)
+
+    def _excel(self, nombre, sueldo):
+        df = pd.DataFrame({
+            "Año": [2025, 2025],
+            "Mes": [1, 1],
+            "Rut de la Empresa": ["76123456-0", "76123456-0"],
+            "Rut del Trabajador": ["11111111-1", "12345678-5"],
+            "Nombre": [nombre, "Luis"],
+            "Apellido Paterno": ["Gomez", "Perez"],
+            "Apellido Materno": ["Luna", "Soto"],
+            "SUELDO BASE": [sueldo, 2000],
+            "BONO": [100, 200],
+        })
+        with NamedTemporaryFile(suffix=".xlsx") as tmp:
+            df.to_excel(tmp.name, index=False)
+            return SimpleUploadedFile("libro.xlsx", open(tmp.name, "rb").read())
+
+    def _procesar(self):
+        LibroRemuneracionesOptimizado.eliminar_libro_parseado(self.libro.id)
+        LibroRemuneracionesOptimizado.preparar_libro_parseado(self.libro)
+        chunk = LibroRemuneracionesOptimizado.dividir_dataframe_empleados(self.libro, 10)[0]
+        empleados = LibroRemuneracionesOptimizado.procesar_chunk_empleados_util(self.libro.id, chunk)
+        registros = LibroRemuneracionesOptimizado.procesar_chunk_registros_util(self.libro.id, chunk)
+        self.assertEqual((empleados["empleados_procesados"], registros["registros_procesados"]), (2, 2))
+
+    def test_reprocesar_un_chunk_actualiza_sin_duplicar(self):
+        self._procesar()
+        self.libro.archivo = self._excel("Ana María", 1500)
+        self.libro.save()
+        self._procesar()
+
+        empleados = EmpleadoCierre.objects.filter(cierre=self.libro.cierre).order_by("rut")
+        self.assertEqual([e.nombre for e in empleados], ["Ana María", "Luis"])
+        registros = RegistroConceptoEmpleado.objects.filter(empleado__cierre=self.libro.cierre)
+        self.assertEqual(registros.count(), 4)
+        sueldo = registros.get(empleado=empleados[0], nombre_concepto_original="SUELDO BASE")
+        self.assertEqual((sueldo.monto, sueldo.concepto.nombre_concepto), ("1500", "SUELDO BASE"))
+        self.assertIsNone(registros.get(empleado=empleados[0], nombre_concepto_original="BONO").concepto)
+
+
+class RutVectorizadoTests(SimpleTestCase):
+    valores = [
+        "12.345.678-5", " 7654321-6 ", "15333444-k", 123456785, "1-9",
+        "total", "", None, "nan", "12 345 678\t5", "１２３４５６７８-5", "x" * 40,
+    ]
+
+    def test_mismo_resultado_que_version_escalar(self):
+        serie = pd.Series(self.valores, dtype=object)
+        validos, formateados = rut_utils.validar_y_formatear_ruts(serie)
+
+        self.assertEqual(
+            validos.tolist(),
+            [rut_utils.es_rut_valido(v) and rut_utils.es_rut_chileno_valido(v) for v in self.valores],
+        )
+        self.assertEqual(
+            formateados.tolist(),
+            [rut_utils.formatear_rut_con_guion(v) for v in self.valores],
+        )
+        self.assertEqual(
+            rut_utils.normalizar_ruts(serie).tolist(),
+            [rut_utils.normalizar_rut(v) for v in self.valores],
+        )
+
+    def test_digito_verificador(self):
+        self.assertEqual(list(rut_utils.calcular_dv_vectorizado([12345678, 15333444, 7654321])), ["5", "7", "6"])
+        self.assertEqual(
+            rut_utils.mascara_dv_correcto(pd.Series(["12.345.678-5", "12345678-4", "total", None])).tolist(),
+            [True, False, False, False],
+        )
+
+
+class DiscrepanciasLibroVsNovedadesTests(ConsultasPorVolumenMixin, TestCase):
+    def setUp(self):
+        self.cliente = Cliente.objects.create(nombre="Test")
+        self.cierre = CierreNomina.objects.create(cliente=self.cliente, periodo="2025-01")
+        self.sueldo = ConceptoRemuneracion.objects.create(
+            cliente=self.cliente, nombre_concepto="SUELDO BASE", clasificacion="haberes_imponibles"
+        )
+        self.mapeo = ConceptoRemuneracionNovedades.objects.create(
+            cliente=self.cliente, nombre_concepto_novedades="Sueldo", concepto_libro=self.sueldo
+        )
+
+    def _crear_empleados(self, cantidad, desde=0):
+        for i in range(desde, desde + cantidad):
+            rut = f"{10000000 + i}-1"
+            emp_libro = EmpleadoCierre.objects.create(cierre=self.cierre, rut=rut, nombre="A", apellido_paterno="B")
+            emp_nov = EmpleadoCierreNovedades.objects.create(cierre=self.cierre, rut=rut.replace("-", ""), nombre="A", apellido_paterno="B")
+            RegistroConceptoEmpleado.objects.create(
+                empleado=emp_libro, concepto=self.sueldo, nombre_concepto_original="SUELDO BASE", monto="1000"
+            )
+            # Pares con diferencia numérica, sin novedad (vacío) y con valor igual tras redondeo
+            monto_novedades = ["1500", "", "1000.4"][i % 3]
+            RegistroConceptoEmpleadoNovedades.objects.create(
+                empleado=emp_nov, concepto=self.mapeo, nombre_concepto_original="Sueldo", monto=monto_novedades
+            )
+
+    def _procesar(self, creados):
+        DiscrepanciaCierre.objects.all().delete()
+        return generar_discrepancias_libro_vs_novedades(self.cierre)
+
+    def test_cruce_en_memoria_con_consultas_constantes(self):
+        resultado, consultas = self.assertConsultasConstantes(3, 9)
+
+        # Cada lado se lee una sola vez y las discrepancias se insertan en bloque
+        self.assertEqual(_consultas_a_tabla(consultas, "nomina_registroconceptoempleado"), 1)
+        self.assertEqual(_consultas_a_tabla(consultas, "nomina_registroconceptoempleadonovedades"), 1)
+        self.assertEqual(_consultas_a_tabla(consultas, "nomina_discrepanciacierre", "INSERT"), 1)
+        self.assertEqual(resultado["diferencias_conceptos"], 4)
+        discrepancia = DiscrepanciaCierre.objects.order_by("id").first()
+        self.assertEqual(discrepancia.valor_libro, "1000")
+        self.assertEqual(discrepancia.valor_novedades, "1500")
+        self.assertEqual(discrepancia.concepto_afectado, "Sueldo → SUELDO BASE")
+
+
+class ComparacionIndividualChunkTests(ConsultasPorVolumenMixin, TestCase):
+    def setUp(self):
+        cliente = Cliente.objects.create(nombre="Test")
+        self.anterior = CierreNomina.objects.create(cliente=cliente, periodo="2025-01")
+        self.actual = CierreNomina.objects.create(cliente=cliente, periodo="2025-02")
+
+    def _crear_empleados(self, cantidad, desde=0):
+        ids = []
+        for i in range(desde, desde + cantidad):
+            rut = f"{10000000 + i}-1"
+            actual = NominaConsolidada.objects.create(cierre=self.actual, rut_empleado=rut, nombre_empleado="A")
+            ids.append(actual.id)
+            if i % 2:
+                # Empleado nuevo con ingreso informado
+                MovimientoPersonal.objects.create(nomina_consolidada=actual, categoria="ingreso")
+                continue
+            anterior = NominaConsolidada.objects.create(cierre=self.anterior, rut_empleado=rut, nombre_empleado="A")
+            for nomina in (actual, anterior):
+                ConceptoConsolidado.objects.create(
+                    nomina_consolidada=nomina, nombre_concepto="BONO", tipo_concepto="haber_imponible", monto_total=Decimal("100")
+                )
+        return ids
+
+    def _procesar(self, ids):
+        return procesar_chunk_comparacion_individual(
+            ids, self.actual.id, self.anterior.id, ["haber_imponible"], "chunk_test"
+        )
+
+    def test_chunk_precargado_y_comparado_en_memoria(self):
+        resultado, consultas = self.assertConsultasConstantes(2, 10)
+
+        # Actuales y anteriores, conceptos, movimientos y empleados del libro: una consulta cada uno
+        self.assertEqual(_consultas_a_tabla(consultas, "nomina_nominaconsolidada"), 2)
+        self.assertEqual(_consultas_a_tabla(consultas, "nomina_conceptoconsolidado"), 1)
+        self.assertEqual(_consultas_a_tabla(consultas, "nomina_movimientopersonal"), 1)
+        self.assertEqual(_consultas_a_tabla(consultas, "nomina_empleadocierre"), 1)
+        self.assertEqual(resultado["incidencias_detectadas"], 0)
+        self.assertEqual(resultado["diag"]["empleados_con_match"], 5)
+        self.assertEqual(resultado["diag"]["empleados_sin_match"], 5)
+        self.assertEqual(resultado["diag"]["conceptos_comparados"], 5)
+
+
+class VariacionesVectorizadasTests(SimpleTestCase):
+    def _montos(self, filas):
+        montos = pd.DataFrame.from_records(filas, columns=variaciones.COLUMNAS_MONTOS)
+        montos["centavos"] = variaciones.a_centavos(montos["centavos"].to_numpy())
+        return montos
+
+    def test_variacion_igual_a_version_escalar(self):
+        actual = [Decimal("130"), Decimal("0"), Decimal("50"), Decimal("-20"), Decimal("129.99")]
+        anterior = [Decimal("100"), Decimal("0"), Decimal("0"), Decimal("-10"), Decimal("100")]
+        esperado = [float(calcular_variacion_porcentual(a, b)) for a, b in zip(actual, anterior)]
+
+        self.assertEqual(
+            variaciones.calcular_variacion_porcentual_vectorizada(actual, anterior).round(6).tolist(),
+            [round(v, 6) for v in esperado],
+        )
+        self.assertEqual(
+            variaciones.supera_umbral(variaciones.a_centavos(actual), variaciones.a_centavos(anterior), 30.0).tolist(),
+            [abs(v) >= 30.0 for v in esperado],
+        )
+
+    def test_celdas_marcadas_por_empleado(self):
+        matrices = variaciones.construir_matrices(
+            self._montos([
+                ("1-9", "SUELDO", "haber_imponible", Decimal("1000")),
+                ("1-9", "BONO", "haber_imponible", Decimal("500")),
+                ("2-7", "SUELDO", "haber_imponible", Decimal("1000")),
+                ("3-5", "SUELDO", None, Decimal("1000")),
+            ]),
+            self._montos([
+                ("1-9", "SUELDO", "haber_imponible", Decimal("1000")),
+                ("2-7", "SUELDO", "haber_imponible", Decimal("700")),
+                ("2-7", "COLACION", "haber_no_imponible", Decimal("100")),
+            ]),
+        )
+        celdas, comparadas = variaciones.detectar_variaciones_individuales(matrices, lambda tipo: 30.0)
+
+        self.assertEqual(comparadas, 4)
+        self.assertEqual(
+            sorted(zip(celdas["rut_empleado"], celdas["nombre_concepto"], celdas["hallazgo"])),
+            [("1-9", "BONO", "concepto_nuevo"), ("2-7", "COLACION", "concepto_eliminado"), ("2-7", "SUELDO", "variacion")],
+        )
+        self.assertEqual(variaciones.desde_centavos(celdas["monto_anterior"].max()), Decimal("700.00"))
+
+
+class IncidenciasSumaTotalTests(TestCase):
+    def test_un_solo_agrupado_por_cierre(self):
+        cliente = Cliente.objects.create(nombre="Test")
+        anterior = CierreNomina.objects.create(cliente=cliente, periodo="2025-01")
+        actual = CierreNomina.objects.create(cliente=cliente, periodo="2025-02")
+        for cierre, montos in ((anterior, ["100", "1000", "5"]), (actual, ["200", "1100", "50"])):
+            emp = NominaConsolidada.objects.create(cierre=cierre, rut_empleado="1-9", nombre_empleado="A")
+            for nombre, tipo, monto in zip(["BONO", "SUELDO", "NOTA"], ["haber_imponible", "haber_imponible", "informativo"], montos):
+                ConceptoConsolidado.objects.create(nomina_consolidada=emp, nombre_concepto=nombre, tipo_concepto=tipo, monto_total=Decimal(monto))
+
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = procesar_incidencias_suma_total_simple(actual, anterior)
+
+        consultas_conceptos = [q for q in consultas.captured_queries if "nomina_conceptoconsolidado" in q["sql"]]
+        self.assertEqual(len(consultas_conceptos), 2)
+        self.assertEqual(resultado["conceptos_analizados"], 2)
+        self.assertEqual(resultado["conceptos_excluidos"], 1)
+        incidencia = IncidenciaCierre.objects.get()
+        self.assertEqual(incidencia.concepto_afectado, "BONO")
+        self.assertEqual(incidencia.impacto_monetario, Decimal("100"))
+
+
+class ConceptosConsolidadosTests(ConsultasPorVolumenMixin, TestCase):
+    def setUp(self):
+        self.cliente = Cliente.objects.create(nombre="Test")
+        self.cierre = CierreNomina.objects.create(cliente=self.cliente, periodo="2025-01")
+        self.conceptos = {
+            nombre: ConceptoRemuneracion.objects.create(cliente=self.cliente, nombre_concepto=nombre, clasificacion=clasificacion)
+            for nombre, clasificacion in (
+                ("SUELDO BASE", "haberes_imponibles"),
+                ("AFP", "descuentos_legales"),
+                ("HORAS EXTRA", "horas_extras"),
+            )
+        }
+
+    def _crear_empleados(self, cantidad, desde=0):
+        for i in range(desde, desde + cantidad):
+            nomina = NominaConsolidada.objects.create(cierre=self.cierre, rut_empleado=f"{i}-1", nombre_empleado="A")
+            for header, nombre, valor in (
+                ("SUELDO BASE", "SUELDO BASE", "1000"),
+                ("SUELDO BASE PROPORCIONAL", "SUELDO BASE", "500.5"),
+                ("AFP", "AFP", "100"),
+                ("HORAS EXTRA", "HORAS EXTRA", "2"),
+            ):
+                HeaderValorEmpleado.objects.create(
+                    nomina_consolidada=nomina, nombre_header=header, concepto_remuneracion=self.conceptos[nombre],
+                    valor_original=valor, valor_numerico=Decimal(valor), es_numerico=True,
+                )
+        # Empleado sin headers numéricos: totales en cero
+        NominaConsolidada.objects.create(
+            cierre=self.cierre, rut_empleado=f"sin-{desde}", nombre_empleado="B", haberes_imponibles=Decimal("9")
+        )
+
+    def _procesar(self, creados):
+        ConceptoConsolidado.objects.all().delete()
+        resultado = procesar_conceptos_consolidados_paralelo(self.cierre.id)
+        self.assertTrue(resultado["success"], resultado)
+        return resultado
+
+    def test_agrega_en_sql_con_consultas_constantes(self):
+        resultado, consultas = self.assertConsultasConstantes(2, 8)
+
+        # Conceptos y totales por categoría salen de dos GROUP BY; los totales se escriben en bloque
+        agrupadas = [
+            q for q in consultas.captured_queries
+            if '"nomina_headervalorempleado"' in q["sql"] and "GROUP BY" in q["sql"]
+        ]
+        self.assertEqual(len(agrupadas), 2)
+        self.assertEqual(_consultas_a_tabla(consultas, "nomina_nominaconsolidada", "UPDATE"), 1)
+        self.assertEqual(resultado["conceptos_consolidados"], 30)
+        sueldo = ConceptoConsolidado.objects.filter(nombre_concepto="SUELDO BASE").first()
+        self.assertEqual((sueldo.tipo_concepto, sueldo.monto_total, sueldo.cantidad), ("haber_imponible", Decimal("1500.50"), 2))
+        self.assertEqual(ConceptoConsolidado.objects.filter(nombre_concepto="HORAS EXTRA").first().tipo_concepto, "informativo")
+
+        nomina = NominaConsolidada.objects.get(rut_empleado="0-1")
+        self.assertEqual(
+            (nomina.haberes_imponibles, nomina.dctos_legales, nomina.horas_extras_cantidad),
+            (Decimal("1500.50"), Decimal("100"), Decimal("2")),
+        )
+        self.assertEqual(NominaConsolidada.objects.get(rut_empleado="sin-0").haberes_imponibles, Decimal("0"))
+
+
+class MovimientosPersonalTests(TestCase):
+    def setUp(self):
+        cliente = Cliente.objects.create(nombre="Test")
+        self.cierre = CierreNomina.objects.create(cliente=cliente, periodo="2025-01")
+        MovimientosMesUpload.objects.create(cierre=self.cierre, archivo="movimientos.xlsx", estado="procesado")
+        NominaConsolidada.objects.create(
+            cierre=self.cierre, rut_empleado=rut_utils.normalizar_rut("11.111.111-1"), nombre_empleado="Ana"
+        )
+        comunes = dict(
+            cierre=self.cierre, empresa_nombre="E", cargo="C", centro_de_costo="CC", sucursal="S",
+        )
+        MovimientoAltaBaja.objects.create(
+            nombres_apellidos="Ana", rut="11.111.111-1", fecha_ingreso=date(2025, 1, 2), tipo_contrato="Indefinido",
+            dias_trabajados=30, sueldo_base=Decimal("1000"), alta_o_baja="ALTA", **comunes
+        )
+        # Finiquito de un empleado que no viene en el libro
+        MovimientoAltaBaja.objects.create(
+            nombres_apellidos="Beto", rut="22.222.222-2", fecha_ingreso=date(2020, 1, 1), fecha_retiro=date(2025, 1, 10),
+            tipo_contrato="Plazo fijo", dias_trabajados=10, sueldo_base=Decimal("1000"), alta_o_baja="BAJA", **comunes
+        )
+        for rut, dias in (("11.111.111-1", 5), ("22.222.222-2", 30)):
+            MovimientoAusentismo.objects.create(
+                nombres_apellidos="X", rut=rut, fecha_inicio_ausencia=date(2024, 12, 28), fecha_fin_ausencia=date(2025, 1, 2),
+                dias=dias, tipo="Licencia Medica", **comunes
+            )
+
+    def _estado_final(self):
+        return (
+            sorted(NominaConsolidada.objects.values_list("rut_empleado", "estado_empleado")),
+            sorted(MovimientoPersonal.objects.values_list("nomina_consolidada__rut_empleado", "categoria", "dias_en_periodo")),
+        )
+
+    def test_tipos_en_paralelo_igual_que_secuencial(self):
+        resultado = procesar_movimientos_personal_paralelo(self.cierre.id)
+        self.assertEqual(resultado["movimientos_creados"], 4)
+        secuencial = self._estado_final()
+        # Ausentismo se aplica después de alta/baja
+        self.assertEqual([estado for _, estado in secuencial[0]], ["ausente_parcial", "ausente_total"])
+        self.assertIn((rut_utils.normalizar_rut("11.111.111-1"), "ausencia", 2), secuencial[1])
+
+        MovimientoPersonal.objects.all().delete()
+        NominaConsolidada.objects.filter(fuente_datos__movimiento_finiquito=True).delete()
+        NominaConsolidada.objects.update(estado_empleado="activo")
+
+        # Celery lee su configuración desde settings: el override se revierte al salir
+        with override_settings(CELERY_TASK_ALWAYS_EAGER=True):
+            flujo_movimientos_personal(self.cierre.id).apply_async()
+        self.assertEqual(self._estado_final(), secuencial)
+
+
+class InformeLibroTests(TestCase):
+    def setUp(self):
+        cliente = Cliente.objects.create(nombre="Test")
+        self.cierre = CierreNomina.objects.create(cliente=cliente, periodo="2025-01")
+        for rut, sueldo, bono in (("11111111-1", "1000", "50"), ("22222222-2", "2000", "0"), ("33333333-3", "1500", "25")):
+            nomina = NominaConsolidada.objects.create(
+                cierre=self.cierre, rut_empleado=rut, nombre_empleado="A",
+                haberes_imponibles=Decimal(sueldo) + Decimal(bono), dctos_legales=Decimal("100"),
+            )
+            for nombre, tipo, monto in (
+                ("SUELDO BASE", "haber_imponible", sueldo),
+                ("BONO", "haber_imponible", bono),
+                ("AFP", "descuento_legal", "100"),
+            ):
+                ConceptoConsolidado.objects.create(
+                    nomina_consolidada=nomina, nombre_concepto=nombre, tipo_concepto=tipo, monto_total=Decimal(monto)
+                )
+
+    def test_una_consulta_agrupada_sobre_conceptos(self):
+        with CaptureQueriesContext(connection) as consultas:
+            libro = build_informe_libro(self.cierre.id)
+        self.assertEqual(sum("conceptoconsolidado" in q["sql"] for q in consultas.captured_queries), 1)
+        self.assertEqual(libro["cierre"]["total_empleados"], 3)
+        self.assertEqual(libro["totales_categorias"]["haber_imponible"], 4575.0)
+        self.assertEqual(libro["totales_categorias"]["descuento_legal"], 300.0)
+        self.assertEqual([(c["categoria"], c["nombre"], c["total"], c["cantidad"], c["empleados"]) for c in libro["conceptos"]], [
+            ("haber_imponible", "SUELDO BASE", 4500.0, 3.0, 3),
+            ("haber_imponible", "BONO", 75.0, 3.0, 2),
+            ("descuento_legal", "AFP", 300.0, 3.0, 3),
+        ])
+
+
+def _cache_nomina_en_fakeredis(**ajustes):
+    """SGMCacheSystemNomina sobre un fakeredis propio, con los settings SGM_CACHE_* dados"""
+    servidor = fakeredis.FakeServer()
+
+    def conectar(**kwargs):
+        return fakeredis.FakeRedis(server=servidor, decode_responses=kwargs.get("decode_responses", False))
+
+    with mock.patch("redis.Redis", side_effect=conectar), override_settings(**ajustes):
+        return SGMCacheSystemNomina()
+
+
+class SerializadorCacheNominaTests(SimpleTestCase):
+    KPIS = {"version": 3, "tramos": {"123": {"empleados": 2}}, "montos": {7: "1500.00"}, "filas": [[1, "ñ"]] * 300}
+
+    CABECERAS = {
+        ("json", True): b"{", ("json", False): b"{",
+        ("json-zlib", True): FORMATO_JSON_ZLIB, ("json-zlib", False): b"{",
+        ("msgpack", True): FORMATO_MSGPACK, ("msgpack", False): FORMATO_MSGPACK,
+        ("msgpack-zlib", True): FORMATO_MSGPACK_ZLIB, ("msgpack-zlib", False): FORMATO_MSGPACK,
+    }
+
+    def test_ida_y_vuelta_en_cada_formato(self):
+        for formato in SERIALIZADORES:
+            for comprimir in (True, False):
+                with self.subTest(formato=formato, comprimir=comprimir):
+                    cache = _cache_nomina_en_fakeredis(
+                        SGM_CACHE_SERIALIZER=formato, SGM_CACHE_COMPRESS_MIN_BYTES=0 if comprimir else 10**9
+                    )
+                    self.assertEqual(cache._serialize_data(self.KPIS)[:1], self.CABECERAS[formato, comprimir])
+                    self.assertTrue(cache.set_kpis_nomina(6, "2025-03", self.KPIS))
+
+                    leido = cache.get_kpis_nomina(6, "2025-03")
+                    self.assertEqual(
+                        (leido["version"], leido["tramos"], leido["filas"]),
+                        (3, {"123": {"empleados": 2}}, self.KPIS["filas"]),
+                    )
+                    # msgpack conserva las claves int; JSON las deja como str
+                    clave = 7 if formato.startswith("msgpack") else "7"
+                    self.assertEqual(leido["montos"], {clave: "1500.00"})
+
+
+class RegistroClavesNominaTests(SimpleTestCase):
+    def test_registro_vencido_se_reconstruye(self):
+        cache = _cache_nomina_en_fakeredis()
+        cache.set_kpis_nomina(6, "2025-03", {"empleados": 10})
+        self.assertEqual(cache.get_client_keys(6), ["sgm:nomina:6:2025-03:kpis"])
+        self.assertGreaterEqual(
+            cache.redis_client.ttl(cache._registry_cliente_key(6)), cache.redis_client.ttl(REGISTRY_READY_KEY)
+        )
+
+        cache.redis_client.delete(REGISTRY_READY_KEY, cache._registry_cliente_key(6))
+        cache.redis_client.set("sgm:nomina:6:2025-04:informe", "{}")
+        cache._registro_verificado -= REGISTRY_CHECK_SECONDS
+        self.assertEqual(sorted(cache.get_client_keys(6)), ["sgm:nomina:6:2025-03:kpis", "sgm:nomina:6:2025-04:informe"])
+
+        self.assertEqual(cache.invalidate_cliente_periodo(6, "2025-03"), 1)
+        self.assertEqual(cache.get_client_keys(6), ["sgm:nomina:6:2025-04:informe"])
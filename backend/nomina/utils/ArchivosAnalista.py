@@ -9,7 +9,7 @@ from nomina.models import (
     AnalistaIncidencia, 
     AnalistaIngreso
 )
-from .GenerarIncidencias import formatear_rut_con_guion, normalizar_rut
+from .rut import formatear_rut_con_guion, normalizar_rut
 
 logger = logging.getLogger(__name__)
 
@@ -15,11 +15,21 @@ import logging
 import json
 import time
 from decimal import Decimal
+import pandas as pd
 from django.db.models import Q, Sum, Count
 from django.contrib.auth.models import User
 from django.utils import timezone
 from celery import shared_task, chord
 from ..cache_redis import get_cache_system_nomina
+from .variaciones import (
+    COLUMNAS_MONTOS,
+    a_centavos,
+    cargar_totales_conceptos,
+    comparar_totales_conceptos,
+    construir_matrices,
+    desde_centavos,
+    detectar_variaciones_individuales,
+)
 from ..models import (
     CierreNomina, 
     NominaConsolidada, 
@@ -238,71 +248,36 @@ def procesar_incidencias_suma_total_simple(cierre_actual, cierre_anterior):
         dict: Estadísticas del procesamiento
     """
     incidencias_creadas = []
-    conceptos_analizados = 0
-    variaciones_sobre_umbral = 0
-    conceptos_excluidos_count = 0
     
     # Obtener versión del cierre para trazabilidad
     cierre_version = cierre_actual.version_datos or 1
     
-    # Obtener todos los conceptos únicos de ambos períodos
-    conceptos_actuales = ConceptoConsolidado.objects.filter(
-        nomina_consolidada__cierre=cierre_actual
-    ).values('nombre_concepto', 'tipo_concepto').distinct()
-    
-    conceptos_anteriores = ConceptoConsolidado.objects.filter(
-        nomina_consolidada__cierre=cierre_anterior
-    ).values('nombre_concepto', 'tipo_concepto').distinct()
+    # Sumas por ítem de ambos períodos (una consulta agrupada por cierre) comparadas en bloque
+    totales = comparar_totales_conceptos(
+        cargar_totales_conceptos(cierre_actual.id),
+        cargar_totales_conceptos(cierre_anterior.id),
+        umbral=UMBRAL_VARIACION_PORCENTUAL
+    )
     
-    # Unir todos los conceptos únicos
-    conceptos_unicos = set()
-    for c in conceptos_actuales:
-        conceptos_unicos.add((c['nombre_concepto'], c['tipo_concepto']))
-    for c in conceptos_anteriores:
-        conceptos_unicos.add((c['nombre_concepto'], c['tipo_concepto']))
+    logger.info(f"📊 Analizando {len(totales)} ítems únicos (umbral: {UMBRAL_VARIACION_PORCENTUAL}%)")
     
-    logger.info(f"📊 Analizando {len(conceptos_unicos)} ítems únicos (umbral: {UMBRAL_VARIACION_PORCENTUAL}%)")
+    # EXCLUIR conceptos informativos
+    excluidos = totales['tipo_concepto'].isin(CONCEPTOS_EXCLUIDOS).to_numpy()
+    conceptos_excluidos_count = int(excluidos.sum())
+    conceptos_analizados = len(totales) - conceptos_excluidos_count
     
-    # Procesar cada concepto único
-    for nombre_concepto, tipo_concepto in conceptos_unicos:
-        # EXCLUIR conceptos informativos
-        if tipo_concepto in CONCEPTOS_EXCLUIDOS:
-            conceptos_excluidos_count += 1
-            continue
-        
-        # Calcular suma total en período actual
-        suma_actual = ConceptoConsolidado.objects.filter(
-            nomina_consolidada__cierre=cierre_actual,
-            nombre_concepto=nombre_concepto,
-            tipo_concepto=tipo_concepto
-        ).aggregate(total=Sum('monto_total'))['total'] or Decimal('0')
-        
-        # Calcular suma total en período anterior
-        suma_anterior = ConceptoConsolidado.objects.filter(
-            nomina_consolidada__cierre=cierre_anterior,
-            nombre_concepto=nombre_concepto,
-            tipo_concepto=tipo_concepto
-        ).aggregate(total=Sum('monto_total'))['total'] or Decimal('0')
-        
-        # Calcular variación porcentual
-        variacion_pct = calcular_variacion_porcentual(suma_actual, suma_anterior)
-        conceptos_analizados += 1
-        
-        # Verificar si supera el umbral
-        if abs(variacion_pct) >= UMBRAL_VARIACION_PORCENTUAL:
-            variaciones_sobre_umbral += 1
-            
-            # Crear incidencia
-            incidencia = crear_incidencia_suma_total(
-                cierre_id=cierre_actual.id,
-                nombre_concepto=nombre_concepto,
-                tipo_concepto=tipo_concepto,
-                suma_actual=suma_actual,
-                suma_anterior=suma_anterior,
-                variacion_pct=variacion_pct
-            )
-            
-            incidencias_creadas.append(incidencia)
+    # Solo los ítems que superan el umbral se materializan como incidencia
+    marcados = totales[~excluidos & totales['supera_umbral'].to_numpy()]
+    variaciones_sobre_umbral = len(marcados)
+    for item in marcados.itertuples(index=False):
+        incidencias_creadas.append(crear_incidencia_suma_total(
+            cierre_id=cierre_actual.id,
+            nombre_concepto=item.nombre_concepto,
+            tipo_concepto=item.tipo_concepto,
+            suma_actual=desde_centavos(item.suma_actual),
+            suma_anterior=desde_centavos(item.suma_anterior),
+            variacion_pct=item.variacion_pct
+        ))
     
     # Guardar todas las incidencias en batch
     if incidencias_creadas:
@@ -420,6 +395,88 @@ def actualizar_estado_cierre_incidencias(cierre, total_incidencias):
 # Las siguientes funciones están comentadas porque ya NO se usa comparación individual
 # Solo se mantienen para referencia histórica
 
+def _precargar_datos_chunk_individual(empleados_ids, cierre_actual_id, cierre_anterior_id,
+                                      clasificaciones_seleccionadas):
+    """
+    Carga de una vez todo lo que la comparación individual necesita para un chunk.
+    
+    Returns:
+        dict con:
+        - actuales: {id: NominaConsolidada} del cierre actual
+        - anteriores_por_rut: {rut: NominaConsolidada} del cierre anterior (primera por id)
+        - conceptos: {nomina_consolidada_id: {(nombre_concepto, tipo_concepto): monto_total}}
+          solo de las clasificaciones seleccionadas
+        - con_finiquito / con_ingreso: ids de NominaConsolidada con ese movimiento
+        - ruts_ingreso_anterior: RUTs con ingreso registrado en el cierre anterior
+        - empleado_libro_por_rut: {rut: EmpleadoCierre.id} del cierre actual
+        - montos_actual / montos_anterior: los mismos conceptos en formato largo
+          (COLUMNAS_MONTOS) para el análisis vectorizado de variaciones
+    """
+    actuales = {
+        emp.id: emp
+        for emp in NominaConsolidada.objects.select_related('cierre').filter(id__in=empleados_ids)
+    }
+    ruts = {emp.rut_empleado for emp in actuales.values()}
+
+    anteriores_por_rut = {}
+    for emp in NominaConsolidada.objects.select_related('cierre').filter(
+        cierre_id=cierre_anterior_id, rut_empleado__in=ruts
+    ).order_by('id'):
+        anteriores_por_rut.setdefault(emp.rut_empleado, emp)
+    anteriores_ids = [emp.id for emp in anteriores_por_rut.values()]
+
+    conceptos = {}
+    for nomina_id, nombre_concepto, tipo_concepto, monto_total in ConceptoConsolidado.objects.filter(
+        nomina_consolidada_id__in=list(actuales) + anteriores_ids,
+        tipo_concepto__in=clasificaciones_seleccionadas
+    ).order_by('id').values_list('nomina_consolidada_id', 'nombre_concepto', 'tipo_concepto', 'monto_total'):
+        conceptos.setdefault(nomina_id, {})[(nombre_concepto, tipo_concepto)] = monto_total
+
+    con_finiquito, con_ingreso, ruts_ingreso_anterior = set(), set(), set()
+    for nomina_id, rut, cierre_id, categoria in MovimientoPersonal.objects.filter(
+        Q(nomina_consolidada_id__in=list(actuales)) |
+        Q(nomina_consolidada__cierre_id=cierre_anterior_id, nomina_consolidada__rut_empleado__in=ruts),
+        categoria__in=['finiquito', 'ingreso']
+    ).values_list(
+        'nomina_consolidada_id', 'nomina_consolidada__rut_empleado', 'nomina_consolidada__cierre_id', 'categoria'
+    ).order_by().distinct():
+        if categoria == 'finiquito':
+            con_finiquito.add(nomina_id)
+        else:
+            con_ingreso.add(nomina_id)
+            if cierre_id == cierre_anterior_id:
+                ruts_ingreso_anterior.add(rut)
+
+    empleado_libro_por_rut = {}
+    for rut, empleado_id in EmpleadoCierre.objects.filter(
+        cierre_id=cierre_actual_id, rut__in=ruts
+    ).order_by('id').values_list('rut', 'id'):
+        empleado_libro_por_rut.setdefault(rut, empleado_id)
+
+    def _montos(empleados):
+        montos = pd.DataFrame.from_records(
+            [
+                (emp.rut_empleado, nombre_concepto, tipo_concepto, monto_total)
+                for emp in empleados
+                for (nombre_concepto, tipo_concepto), monto_total in conceptos.get(emp.id, {}).items()
+            ],
+            columns=COLUMNAS_MONTOS
+        )
+        montos['centavos'] = a_centavos(montos['centavos'].to_numpy())
+        return montos
+
+    return {
+        'actuales': actuales,
+        'anteriores_por_rut': anteriores_por_rut,
+        'conceptos': conceptos,
+        'montos_actual': _montos(actuales.values()),
+        'montos_anterior': _montos(anteriores_por_rut.values()),
+        'con_finiquito': con_finiquito,
+        'con_ingreso': con_ingreso,
+        'ruts_ingreso_anterior': ruts_ingreso_anterior,
+        'empleado_libro_por_rut': empleado_libro_por_rut,
+    }
+
 @shared_task
 def procesar_chunk_comparacion_individual(empleados_ids, cierre_actual_id, cierre_anterior_id, 
                                         clasificaciones_seleccionadas, chunk_id):
@@ -460,17 +517,18 @@ def procesar_chunk_comparacion_individual(empleados_ids, cierre_actual_id, cierr
             cierre_version = CierreNomina.objects.values_list('version_datos', flat=True).get(id=cierre_actual_id) or 1
         except Exception:
             cierre_version = 1
-        cache_empleado_libro = {}
+
+        # Precarga del chunk: empleados, conceptos y movimientos en pocas consultas,
+        # la comparación posterior se hace completamente en memoria
+        datos = _precargar_datos_chunk_individual(
+            empleados_ids, cierre_actual_id, cierre_anterior_id, clasificaciones_seleccionadas
+        )
+        empleado_libro_por_rut = datos['empleado_libro_por_rut']
 
         def _empleado_libro_id(rut: str):
             if not rut:
                 return None
-            rid = cache_empleado_libro.get(rut)
-            if rid is not None:
-                return rid
-            rid = EmpleadoCierre.objects.filter(cierre_id=cierre_actual_id, rut=rut).values_list('id', flat=True).first()
-            cache_empleado_libro[rut] = rid
-            return rid
+            return empleado_libro_por_rut.get(rut)
 
         def _preparar_incidencia(inc: IncidenciaCierre, rut: str):
             """Completa firma, versiones y referencia empleado_libro antes de agregar al batch."""
@@ -490,15 +548,13 @@ def procesar_chunk_comparacion_individual(empleados_ids, cierre_actual_id, cierr
                 pass
             return inc
         for empleado_consolidado_id in empleados_ids:
-            empleado_actual = NominaConsolidada.objects.select_related('cierre').get(
-                id=empleado_consolidado_id
-            )
+            empleado_actual = datos['actuales'].get(empleado_consolidado_id)
+            if empleado_actual is None:
+                logger.warning(f"⚠️ {chunk_id}: NominaConsolidada {empleado_consolidado_id} no encontrada, se omite")
+                continue
             
             # Buscar empleado equivalente en período anterior
-            empleado_anterior = NominaConsolidada.objects.filter(
-                cierre_id=cierre_anterior_id,
-                rut_empleado=empleado_actual.rut_empleado
-            ).first()
+            empleado_anterior = datos['anteriores_por_rut'].get(empleado_actual.rut_empleado)
             
             # Para nuestra lógica: si no hay empleado anterior, trataremos todos los conceptos como vs 0
             empleados_con_match += 1 if empleado_anterior else 0
@@ -508,10 +564,7 @@ def procesar_chunk_comparacion_individual(empleados_ids, cierre_actual_id, cierr
             # 1) Empleado aparece en cierre actual, pero en el cierre anterior tiene finiquito → finiquito_no_aplicado
             try:
                 if empleado_anterior:
-                    tuvo_finiquito = MovimientoPersonal.objects.filter(
-                        nomina_consolidada=empleado_anterior,
-                        categoria='finiquito'
-                    ).exists()
+                    tuvo_finiquito = empleado_anterior.id in datos['con_finiquito']
                     if tuvo_finiquito:
                         incidencias_detectadas.append(
                             _preparar_incidencia(IncidenciaCierre(
@@ -541,15 +594,8 @@ def procesar_chunk_comparacion_individual(empleados_ids, cierre_actual_id, cierr
             # 2) Empleado NO existe en cierre anterior: verificar que tenga registro de ingreso en actual o anterior → si no, ingreso_no_informado
             try:
                 if not empleado_anterior:
-                    ingreso_actual = MovimientoPersonal.objects.filter(
-                        nomina_consolidada=empleado_actual,
-                        categoria='ingreso'
-                    ).exists()
-                    ingreso_en_anterior = MovimientoPersonal.objects.filter(
-                        nomina_consolidada__cierre_id=cierre_anterior_id,
-                        nomina_consolidada__rut_empleado=empleado_actual.rut_empleado,
-                        categoria='ingreso'
-                    ).exists()
+                    ingreso_actual = empleado_actual.id in datos['con_ingreso']
+                    ingreso_en_anterior = empleado_actual.rut_empleado in datos['ruts_ingreso_anterior']
                     if not ingreso_actual and not ingreso_en_anterior:
                         incidencias_detectadas.append(
                             _preparar_incidencia(IncidenciaCierre(
@@ -576,17 +622,8 @@ def procesar_chunk_comparacion_individual(empleados_ids, cierre_actual_id, cierr
                 pass
 
             # Cargar conceptos actuales y anteriores, solo de las clasificaciones seleccionadas
-            conceptos_actuales_qs = ConceptoConsolidado.objects.filter(
-                nomina_consolidada=empleado_actual,
-                tipo_concepto__in=clasificaciones_seleccionadas
-            ).values('nombre_concepto', 'tipo_concepto', 'monto_total')
-
-            anteriores_qs = ConceptoConsolidado.objects.filter(
-                nomina_consolidada=empleado_anterior
-            ).values('nombre_concepto', 'tipo_concepto', 'monto_total') if empleado_anterior else []
-
-            mapa_actual = { (c['nombre_concepto'], c['tipo_concepto']): c['monto_total'] for c in conceptos_actuales_qs }
-            mapa_anterior = { (c['nombre_concepto'], c['tipo_concepto']): c['monto_total'] for c in anteriores_qs if c['tipo_concepto'] in clasificaciones_seleccionadas }
+            mapa_actual = datos['conceptos'].get(empleado_actual.id, {})
+            mapa_anterior = datos['conceptos'].get(empleado_anterior.id, {}) if empleado_anterior else {}
 
             # Si el empleado es NUEVO (no existía en el cierre anterior), queremos:
             # - NO crear incidencias de variación individual (vs 0)
@@ -622,87 +659,61 @@ def procesar_chunk_comparacion_individual(empleados_ids, cierre_actual_id, cierr
                 except Exception:
                     pass
 
-            # Unión de conceptos
-            todas_claves = set(mapa_actual.keys()) | set(mapa_anterior.keys())
-
-            if not todas_claves and len(debug_samples) < DEBUG_MAX_SAMPLES:
+            if not mapa_actual and not mapa_anterior and len(debug_samples) < DEBUG_MAX_SAMPLES:
                 # Muestreo cuando no hay claves que comparar para este empleado
-                try:
-                    logger.debug(
-                        f"🔎 {chunk_id}: Sin claves a comparar para empleado {empleado_actual.rut_empleado}. "
-                        f"Actual={list(mapa_actual.keys())[:5]} Anterior={list(mapa_anterior.keys())[:5]}"
-                    )
-                except Exception:
-                    pass
-
-            for (nombre_concepto, tipo_concepto) in todas_claves:
-                # Si el empleado es nuevo, saltar la creación de incidencias de variación
-                if not empleado_anterior:
-                    continue
-                monto_act = mapa_actual.get((nombre_concepto, tipo_concepto), Decimal('0'))
-                monto_ant = mapa_anterior.get((nombre_concepto, tipo_concepto), Decimal('0'))
-
-                variacion_pct = calcular_variacion_porcentual(monto_act, monto_ant)
-                try:
-                    variacion_pct_f = float(variacion_pct)
-                except Exception:
-                    variacion_pct_f = 0.0
-                umbral = obtener_umbral_individual(tipo_concepto)
-                conceptos_comparados += 1
-
-                if abs(variacion_pct_f) >= umbral:
-                    comparaciones_superan_umbral += 1
-                    # Crear una incidencia sintética con valores actuales/anterior
-                    # Creamos objetos ligeros para usar el factory existente
-                    class _Obj:
-                        pass
-                    obj_actual = _Obj(); obj_anterior = _Obj()
-                    obj_actual.nombre_concepto = nombre_concepto
-                    obj_actual.tipo_concepto = tipo_concepto
-                    obj_actual.monto_total = Decimal(monto_act)
-                    obj_anterior.nombre_concepto = nombre_concepto
-                    obj_anterior.tipo_concepto = tipo_concepto
-                    obj_anterior.monto_total = Decimal(monto_ant)
-
-                    incidencias_detectadas.append(
-                        _preparar_incidencia(IncidenciaCierre(
-                            cierre_id=cierre_actual_id,
-                            rut_empleado=empleado_actual.rut_empleado,
-                            empleado_nombre=empleado_actual.nombre_empleado,
-                            tipo_incidencia='variacion_concepto_individual',
-                            tipo_comparacion='individual',
-                            prioridad=determinar_prioridad_individual(variacion_pct_f),
-                            concepto_afectado=nombre_concepto,
-                            descripcion=f'Variación {variacion_pct_f:.1f}% en {nombre_concepto}',
-                            impacto_monetario=abs(Decimal(monto_act) - Decimal(monto_ant)),
-                            datos_adicionales={
-                                'alcance': 'empleado',
-                                'categoria_concepto': tipo_concepto,
-                                'concepto': nombre_concepto,
-                                'tipo_concepto': tipo_concepto,
-                                'monto_actual': float(monto_act),
-                                'monto_anterior': float(monto_ant),
-                                'variacion_porcentual': round(variacion_pct_f, 2),
-                                'variacion_absoluta': float(abs(Decimal(monto_act) - Decimal(monto_ant))),
-                                'tipo_comparacion': 'individual'
-                            }
-                        ), empleado_actual.rut_empleado)
-                    )
+                logger.debug(f"🔎 {chunk_id}: Sin claves a comparar para empleado {empleado_actual.rut_empleado}")
+
+        # Variaciones (empleado × concepto) del chunk en bloque; solo empleados con match
+        # en el cierre anterior, y solo las celdas marcadas se materializan como incidencia
+        celdas_marcadas, conceptos_comparados = detectar_variaciones_individuales(
+            construir_matrices(datos['montos_actual'], datos['montos_anterior']),
+            obtener_umbral_individual,
+            ruts_comparables=datos['anteriores_por_rut'].keys()
+        )
+        comparaciones_superan_umbral = len(celdas_marcadas)
+        nombres_por_rut = {emp.rut_empleado: emp.nombre_empleado for emp in datos['actuales'].values()}
+
+        for celda in celdas_marcadas.itertuples(index=False):
+            monto_act = desde_centavos(celda.monto_actual)
+            monto_ant = desde_centavos(celda.monto_anterior)
+            variacion_pct_f = float(celda.variacion_pct)
+            incidencias_detectadas.append(
+                _preparar_incidencia(IncidenciaCierre(
+                    cierre_id=cierre_actual_id,
+                    rut_empleado=celda.rut_empleado,
+                    empleado_nombre=nombres_por_rut.get(celda.rut_empleado, ''),
+                    tipo_incidencia='variacion_concepto_individual',
+                    tipo_comparacion='individual',
+                    prioridad=determinar_prioridad_individual(variacion_pct_f),
+                    concepto_afectado=celda.nombre_concepto,
+                    descripcion=f'Variación {variacion_pct_f:.1f}% en {celda.nombre_concepto}',
+                    impacto_monetario=abs(monto_act - monto_ant),
+                    datos_adicionales={
+                        'alcance': 'empleado',
+                        'categoria_concepto': celda.tipo_concepto,
+                        'concepto': celda.nombre_concepto,
+                        'tipo_concepto': celda.tipo_concepto,
+                        'monto_actual': float(monto_act),
+                        'monto_anterior': float(monto_ant),
+                        'variacion_porcentual': round(variacion_pct_f, 2),
+                        'variacion_absoluta': float(abs(monto_act - monto_ant)),
+                        'hallazgo': celda.hallazgo,
+                        'tipo_comparacion': 'individual'
+                    }
+                ), celda.rut_empleado)
+            )
 
-                if len(debug_samples) < DEBUG_MAX_SAMPLES:
-                    try:
-                        debug_samples.append({
-                            'empleado': empleado_actual.rut_empleado,
-                            'concepto': nombre_concepto,
-                            'tipo_concepto': tipo_concepto,
-                            'monto_actual': float(monto_act),
-                            'monto_anterior': float(monto_ant),
-                            'variacion_pct': round(float(variacion_pct), 4) if monto_ant != 0 or monto_act != 0 else 0.0,
-                            'umbral_usado': umbral,
-                            'dispara_incidencia': abs(variacion_pct_f) >= umbral
-                        })
-                    except Exception:
-                        pass
+            if len(debug_samples) < DEBUG_MAX_SAMPLES:
+                debug_samples.append({
+                    'empleado': celda.rut_empleado,
+                    'concepto': celda.nombre_concepto,
+                    'tipo_concepto': celda.tipo_concepto,
+                    'monto_actual': float(monto_act),
+                    'monto_anterior': float(monto_ant),
+                    'variacion_pct': round(variacion_pct_f, 4),
+                    'hallazgo': celda.hallazgo,
+                    'umbral_usado': obtener_umbral_individual(celda.tipo_concepto),
+                })
         
         # Batch insert optimizado
         if incidencias_detectadas or eventos_informativos:
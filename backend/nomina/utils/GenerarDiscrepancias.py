@@ -9,8 +9,10 @@ from ..models import (
     EmpleadoCierreNovedades, RegistroConceptoEmpleadoNovedades,
     MovimientoAltaBaja, MovimientoAusentismo, MovimientoVacaciones,
     AnalistaFiniquito, AnalistaIncidencia, AnalistaIngreso,
-    DiscrepanciaCierre, TipoDiscrepancia
+    DiscrepanciaCierre, TipoDiscrepancia,
+    monto_a_numero, monto_es_numerico
 )
+from .rut import normalizar_rut
 
 logger = logging.getLogger(__name__)
 
@@ -44,28 +46,6 @@ def textos_son_equivalentes(texto1, texto2):
     """Compara si dos textos son equivalentes después de normalización"""
     return normalizar_texto(texto1) == normalizar_texto(texto2)
 
-def normalizar_rut(rut):
-    """
-    Normaliza RUT para comparaciones removiendo puntos, guiones y espacios
-    """
-    if not rut:
-        return ""
-    
-    # Convertir a string y limpiar
-    rut_limpio = str(rut).strip()
-    
-    # Remover puntos, guiones, espacios
-    rut_limpio = re.sub(r'[.\-\s]', '', rut_limpio)
-    
-    # Convertir a mayúsculas (por si el dígito verificador es 'k')
-    rut_limpio = rut_limpio.upper()
-    
-    return rut_limpio
-
-def ruts_son_equivalentes(rut1, rut2):
-    """Compara si dos RUTs son equivalentes después de normalización"""
-    return normalizar_rut(rut1) == normalizar_rut(rut2)
-
 def _es_valor_vacio(valor):
     """
     Determina si un valor representa "vacío" o "sin novedad"
@@ -163,9 +143,9 @@ def generar_discrepancias_libro_vs_novedades(cierre):
     
     logger.info(f"Generando discrepancias Libro vs Novedades para cierre {cierre.id}")
     
-    # Obtener empleados de ambos archivos
-    empleados_libro = EmpleadoCierre.objects.filter(cierre=cierre).prefetch_related('registroconceptoempleado_set')
-    empleados_novedades = EmpleadoCierreNovedades.objects.filter(cierre=cierre).prefetch_related('registroconceptoempleadonovedades_set')
+    # Obtener empleados de ambos archivos (los registros se cargan aparte, en bloque)
+    empleados_libro = EmpleadoCierre.objects.filter(cierre=cierre)
+    empleados_novedades = EmpleadoCierreNovedades.objects.filter(cierre=cierre)
     
     # Crear diccionarios por RUT normalizado
     dict_libro = {normalizar_rut(emp.rut): emp for emp in empleados_libro}
@@ -209,19 +189,19 @@ def generar_discrepancias_libro_vs_novedades(cierre):
             ))
     
     # 3. Empleados en ambos - comparar solo montos (omitir datos personales y conceptos únicos)
-    conceptos_comparados_total = 0
-    conceptos_omitidos_total = 0
+    # OMITIDO: Comparar datos personales (diferencias menores normales)
+    # discrepancias.extend(_comparar_datos_personales(cierre, emp_libro, emp_novedades))
+    pares = {
+        dict_novedades[rut_norm].id: (dict_libro[rut_norm], dict_novedades[rut_norm])
+        for rut_norm in dict_libro.keys() & dict_novedades.keys()
+    }
     
-    for rut_norm in dict_libro.keys() & dict_novedades.keys():
-        emp_libro = dict_libro[rut_norm]
-        emp_novedades = dict_novedades[rut_norm]
-        
-        # OMITIDO: Comparar datos personales (diferencias menores normales)
-        # discrepancias.extend(_comparar_datos_personales(cierre, emp_libro, emp_novedades))
-        
-        # Solo comparar diferencias en montos de conceptos comunes
-        discrepancias_conceptos = _comparar_solo_montos_conceptos(cierre, emp_libro, emp_novedades)
-        discrepancias.extend(discrepancias_conceptos)
+    # Ambos lados se cargan una vez para todo el cierre y se cruzan en memoria
+    montos_libro = _cargar_montos_libro(empleado__cierre=cierre)
+    registros_novedades = _cargar_registros_novedades_mapeados(empleado__cierre=cierre)
+    discrepancias.extend(
+        _comparar_montos_mapeados(cierre, pares, montos_libro, registros_novedades)
+    )
     
     # Guardar discrepancias en la base de datos
     if discrepancias:
@@ -259,65 +239,92 @@ def _comparar_datos_personales(cierre, emp_libro, emp_novedades):
     
     return discrepancias
 
-def _comparar_solo_montos_conceptos(cierre, emp_libro, emp_novedades):
+def _cargar_montos_libro(**filtros):
     """
-    Compara solo diferencias en montos de conceptos comunes entre libro y novedades
+    Carga los montos del libro como {(empleado_id, concepto_id): monto} en una consulta.
+    Si un empleado repite concepto, gana el último registro (como el dict por empleado previo).
+    """
+    return {
+        (empleado_id, concepto_id): monto
+        for empleado_id, concepto_id, monto in (
+            RegistroConceptoEmpleado.objects
+            .filter(concepto__isnull=False, **filtros)
+            .order_by('id')
+            .values_list('empleado_id', 'concepto_id', 'monto')
+        )
+    }
+
+def _cargar_registros_novedades_mapeados(**filtros):
+    """
+    Carga en una consulta los registros de novedades con concepto libro mapeado en
+    ConceptoRemuneracionNovedades, como tuplas planas:
+    (empleado_id, nombre_concepto_original, monto, concepto_libro_id, nombre_concepto_libro)
+    """
+    return list(
+        RegistroConceptoEmpleadoNovedades.objects
+        .filter(
+            concepto__isnull=False,  # Solo registros con mapeo definido
+            concepto__concepto_libro__isnull=False,  # Y que tengan concepto libro mapeado
+            **filtros
+        )
+        .order_by('id')
+        .values_list(
+            'empleado_id', 'nombre_concepto_original', 'monto',
+            'concepto__concepto_libro_id', 'concepto__concepto_libro__nombre_concepto'
+        )
+    )
+
+def _comparar_montos_mapeados(cierre, pares, montos_libro, registros_novedades):
+    """
+    Cruza (hash join) los registros de novedades con los montos del libro usando el
+    mapeo novedades → concepto libro, y genera las discrepancias de monto.
     
-    LÓGICA CORREGIDA CON MAPEO:
-    - Usa el mapeo definido en ConceptoRemuneracionNovedades
-    - Para cada concepto de novedades, busca su concepto_libro_equivalente
+    LÓGICA CON MAPEO:
+    - Para cada concepto de novedades se usa su concepto_libro_equivalente
     - Compara el monto de novedades vs el monto del concepto mapeado en libro
     - OMITE conceptos donde novedades tiene valor vacío (significa "sin novedad")
-    """
-    discrepancias = []
     
-    # Obtener registros de conceptos
-    registros_libro = RegistroConceptoEmpleado.objects.filter(empleado=emp_libro)
-    registros_novedades = RegistroConceptoEmpleadoNovedades.objects.filter(
-        empleado=emp_novedades,
-        concepto__isnull=False,  # Solo registros con mapeo definido
-        concepto__concepto_libro__isnull=False  # Y que tengan concepto libro mapeado
-    )
-    
-    # Crear diccionario de libro por concepto ID
-    dict_libro = {reg.concepto.id: reg for reg in registros_libro if reg.concepto}
+    Args:
+        cierre: CierreNomina
+        pares: {empleado_novedades_id: (EmpleadoCierre, EmpleadoCierreNovedades)} de RUT comunes
+        montos_libro: Resultado de _cargar_montos_libro
+        registros_novedades: Resultado de _cargar_registros_novedades_mapeados
     
-    # Estadísticas para logging
-    registros_con_mapeo = len(registros_novedades)
+    Returns:
+        list[DiscrepanciaCierre] sin guardar
+    """
+    discrepancias = []
     conceptos_omitidos_sin_novedad = 0
     conceptos_comparados = 0
-    comparaciones_realizadas = 0
     
-    logger.debug(f"RUT {emp_libro.rut}: {registros_con_mapeo} registros de novedades con mapeo definido")
-    
-    # Comparar conceptos usando el mapeo
-    for reg_novedades in registros_novedades:
-        # Obtener el concepto equivalente en el libro
-        concepto_libro_equivalente = reg_novedades.concepto_libro_equivalente
-        if not concepto_libro_equivalente:
+    for emp_nov_id, nombre_novedades, monto_novedades, concepto_libro_id, nombre_libro in registros_novedades:
+        par = pares.get(emp_nov_id)
+        if not par:
             continue
+        emp_libro, emp_novedades = par
         
         # Buscar el registro correspondiente en el libro
-        reg_libro = dict_libro.get(concepto_libro_equivalente.id)
-        if not reg_libro:
+        clave_libro = (emp_libro.id, concepto_libro_id)
+        if clave_libro not in montos_libro:
             # El concepto mapeado no existe en el libro para este empleado
-            logger.debug(f"RUT {emp_libro.rut} - Concepto '{concepto_libro_equivalente.nombre_concepto}' (mapeado desde '{reg_novedades.nombre_concepto_original}') no encontrado en libro")
             continue
+        monto_libro = montos_libro[clave_libro]
         
         # FILTRO: Omitir si novedades tiene valor vacío/nulo (significa que no hubo novedad)
-        if _es_valor_vacio(reg_novedades.monto):
+        if _es_valor_vacio(monto_novedades):
             conceptos_omitidos_sin_novedad += 1
-            logger.debug(f"RUT {emp_libro.rut} - Concepto '{reg_novedades.nombre_concepto_original}' → '{concepto_libro_equivalente.nombre_concepto}': omitido (valor vacío en novedades = sin novedad)")
             continue
         
         conceptos_comparados += 1
-        comparaciones_realizadas += 1
+        concepto_afectado = f"{nombre_novedades} → {nombre_libro}"
         
         # Comparar montos si ambos son numéricos
-        if reg_libro.es_numerico and reg_novedades.es_numerico:
-            diferencia = abs(reg_libro.monto_numerico - reg_novedades.monto_numerico)
+        if monto_es_numerico(monto_libro) and monto_es_numerico(monto_novedades):
+            numerico_libro = monto_a_numero(monto_libro)
+            numerico_novedades = monto_a_numero(monto_novedades)
+            diferencia = abs(numerico_libro - numerico_novedades)
             if diferencia > 0.01:  # Tolerancia de 1 centavo
-                logger.info(f"RUT {emp_libro.rut} - Concepto '{reg_novedades.nombre_concepto_original}' → '{concepto_libro_equivalente.nombre_concepto}': discrepancia numérica (Libro: {reg_libro.monto}, Novedades: {reg_novedades.monto}, Diff: {diferencia})")
+                logger.info(f"RUT {emp_libro.rut} - Concepto '{concepto_afectado}': discrepancia numérica (Libro: {monto_libro}, Novedades: {monto_novedades}, Diff: {diferencia})")
                 
                 discrepancias.append(DiscrepanciaCierre(
                     cierre=cierre,
@@ -325,14 +332,14 @@ def _comparar_solo_montos_conceptos(cierre, emp_libro, emp_novedades):
                     empleado_libro=emp_libro,
                     empleado_novedades=emp_novedades,
                     rut_empleado=emp_libro.rut,
-                    descripcion=f"Diferencia en monto: '{reg_novedades.nombre_concepto_original}' (novedades) → '{concepto_libro_equivalente.nombre_concepto}' (libro) para RUT {emp_libro.rut}",
-                    valor_libro=str(int(reg_libro.monto_numerico)),
-                    valor_novedades=str(int(reg_novedades.monto_numerico)),
-                    concepto_afectado=f"{reg_novedades.nombre_concepto_original} → {concepto_libro_equivalente.nombre_concepto}"
+                    descripcion=f"Diferencia en monto: '{nombre_novedades}' (novedades) → '{nombre_libro}' (libro) para RUT {emp_libro.rut}",
+                    valor_libro=str(int(numerico_libro)),
+                    valor_novedades=str(int(numerico_novedades)),
+                    concepto_afectado=concepto_afectado
                 ))
-        elif str(reg_libro.monto) != str(reg_novedades.monto):
+        elif str(monto_libro) != str(monto_novedades):
             # Si no son numéricos, comparar como texto
-            logger.info(f"RUT {emp_libro.rut} - Concepto '{reg_novedades.nombre_concepto_original}' → '{concepto_libro_equivalente.nombre_concepto}': discrepancia textual (Libro: '{reg_libro.monto}', Novedades: '{reg_novedades.monto}')")
+            logger.info(f"RUT {emp_libro.rut} - Concepto '{concepto_afectado}': discrepancia textual (Libro: '{monto_libro}', Novedades: '{monto_novedades}')")
             
             discrepancias.append(DiscrepanciaCierre(
                 cierre=cierre,
@@ -340,18 +347,27 @@ def _comparar_solo_montos_conceptos(cierre, emp_libro, emp_novedades):
                 empleado_libro=emp_libro,
                 empleado_novedades=emp_novedades,
                 rut_empleado=emp_libro.rut,
-                descripcion=f"Diferencia en valor: '{reg_novedades.nombre_concepto_original}' (novedades) → '{concepto_libro_equivalente.nombre_concepto}' (libro) para RUT {emp_libro.rut}",
-                valor_libro=str(reg_libro.monto),
-                valor_novedades=str(reg_novedades.monto),
-                concepto_afectado=f"{reg_novedades.nombre_concepto_original} → {concepto_libro_equivalente.nombre_concepto}"
+                descripcion=f"Diferencia en valor: '{nombre_novedades}' (novedades) → '{nombre_libro}' (libro) para RUT {emp_libro.rut}",
+                valor_libro=str(monto_libro),
+                valor_novedades=str(monto_novedades),
+                concepto_afectado=concepto_afectado
             ))
     
-    # Log estadísticas finales
-    if registros_con_mapeo > 0:
-        logger.debug(f"RUT {emp_libro.rut}: {conceptos_omitidos_sin_novedad}/{registros_con_mapeo} conceptos omitidos (sin novedad), {conceptos_comparados} comparados, {len(discrepancias)} discrepancias encontradas")
-    
+    logger.debug(f"Conceptos mapeados: {conceptos_omitidos_sin_novedad} omitidos (sin novedad), {conceptos_comparados} comparados, {len(discrepancias)} discrepancias encontradas")
     return discrepancias
 
+def _comparar_solo_montos_conceptos(cierre, emp_libro, emp_novedades):
+    """
+    Compara solo diferencias en montos de conceptos comunes entre libro y novedades
+    para un par de empleados (mismo criterio que el cruce en bloque del cierre).
+    """
+    return _comparar_montos_mapeados(
+        cierre,
+        {emp_novedades.id: (emp_libro, emp_novedades)},
+        _cargar_montos_libro(empleado=emp_libro),
+        _cargar_registros_novedades_mapeados(empleado=emp_novedades),
+    )
+
 def generar_discrepancias_movimientos_vs_analista(cierre):
     """Genera discrepancias comparando MovimientosMes vs Archivos del Analista"""
     discrepancias = []
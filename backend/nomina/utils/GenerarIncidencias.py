@@ -11,6 +11,7 @@ from ..models import (
     AnalistaFiniquito, AnalistaIncidencia, AnalistaIngreso,
     IncidenciaCierre, TipoIncidencia, ResolucionIncidencia
 )
+from .rut import normalizar_rut
 
 logger = logging.getLogger(__name__)
 
@@ -44,57 +45,6 @@ def textos_son_equivalentes(texto1, texto2):
     """Compara si dos textos son equivalentes después de normalización"""
     return normalizar_texto(texto1) == normalizar_texto(texto2)
 
-def normalizar_rut(rut):
-    """
-    Normaliza RUT para comparaciones removiendo puntos, guiones y espacios
-    Ejemplos:
-    - '12.345.678-9' -> '123456789'
-    - '12345678-9' -> '123456789'
-    - ' 12.345.678-9 ' -> '123456789'
-    """
-    if not rut:
-        return ""
-    
-    # Convertir a string y limpiar
-    rut_limpio = str(rut).strip()
-    
-    # Remover puntos, guiones, espacios
-    rut_limpio = re.sub(r'[.\-\s]', '', rut_limpio)
-    
-    # Convertir a mayúsculas (por si el dígito verificador es 'k')
-    rut_limpio = rut_limpio.upper()
-    
-    return rut_limpio
-
-def formatear_rut_con_guion(rut):
-    """
-    Formatea RUT agregando guión antes del dígito verificador
-    Ejemplos:
-    - '123456789' -> '12345678-9'
-    - '12345678K' -> '12345678-K'
-    - '12.345.678-9' -> '12345678-9' (primero normaliza, luego formatea)
-    """
-    if not rut:
-        return ""
-    
-    # Primero normalizar para limpiar formato
-    rut_limpio = normalizar_rut(rut)
-    
-    # Validar que tenga al menos 2 caracteres (número + dígito verificador)
-    if len(rut_limpio) < 2:
-        return rut_limpio
-    
-    # Separar número del dígito verificador
-    numero = rut_limpio[:-1]
-    digito_verificador = rut_limpio[-1]
-    
-    # Formatear con guión
-    return f"{numero}-{digito_verificador}"
-
-def ruts_son_equivalentes(rut1, rut2):
-    """Compara si dos RUTs son equivalentes después de normalización"""
-    return normalizar_rut(rut1) == normalizar_rut(rut2)
-
 def generar_todas_incidencias(cierre):
     """Función principal para generar todas las incidencias de un cierre"""
     logger.info(f"Iniciando generación de incidencias para cierre {cierre.id}")
@@ -1,60 +1,27 @@
 import pandas as pd
 import logging
-import re
 
 from nomina.models import ConceptoRemuneracion, LibroRemuneracionesUpload, EmpleadoCierre, RegistroConceptoEmpleado
-from .GenerarIncidencias import normalizar_rut, formatear_rut_con_guion
+from .rut import validar_y_formatear_ruts
 
 logger = logging.getLogger(__name__)
 
-def _es_rut_valido(valor_rut):
+def _filas_con_rut_valido(df, rut_col):
     """
-    Determina si un valor de RUT es válido para procesamiento.
-    Retorna False para valores NaN, vacíos, o palabras como "total" que usa Talana.
-    """
-    if valor_rut is None:
-        return False
-    
-    # Verificar si es NaN de pandas
-    if pd.isna(valor_rut):
-        return False
-    
-    # Convertir a string y limpiar
-    rut_str = str(valor_rut).strip().lower()
-    
-    # Verificar si está vacío
-    if not rut_str:
-        return False
-    
-    # Verificar si es "nan" como string
-    if rut_str == "nan":
-        return False
-    
-    # Verificar palabras típicas de filas de totales que usa Talana
-    palabras_invalidas = [
-        "total", "totales", "suma", "sumatoria", 
-        "resumen", "consolidado", "subtotal"
-    ]
-    
-    if rut_str in palabras_invalidas:
-        return False
-    
-    return True
-
+    Filtra en bloque las filas de empleados: primera columna no vacía y RUT chileno
+    válido (descarta NaN, vacíos y filas de totales de Talana).
 
-def _es_rut_chileno_valido(valor_rut):
+    Returns:
+        (DataFrame, Series, int): filas válidas, RUT formateado por índice de fila,
+        cantidad de filas ignoradas por RUT inválido
     """
-    Valida que el RUT tenga estructura chilena tras normalizar:
-    - Solo dígitos + DV (0-9 o K)
-    - Largo entre 8 y 9 (7-8 dígitos + DV)
-    """
-    try:
-        rut_norm = normalizar_rut(valor_rut)
-        if not rut_norm or len(rut_norm) < 2:
-            return False
-        return re.match(r"^\d{7,8}[0-9K]$", rut_norm) is not None
-    except Exception:
-        return False
+    con_datos = df[df.columns[0]].astype(str).str.strip() != ""
+    rut_valido, ruts = validar_y_formatear_ruts(df[rut_col])
+    ignoradas = con_datos & ~rut_valido
+    if ignoradas.any():
+        logger.debug(f"Filas ignoradas por RUT inválido: {df.loc[ignoradas, rut_col].tolist()[:20]} (posibles totales de Talana)")
+    return df[con_datos & rut_valido], ruts, int(ignoradas.sum())
+
 
 def obtener_headers_libro_remuneraciones(path_archivo):
     """Obtiene los encabezados de un libro de remuneraciones.
@@ -157,24 +124,15 @@ def actualizar_empleados_desde_libro_util(libro):
         raise ValueError(f"Faltan columnas en el Excel: {', '.join(missing)}")
 
     cierre = libro.cierre
-    primera_col = df.columns[0]
     count = 0
-    filas_ignoradas = 0
+    
+    # Ignorar filas con RUT inválido (NaN, vacío, "total", etc.) y formatear
+    # todos los RUT (8..9 + '-' + DV) en bloque
+    df_validas, ruts, filas_ignoradas = _filas_con_rut_valido(df, expected["rut_trabajador"])
     
     vistos = set()
-    for _, row in df.iterrows():
-        if not str(row.get(primera_col, "")).strip():
-            continue
-        
-        # NUEVA VALIDACIÓN: Ignorar filas con RUT inválido (NaN, vacío, "total", etc.)
-        rut_raw = row.get(expected["rut_trabajador"])
-        if not (_es_rut_valido(rut_raw) and _es_rut_chileno_valido(rut_raw)):
-            filas_ignoradas += 1
-            logger.debug(f"Fila ignorada por RUT inválido: '{rut_raw}' (posible fila de totales de Talana)")
-            continue
-        
-        # Normalizar y formatear para guardar de forma consistente (8..9 + '-' + DV)
-        rut = formatear_rut_con_guion(normalizar_rut(rut_raw))
+    for idx, row in df_validas.iterrows():
+        rut = ruts[idx]
         if rut in vistos:
             # Evitar duplicados dentro del mismo archivo
             continue
@@ -239,22 +197,13 @@ def guardar_registros_nomina_util(libro):
     # El archivo puede traer headers duplicados; conservar solo el primero de cada uno
     headers = list(dict.fromkeys(headers))
 
-    primera_col = df.columns[0]
     count = 0
-    filas_ignoradas = 0
     
-    for _, row in df.iterrows():
-        if not str(row.get(primera_col, "")).strip():
-            continue
-        
-        # NUEVA VALIDACIÓN: Ignorar filas con RUT inválido (NaN, vacío, "total", etc.)
-        rut_raw = row.get(expected["rut_trabajador"])
-        if not (_es_rut_valido(rut_raw) and _es_rut_chileno_valido(rut_raw)):
-            filas_ignoradas += 1
-            logger.debug(f"Fila ignorada por RUT inválido: '{rut_raw}' (posible fila de totales de Talana)")
-            continue
-            
-        rut = formatear_rut_con_guion(normalizar_rut(rut_raw))
+    # Ignorar filas con RUT inválido (NaN, vacío, "total", etc.)
+    df_validas, ruts, filas_ignoradas = _filas_con_rut_valido(df, expected["rut_trabajador"])
+    
+    for idx, row in df_validas.iterrows():
+        rut = ruts[idx]
         empleado = EmpleadoCierre.objects.filter(
             cierre=libro.cierre, rut=rut
         ).first()
@@ -5,8 +5,12 @@ Esta versión divide el procesamiento en chunks paralelos para mejor rendimiento
 """
 
 import pandas as pd
+import json
 import logging
-import re
+import os
+import shutil
+import uuid
+from django.conf import settings
 from django.db import transaction
 from nomina.models import (
     ConceptoRemuneracion, 
@@ -14,68 +18,172 @@ from nomina.models import (
     EmpleadoCierre, 
     RegistroConceptoEmpleado
 )
-from .GenerarIncidencias import normalizar_rut, formatear_rut_con_guion
+from .rut import mascara_ruts_validos, validar_y_formatear_ruts
 
 logger = logging.getLogger(__name__)
 
+# Filas por bloque del libro ya parseado (un chunk lee solo los bloques que cubre)
+LIBRO_BLOQUE_FILAS = 1000
 
-def _es_rut_valido(valor_rut):
+# Filas por sentencia en los upserts de empleados y registros
+UPSERT_BATCH_SIZE = 1000
+
+
+def _directorio_libro_parseado(libro_id):
     """
-    Determina si un valor de RUT es válido para procesamiento.
-    Retorna False para valores NaN, vacíos, o palabras como "total" que usa Talana.
+    Directorio del libro ya parseado. Los chunks del chord corren en cualquier worker,
+    así que vive en el almacenamiento compartido de MEDIA_ROOT (donde ya está el Excel).
     """
-    if valor_rut is None:
-        return False
-    
-    # Verificar si es NaN de pandas
-    if pd.isna(valor_rut):
-        return False
-    
-    # Convertir a string y limpiar
-    rut_str = str(valor_rut).strip().lower()
-    
-    # Verificar si está vacío
-    if not rut_str:
-        return False
-    
-    # Verificar si es "nan" como string
-    if rut_str == "nan":
-        return False
-    
-    # Verificar palabras típicas de filas de totales que usa Talana
-    palabras_invalidas = [
-        "total", "totales", "suma", "sumatoria", 
-        "resumen", "consolidado", "subtotal"
-    ]
-    
-    if rut_str in palabras_invalidas:
-        return False
-    
-    return True
+    base = getattr(
+        settings,
+        'NOMINA_LIBRO_PARSEADO_DIR',
+        os.path.join(settings.MEDIA_ROOT, 'temp', 'nomina', 'libros_parseados')
+    )
+    return os.path.join(str(base), str(libro_id))
+
+
+def _huella_archivo(archivo_path):
+    """Identifica la versión del Excel: si cambia, el parseo previo se descarta"""
+    stat = os.stat(archivo_path)
+    return f"{os.path.basename(archivo_path)}:{stat.st_size}:{stat.st_mtime_ns}"
 
 
-def _es_rut_chileno_valido(valor_rut):
+def preparar_libro_parseado(libro):
     """
-    Valida que el RUT tenga estructura chilena tras normalizar:
-    - Solo dígitos + DV (0-9 o K)
-    - Largo entre 8 y 9 (7-8 dígitos + DV)
+    📦 Parsea el Excel del libro UNA vez y lo deja por bloques de filas en disco.
+
+    Los bloques se guardan con pickle de pandas para conservar los tipos de cada
+    celda (int/float/str mezclados en una misma columna), de los que depende la
+    normalización de montos en procesar_chunk_registros_util.
+
+    Args:
+        libro: LibroRemuneracionesUpload
+
+    Returns:
+        Dict: Metadatos {'huella', 'filas', 'columnas', 'bloque_filas', 'bloques'}
     """
+    directorio = _directorio_libro_parseado(libro.id)
+    huella = _huella_archivo(libro.archivo.path)
+    meta_path = os.path.join(directorio, 'meta.json')
+
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('huella') == huella:
+            return meta
+    except (OSError, ValueError):
+        pass
+
+    logger.info(f"📦 Parseando Excel del libro {libro.id} (una vez para todos los chunks)")
+    df = pd.read_excel(libro.archivo.path, engine="openpyxl")
+
+    temporal = f"{directorio}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(temporal)
     try:
-        rut_norm = normalizar_rut(valor_rut)
-        if not rut_norm or len(rut_norm) < 2:
-            return False
-        # 7-8 dígitos + DV (número total 8-9)
-        return re.match(r"^\d{7,8}[0-9K]$", rut_norm) is not None
-    except Exception:
-        return False
+        bloques = 0
+        for inicio in range(0, len(df), LIBRO_BLOQUE_FILAS):
+            df.iloc[inicio:inicio + LIBRO_BLOQUE_FILAS].to_pickle(
+                os.path.join(temporal, f"bloque_{bloques:05d}.pkl")
+            )
+            bloques += 1
+
+        meta = {
+            'huella': huella,
+            'filas': len(df),
+            'columnas': [str(c) for c in df.columns],
+            'bloque_filas': LIBRO_BLOQUE_FILAS,
+            'bloques': bloques,
+        }
+        with open(os.path.join(temporal, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
 
+        # Reemplazo atómico; si otro worker ya lo publicó, se usa el suyo
+        shutil.rmtree(directorio, ignore_errors=True)
+        try:
+            os.replace(temporal, directorio)
+        except OSError:
+            pass
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
 
-def dividir_dataframe_empleados(archivo_path, chunk_size):
+    logger.info(f"✅ Libro {libro.id} parseado: {meta['filas']} filas en {meta['bloques']} bloques")
+    return meta
+
+
+def leer_filas_libro(libro, indices=None):
+    """
+    📖 Lee filas del libro ya parseado, cargando solo los bloques necesarios.
+
+    Args:
+        libro: LibroRemuneracionesUpload
+        indices: Posiciones de fila a leer (default: todas)
+
+    Returns:
+        DataFrame: Filas pedidas con el mismo índice que en el Excel completo
+    """
+    meta = preparar_libro_parseado(libro)
+    directorio = _directorio_libro_parseado(libro.id)
+    bloque_filas = meta['bloque_filas']
+
+    if indices is None:
+        numeros = range(meta['bloques'])
+    else:
+        numeros = sorted({i // bloque_filas for i in indices})
+
+    partes = [
+        pd.read_pickle(os.path.join(directorio, f"bloque_{n:05d}.pkl"))
+        for n in numeros
+    ]
+    if not partes:
+        return pd.DataFrame(columns=meta['columnas'])
+
+    df = pd.concat(partes) if len(partes) > 1 else partes[0]
+    return df if indices is None else df.loc[list(indices)]
+
+
+def eliminar_libro_parseado(libro_id):
+    """🗑️ Elimina el parseo intermedio del libro una vez procesado"""
+    shutil.rmtree(_directorio_libro_parseado(libro_id), ignore_errors=True)
+
+
+def _normalizar_valor_registro(valor_raw):
+    """
+    Normaliza el valor de una celda de concepto para RegistroConceptoEmpleado.monto:
+    enteros sin decimales, decimales con hasta 2 posiciones y montos con formato
+    monetario ('$1,500') convertidos a número cuando es posible.
+    """
+    if pd.isna(valor_raw) or valor_raw == '':
+        return ""
+    
+    # Si es un número, preservar su precisión original
+    if isinstance(valor_raw, (int, float)):
+        if isinstance(valor_raw, int) or (isinstance(valor_raw, float) and valor_raw.is_integer()):
+            return str(int(valor_raw))
+        return f"{valor_raw:.2f}".rstrip('0').rstrip('.')
+    
+    # Para strings, limpiar y validar
+    valor = str(valor_raw).strip()
+    if valor.lower() == 'nan':
+        return ""
+    if valor:
+        # Intentar limpiar formato monetario si existe
+        valor_limpio = valor.replace('$', '').replace(',', '').replace('.', '').strip()
+        try:
+            numero = float(valor_limpio) if '.' in valor else int(valor_limpio)
+            if isinstance(numero, int) or numero.is_integer():
+                return str(int(numero))
+            return f"{numero:.2f}".rstrip('0').rstrip('.')
+        except (ValueError, TypeError):
+            pass
+    return valor
+
+
+def dividir_dataframe_empleados(libro, chunk_size):
     """
     🔀 Divide el DataFrame en chunks para procesamiento paralelo.
     
     Args:
-        archivo_path: Ruta al archivo Excel
+        libro: LibroRemuneracionesUpload (se lee desde su parseo intermedio)
         chunk_size: Tamaño de cada chunk
         
     Returns:
@@ -83,7 +191,7 @@ def dividir_dataframe_empleados(archivo_path, chunk_size):
     """
     logger.info(f"📊 Dividiendo DataFrame en chunks de tamaño {chunk_size}")
     
-    df = pd.read_excel(archivo_path, engine="openpyxl")
+    df = leer_filas_libro(libro)
     
     # Filtrar filas con RUT válido
     expected = {
@@ -93,20 +201,10 @@ def dividir_dataframe_empleados(archivo_path, chunk_size):
     if expected["rut_trabajador"] not in df.columns:
         raise ValueError(f"Falta columna {expected['rut_trabajador']} en el Excel")
     
-    # Pre-filtrar filas válidas
-    primera_col = df.columns[0]
-    filas_validas = []
-    
-    for idx, row in df.iterrows():
-        if not str(row.get(primera_col, "")).strip():
-            continue
-        
-        rut_raw = row.get(expected["rut_trabajador"])
-        # Filtro estricto: debe ser RUT chileno válido
-        if not (_es_rut_valido(rut_raw) and _es_rut_chileno_valido(rut_raw)):
-            continue
-            
-        filas_validas.append(idx)
+    # Pre-filtrar filas válidas en bloque (filtro estricto: RUT chileno válido)
+    con_datos = df[df.columns[0]].astype(str).str.strip() != ""
+    rut_valido = mascara_ruts_validos(df[expected["rut_trabajador"]])
+    filas_validas = df.index[con_datos & rut_valido].tolist()
     
     logger.info(f"✅ {len(filas_validas)} filas válidas de {len(df)} total")
     
@@ -145,7 +243,9 @@ def procesar_chunk_empleados_util(libro_id, chunk_data):
     
     try:
         libro = LibroRemuneracionesUpload.objects.get(id=libro_id)
-        df = pd.read_excel(libro.archivo.path, engine="openpyxl")
+        # Solo las filas de este chunk, desde el libro ya parseado
+        chunk_indices = chunk_data['indices']
+        df = leer_filas_libro(libro, chunk_indices)
         
         expected = {
             "ano": "Año",
@@ -162,45 +262,38 @@ def procesar_chunk_empleados_util(libro_id, chunk_data):
             raise ValueError(f"Faltan columnas en el Excel: {', '.join(missing)}")
         
         cierre = libro.cierre
-        count = 0
-        errores = []
         
-        # Procesar solo las filas de este chunk
-        chunk_indices = chunk_data['indices']
-        chunk_df = df.iloc[chunk_indices]
+        # Normalizar y formatear RUT en bloque; saltar filas cuyo RUT no es válido
+        # para evitar basura (p.ej. nombres de conceptos)
+        rut_valido, ruts = validar_y_formatear_ruts(df[expected["rut_trabajador"]])
+        df_validas = df[rut_valido]
         
+        # Un empleado por RUT: si se repite en el chunk gana la última fila
+        empleados = {}
+        for idx, row in df_validas.iterrows():
+            empleados[ruts[idx]] = EmpleadoCierre(
+                cierre=cierre,
+                rut=ruts[idx],
+                rut_empresa=str(row.get(expected["rut_empresa"], "")).strip(),
+                nombre=str(row.get(expected["nombre"], "")).strip(),
+                apellido_paterno=str(row.get(expected["ape_pat"], "")).strip(),
+                apellido_materno=str(row.get(expected["ape_mat"], "")).strip(),
+            )
+        
+        # Upsert en bloque por (cierre, rut)
         with transaction.atomic():
-            for _, row in chunk_df.iterrows():
-                try:
-                    # Normalizar y formatear RUT para guardar de forma consistente
-                    rut_valor = row.get(expected["rut_trabajador"])
-                    if not _es_rut_chileno_valido(rut_valor):
-                        # Saltar filas cuyo RUT no es válido para evitar basura (p.ej. nombres de conceptos)
-                        continue
-                    rut = formatear_rut_con_guion(normalizar_rut(rut_valor))
-                    defaults = {
-                        "rut_empresa": str(row.get(expected["rut_empresa"], "")).strip(),
-                        "nombre": str(row.get(expected["nombre"], "")).strip(),
-                        "apellido_paterno": str(row.get(expected["ape_pat"], "")).strip(),
-                        "apellido_materno": str(row.get(expected["ape_mat"], "")).strip(),
-                    }
-                    
-                    EmpleadoCierre.objects.update_or_create(
-                        cierre=cierre,
-                        rut=rut,
-                        defaults=defaults,
-                    )
-                    count += 1
-                    
-                except Exception as e:
-                    error_msg = f"Error procesando empleado RUT {rut}: {str(e)}"
-                    errores.append(error_msg)
-                    logger.error(error_msg)
+            EmpleadoCierre.objects.bulk_create(
+                list(empleados.values()),
+                batch_size=UPSERT_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['cierre', 'rut'],
+                update_fields=['rut_empresa', 'nombre', 'apellido_paterno', 'apellido_materno'],
+            )
+        count = len(df_validas)
         
         resultado = {
             'chunk_id': chunk_id,
             'empleados_procesados': count,
-            'errores': errores,
             'libro_id': libro_id
         }
         
@@ -234,7 +327,9 @@ def procesar_chunk_registros_util(libro_id, chunk_data):
     
     try:
         libro = LibroRemuneracionesUpload.objects.get(id=libro_id)
-        df = pd.read_excel(libro.archivo.path, engine="openpyxl")
+        # Solo las filas de este chunk, desde el libro ya parseado
+        chunk_indices = chunk_data['indices']
+        df = leer_filas_libro(libro, chunk_indices)
         
         expected = {
             "ano": "Año",
@@ -258,93 +353,63 @@ def procesar_chunk_registros_util(libro_id, chunk_data):
             headers = [h for h in df.columns if h not in empleado_cols]
         
         # 🔍 DEBUG LOGGING AGREGADO
-        chunk_indices = chunk_data['indices']
         logger.info(f"🔍 [DEBUG Chunk {chunk_id}] Total indices recibidos: {len(chunk_indices)}")
         logger.info(f"🔍 [DEBUG Chunk {chunk_id}] Primeros 3 indices: {chunk_indices[:3] if chunk_indices else 'VACÍO'}")
         logger.info(f"🔍 [DEBUG Chunk {chunk_id}] Total headers: {len(headers)}")
         logger.info(f"🔍 [DEBUG Chunk {chunk_id}] DataFrame shape: {df.shape}")
         
-        count = 0
-        errores = []
+        # Mismo criterio de normalización que al crear EmpleadoCierre; sin RUT
+        # válido no hay empleado que buscar
+        rut_valido, ruts = validar_y_formatear_ruts(df[expected["rut_trabajador"]])
+        df_validas = df[rut_valido]
         
-        # Procesar solo las filas de este chunk
-        chunk_df = df.iloc[chunk_indices]
-        logger.info(f"🔍 [DEBUG Chunk {chunk_id}] chunk_df shape: {chunk_df.shape}")
+        # Una consulta para los empleados del chunk y otra para los conceptos vigentes
+        empleado_por_rut = dict(
+            EmpleadoCierre.objects.filter(
+                cierre=libro.cierre, rut__in=set(ruts[df_validas.index])
+            ).values_list('rut', 'id')
+        )
+        concepto_por_nombre = {}
+        for concepto_id, nombre in (
+            ConceptoRemuneracion.objects
+            .filter(cliente=libro.cierre.cliente, nombre_concepto__in=headers, vigente=True)
+            .order_by('id')
+            .values_list('id', 'nombre_concepto')
+        ):
+            concepto_por_nombre.setdefault(nombre, concepto_id)
         
+        # Un registro por (empleado, header): si se repite gana el último valor
+        registros = {}
+        count = 0
+        for idx, row in df_validas.iterrows():
+            rut = ruts[idx]
+            empleado_id = empleado_por_rut.get(rut)
+            if not empleado_id:
+                continue
+            
+            for h in headers:
+                registros[(empleado_id, h)] = RegistroConceptoEmpleado(
+                    empleado_id=empleado_id,
+                    nombre_concepto_original=h,
+                    monto=_normalizar_valor_registro(row.get(h)),
+                    concepto_id=concepto_por_nombre.get(h),
+                )
+            
+            count += 1
+        
+        # Upsert en bloque por (empleado, nombre_concepto_original)
         with transaction.atomic():
-            for _, row in chunk_df.iterrows():
-                try:
-                    # Usar el mismo criterio de normalización que al crear EmpleadoCierre
-                    rut_valor = row.get(expected["rut_trabajador"])
-                    if not _es_rut_chileno_valido(rut_valor):
-                        # Si el RUT no es válido, no hay empleado que buscar
-                        continue
-                    rut = formatear_rut_con_guion(normalizar_rut(rut_valor))
-                    empleado = EmpleadoCierre.objects.filter(
-                        cierre=libro.cierre, rut=rut
-                    ).first()
-                    
-                    if not empleado:
-                        continue
-                    
-                    # Procesar todos los headers para este empleado
-                    for h in headers:
-                        try:
-                            valor_raw = row.get(h)
-                            
-                            # Procesamiento mejorado de valores
-                            if pd.isna(valor_raw) or valor_raw == '':
-                                valor = ""
-                            else:
-                                # Si es un número, preservar su precisión original
-                                if isinstance(valor_raw, (int, float)):
-                                    if isinstance(valor_raw, int) or (isinstance(valor_raw, float) and valor_raw.is_integer()):
-                                        valor = str(int(valor_raw))
-                                    else:
-                                        valor = f"{valor_raw:.2f}".rstrip('0').rstrip('.')
-                                else:
-                                    # Para strings, limpiar y validar
-                                    valor = str(valor_raw).strip()
-                                    if valor.lower() == 'nan':
-                                        valor = ""
-                                    elif valor:
-                                        # Intentar limpiar formato monetario si existe
-                                        valor_limpio = valor.replace('$', '').replace(',', '').replace('.', '').strip()
-                                        try:
-                                            numero = float(valor_limpio) if '.' in valor else int(valor_limpio)
-                                            if isinstance(numero, int) or numero.is_integer():
-                                                valor = str(int(numero))
-                                            else:
-                                                valor = f"{numero:.2f}".rstrip('0').rstrip('.')
-                                        except (ValueError, TypeError):
-                                            pass
-                            
-                            concepto = ConceptoRemuneracion.objects.filter(
-                                cliente=libro.cierre.cliente, nombre_concepto=h, vigente=True
-                            ).first()
-                            
-                            RegistroConceptoEmpleado.objects.update_or_create(
-                                empleado=empleado,
-                                nombre_concepto_original=h,
-                                defaults={"monto": valor, "concepto": concepto},
-                            )
-                            
-                        except Exception as concepto_error:
-                            error_msg = f"Error en concepto '{h}' para RUT {rut}: {str(concepto_error)}"
-                            errores.append(error_msg)
-                            logger.error(error_msg)
-                    
-                    count += 1
-                    
-                except Exception as e:
-                    error_msg = f"Error procesando registros para RUT {rut}: {str(e)}"
-                    errores.append(error_msg)
-                    logger.error(error_msg)
+            RegistroConceptoEmpleado.objects.bulk_create(
+                list(registros.values()),
+                batch_size=UPSERT_BATCH_SIZE,
+                update_conflicts=True,
+                unique_fields=['empleado', 'nombre_concepto_original'],
+                update_fields=['monto', 'concepto'],
+            )
         
         resultado = {
             'chunk_id': chunk_id,
             'registros_procesados': count,
-            'errores': errores,
             'libro_id': libro_id
         }
         
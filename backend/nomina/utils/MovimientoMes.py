@@ -13,6 +13,7 @@ from ..models import (
     MovimientoVariacionContrato,
     EmpleadoCierre,
 )
+from .rut import formatear_rut_con_guion
 
 logger = logging.getLogger(__name__)
 
@@ -118,13 +119,7 @@ def limpiar_rut(rut: str) -> str:
     if pd.isna(rut) or rut is None:
         return ""
     
-    rut_str = str(rut).strip().replace(".", "").replace("-", "").upper()
-    # Asegurar que el dígito verificador esté separado
-    if len(rut_str) > 1 and rut_str[-1].isalpha():
-        return f"{rut_str[:-1]}-{rut_str[-1]}"
-    elif len(rut_str) > 1:
-        return f"{rut_str[:-1]}-{rut_str[-1]}"
-    return rut_str
+    return formatear_rut_con_guion(rut)
 
 def convertir_fecha(fecha_valor: Any) -> Any:
     """Convierte un valor a fecha, manejando diferentes formatos"""
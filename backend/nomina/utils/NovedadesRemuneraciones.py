@@ -7,10 +7,26 @@ from nomina.models import (
     EmpleadoCierreNovedades, 
     RegistroConceptoEmpleadoNovedades
 )
-from .LibroRemuneraciones import _es_rut_valido
+from .rut import mascara_ruts_validos
 
 logger = logging.getLogger(__name__)
 
+def _filas_con_rut_valido(df, rut_col):
+    """
+    Filtra en bloque las filas de empleados: primera columna no vacía y RUT
+    procesable (descarta NaN, vacíos y filas de totales de Talana).
+
+    Returns:
+        (DataFrame, int): filas válidas y cantidad de filas ignoradas por RUT inválido
+    """
+    con_datos = df[df.columns[0]].astype(str).str.strip() != ""
+    rut_valido = mascara_ruts_validos(df[rut_col], estructura_chilena=False)
+    ignoradas = con_datos & ~rut_valido
+    if ignoradas.any():
+        logger.debug(f"Filas ignoradas por RUT inválido en novedades: {df.loc[ignoradas, rut_col].tolist()[:20]} (posibles totales de Talana)")
+    return df[con_datos & rut_valido], int(ignoradas.sum())
+
+
 def _normalizar_monto_peso(valor_raw):
     """Normaliza un valor numérico a pesos (entero) con redondeo HALF_UP.
     Retorna string con entero si es numérico; en caso contrario retorna None.
@@ -184,22 +200,13 @@ def actualizar_empleados_desde_novedades(archivo_novedades):
     rut_col, nombre_col, apellido_pat_col, apellido_mat_col = columnas_empleado
 
     cierre = archivo_novedades.cierre
-    primera_col = df.columns[0]
     count = 0
-    filas_ignoradas = 0
     
-    for _, row in df.iterrows():
-        if not str(row.get(primera_col, "")).strip():
-            continue
-        
-        # NUEVA VALIDACIÓN: Ignorar filas con RUT inválido (NaN, vacío, "total", etc.)
-        rut_raw = row.get(rut_col)
-        if not _es_rut_valido(rut_raw):
-            filas_ignoradas += 1
-            logger.debug(f"Fila ignorada por RUT inválido en novedades: '{rut_raw}' (posible fila de totales de Talana)")
-            continue
-        
-        rut = str(rut_raw).strip()
+    # Ignorar filas con RUT inválido (NaN, vacío, "total", etc.)
+    df_validas, filas_ignoradas = _filas_con_rut_valido(df, rut_col)
+    
+    for _, row in df_validas.iterrows():
+        rut = str(row.get(rut_col)).strip()
         defaults = {
             "nombre": str(row.get(nombre_col, "")).strip(),
             "apellido_paterno": str(row.get(apellido_pat_col, "")).strip(),
@@ -243,22 +250,13 @@ def guardar_registros_novedades(archivo_novedades):
     if not headers:
         headers = list(df.columns[4:])  # Todas las columnas después de las primeras 4
 
-    primera_col = df.columns[0]
     count = 0
-    filas_ignoradas = 0
     
-    for _, row in df.iterrows():
-        if not str(row.get(primera_col, "")).strip():
-            continue
-            
-        # NUEVA VALIDACIÓN: Ignorar filas con RUT inválido (NaN, vacío, "total", etc.)
-        rut_raw = row.get(rut_col)
-        if not _es_rut_valido(rut_raw):
-            filas_ignoradas += 1
-            logger.debug(f"Fila ignorada por RUT inválido en novedades: '{rut_raw}' (posible fila de totales de Talana)")
-            continue
-            
-        rut = str(rut_raw).strip()
+    # Ignorar filas con RUT inválido (NaN, vacío, "total", etc.)
+    df_validas, filas_ignoradas = _filas_con_rut_valido(df, rut_col)
+    
+    for _, row in df_validas.iterrows():
+        rut = str(row.get(rut_col)).strip()
         empleado = EmpleadoCierreNovedades.objects.filter(
             cierre=archivo_novedades.cierre, rut=rut
         ).first()
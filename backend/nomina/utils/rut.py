@@ -0,0 +1,327 @@
+"""
+🆔 rut.py
+Normalización, validación y formato de RUT chileno compartidos por los flujos
+de ingesta de nómina (libro, novedades, movimientos, archivos del analista).
+
+Cada operación existe en versión escalar (un valor) y vectorizada (una columna
+completa de pandas), con el mismo criterio en ambas.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# Palabras típicas de filas de totales que usa Talana en la columna de RUT
+PALABRAS_NO_RUT = frozenset({
+    "total", "totales", "suma", "sumatoria",
+    "resumen", "consolidado", "subtotal",
+})
+
+# 7-8 dígitos + DV (largo total 8-9) tras normalizar
+RUT_CHILENO_RE = r"^\d{7,8}[0-9K]$"
+
+_SEPARADORES_RE = r"[.\-\s]"
+
+# Factores del módulo 11, aplicados desde el dígito menos significativo
+_FACTORES_DV = (2, 3, 4, 5, 6, 7)
+
+
+# ==============================================================================
+# VERSIONES ESCALARES
+# ==============================================================================
+
+def normalizar_rut(rut):
+    """
+    Normaliza RUT para comparaciones removiendo puntos, guiones y espacios
+    Ejemplos:
+    - '12.345.678-9' -> '123456789'
+    - '12345678-9' -> '123456789'
+    - ' 12.345.678-9 ' -> '123456789'
+    """
+    if not rut:
+        return ""
+
+    # Remover puntos, guiones, espacios y pasar a mayúsculas (DV 'k')
+    return re.sub(_SEPARADORES_RE, '', str(rut).strip()).upper()
+
+
+def formatear_rut_con_guion(rut):
+    """
+    Formatea RUT agregando guión antes del dígito verificador
+    Ejemplos:
+    - '123456789' -> '12345678-9'
+    - '12345678K' -> '12345678-K'
+    - '12.345.678-9' -> '12345678-9' (primero normaliza, luego formatea)
+    """
+    if not rut:
+        return ""
+
+    rut_limpio = normalizar_rut(rut)
+
+    # Se necesita al menos número + dígito verificador
+    if len(rut_limpio) < 2:
+        return rut_limpio
+
+    return f"{rut_limpio[:-1]}-{rut_limpio[-1]}"
+
+
+def ruts_son_equivalentes(rut1, rut2):
+    """Compara si dos RUTs son equivalentes después de normalización"""
+    return normalizar_rut(rut1) == normalizar_rut(rut2)
+
+
+def es_rut_valido(valor_rut):
+    """
+    Determina si un valor de RUT es válido para procesamiento.
+    Retorna False para valores NaN, vacíos, o palabras como "total" que usa Talana.
+    """
+    if valor_rut is None or pd.isna(valor_rut):
+        return False
+
+    rut_str = str(valor_rut).strip().lower()
+    return bool(rut_str) and rut_str != "nan" and rut_str not in PALABRAS_NO_RUT
+
+
+def es_rut_chileno_valido(valor_rut):
+    """
+    Valida que el RUT tenga estructura chilena tras normalizar:
+    - Solo dígitos + DV (0-9 o K)
+    - Largo entre 8 y 9 (7-8 dígitos + DV)
+    """
+    try:
+        return re.match(RUT_CHILENO_RE, normalizar_rut(valor_rut)) is not None
+    except Exception:
+        return False
+
+
+def calcular_dv(numero):
+    """Calcula el dígito verificador (módulo 11) del cuerpo numérico de un RUT"""
+    numero = int(numero)
+    suma = 0
+    i = 0
+    while numero:
+        suma += (numero % 10) * _FACTORES_DV[i % len(_FACTORES_DV)]
+        numero //= 10
+        i += 1
+    resto = 11 - suma % 11
+    return {11: '0', 10: 'K'}.get(resto, str(resto))
+
+
+# ==============================================================================
+# VERSIONES VECTORIZADAS (COLUMNAS COMPLETAS)
+# ==============================================================================
+#
+# La columna se convierte a una matriz NumPy de códigos Unicode (una fila por
+# RUT) y se normaliza con operaciones sobre la matriz completa. Las filas con
+# caracteres no ASCII, donde \s y \d de Python abarcan más que los códigos
+# ASCII, se resuelven con la versión escalar para mantener el mismo resultado.
+
+# Textos más largos que esto no son RUT: se resuelven por fila sin ensanchar la matriz
+_ANCHO_MAXIMO = 32
+
+
+def _como_serie(serie):
+    if isinstance(serie, pd.Series):
+        return serie
+    return pd.Series(list(serie), dtype=object)
+
+
+def _textos(serie):
+    """Texto de cada valor como lo vería str(rut); vacío donde `not rut`"""
+    vacio = serie.isna() | (serie == 0) | (serie == "")
+    return serie.where(~vacio, "").astype(str).to_numpy(), vacio.to_numpy()
+
+
+def _normalizar_matriz(textos):
+    """
+    Quita puntos, guiones y espacios y pasa a mayúsculas una columna de textos.
+
+    Returns:
+        (matriz, largo, por_fila): códigos normalizados compactados a la izquierda
+        (n, ancho), largo normalizado de cada fila y máscara de filas que deben
+        resolverse con la versión escalar
+    """
+    arreglo = np.asarray(textos).astype(str)
+    por_fila = np.zeros(len(arreglo), dtype=bool)
+    if arreglo.dtype.itemsize // 4 > _ANCHO_MAXIMO:
+        por_fila = np.char.str_len(arreglo) > _ANCHO_MAXIMO
+        arreglo = np.where(por_fila, "", arreglo).astype(f"U{_ANCHO_MAXIMO}")
+    arreglo = arreglo.astype(f"U{max(arreglo.dtype.itemsize // 4, 1)}")
+
+    codigos = arreglo.view(np.uint32).reshape(len(arreglo), -1)
+    por_fila |= ((codigos > 127) | ((codigos >= 28) & (codigos <= 31))).any(axis=1)
+
+    conservar = (
+        (codigos != 0) & (codigos != 32) & (codigos != 46) & (codigos != 45)
+        & ((codigos < 9) | (codigos > 13))
+    )
+    largo = conservar.sum(axis=1)
+    filas, columnas = np.nonzero(conservar)
+    destino = np.cumsum(conservar, axis=1)[filas, columnas] - 1
+    valores = codigos[filas, columnas]
+
+    matriz = np.zeros_like(codigos)
+    matriz[filas, destino] = np.where((valores >= 97) & (valores <= 122), valores - 32, valores)
+    return matriz, largo, por_fila
+
+
+def _matriz_a_textos(matriz, largo, con_guion):
+    """Convierte la matriz normalizada a lista de str, opcionalmente con guión antes del DV"""
+    if con_guion:
+        salida = np.zeros((matriz.shape[0], matriz.shape[1] + 1), dtype=np.uint32)
+        salida[:, :-1] = matriz
+        filas = np.nonzero(largo >= 2)[0]
+        salida[filas, largo[filas]] = matriz[filas, largo[filas] - 1]
+        salida[filas, largo[filas] - 1] = ord('-')
+    else:
+        salida = np.ascontiguousarray(matriz)
+    return salida.view(f"U{salida.shape[1]}").ravel().tolist()
+
+
+def _estructura_chilena(matriz, largo):
+    """Equivalente de RUT_CHILENO_RE sobre la matriz normalizada"""
+    posiciones = np.arange(matriz.shape[1])
+    es_digito = (matriz >= 48) & (matriz <= 57)
+    cuerpo = posiciones < (largo - 1)[:, None]
+    dv = matriz[np.arange(len(matriz)), np.maximum(largo - 1, 0)]
+    return (
+        (largo >= 8) & (largo <= 9)
+        & ((es_digito & cuerpo).sum(axis=1) == largo - 1)
+        & (((dv >= 48) & (dv <= 57)) | (dv == ord('K')))
+    )
+
+
+def _normalizar_columna(serie, con_guion):
+    serie = _como_serie(serie)
+    if serie.empty:
+        return pd.Series([], index=serie.index, dtype=object)
+
+    textos, _ = _textos(serie)
+    matriz, largo, por_fila = _normalizar_matriz(textos)
+    resultado = _matriz_a_textos(matriz, largo, con_guion)
+
+    escalar = formatear_rut_con_guion if con_guion else normalizar_rut
+    for i in np.nonzero(por_fila)[0]:
+        resultado[i] = escalar(textos[i])
+    return pd.Series(resultado, index=serie.index, dtype=object)
+
+
+def normalizar_ruts(serie):
+    """
+    Normaliza una columna de RUTs (ver normalizar_rut).
+
+    Los valores nulos (None/NaN) quedan como cadena vacía.
+    """
+    return _normalizar_columna(serie, con_guion=False)
+
+
+def formatear_ruts_con_guion(serie):
+    """Formatea una columna de RUTs como 'NUMERO-DV' (ver formatear_rut_con_guion)"""
+    return _normalizar_columna(serie, con_guion=True)
+
+
+def mascara_ruts_validos(serie, estructura_chilena=True):
+    """
+    Máscara booleana de filas con RUT procesable.
+
+    Args:
+        serie: Columna con los RUT tal como vienen del archivo
+        estructura_chilena: Exigir además 7-8 dígitos + DV (es_rut_chileno_valido)
+
+    Returns:
+        Series[bool]: Mismo índice que la serie de entrada
+    """
+    serie = _como_serie(serie)
+    if serie.empty:
+        return pd.Series([], index=serie.index, dtype=bool)
+
+    if not estructura_chilena:
+        texto = serie.where(serie.notna(), "").astype(str).str.strip().str.lower()
+        return serie.notna() & (texto != "") & (texto != "nan") & ~texto.isin(PALABRAS_NO_RUT)
+
+    # Vacíos, "nan" y filas de totales nunca cumplen la estructura chilena
+    textos, vacio = _textos(serie)
+    matriz, largo, por_fila = _normalizar_matriz(textos)
+    validos = _estructura_chilena(matriz, largo) & ~vacio
+    for i in np.nonzero(por_fila)[0]:
+        validos[i] = es_rut_chileno_valido(textos[i])
+    return pd.Series(validos, index=serie.index)
+
+
+def validar_y_formatear_ruts(serie):
+    """
+    Valida (estructura chilena) y formatea una columna de RUTs en una sola pasada.
+
+    Equivale a mascara_ruts_validos(serie) y formatear_ruts_con_guion(serie) juntos,
+    normalizando la columna una sola vez.
+
+    Returns:
+        (Series[bool], Series[str]): máscara de RUT válidos y RUT formateados
+    """
+    serie = _como_serie(serie)
+    if serie.empty:
+        return (
+            pd.Series([], index=serie.index, dtype=bool),
+            pd.Series([], index=serie.index, dtype=object),
+        )
+
+    textos, vacio = _textos(serie)
+    matriz, largo, por_fila = _normalizar_matriz(textos)
+    validos = _estructura_chilena(matriz, largo) & ~vacio
+    formateados = _matriz_a_textos(matriz, largo, con_guion=True)
+    for i in np.nonzero(por_fila)[0]:
+        validos[i] = es_rut_chileno_valido(textos[i])
+        formateados[i] = formatear_rut_con_guion(textos[i])
+    return (
+        pd.Series(validos, index=serie.index),
+        pd.Series(formateados, index=serie.index, dtype=object),
+    )
+
+
+def _dv_desde_suma(suma):
+    resto = 11 - suma % 11
+    return np.where(resto == 11, '0', np.where(resto == 10, 'K', resto.astype(str)))
+
+
+def calcular_dv_vectorizado(numeros):
+    """
+    Calcula el dígito verificador de un arreglo de cuerpos numéricos de RUT.
+
+    Args:
+        numeros: Iterable de enteros (sin DV)
+
+    Returns:
+        np.ndarray[str]: '0'-'9' o 'K' por elemento
+    """
+    restantes = np.asarray(numeros, dtype=np.int64).copy()
+    suma = np.zeros_like(restantes)
+    # Un RUT tiene a lo más 9 dígitos de cuerpo; los ceros extra no suman
+    for i in range(9):
+        suma += (restantes % 10) * _FACTORES_DV[i % len(_FACTORES_DV)]
+        restantes //= 10
+    return _dv_desde_suma(suma)
+
+
+def mascara_dv_correcto(serie):
+    """Máscara de RUTs con estructura chilena y dígito verificador correcto"""
+    serie = _como_serie(serie)
+    if serie.empty:
+        return pd.Series([], index=serie.index, dtype=bool)
+
+    textos, vacio = _textos(serie)
+    matriz, largo, por_fila = _normalizar_matriz(textos)
+    estructura = _estructura_chilena(matriz, largo) & ~vacio
+
+    # Factor de cada dígito del cuerpo según su distancia al DV
+    distancia = (largo - 2)[:, None] - np.arange(matriz.shape[1])
+    factores = np.asarray(_FACTORES_DV)[distancia % len(_FACTORES_DV)]
+    digitos = np.where(distancia >= 0, matriz.astype(np.int64) - 48, 0)
+    esperado = _dv_desde_suma((digitos * factores).sum(axis=1))
+    dv = matriz[np.arange(len(matriz)), np.maximum(largo - 1, 0)].view('U1')
+
+    correctos = estructura & (dv == esperado)
+    for i in np.nonzero(por_fila)[0]:
+        rut = normalizar_rut(textos[i])
+        correctos[i] = es_rut_chileno_valido(rut) and calcular_dv(rut[:-1]) == rut[-1]
+    return pd.Series(correctos, index=serie.index)
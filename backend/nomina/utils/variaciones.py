@@ -0,0 +1,203 @@
+# backend/nomina/utils/variaciones.py
+"""
+Análisis vectorizado de variaciones de conceptos entre dos cierres.
+
+Los montos de ambos períodos se llevan a matrices (empleado × concepto) en centavos
+enteros, que la base de datos entrega ya convertidos (sin pasar por Decimal): las
+sumas son exactas y el umbral se evalúa por multiplicación cruzada
+(|actual - anterior| · 100 ≥ umbral · |anterior|), sin divisiones en el borde.
+Solo las celdas que superan el umbral se devuelven, para materializar incidencias
+únicamente sobre ellas.
+"""
+
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+from django.db.models import BigIntegerField, Sum
+from django.db.models.functions import Cast, Round
+
+from ..models import ConceptoConsolidado
+
+COLUMNAS_MONTOS = ['rut_empleado', 'nombre_concepto', 'tipo_concepto', 'centavos']
+COLUMNAS_TOTALES = ['nombre_concepto', 'tipo_concepto', 'centavos']
+
+
+def _en_centavos(expresion):
+    return Cast(Round(expresion * 100), output_field=BigIntegerField())
+
+
+def cargar_totales_conceptos(cierre_id):
+    """Suma total por ítem (nombre_concepto, tipo_concepto) del cierre (una consulta agrupada)"""
+    filas = (
+        ConceptoConsolidado.objects
+        .filter(nomina_consolidada__cierre_id=cierre_id)
+        .order_by()
+        .values('nombre_concepto', 'tipo_concepto')
+        .annotate(centavos=_en_centavos(Sum('monto_total')))
+        .values_list('nombre_concepto', 'tipo_concepto', 'centavos')
+    )
+    return pd.DataFrame.from_records(list(filas), columns=COLUMNAS_TOTALES)
+
+
+def a_centavos(montos):
+    """Decimal/float/None → int64 en centavos (monto_total tiene 2 decimales)"""
+    valores = pd.Series(montos, dtype=object).fillna(0).to_numpy(dtype=np.float64)
+    return np.rint(valores * 100).astype(np.int64)
+
+
+def desde_centavos(centavos):
+    """int en centavos → Decimal con 2 decimales, como lo entrega el ORM"""
+    return Decimal(int(centavos)).scaleb(-2)
+
+
+def calcular_variacion_porcentual_vectorizada(actual, anterior):
+    """Misma regla que calcular_variacion_porcentual, sobre arreglos"""
+    actual = np.asarray(actual, dtype=np.float64)
+    anterior = np.asarray(anterior, dtype=np.float64)
+    resultado = np.where(actual > 0, 100.0, 0.0)
+    np.divide((actual - anterior) * 100.0, anterior, out=resultado, where=anterior != 0)
+    return resultado
+
+
+def supera_umbral(actual_centavos, anterior_centavos, umbral):
+    """|variación%| ≥ umbral evaluado en enteros; umbral puede ser escalar o arreglo"""
+    actual_centavos = np.asarray(actual_centavos, dtype=np.int64)
+    anterior_centavos = np.asarray(anterior_centavos, dtype=np.int64)
+    umbral = np.asarray(umbral, dtype=np.float64)
+    con_base = np.abs(actual_centavos - anterior_centavos) * 100 >= umbral * np.abs(anterior_centavos)
+    sin_base = np.where(actual_centavos > 0, 100.0, 0.0) >= umbral
+    return np.where(anterior_centavos != 0, con_base, sin_base)
+
+
+def _factorizar_conceptos(nombres, tipos):
+    """Códigos de ítem (nombre_concepto, tipo_concepto); tipo None es un valor válido"""
+    codigos_nombre, nombres_unicos = pd.factorize(np.asarray(nombres, dtype=object))
+    codigos_tipo, tipos_unicos = pd.factorize(np.asarray(tipos, dtype=object), use_na_sentinel=False)
+    combinados, unicos = pd.factorize(codigos_nombre.astype(np.int64) * len(tipos_unicos) + codigos_tipo)
+    return (
+        combinados,
+        np.asarray(nombres_unicos, dtype=object)[unicos // len(tipos_unicos)],
+        np.asarray(tipos_unicos, dtype=object)[unicos % len(tipos_unicos)],
+    )
+
+
+def construir_matrices(montos_actual, montos_anterior):
+    """
+    Alinea ambos períodos en matrices (empleado × concepto) sobre la unión de RUTs e ítems.
+
+    Args:
+        montos_actual, montos_anterior: DataFrames con COLUMNAS_MONTOS (montos en centavos)
+
+    Returns:
+        dict con ruts, nombres, tipos (ejes), actual/anterior (int64 centavos, suma si
+        un ítem se repite) y presente_actual/presente_anterior (bool)
+    """
+    n_actual = len(montos_actual)
+    unidos = pd.concat([montos_actual, montos_anterior], ignore_index=True)
+    codigos_rut, ruts = pd.factorize(unidos['rut_empleado'].to_numpy(dtype=object))
+    codigos_concepto, nombres, tipos = _factorizar_conceptos(
+        unidos['nombre_concepto'].to_numpy(), unidos['tipo_concepto'].to_numpy()
+    )
+    centavos = unidos['centavos'].to_numpy(dtype=np.int64)
+
+    forma = (len(ruts), len(nombres))
+    celdas = forma[0] * forma[1]
+    plano = codigos_rut.astype(np.int64) * forma[1] + codigos_concepto
+
+    def _matriz(desde, hasta):
+        indice = plano[desde:hasta]
+        montos = np.bincount(indice, weights=centavos[desde:hasta], minlength=celdas)
+        presencia = np.bincount(indice, minlength=celdas) > 0
+        return np.rint(montos).astype(np.int64).reshape(forma), presencia.reshape(forma)
+
+    actual, presente_actual = _matriz(0, n_actual)
+    anterior, presente_anterior = _matriz(n_actual, len(unidos))
+    return {
+        'ruts': np.asarray(ruts, dtype=object),
+        'nombres': nombres,
+        'tipos': tipos,
+        'actual': actual,
+        'anterior': anterior,
+        'presente_actual': presente_actual,
+        'presente_anterior': presente_anterior,
+    }
+
+
+def detectar_variaciones_individuales(matrices, obtener_umbral, ruts_comparables=None):
+    """
+    Celdas (empleado, concepto) cuya variación supera el umbral de su tipo de concepto.
+
+    Un concepto ausente en un período cuenta como 0 (mismo criterio que la comparación
+    por empleado); solo se comparan empleados presentes en ambos períodos.
+
+    Args:
+        matrices: Resultado de construir_matrices
+        obtener_umbral: función tipo_concepto → umbral porcentual
+        ruts_comparables: RUTs presentes en ambos cierres. Por defecto, los que
+            tienen algún concepto en ambos
+
+    Returns:
+        tuple(DataFrame, int): celdas marcadas (rut_empleado, nombre_concepto, tipo_concepto,
+        monto_actual, monto_anterior en centavos, variacion_pct, hallazgo) y cantidad de
+        celdas comparadas. hallazgo es 'variacion', 'concepto_nuevo' o 'concepto_eliminado'
+    """
+    presente_actual, presente_anterior = matrices['presente_actual'], matrices['presente_anterior']
+    if ruts_comparables is None:
+        filas = presente_actual.any(axis=1) & presente_anterior.any(axis=1)
+    else:
+        filas = np.isin(matrices['ruts'], list(ruts_comparables))
+
+    umbrales = {tipo: obtener_umbral(tipo) for tipo in pd.unique(matrices['tipos'])}
+    umbral_columna = np.array([umbrales[tipo] for tipo in matrices['tipos']], dtype=np.float64)
+
+    comparadas = (presente_actual | presente_anterior) & filas[:, None]
+    marcadas = comparadas & supera_umbral(matrices['actual'], matrices['anterior'], umbral_columna[None, :])
+
+    fila, columna = np.nonzero(marcadas)
+    actual = matrices['actual'][fila, columna]
+    anterior = matrices['anterior'][fila, columna]
+    hallazgo = np.where(
+        ~presente_anterior[fila, columna], 'concepto_nuevo',
+        np.where(~presente_actual[fila, columna], 'concepto_eliminado', 'variacion')
+    )
+    celdas = pd.DataFrame({
+        'rut_empleado': matrices['ruts'][fila],
+        'nombre_concepto': matrices['nombres'][columna],
+        'tipo_concepto': matrices['tipos'][columna],
+        'monto_actual': actual,
+        'monto_anterior': anterior,
+        'variacion_pct': calcular_variacion_porcentual_vectorizada(actual, anterior),
+        'hallazgo': hallazgo,
+    })
+    return celdas, int(comparadas.sum())
+
+
+def comparar_totales_conceptos(totales_actual, totales_anterior, umbral):
+    """
+    Compara la suma total de cada ítem entre períodos.
+
+    Args:
+        totales_actual, totales_anterior: DataFrames con COLUMNAS_TOTALES (montos en centavos)
+        umbral: umbral porcentual
+
+    Returns:
+        DataFrame por ítem (unión de ambos períodos) con nombre_concepto, tipo_concepto,
+        suma_actual, suma_anterior (centavos), variacion_pct y supera_umbral
+    """
+    n_actual = len(totales_actual)
+    unidos = pd.concat([totales_actual, totales_anterior], ignore_index=True)
+    codigos, nombres, tipos = _factorizar_conceptos(
+        unidos['nombre_concepto'].to_numpy(), unidos['tipo_concepto'].to_numpy()
+    )
+    centavos = unidos['centavos'].to_numpy(dtype=np.int64)
+    suma_actual = np.rint(np.bincount(codigos[:n_actual], weights=centavos[:n_actual], minlength=len(nombres))).astype(np.int64)
+    suma_anterior = np.rint(np.bincount(codigos[n_actual:], weights=centavos[n_actual:], minlength=len(nombres))).astype(np.int64)
+    return pd.DataFrame({
+        'nombre_concepto': nombres,
+        'tipo_concepto': tipos,
+        'suma_actual': suma_actual,
+        'suma_anterior': suma_anterior,
+        'variacion_pct': calcular_variacion_porcentual_vectorizada(suma_actual, suma_anterior),
+        'supera_umbral': supera_umbral(suma_actual, suma_anterior, umbral),
+    })
@@ -41,7 +41,7 @@ def libro_preview_cached(request, cierre_id: int):
     cache_key = f"{cierre_id}_cache_libro"
     
     # Intentar desde cache
-    cached_data = cache.redis_client.get(cache_key)
+    cached_data = cache.redis_bin.get(cache_key)
     if cached_data:
         try:
             data = cache._deserialize_data(cached_data)
@@ -107,7 +107,7 @@ def movimientos_preview_cached(request, cierre_id: int):
     cache_key = f"{cierre_id}_cache_mov"
     
     # Intentar desde cache
-    cached_data = cache.redis_client.get(cache_key)
+    cached_data = cache.redis_bin.get(cache_key)
     if cached_data:
         try:
             data = cache._deserialize_data(cached_data)
@@ -177,7 +177,7 @@ def reporte_oficial_cached(request, cierre_id: int):
     cache_key = f"{cierre_id}_informe_oficial"
     
     # Intentar desde cache
-    cached_data = cache.redis_client.get(cache_key)
+    cached_data = cache.redis_bin.get(cache_key)
     if cached_data:
         try:
             data = cache._deserialize_data(cached_data)
@@ -173,6 +173,17 @@ _cache_opts = {
 
 CACHES["default"]["KEY_PREFIX"] = "sgm_backend"
 
+# Cache SGM (contabilidad/nómina): formato de los payloads en Redis
+# json | json-zlib | msgpack | msgpack-zlib
+SGM_CACHE_SERIALIZER = os.environ.get('SGM_CACHE_SERIALIZER', 'json')
+SGM_CACHE_COMPRESS_MIN_BYTES = int(os.environ.get('SGM_CACHE_COMPRESS_MIN_BYTES', 2048))
+
+# Tier local (LRU por proceso) delante de Redis, coherente vía pub/sub
+SGM_CACHE_LOCAL_TIER = os.environ.get('SGM_CACHE_LOCAL_TIER', 'False').lower() in {"1", "true", "yes", "y"}
+SGM_CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get('SGM_CACHE_LOCAL_MAX_ENTRIES', 256))
+SGM_CACHE_LOCAL_MAX_BYTES = int(os.environ.get('SGM_CACHE_LOCAL_MAX_BYTES', 64 * 1024 * 1024))
+SGM_CACHE_LOCAL_TTL = int(os.environ.get('SGM_CACHE_LOCAL_TTL', 30))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -1,5 +1,5 @@
 import streamlit as st
-from data.loader_contabilidad import cargar_datos_redis
+from data.loader_contabilidad import cargar_datos_redis, cargar_movimientos_redis
 from modules import esf, eri, ecp, resumen, movimientos, analisis, excel_tools
 import os
 
@@ -223,7 +223,8 @@ def main():
                 data_esf=data.get("esf"),
                 data_eri=data.get("eri"),
                 metadata=metadata,
-                data_ecp=data.get("ecp")
+                data_ecp=data.get("ecp"),
+                movimientos_por_cuenta=cargar_movimientos_redis(cliente_id_actual, periodo_seleccionado)
             )
         elif menu == "ECP":  # Agregar este caso nuevo
             ecp.show(
@@ -236,7 +237,8 @@ def main():
             analisis.show(
                 data_esf=data.get("esf"),
                 data_eri=data.get("eri"),
-                metadata=metadata
+                metadata=metadata,
+                movimientos_por_cuenta=cargar_movimientos_redis(cliente_id_actual, periodo_seleccionado)
             )
         elif menu == "Herramientas Excel":
             excel_tools.show_excel_tools_section()
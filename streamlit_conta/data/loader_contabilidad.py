@@ -1,22 +1,38 @@
 import json
+import zlib
 import pathlib
 import redis
 import logging
 import os
+import urllib.parse
+import urllib.request
 from typing import Optional, Dict, Any
 from functools import lru_cache
 
+try:
+    import msgpack
+except ImportError:  # Solo hace falta si el backend usa SGM_CACHE_SERIALIZER=msgpack*
+    msgpack = None
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Cache global para reutilizar conexión Redis
 _redis_client = None
+# Cliente binario para leer payloads (pueden venir comprimidos o en msgpack)
+_redis_bin = None
+
+# API del backend para el detalle paginado de movimientos (detalle_movimientos)
+SGM_API_URL = os.getenv('SGM_API_URL', 'http://django:8000')
+SGM_API_TOKEN = os.getenv('SGM_API_TOKEN', '')
+# Filas por página pedidas al endpoint (el backend las acota a su máximo)
+DETALLE_MOVIMIENTOS_LIMITE = 1000
 
 
 def conectar_redis():
     """Conectar a Redis DB 1 (contabilidad) con reutilización de conexión"""
-    global _redis_client
+    global _redis_client, _redis_bin
     
     # Reutilizar conexión existente si está activa
     if _redis_client is not None:
@@ -47,6 +63,16 @@ def conectar_redis():
             socket_timeout=5,
             retry_on_timeout=True
         )
+        _redis_bin = redis.Redis(
+            host=redis_host,
+            port=redis_port,
+            db=redis_db,
+            password=redis_password,
+            decode_responses=False,
+            socket_connect_timeout=5,
+            socket_timeout=5,
+            retry_on_timeout=True
+        )
         
         # Verificar conexión
         if _redis_client.ping():
@@ -63,6 +89,53 @@ def conectar_redis():
         return None
 
 
+def conectar_redis_binario():
+    """Cliente Redis DB 1 (contabilidad) sin decode_responses, para leer payloads del cache"""
+    if conectar_redis() is None:
+        return None
+    return _redis_bin
+
+
+# Formatos del cache del backend (SGM_CACHE_SERIALIZER en backend/contabilidad/cache_redis.py):
+# los payloads compactos llevan un byte de cabecera; el JSON plano no lleva
+FORMATO_MSGPACK = b'\x01'
+FORMATO_MSGPACK_ZLIB = b'\x02'
+FORMATO_JSON_ZLIB = b'\x03'
+
+
+def _claves_a_str(valor):
+    """msgpack conserva claves int en los dicts; JSON las deja como str"""
+    if isinstance(valor, dict):
+        return {str(k): _claves_a_str(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_claves_a_str(v) for v in valor]
+    return valor
+
+
+def deserializar_payload(valor):
+    """
+    Deserializar un valor del cache del backend en cualquiera de sus formatos
+    (json, json-zlib, msgpack, msgpack-zlib), con claves str como en JSON
+    
+    Args:
+        valor: Bytes (o str) leídos de Redis
+        
+    Returns:
+        Datos deserializados
+    """
+    if isinstance(valor, str):
+        valor = valor.encode('utf-8')
+    cabecera = valor[:1]
+    if cabecera in (FORMATO_MSGPACK, FORMATO_MSGPACK_ZLIB):
+        if msgpack is None:
+            raise ValueError("Payload en msgpack pero msgpack no está instalado")
+        raw = zlib.decompress(valor[1:]) if cabecera == FORMATO_MSGPACK_ZLIB else valor[1:]
+        return _claves_a_str(msgpack.unpackb(raw, raw=False, strict_map_key=False))
+    if cabecera == FORMATO_JSON_ZLIB:
+        return json.loads(zlib.decompress(valor[1:]))
+    return json.loads(valor)
+
+
 def obtener_datos_batch_redis(cliente_id: int, periodo: str, redis_client) -> Dict[str, Any]:
     """
     🚀 OPTIMIZACIÓN: Obtener ESF, ERI y ECP de Redis en una sola consulta batch
@@ -71,7 +144,7 @@ def obtener_datos_batch_redis(cliente_id: int, periodo: str, redis_client) -> Di
     Args:
         cliente_id: ID del cliente
         periodo: Período contable
-        redis_client: Cliente Redis conectado
+        redis_client: Cliente Redis conectado (binario, ver conectar_redis_binario)
         
     Returns:
         Dict con ESF, ERI y ECP disponibles
@@ -98,10 +171,10 @@ def obtener_datos_batch_redis(cliente_id: int, periodo: str, redis_client) -> Di
         for i, (nombre_dato, clave) in enumerate(claves_consulta.items()):
             if resultados[i]:
                 try:
-                    datos_encontrados[nombre_dato] = json.loads(resultados[i])
+                    datos_encontrados[nombre_dato] = deserializar_payload(resultados[i])
                     #logger.info(f"✅ {nombre_dato.upper()} encontrado ({len(resultados[i])} bytes)")
-                except json.JSONDecodeError as e:
-                    logger.warning(f"⚠️ Error parsing JSON para {nombre_dato}: {e}")
+                except (ValueError, zlib.error) as e:
+                    logger.warning(f"⚠️ Error deserializando {nombre_dato}: {e}")
             else:
                 logger.debug(f"❌ No encontrado: {nombre_dato}")
                 
@@ -126,7 +199,7 @@ def cargar_datos_redis(cliente_id: int = 2, periodo: str = "2025-08") -> Dict[st
     Returns:
         Dict con ESF, ERI y ECP desde Redis o datos de ejemplo como fallback
     """
-    redis_client = conectar_redis()
+    redis_client = conectar_redis_binario()
     if not redis_client:
         logger.warning(f"⚠️ No se pudo conectar a Redis, usando datos de ejemplo")
         return None
@@ -173,6 +246,81 @@ def cargar_datos_redis(cliente_id: int = 2, periodo: str = "2025-08") -> Dict[st
 
 
 
+def cargar_movimientos_redis(cliente_id: int, periodo: str) -> Dict[str, dict]:
+    """
+    Cargar el índice de movimientos del cierre: los estados financieros solo traen
+    movimientos_count por cuenta, y el detalle se pide paginado al backend
+    (movimientos_de_cuenta) solo para las cuentas que se muestran
+    
+    Args:
+        cliente_id: ID del cliente
+        periodo: Período contable
+        
+    Returns:
+        Dict {codigo_cuenta: {'cuenta_id', 'movimientos_count', 'detalle_movimientos'}}
+        (vacío si no está en Redis)
+    """
+    redis_client = conectar_redis_binario()
+    if not redis_client:
+        return {}
+    
+    clave = f"sgm:contabilidad:{cliente_id}:{periodo}:movimientos_cierre"
+    try:
+        valor = redis_client.get(clave)
+        if not valor:
+            logger.info(f"ℹ️ Sin índice de movimientos en Redis: {clave}")
+            return {}
+        indice = deserializar_payload(valor)
+    except Exception as e:
+        logger.warning(f"⚠️ Error cargando índice de movimientos: {e}")
+        return {}
+    
+    return {str(codigo): dict(cuenta) for codigo, cuenta in indice.get('cuentas', {}).items()}
+
+
+def cargar_detalle_movimientos(url: str) -> list:
+    """
+    Recorrer las páginas del endpoint detalle_movimientos de una cuenta siguiendo su
+    cursor ('siguiente') y devolver todos sus movimientos
+    """
+    movimientos = []
+    params = {'limit': DETALLE_MOVIMIENTOS_LIMITE}
+    headers = {'Authorization': f'Bearer {SGM_API_TOKEN}'} if SGM_API_TOKEN else {}
+    try:
+        while True:
+            peticion = urllib.request.Request(
+                f"{SGM_API_URL.rstrip('/')}{url}?{urllib.parse.urlencode(params)}", headers=headers
+            )
+            with urllib.request.urlopen(peticion, timeout=30) as respuesta:
+                pagina = json.loads(respuesta.read())
+            movimientos.extend(pagina.get('movimientos', []))
+            if not pagina.get('siguiente'):
+                return movimientos
+            params['cursor'] = pagina['siguiente']
+    except Exception as e:
+        logger.warning(f"⚠️ Error cargando detalle de movimientos ({url}): {e}")
+        return movimientos
+
+
+def movimientos_de_cuenta(cuenta: Dict[str, Any], movimientos_por_cuenta: Optional[Dict[str, dict]],
+                          codigo: Optional[str] = None) -> list:
+    """
+    Movimientos de una cuenta de ESF/ERI/ECP: los estados solo traen movimientos_count,
+    así que el detalle se pide al endpoint paginado que indica el índice de
+    cargar_movimientos_redis (una vez por cuenta; la lista embebida de estados
+    generados antes se sigue respetando)
+    """
+    if cuenta.get("movimientos"):
+        return cuenta["movimientos"]
+    codigo = codigo if codigo is not None else cuenta.get("codigo", "")
+    entrada = (movimientos_por_cuenta or {}).get(str(codigo))
+    if not entrada or not entrada.get("movimientos_count"):
+        return []
+    if "movimientos" not in entrada:
+        entrada["movimientos"] = cargar_detalle_movimientos(entrada["detalle_movimientos"])
+    return entrada["movimientos"]
+
+
 def obtener_info_redis_completa(cliente_id) -> Dict[str, Any]:
     """
     Obtener información completa de Redis y cierres disponibles
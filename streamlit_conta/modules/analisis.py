@@ -1,8 +1,9 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
+from data.loader_contabilidad import movimientos_de_cuenta
 
-def show(data_esf=None, data_eri=None, metadata=None):
+def show(data_esf=None, data_eri=None, metadata=None, movimientos_por_cuenta=None):
     st.subheader("Análisis Exploratorio de Movimientos")
 
     lang_field = st.session_state.get("lang_field", "nombre_es")
@@ -15,7 +16,7 @@ def show(data_esf=None, data_eri=None, metadata=None):
     # ----------------------------
     # Extraer movimientos
     # ----------------------------
-    df = extraer_todos_los_movimientos(data_esf, data_eri, lang_field)
+    df = extraer_todos_los_movimientos(data_esf, data_eri, lang_field, movimientos_por_cuenta)
 
     if df.empty:
         st.info("No hay movimientos para análisis.")
@@ -119,7 +120,7 @@ def show(data_esf=None, data_eri=None, metadata=None):
     else:
         st.info("No hay movimientos para la cuenta seleccionada.")
 
-def extraer_todos_los_movimientos(data_esf, data_eri, lang_field="nombre_es"):
+def extraer_todos_los_movimientos(data_esf, data_eri, lang_field="nombre_es", movimientos_por_cuenta=None):
     """
     Extrae todos los movimientos desde ESF y ERI en un solo DataFrame.
     """
@@ -141,7 +142,7 @@ def extraer_todos_los_movimientos(data_esf, data_eri, lang_field="nombre_es"):
                 for grupo, info in grupos.items():
                     cuentas = info.get("cuentas", [])
                     for cuenta in cuentas:
-                        movimientos = cuenta.get("movimientos", [])
+                        movimientos = movimientos_de_cuenta(cuenta, movimientos_por_cuenta)
                         for mov in movimientos:
                             rows.append({
                                 "Origen": "ESF",
@@ -163,7 +164,7 @@ def extraer_todos_los_movimientos(data_esf, data_eri, lang_field="nombre_es"):
             for grupo, info in grupos.items():
                 cuentas = info.get("cuentas", [])
                 for cuenta in cuentas:
-                    movimientos = cuenta.get("movimientos", [])
+                    movimientos = movimientos_de_cuenta(cuenta, movimientos_por_cuenta)
                     for mov in movimientos:
                         rows.append({
                             "Origen": "ERI",
@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+from data.loader_contabilidad import movimientos_de_cuenta
 
 # Importar utilidades de exportación Excel
 try:
@@ -18,7 +19,7 @@ BLOQUES_ERI = [
     "ganancia_perdida_antes_impuestos"
 ]
 
-def show(data_esf=None, data_eri=None, metadata=None, data_ecp=None):
+def show(data_esf=None, data_eri=None, metadata=None, data_ecp=None, movimientos_por_cuenta=None):
     st.subheader("Movimientos Contables")
 
     lang_field = st.session_state.get("lang_field", "nombre_es")
@@ -33,7 +34,7 @@ def show(data_esf=None, data_eri=None, metadata=None, data_ecp=None):
         return
 
     # Extraer movimientos desde ESF, ERI y ECP
-    df = extraer_todos_los_movimientos(data_esf, data_eri, data_ecp, lang_field)
+    df = extraer_todos_los_movimientos(data_esf, data_eri, data_ecp, lang_field, movimientos_por_cuenta)
 
     if df.empty:
         st.info("No hay movimientos para mostrar.")
@@ -219,7 +220,7 @@ def show(data_esf=None, data_eri=None, metadata=None, data_ecp=None):
         st.info("No hay datos que coincidan con los filtros.")
 
 
-def extraer_todos_los_movimientos(data_esf, data_eri, data_ecp=None, lang_field="nombre_es"):
+def extraer_todos_los_movimientos(data_esf, data_eri, data_ecp=None, lang_field="nombre_es", movimientos_por_cuenta=None):
     """
     Extrae todos los movimientos desde ESF, ERI y ECP en un solo DataFrame.
     Ahora incluye saldo inicial y clasificación.
@@ -247,7 +248,7 @@ def extraer_todos_los_movimientos(data_esf, data_eri, data_ecp=None, lang_field=
                         saldo_inicial = float(cuenta.get("saldo_anterior", 0) or 0)  # CAMBIADO: saldo_anterior
                         clasificacion = cuenta.get("clasificacion", f"{bloque_name.title()} - {sub_bloque_name.title()}")
                         
-                        for mov in cuenta.get("movimientos", []):
+                        for mov in movimientos_de_cuenta(cuenta, movimientos_por_cuenta):
                             rows.append({
                                 "Origen": "ESF",
                                 "Fecha": mov.get("fecha", ""),
@@ -275,7 +276,7 @@ def extraer_todos_los_movimientos(data_esf, data_eri, data_ecp=None, lang_field=
                         clasificacion = info_cuenta.get("clasificacion", tipo.title())
                         
                         # Si hay movimientos en la cuenta
-                        movimientos = info_cuenta.get("movimientos", [])
+                        movimientos = movimientos_de_cuenta(info_cuenta, movimientos_por_cuenta, codigo)
                         if movimientos:
                             for mov in movimientos:
                                 rows.append({
@@ -303,7 +304,7 @@ def extraer_todos_los_movimientos(data_esf, data_eri, data_ecp=None, lang_field=
                     saldo_inicial = float(cuenta.get("saldo_anterior", 0) or 0)  # CAMBIADO: saldo_anterior
                     clasificacion = cuenta.get("clasificacion", bloque_key.replace("_", " ").title())
                     
-                    for mov in cuenta.get("movimientos", []):
+                    for mov in movimientos_de_cuenta(cuenta, movimientos_por_cuenta):
                         rows.append({
                             "Origen": "ERI",
                             "Fecha": mov.get("fecha", ""),
@@ -332,7 +333,7 @@ def extraer_todos_los_movimientos(data_esf, data_eri, data_ecp=None, lang_field=
                     saldo_inicial = float(cuenta.get("saldo_anterior", 0) or 0)
                     clasificacion = f"ECP - {categoria.replace('_', ' ').title()}"
                     
-                    for mov in cuenta.get("movimientos", []):
+                    for mov in movimientos_de_cuenta(cuenta, movimientos_por_cuenta):
                         rows.append({
                             "Origen": "ECP",
                             "Fecha": mov.get("fecha", ""),
@@ -357,7 +358,7 @@ def extraer_todos_los_movimientos(data_esf, data_eri, data_ecp=None, lang_field=
                             saldo_inicial = float(cuenta.get("saldo_anterior", 0) or 0)
                             clasificacion = f"ECP - {categoria.replace('_', ' ').title()}"
                             
-                            for mov in cuenta.get("movimientos", []):
+                            for mov in movimientos_de_cuenta(cuenta, movimientos_por_cuenta):
                                 rows.append({
                                     "Origen": "ECP",
                                     "Fecha": mov.get("fecha", ""),
@@ -463,7 +464,7 @@ def extraer_info_cuentas_completa(data_esf, data_eri, data_ecp=None, lang_field=
                             "Debe Movimientos": float(info_cuenta.get("debe_movimientos", 0) or 0),
                             "Haber Movimientos": float(info_cuenta.get("haber_movimientos", 0) or 0),
                             "Saldo Final": float(info_cuenta.get("monto", 0) or 0),
-                            "Cantidad Movimientos": len(info_cuenta.get("movimientos", []))
+                            "Cantidad Movimientos": info_cuenta.get("movimientos_count", len(info_cuenta.get("movimientos", [])))
                         }
                         agregar_cuenta(cuenta_info, "ERI")
         
@@ -486,7 +487,7 @@ def extraer_info_cuentas_completa(data_esf, data_eri, data_ecp=None, lang_field=
                                 "Debe Movimientos": float(cuenta.get("debe_movimientos", 0) or 0),
                                 "Haber Movimientos": float(cuenta.get("haber_movimientos", 0) or 0),
                                 "Saldo Final": float(cuenta.get("saldo_final", 0) or cuenta.get("saldo", 0) or 0),
-                                "Cantidad Movimientos": len(cuenta.get("movimientos", []))
+                                "Cantidad Movimientos": cuenta.get("movimientos_count", len(cuenta.get("movimientos", [])))
                             }
                             agregar_cuenta(cuenta_info, "ERI")
 
@@ -511,7 +512,7 @@ def extraer_info_cuentas_completa(data_esf, data_eri, data_ecp=None, lang_field=
                             "Debe Movimientos": float(cuenta.get("debe_movimientos", 0) or 0),
                             "Haber Movimientos": float(cuenta.get("haber_movimientos", 0) or 0),
                             "Saldo Final": float(cuenta.get("saldo_final", 0) or 0),
-                            "Cantidad Movimientos": len(cuenta.get("movimientos", []))
+                            "Cantidad Movimientos": cuenta.get("movimientos_count", len(cuenta.get("movimientos", [])))
                         }
                         agregar_cuenta(cuenta_info, "ECP")
                 
@@ -532,7 +533,7 @@ def extraer_info_cuentas_completa(data_esf, data_eri, data_ecp=None, lang_field=
                                     "Debe Movimientos": float(cuenta.get("debe_movimientos", 0) or 0),
                                     "Haber Movimientos": float(cuenta.get("haber_movimientos", 0) or 0),
                                     "Saldo Final": float(cuenta.get("saldo_final", 0) or 0),
-                                    "Cantidad Movimientos": len(cuenta.get("movimientos", []))
+                                    "Cantidad Movimientos": cuenta.get("movimientos_count", len(cuenta.get("movimientos", [])))
                                 }
                                 agregar_cuenta(cuenta_info, "ECP")
 
@@ -1,4 +1,5 @@
 import json
+import zlib
 import redis
 import logging
 import os
@@ -7,17 +8,24 @@ from pathlib import Path
 from functools import lru_cache
 from datetime import datetime
 
+try:
+    import msgpack
+except ImportError:  # Solo hace falta si el backend usa SGM_CACHE_SERIALIZER=msgpack*
+    msgpack = None
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Cache global para reutilizar conexión Redis
 _redis_client = None
+# Cliente binario para leer payloads (pueden venir comprimidos o en msgpack)
+_redis_bin = None
 
 
 def conectar_redis():
     """Conectar a Redis DB 2 (nómina) con reutilización de conexión"""
-    global _redis_client
+    global _redis_client, _redis_bin
     
     # Reutilizar conexión existente si está activa
     if _redis_client is not None:
@@ -48,6 +56,16 @@ def conectar_redis():
             socket_timeout=5,
             retry_on_timeout=True
         )
+        _redis_bin = redis.Redis(
+            host=redis_host,
+            port=redis_port,
+            db=redis_db,
+            password=redis_password,
+            decode_responses=False,
+            socket_connect_timeout=5,
+            socket_timeout=5,
+            retry_on_timeout=True
+        )
         
         # Verificar conexión
         if _redis_client.ping():
@@ -64,6 +82,53 @@ def conectar_redis():
         return None
 
 
+def conectar_redis_binario():
+    """Cliente Redis DB 2 (nómina) sin decode_responses, para leer payloads del cache"""
+    if conectar_redis() is None:
+        return None
+    return _redis_bin
+
+
+# Formatos del cache del backend (SGM_CACHE_SERIALIZER en backend/nomina/cache_redis.py):
+# los payloads compactos llevan un byte de cabecera; el JSON plano no lleva
+FORMATO_MSGPACK = b'\x01'
+FORMATO_MSGPACK_ZLIB = b'\x02'
+FORMATO_JSON_ZLIB = b'\x03'
+
+
+def _claves_a_str(valor):
+    """msgpack conserva claves int en los dicts; JSON las deja como str"""
+    if isinstance(valor, dict):
+        return {str(k): _claves_a_str(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [_claves_a_str(v) for v in valor]
+    return valor
+
+
+def deserializar_payload(valor):
+    """
+    Deserializar un valor del cache del backend en cualquiera de sus formatos
+    (json, json-zlib, msgpack, msgpack-zlib), con claves str como en JSON
+    
+    Args:
+        valor: Bytes (o str) leídos de Redis
+        
+    Returns:
+        Datos deserializados
+    """
+    if isinstance(valor, str):
+        valor = valor.encode('utf-8')
+    cabecera = valor[:1]
+    if cabecera in (FORMATO_MSGPACK, FORMATO_MSGPACK_ZLIB):
+        if msgpack is None:
+            raise ValueError("Payload en msgpack pero msgpack no está instalado")
+        raw = zlib.decompress(valor[1:]) if cabecera == FORMATO_MSGPACK_ZLIB else valor[1:]
+        return _claves_a_str(msgpack.unpackb(raw, raw=False, strict_map_key=False))
+    if cabecera == FORMATO_JSON_ZLIB:
+        return json.loads(zlib.decompress(valor[1:]))
+    return json.loads(valor)
+
+
 def obtener_informes_disponibles_redis(cliente_id: Optional[int] = None) -> Dict[str, Any]:
     """
     Obtener lista de informes de nómina disponibles en Redis
@@ -86,6 +151,7 @@ def obtener_informes_disponibles_redis(cliente_id: Optional[int] = None) -> Dict
             pattern = "sgm:nomina:*:*:informe"
         
         claves = redis_client.keys(pattern)
+        redis_bin = conectar_redis_binario()
         informes = []
         
         for clave in claves:
@@ -100,9 +166,9 @@ def obtener_informes_disponibles_redis(cliente_id: Optional[int] = None) -> Dict
                     ttl = redis_client.ttl(clave)
                     
                     # Obtener metadatos básicos sin cargar el informe completo
-                    data_raw = redis_client.get(clave)
+                    data_raw = redis_bin.get(clave)
                     if data_raw:
-                        data = json.loads(data_raw)
+                        data = deserializar_payload(data_raw)
                         informes.append({
                             'cliente_id': int(cliente_id_key),
                             'periodo': periodo_key,
@@ -169,14 +235,14 @@ def cargar_datos_redis(cliente_id: int = 6, periodo: str = "2025-03") -> Optiona
         logger.info(f"🔍 Buscando informe en Redis: {clave_redis}")
         
         # Obtener datos desde Redis
-        data_raw = redis_client.get(clave_redis)
+        data_raw = conectar_redis_binario().get(clave_redis)
         
         if not data_raw:
             logger.warning(f"❌ No se encontró informe en Redis para cliente {cliente_id}, período {periodo}")
             return None
         
-        # Parsear JSON
-        data = json.loads(data_raw)
+        # Deserializar (JSON o formato compacto del backend)
+        data = deserializar_payload(data_raw)
         
         logger.info(f"✅ Informe encontrado en Redis: {data.get('cliente_nombre')} - {periodo}")
         logger.info(f"📏 Tamaño: {len(data_raw)/1024:.1f} KB")
@@ -200,8 +266,8 @@ def cargar_datos_redis(cliente_id: int = 6, periodo: str = "2025-03") -> Optiona
             logger.error("❌ Estructura de informe en Redis inválida (no es dict)")
             return None
         
-    except json.JSONDecodeError as e:
-        logger.error(f"❌ Error parsing JSON desde Redis: {e}")
+    except (ValueError, zlib.error) as e:
+        logger.error(f"❌ Error deserializando informe desde Redis: {e}")
         return None
     except Exception as e:
         logger.error(f"❌ Error cargando datos desde Redis: {e}")